@@ -15,6 +15,7 @@ from .models import (
     Conta, Municipe, Atendimento, Tramitacao, CategoriaAtendimento, ReservaEspaco,
     SolicitacaoAgenda, Anexo, LogDeAtividade, PerfilUsuario, Notificacao, CategoriaContato, Espaco, RegistroVisita, Lembrete
 )
+from .busca import normalizar_cpf
 
 def enviar_email_de_acesso(modeladmin, request, queryset):
     """
@@ -145,12 +146,13 @@ class MunicipeResource(resources.ModelResource):
         A verificação segue uma ordem de prioridade para evitar duplicatas.
         """
         # Prioridade 1: CPF (o identificador mais forte)
-        cpf = row.get('cpf')
-        if cpf and str(cpf).strip():
-            try:
-                return Municipe.objects.get(cpf=str(cpf).strip())
-            except Municipe.DoesNotExist:
-                pass # Se não achar por CPF, continua para a próxima verificação
+        # (pela coluna indexada cpf_digitos, então a formatação da planilha não importa)
+        cpf_digitos = normalizar_cpf(row.get('cpf'))
+        if cpf_digitos:
+            municipe = Municipe.objects.filter(cpf_digitos=cpf_digitos).first()
+            if municipe:
+                return municipe
+            # Se não achar por CPF, continua para a próxima verificação
 
         # Prioridade 2: Email (segundo identificador mais forte)
         email = row.get('email')
@@ -187,7 +189,7 @@ class MunicipeResource(resources.ModelResource):
 class MunicipeAdmin(ImportExportModelAdmin):
     resource_class = MunicipeResource
     list_display = ('nome_completo', 'tratamento', 'cpf', 'get_email_principal', 'get_telefone_principal', 'categoria', 'listar_contas')
-    search_fields = ('nome_completo', 'cpf', 'emails__email')
+    search_fields = ('nome_completo', 'cpf', 'contatos__valor')
     list_filter = ('categoria', 'contas')
     filter_horizontal = ('contas',)
 
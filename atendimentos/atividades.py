@@ -0,0 +1,167 @@
+"""
+Linha do tempo de atividades do munícipe (AtividadeMunicipe).
+
+Cada registro de origem vira uma linha com data, título e resumo já prontos
+para exibição; os sinais (atendimentos/signals.py e eventos/signals.py)
+chamam `registrar`/`remover` a cada gravação. Presenças e comunicações são
+identificadas pelo evento/comunicação + munícipe, como as próprias tabelas
+(unique_together), o que permite registrar os destinatários criados com
+bulk_create, que no MySQL não devolve as PKs.
+
+`reconstruir()` (comando `reconstruir_atividades`) refaz a tabela inteira a
+partir das tabelas de origem.
+"""
+from django.db import transaction
+
+from .models import AtividadeMunicipe, Atendimento, RegistroVisita, SolicitacaoAgenda, Tramitacao
+
+TAMANHO_RESUMO = 500
+TAMANHO_LOTE = 2000
+
+# Tipos em que o mesmo objeto de origem (evento, comunicação) tem uma linha por munícipe
+TIPOS_POR_MUNICIPE = {AtividadeMunicipe.PRESENCA, AtividadeMunicipe.COMUNICACAO}
+
+
+def _resumo(texto):
+    return (texto or '')[:TAMANHO_RESUMO]
+
+
+def _titulo(texto):
+    return texto[:255]
+
+
+def dados_atendimento(atendimento):
+    return {
+        'objeto_id': atendimento.pk, 'municipe_id': atendimento.municipe_id, 'referencia_id': None,
+        'data': atendimento.data_criacao, 'titulo': _titulo(f'Atendimento {atendimento.protocolo}: {atendimento.titulo}'),
+        'resumo': _resumo(atendimento.descricao), 'status': atendimento.status,
+    }
+
+
+def dados_tramitacao(tramitacao):
+    atendimento = tramitacao.atendimento
+    return {
+        'objeto_id': tramitacao.pk, 'municipe_id': atendimento.municipe_id, 'referencia_id': atendimento.pk,
+        'data': tramitacao.data_tramitacao, 'titulo': _titulo(f'Tramitação do atendimento {atendimento.protocolo}'),
+        'resumo': _resumo(tramitacao.despacho), 'status': '',
+    }
+
+
+def dados_visita(visita):
+    return {
+        'objeto_id': visita.pk, 'municipe_id': visita.municipe_id, 'referencia_id': None,
+        'data': visita.data_checkin, 'titulo': _titulo(f'Visita a {visita.conta_destino.nome}'),
+        'resumo': _resumo(visita.observacao), 'status': '',
+    }
+
+
+def dados_agenda(agenda):
+    return {
+        'objeto_id': agenda.pk, 'municipe_id': agenda.solicitante_id, 'referencia_id': None,
+        'data': agenda.data_criacao, 'titulo': _titulo(f'Solicitação de agenda: {agenda.assunto}'),
+        'resumo': _resumo(agenda.detalhes), 'status': agenda.status,
+    }
+
+
+def dados_presenca(presenca):
+    return {
+        'objeto_id': presenca.evento_id, 'municipe_id': presenca.municipe_id, 'referencia_id': None,
+        'data': presenca.data_registro, 'titulo': _titulo(f'Presença no evento {presenca.evento.nome}'),
+        'resumo': '', 'status': '',
+    }
+
+
+def dados_comunicacao(destinatario):
+    comunicacao = destinatario.comunicacao
+    return {
+        'objeto_id': comunicacao.pk, 'municipe_id': destinatario.municipe_id, 'referencia_id': None,
+        'data': comunicacao.data_envio or comunicacao.data_criacao, 'titulo': _titulo(f'Comunicação: {comunicacao.titulo}'),
+        'resumo': _resumo(comunicacao.descricao), 'status': comunicacao.status,
+    }
+
+
+CONSTRUTORES = {
+    AtividadeMunicipe.ATENDIMENTO: dados_atendimento,
+    AtividadeMunicipe.TRAMITACAO: dados_tramitacao,
+    AtividadeMunicipe.VISITA: dados_visita,
+    AtividadeMunicipe.AGENDA: dados_agenda,
+    AtividadeMunicipe.PRESENCA: dados_presenca,
+    AtividadeMunicipe.COMUNICACAO: dados_comunicacao,
+}
+
+
+def _separar_chave(tipo, dados):
+    chave = {'tipo': tipo, 'objeto_id': dados.pop('objeto_id')}
+    if tipo in TIPOS_POR_MUNICIPE:
+        chave['municipe_id'] = dados.pop('municipe_id')
+    return chave, dados
+
+
+def registrar(tipo, instancia):
+    """Cria ou atualiza a linha da atividade de `instancia`."""
+    chave, dados = _separar_chave(tipo, CONSTRUTORES[tipo](instancia))
+    AtividadeMunicipe.objects.update_or_create(**chave, defaults=dados)
+
+
+def registrar_em_lote(tipo, instancias):
+    """Para registros criados com bulk_create (sem sinais); ignora os que já existem."""
+    AtividadeMunicipe.objects.bulk_create(
+        [AtividadeMunicipe(tipo=tipo, **CONSTRUTORES[tipo](instancia)) for instancia in instancias],
+        batch_size=TAMANHO_LOTE, ignore_conflicts=True
+    )
+
+
+def remover(tipo, instancia):
+    dados = CONSTRUTORES[tipo](instancia) if tipo in TIPOS_POR_MUNICIPE else {'objeto_id': instancia.pk}
+    chave, _ = _separar_chave(tipo, dados)
+    AtividadeMunicipe.objects.filter(**chave).delete()
+
+
+def atualizar_tramitacoes(atendimento):
+    """As tramitações acompanham o munícipe do atendimento."""
+    AtividadeMunicipe.objects.filter(
+        tipo=AtividadeMunicipe.TRAMITACAO, referencia_id=atendimento.pk
+    ).exclude(municipe_id=atendimento.municipe_id).update(municipe_id=atendimento.municipe_id)
+
+
+def atualizar_comunicacao(comunicacao):
+    """Título, data de envio e status da comunicação em todas as linhas dos destinatários."""
+    AtividadeMunicipe.objects.filter(tipo=AtividadeMunicipe.COMUNICACAO, objeto_id=comunicacao.pk).update(
+        data=comunicacao.data_envio or comunicacao.data_criacao,
+        titulo=_titulo(f'Comunicação: {comunicacao.titulo}'),
+        resumo=_resumo(comunicacao.descricao), status=comunicacao.status,
+    )
+
+
+def atualizar_evento(evento):
+    AtividadeMunicipe.objects.filter(tipo=AtividadeMunicipe.PRESENCA, objeto_id=evento.pk).update(
+        titulo=_titulo(f'Presença no evento {evento.nome}')
+    )
+
+
+def _origens():
+    from eventos.models import Destinatario, ListaPresenca
+
+    return [
+        (AtividadeMunicipe.ATENDIMENTO, Atendimento.objects.all()),
+        (AtividadeMunicipe.TRAMITACAO, Tramitacao.objects.select_related('atendimento')),
+        (AtividadeMunicipe.VISITA, RegistroVisita.objects.select_related('conta_destino')),
+        (AtividadeMunicipe.AGENDA, SolicitacaoAgenda.objects.all()),
+        (AtividadeMunicipe.PRESENCA, ListaPresenca.objects.select_related('evento')),
+        (AtividadeMunicipe.COMUNICACAO, Destinatario.objects.select_related('comunicacao')),
+    ]
+
+
+def reconstruir():
+    """Apaga e recria todas as atividades a partir das tabelas de origem. Devolve o total."""
+    with transaction.atomic():
+        AtividadeMunicipe.objects.all().delete()
+        for tipo, queryset in _origens():
+            lote = []
+            for instancia in queryset.order_by('pk').iterator(chunk_size=TAMANHO_LOTE):
+                lote.append(instancia)
+                if len(lote) >= TAMANHO_LOTE:
+                    registrar_em_lote(tipo, lote)
+                    lote = []
+            registrar_em_lote(tipo, lote)
+    return AtividadeMunicipe.objects.count()
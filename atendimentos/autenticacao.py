@@ -0,0 +1,77 @@
+"""
+Autenticações JWT do SIGA.
+
+`JWTCacheAuthentication` (padrão) lê o usuário, o perfil, os grupos e as
+contas pelo cache de usuários (atendimentos/cache_usuarios.py, SIGA_CACHE_USUARIO
+em core/settings.py): com o cache ativo, uma requisição típica chega à view sem
+nenhuma query. Com o cache desligado, o usuário é lido com o perfil na mesma
+query e o resto carrega sob demanda.
+
+`JWTClaimsAuthentication` também confia nas claims de autorização do token.
+
+O access token emitido por MyTokenObtainPairSerializer já leva os grupos e as
+contas do usuário. Com `JWTClaimsAuthentication` (opcional, ver
+REST_FRAMEWORK em core/settings.py), essas claims alimentam o
+ContextoAutorizacao da requisição: grupos e contas não são mais consultados e
+os filtros por conta usam a lista de ids em vez da subconsulta do perfil.
+
+O usuário continua sendo carregado como na JWTCacheAuthentication, e a
+`versao_autorizacao` do perfil é comparada com a do token: qualquer mudança de
+grupos ou contas incrementa essa versão (atendimentos/signals.py), e o token
+antigo é recusado com 401 `token_not_valid`, o que leva o frontend a renovar o
+access token. A renovação (MyTokenRefreshSerializer) grava claims atuais.
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache_usuarios import carregar_usuario
+from .permissions import ContextoAutorizacao
+
+
+class JWTCacheAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        # Mesmas verificações do JWTAuthentication, com o usuário vindo do cache
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = carregar_usuario(user_id)
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class JWTClaimsAuthentication(JWTCacheAuthentication):
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        self.aplicar_claims(user, validated_token)
+        return user
+
+    def aplicar_claims(self, user, validated_token):
+        perfil = getattr(user, 'perfil', None)
+        claims_perfil = validated_token.get('perfil')
+        if perfil is None or not isinstance(claims_perfil, dict) or 'versao_autorizacao' not in claims_perfil:
+            # Sem perfil ou token antigo (sem versão): o contexto carrega do banco
+            return
+
+        if claims_perfil['versao_autorizacao'] != perfil.versao_autorizacao:
+            raise InvalidToken('As permissões do usuário mudaram. Renove o token.')
+
+        user._contexto_autorizacao = ContextoAutorizacao.de_claims(
+            user, validated_token.get('groups', []), claims_perfil.get('contas', [])
+        )
@@ -0,0 +1,215 @@
+"""
+Ferramentas de benchmark da busca: gerador determinístico de munícipes
+sintéticos, mistura de consultas realistas, contagem de queries e medição de
+latência e de recall (usadas pelo comando `benchmark_busca_municipes`).
+"""
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.db.models import Max
+
+from .busca import atualizar_visibilidade_municipes, tokens_dos_nomes
+from .models import Conta, Municipe, MunicipeContato, MunicipeToken, MunicipeVisibilidade
+
+
+PRIMEIROS_NOMES = [
+    'JOÃO', 'JOSÉ', 'MARIA', 'ANA', 'ANTÔNIO', 'FRANCISCO', 'CARLOS', 'PAULO', 'PEDRO', 'LUCAS',
+    'LUIZ', 'LUÍS', 'MARCOS', 'GABRIEL', 'RAFAEL', 'DANIEL', 'MARCELO', 'BRUNO', 'EDUARDO', 'FELIPE',
+    'FERNANDA', 'JULIANA', 'PATRÍCIA', 'ALINE', 'CAMILA', 'AMANDA', 'BRUNA', 'JÉSSICA', 'LETÍCIA', 'JÚLIA',
+    'THIAGO', 'TIAGO', 'MATHEUS', 'MATEUS', 'GLÁUCIA', 'CÉLIA', 'SÔNIA', 'VÂNIA', 'RÉGIS', 'INÊS',
+]
+SOBRENOMES = [
+    'SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'SOUSA', 'RODRIGUES', 'FERREIRA', 'ALVES', 'PEREIRA', 'LIMA',
+    'GOMES', 'COSTA', 'RIBEIRO', 'MARTINS', 'CARVALHO', 'ALMEIDA', 'LOPES', 'SOARES', 'FERNANDES', 'VIEIRA',
+    'BARBOSA', 'ROCHA', 'DIAS', 'NASCIMENTO', 'ANDRADE', 'MOREIRA', 'NUNES', 'MARQUES', 'MACHADO', 'MENDES',
+    'FREITAS', 'CARDOSO', 'RAMOS', 'GONÇALVES', 'SANTANA', 'TEIXEIRA', 'CONCEIÇÃO', 'ARAÚJO', 'MONTEIRO', 'BRAGANÇA',
+]
+CONECTIVOS = ['DE', 'DA', 'DOS', 'DAS', 'DO']
+DOMINIOS = ['gmail.com', 'hotmail.com', 'yahoo.com.br', 'uol.com.br', 'exemplo.com.br']
+
+PREFIXO_CONTAS = 'BENCHMARK'
+# Parte dos CPFs sintéticos que nunca colide com CPFs reais do cadastro (começam com 000)
+PREFIXO_CPF = '000'
+
+# Mistura de consultas por nome: (descrição, termo, parâmetros extras, variantes).
+# As variantes definem o que é "relevante" no cálculo do recall: munícipes em que
+# cada palavra de alguma variante é o início de um token do nome.
+CONSULTAS_NOME = [
+    ('nome + sobrenome', 'joao silva', {}, ['joao silva']),
+    ('sobrenome comum', 'souza', {}, ['souza']),
+    ('com conectivo', 'maria de souza', {}, ['maria souza']),
+    ('acentos/caixa', 'JOSÉ', {}, ['jose']),
+    ('prefixos', 'mar oli', {}, ['mar oli']),
+    ('prefixo curto', 'gl', {}, ['gl']),
+    ('três palavras', 'ana lima costa', {}, ['ana lima costa']),
+    ('grafia (fuzzy)', 'luis sousa', {'fuzzy': '1'}, ['luis sousa', 'luiz sousa', 'luis souza', 'luiz souza']),
+    ('grafia (fuzzy)', 'tiago goncalves', {'fuzzy': '1'}, ['tiago goncalves', 'thiago goncalves']),
+]
+
+
+def gerar_nome(rng):
+    partes = [rng.choice(PRIMEIROS_NOMES)]
+    if rng.random() < 0.4:
+        partes.append(rng.choice(PRIMEIROS_NOMES))
+    for _ in range(rng.randint(1, 3)):
+        if rng.random() < 0.3:
+            partes.append(rng.choice(CONECTIVOS))
+        partes.append(rng.choice(SOBRENOMES))
+    return ' '.join(partes)
+
+
+def formatar_cpf_sintetico(municipe_id):
+    digitos = f'{PREFIXO_CPF}{municipe_id:08d}'
+    return f'{digitos[:3]}.{digitos[3:6]}.{digitos[6:9]}-{digitos[9:]}'
+
+
+def gerar_contas_sinteticas(quantidade=5):
+    return [
+        Conta.objects.get_or_create(nome=f'{PREFIXO_CONTAS} {numero}')[0]
+        for numero in range(1, quantidade + 1)
+    ]
+
+
+def gerar_municipes_sinteticos(quantidade, semente=42, tamanho_lote=5000, contas=None):
+    """
+    Insere `quantidade` munícipes sintéticos com IDs explícitos (o bulk_create do
+    MySQL não devolve as PKs, e elas são necessárias para indexar os tokens).
+    A mesma semente sempre gera os mesmos dados: nome, CPF, e-mail, telefone
+    e, se `contas` for informado, o vínculo com uma delas (40% ficam públicos).
+    """
+    rng = random.Random(semente)
+    contas = list(contas or [])
+    ContaMunicipe = Municipe.contas.through
+    proximo_id = (Municipe.objects.aggregate(maior=Max('id'))['maior'] or 0) + 1
+    gerados = 0
+    while gerados < quantidade:
+        lote, vinculos = [], []
+        for _ in range(min(tamanho_lote, quantidade - gerados)):
+            nome = gerar_nome(rng)
+            apelido = rng.choice(PRIMEIROS_NOMES) if rng.random() < 0.1 else None
+            emails, telefones = [], []
+            if rng.random() < 0.5:
+                usuario = '.'.join(sorted(tokens_dos_nomes(nome))[:2])
+                emails.append({'tipo': 'PESSOAL', 'email': f'{usuario}{proximo_id}@{rng.choice(DOMINIOS)}'})
+            if rng.random() < 0.8:
+                telefones.append({'tipo': 'CELULAR', 'numero': f'(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}'})
+            lote.append(Municipe(
+                id=proximo_id, nome_completo=nome, nome_de_guerra=apelido,
+                cpf=formatar_cpf_sintetico(proximo_id) if rng.random() < 0.7 else None,
+                emails=emails, telefones=telefones,
+            ))
+            if contas and rng.random() < 0.6:
+                vinculos.append(ContaMunicipe(municipe_id=proximo_id, conta_id=rng.choice(contas).id))
+            proximo_id += 1
+        Municipe.objects.bulk_create(lote)
+        ContaMunicipe.objects.bulk_create(vinculos)
+        # Os vínculos em lote não disparam o m2m_changed que mantém a visibilidade
+        atualizar_visibilidade_municipes([vinculo.municipe_id for vinculo in vinculos])
+        gerados += len(lote)
+    return gerados
+
+
+# Tabelas limpas pelo `remover_municipes_sinteticos`, das dependentes para o Munícipe.
+TABELAS_DOS_SINTETICOS = (
+    (Municipe.contas.through, 'municipe_id'),
+    (MunicipeToken, 'municipe_id'),
+    (MunicipeContato, 'municipe_id'),
+    (MunicipeVisibilidade, 'municipe_id'),
+    (Municipe, 'id'),
+)
+
+
+def remover_municipes_sinteticos(primeiro_id):
+    """
+    Apaga os munícipes sintéticos (IDs a partir de `primeiro_id`) com DELETEs
+    diretos: pelo ORM seriam carregados um a um para os sinais de post_delete.
+    """
+    from . import cache_busca, typeahead
+
+    q = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for modelo, coluna in TABELAS_DOS_SINTETICOS:
+            cursor.execute(f'DELETE FROM {q(modelo._meta.db_table)} WHERE {q(coluna)} >= %s', [primeiro_id])
+    Conta.objects.filter(nome__startswith=f'{PREFIXO_CONTAS} ').delete()
+    typeahead.invalidar()
+    cache_busca.invalidar()
+
+
+def medir(funcao, repeticoes=20):
+    """Executa `funcao` várias vezes e devolve (mediana, p95) em milissegundos."""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    p95 = tempos[min(len(tempos) - 1, int(round(0.95 * (len(tempos) - 1))))]
+    return statistics.median(tempos), p95
+
+
+class ContadorConsultas:
+    """
+    Conta as queries executadas em todas as threads enquanto estiver ativo,
+    inclusive nas conexões abertas pelas threads da busca global.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.total += 1
+        return execute(sql, params, many, context)
+
+    def _conexao_criada(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        self.total = 0
+        connection_created.connect(self._conexao_criada)
+        for conexao in connections.all(initialized_only=True):
+            conexao.execute_wrappers.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._conexao_criada)
+        for conexao in connections.all(initialized_only=True):
+            if self in conexao.execute_wrappers:
+                conexao.execute_wrappers.remove(self)
+
+
+def _casa_variante(tokens, variante):
+    return all(any(token.startswith(palavra) for token in tokens) for palavra in variante)
+
+
+def relevantes_por_consulta(consultas):
+    """
+    Gabarito do recall: varre os nomes do banco uma vez e devolve, para cada
+    consulta (pelo índice na lista), os IDs relevantes.
+    """
+    variantes = [
+        [sorted(tokens_dos_nomes(texto)) for texto in consulta[3]]
+        for consulta in consultas
+    ]
+    relevantes = defaultdict(set)
+    municipes = Municipe.objects.order_by().values_list('id', 'nome_completo', 'nome_de_guerra')
+    for municipe_id, nome_completo, nome_de_guerra in municipes.iterator(chunk_size=5000):
+        tokens = tokens_dos_nomes(nome_completo, nome_de_guerra)
+        for indice, opcoes in enumerate(variantes):
+            if any(_casa_variante(tokens, variante) for variante in opcoes):
+                relevantes[indice].add(municipe_id)
+    return relevantes
+
+
+def recall(encontrados, relevantes, limite):
+    """Fração dos relevantes que voltou, limitada ao que cabia na resposta (recall@limite)."""
+    if not relevantes:
+        return None
+    return len(set(encontrados) & relevantes) / min(len(relevantes), limite)
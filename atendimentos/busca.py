@@ -0,0 +1,293 @@
+"""
+Índices de busca de Munícipes.
+
+Os nomes são quebrados em palavras normalizadas (sem acentos, minúsculas, sem
+pontuação e sem preposições) e gravados na tabela MunicipeToken. As buscas por
+nome viram interseções de consultas indexadas nessa tabela, em vez de cadeias
+de `icontains` que obrigam o banco a varrer a tabela de munícipes inteira.
+
+Telefones e e-mails são espelhados em MunicipeContato (só dígitos / minúsculas),
+para que as buscas exatas não dependam de `contains` nos JSONFields. O CPF tem a
+coluna indexada `Municipe.cpf_digitos`, sem a formatação.
+
+Cada token guarda também uma chave fonética (ver `chave_fonetica`), usada pelas
+buscas com `fuzzy=1` para achar grafias diferentes do mesmo nome.
+
+As contas vinculadas são espelhadas em MunicipeVisibilidade (conta 0 para os
+públicos), que resolve o filtro de visibilidade sem JOIN nem DISTINCT.
+"""
+import re
+import string
+import unicodedata
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Municipe, MunicipeContato, MunicipeToken, MunicipeVisibilidade
+
+try:
+    from unidecode import unidecode
+except ImportError:
+    def unidecode(texto):
+        # Fallback sem a biblioteca: remove apenas os acentos (suficiente para nomes em português).
+        return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+
+# Palavras a serem ignoradas (artigos, preposições, etc.)
+PALAVRAS_IGNORADAS = {'de', 'da', 'do', 'dos', 'das', 'e'}
+
+TAMANHO_MAXIMO_TOKEN = MunicipeToken._meta.get_field('token').max_length
+
+# Caracteres possíveis num token (ver normalizar_nome_para_conjunto), na ordem das collations
+ALFABETO_TOKEN = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+TAMANHO_LOTE = 1000
+
+# Termos de busca com cara de CPF: só dígitos, pontos, hífen e espaços.
+PADRAO_CPF = re.compile(r'^[\d.\-\s]+$')
+TAMANHO_MINIMO_PREFIXO_CPF = 3
+
+
+def normalizar_nome_para_conjunto(nome):
+    """
+    Transforma um nome em um conjunto de palavras-chave.
+    Ex: "Glaucia Cristina M. Coutinho" -> {'glaucia', 'cristina', 'm', 'coutinho'}
+    """
+    if not nome:
+        return set()
+
+    # Remove acentos e converte para minúsculas
+    nome_sem_acentos = unidecode(nome).lower()
+
+    # Remove caracteres que não sejam letras, números ou espaços
+    nome_limpo = re.sub(r'[^a-z0-9\s]', '', nome_sem_acentos)
+
+    # Divide o nome em palavras e remove as ignoradas
+    return {palavra for palavra in nome_limpo.split() if palavra not in PALAVRAS_IGNORADAS}
+
+
+# Regras da chave fonética, aplicadas em ordem sobre o token já normalizado
+# (minúsculo, sem acentos). Inspiradas no BuscaBR, mas mantendo as vogais para
+# não juntar nomes curtos demais.
+REGRAS_FONETICAS = [
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'lh'), 'l'),
+    (re.compile(r'nh'), 'n'),
+    (re.compile(r'ch|sh'), 'x'),
+    (re.compile(r'[sx]c(?=[ei])'), 's'),                     # nascimento, excelência
+    (re.compile(r'c(?=[ei])'), 's'),                         # Cecília / Sesília
+    (re.compile(r'qu(?=[ei])|ck|c|q'), 'k'),                 # Kátia / Cátia, Henrique
+    (re.compile(r'g(u?)(?=[ei])'), lambda m: 'g' if m.group(1) else 'j'),  # Guilherme; Gessica / Jessica
+    (re.compile(r'w'), 'v'),                                 # Wagner / Vagner
+    (re.compile(r'y'), 'i'),                                 # Yara / Iara
+    (re.compile(r'z'), 's'),                                 # Luiz / Luis, Souza / Sousa
+    (re.compile(r'h'), ''),                                  # Thiago / Tiago, Henrique / Enrique
+    (re.compile(r'm(?=[^aeiou]|$)'), 'n'),                   # Campos / Canpos, Adam / Adan
+    (re.compile(r'e'), 'i'),                                 # Felipe / Filipe (vogais átonas)
+    (re.compile(r'o'), 'u'),                                 # Rodrigo / Rodrigu
+    (re.compile(r'(.)\1+'), r'\1'),                          # letras dobradas: Anna / Ana
+]
+
+
+def chave_fonetica(token):
+    """
+    Chave fonética (português do Brasil) de um token normalizado:
+    'luiz' e 'luis' -> 'luis'; 'thiago' e 'tiago' -> 'tiagu'; 'souza' e 'sousa' -> 'susa'.
+    Tokens com dígitos são devolvidos sem alteração.
+    """
+    if not token or not token.isalpha():
+        return token
+    for padrao, substituto in REGRAS_FONETICAS:
+        token = padrao.sub(substituto, token)
+    return token[:TAMANHO_MAXIMO_TOKEN]
+
+
+def tokens_dos_nomes(nome_completo, nome_de_guerra=None):
+    """Tokens indexados de um munícipe: nome completo + nome de guerra."""
+    tokens = normalizar_nome_para_conjunto(nome_completo) | normalizar_nome_para_conjunto(nome_de_guerra)
+    return {token[:TAMANHO_MAXIMO_TOKEN] for token in tokens}
+
+
+def tokens_do_municipe(municipe):
+    return tokens_dos_nomes(municipe.nome_completo, municipe.nome_de_guerra)
+
+
+def normalizar_telefone(numero):
+    """Só os dígitos, sem o DDI 55: '(11) 99999-0001' e '+55 11 999990001' viram '11999990001'."""
+    digitos = re.sub(r'\D', '', str(numero or ''))
+    if len(digitos) in (12, 13) and digitos.startswith('55'):
+        digitos = digitos[2:]
+    return digitos
+
+
+def normalizar_email(email):
+    return str(email or '').strip().lower()
+
+
+def contatos_dos_campos(emails, telefones):
+    """
+    Lista de (tipo, valor_normalizado, principal) a partir dos JSONFields.
+    O primeiro item de cada lista é o principal; valores repetidos são ignorados.
+    """
+    contatos = []
+    for tipo, itens, chave, normalizar in (
+        ('email', emails, 'email', normalizar_email),
+        ('telefone', telefones, 'numero', normalizar_telefone),
+    ):
+        vistos = set()
+        for item in itens if isinstance(itens, list) else []:
+            if not isinstance(item, dict):
+                continue
+            valor = normalizar(item.get(chave))[:255]
+            if valor and valor not in vistos:
+                contatos.append((tipo, valor, not vistos))
+                vistos.add(valor)
+    return contatos
+
+
+def atualizar_indices_municipes(municipes):
+    """
+    Reconstrói os tokens de nome e os contatos normalizados dos munícipes informados.
+    Aceita uma lista ou um queryset; processa em lotes para suportar cargas grandes.
+    """
+    lote = []
+    for municipe in municipes:
+        lote.append(municipe)
+        if len(lote) >= TAMANHO_LOTE:
+            _gravar_lote(lote)
+            lote = []
+    if lote:
+        _gravar_lote(lote)
+
+
+def _gravar_lote(municipes):
+    ids = [m.pk for m in municipes]
+    MunicipeToken.objects.filter(municipe_id__in=ids).delete()
+    MunicipeToken.objects.bulk_create(
+        [
+            MunicipeToken(municipe_id=m.pk, token=token, fonetica=chave_fonetica(token))
+            for m in municipes for token in tokens_do_municipe(m)
+        ],
+        batch_size=TAMANHO_LOTE
+    )
+    MunicipeContato.objects.filter(municipe_id__in=ids).delete()
+    MunicipeContato.objects.bulk_create(
+        [
+            MunicipeContato(municipe_id=m.pk, tipo=tipo, valor=valor, principal=principal)
+            for m in municipes for tipo, valor, principal in contatos_dos_campos(m.emails, m.telefones)
+        ],
+        batch_size=TAMANHO_LOTE
+    )
+
+
+def atualizar_visibilidade_municipes(municipes_ids):
+    """Regrava as linhas de MunicipeVisibilidade dos munícipes informados a partir do M2M `contas`."""
+    municipes_ids = list(municipes_ids)
+    ContaMunicipe = Municipe.contas.through
+    for inicio in range(0, len(municipes_ids), TAMANHO_LOTE):
+        lote = municipes_ids[inicio:inicio + TAMANHO_LOTE]
+        contas = defaultdict(set)
+        for municipe_id, conta_id in ContaMunicipe.objects.filter(municipe_id__in=lote).values_list('municipe_id', 'conta_id'):
+            contas[municipe_id].add(conta_id)
+        MunicipeVisibilidade.objects.filter(municipe_id__in=lote).delete()
+        MunicipeVisibilidade.objects.bulk_create(
+            [
+                MunicipeVisibilidade(municipe_id=municipe_id, conta_id=conta_id)
+                for municipe_id in lote
+                for conta_id in (contas[municipe_id] or {MunicipeVisibilidade.CONTA_PUBLICO})
+            ],
+            batch_size=TAMANHO_LOTE
+        )
+
+
+def normalizar_cpf(cpf):
+    """Só os dígitos do CPF ('123.456.789-00' -> '12345678900'); None se não houver nenhum."""
+    digitos = re.sub(r'\D', '', str(cpf or ''))[:11]
+    return digitos or None
+
+
+def filtro_cpf(termo_busca):
+    """
+    Filtro indexado por CPF para termos com cara de CPF, formatados ou não:
+    CPF completo (11 dígitos) vira busca exata, trechos iniciais viram busca por
+    prefixo em `cpf_digitos`. Retorna None para termos que não parecem CPF.
+    """
+    termo_busca = str(termo_busca or '').strip()
+    if not PADRAO_CPF.match(termo_busca):
+        return None
+    digitos = re.sub(r'\D', '', termo_busca)
+    if len(digitos) == 11:
+        return Q(cpf_digitos=digitos)
+    if TAMANHO_MINIMO_PREFIXO_CPF <= len(digitos) < 11:
+        # Intervalo só com dígitos ('129' -> '13'), válido em qualquer collation
+        return intervalo_prefixo('cpf_digitos', digitos, alfabeto=string.digits)
+    return None
+
+
+def filtro_contato(tipo, valor):
+    """Filtro exato e indexado por telefone ou e-mail; None se o valor normalizado ficar vazio."""
+    valor = normalizar_telefone(valor) if tipo == 'telefone' else normalizar_email(valor)
+    if not valor:
+        return None
+    return Q(id__in=MunicipeContato.objects.filter(tipo=tipo, valor=valor).values('municipe_id'))
+
+
+def filtro_nome_por_tokens(termo_busca):
+    """
+    Monta o filtro de nome para um termo com várias palavras: cada palavra precisa
+    ser o início de algum token do munícipe (interseção de subconsultas indexadas).
+    Retorna None quando o termo não tem nenhuma palavra pesquisável.
+    """
+    palavras = normalizar_nome_para_conjunto(termo_busca)
+    if not palavras:
+        return None
+
+    filtro = Q()
+    for palavra in sorted(palavras, key=len, reverse=True):
+        filtro &= Q(id__in=MunicipeToken.objects.filter(filtro_prefixo_token(palavra)).values('municipe_id'))
+    return filtro
+
+
+def filtro_nome_fonetico(termo_busca):
+    """
+    Filtro de nome tolerante a grafia (`fuzzy=1`): cada palavra precisa ter a
+    mesma chave fonética de algum token do munícipe. Usa o índice
+    (fonetica, municipe); None quando o termo não tem palavras pesquisáveis.
+    """
+    palavras = normalizar_nome_para_conjunto(termo_busca)
+    if not palavras:
+        return None
+
+    filtro = Q()
+    for chave in sorted({chave_fonetica(palavra[:TAMANHO_MAXIMO_TOKEN]) for palavra in palavras}, key=len, reverse=True):
+        filtro &= Q(id__in=MunicipeToken.objects.filter(fonetica=chave).values('municipe_id'))
+    return filtro
+
+
+def filtro_prefixo_token(prefixo):
+    """
+    Prefixo como intervalo [prefixo, prefixo_seguinte) em vez de LIKE 'prefixo%':
+    o LIKE do SQLite (com o ESCAPE do Django) não usa índice, já o intervalo
+    vira um range scan no índice (token, municipe). Ver intervalo_prefixo.
+    """
+    return intervalo_prefixo('token', prefixo[:TAMANHO_MAXIMO_TOKEN])
+
+
+def intervalo_prefixo(campo, prefixo, alfabeto=ALFABETO_TOKEN):
+    """
+    Q de `campo` começando com `prefixo` (só caracteres de `alfabeto`) como
+    intervalo indexável. O limite superior também só usa caracteres do
+    alfabeto ('souz' -> 'sov', '129' -> '12a'), então o intervalo vale em
+    qualquer collation que ordene dígitos e letras na ordem usual, inclusive a
+    padrão do MySQL 8 (utf8mb4_0900_ai_ci), que põe a pontuação antes deles:
+    lá o "próximo caractere" ASCII ('{' depois de 'z', ':' depois de '9')
+    deixaria o intervalo vazio.
+    """
+    seguinte = prefixo.rstrip(alfabeto[-1])
+    if not seguinte:
+        # Só o último caractere do alfabeto ('zz'): não há limite superior
+        return Q(**{f'{campo}__gte': prefixo})
+    seguinte = seguinte[:-1] + alfabeto[alfabeto.index(seguinte[-1]) + 1]
+    return Q(**{f'{campo}__gte': prefixo, f'{campo}__lt': seguinte})
+
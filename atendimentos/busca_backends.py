@@ -0,0 +1,240 @@
+"""
+Backends de busca textual.
+
+Os caminhos de busca de Munícipe, Atendimento, Ofício, Evento e Lembrete não montam mais os
+próprios `icontains`: chamam `buscar()`, que delega para o backend configurado
+em settings.SIGA_BUSCA['BACKEND'] e devolve o queryset filtrado e ordenado por
+relevância (anotação `relevancia`).
+
+- BackendMySQLFullText: MATCH ... AGAINST em índices FULLTEXT (produção);
+  Munícipe continua no índice de tokens.
+- BackendSQLiteFTS5: tabelas virtuais FTS5 com bm25 (desenvolvimento local).
+- BackendPadrao: índice de tokens para Munícipe e `icontains` para o resto;
+  funciona em qualquer banco e é o fallback para palavras curtas.
+
+Os índices (FULLTEXT ou FTS5) são criados pelas migrações (DDL congelada em
+atendimentos/migrations/_indice_textual.py), com as mesmas colunas declaradas
+em INDICES_BUSCA.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When, Exists, OuterRef
+from django.db.models.expressions import RawSQL
+from django.db.models.fields import BooleanField
+from django.db.models.functions import Coalesce
+from django.utils.module_loading import import_string
+
+from .busca import normalizar_nome_para_conjunto, filtro_nome_por_tokens, TAMANHO_MAXIMO_TOKEN
+
+
+# Colunas indexadas por modelo. A ordem importa: no MySQL o MATCH precisa citar
+# exatamente as colunas do índice FULLTEXT.
+INDICES_BUSCA = {
+    'atendimentos.Municipe': ('nome_completo', 'nome_de_guerra'),
+    'atendimentos.Atendimento': ('titulo', 'descricao'),
+    'oficios.Oficio': ('assunto', 'destinatario_nome', 'destinatario_orgao', 'corpo'),
+    'eventos.Evento': ('nome', 'local', 'descricao'),
+    'atendimentos.Lembrete': ('titulo', 'conteudo'),
+}
+
+CONFIGURACAO_PADRAO = {
+    'BACKEND': 'auto',
+    'LIMITE_RESULTADOS': 100,
+    'LIMITE_MAXIMO': 500,
+}
+
+
+def configuracao_busca():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_BUSCA', {})}
+
+
+def nome_indice_textual(tabela):
+    return f'busca_{tabela}'
+
+
+def colunas_do_modelo(modelo):
+    return INDICES_BUSCA[modelo._meta.label]
+
+
+# -----------------------------------------------------------------------------
+# Backends
+# -----------------------------------------------------------------------------
+
+class BackendPadrao:
+    """
+    Busca sem índice textual do banco: Munícipe usa o índice de tokens
+    (MunicipeToken) e os demais modelos um `icontains` por palavra.
+    A relevância conta as palavras que são um token inteiro do munícipe (e não
+    só prefixo) ou, nos demais modelos, que aparecem no primeiro campo indexado.
+    """
+
+    def palavras(self, termo):
+        return sorted(normalizar_nome_para_conjunto(termo), key=len, reverse=True)
+
+    def filtro(self, modelo, palavras):
+        if not palavras:
+            return None
+        if modelo._meta.label == 'atendimentos.Municipe':
+            return filtro_nome_por_tokens(' '.join(palavras))
+        filtro = Q()
+        for palavra in palavras:
+            filtro_palavra = Q()
+            for coluna in colunas_do_modelo(modelo):
+                filtro_palavra |= Q(**{f'{coluna}__icontains': palavra})
+            filtro &= filtro_palavra
+        return filtro
+
+    def relevancia(self, modelo, palavras):
+        if not palavras:
+            return Value(0.0)
+        if modelo._meta.label == 'atendimentos.Municipe':
+            from .models import MunicipeToken
+            # Palavra inteira vale mais que prefixo: 1 ponto por token idêntico
+            pontos = [
+                Case(
+                    When(Exists(MunicipeToken.objects.filter(
+                        municipe=OuterRef('pk'), token=palavra[:TAMANHO_MAXIMO_TOKEN]
+                    )), then=Value(1.0)),
+                    default=Value(0.0), output_field=FloatField()
+                )
+                for palavra in palavras
+            ]
+        else:
+            principal = colunas_do_modelo(modelo)[0]
+            pontos = [
+                Case(
+                    When(**{f'{principal}__icontains': palavra, 'then': Value(1.0)}),
+                    default=Value(0.0), output_field=FloatField()
+                )
+                for palavra in palavras
+            ]
+        total = pontos[0]
+        for ponto in pontos[1:]:
+            total = total + ponto
+        return total
+
+    def buscar(self, queryset, termo, outros_campos=None, limite=None):
+        modelo = queryset.model
+        palavras = self.palavras(termo)
+
+        filtro = self.filtro(modelo, palavras)
+        if outros_campos is not None:
+            filtro = outros_campos if filtro is None else filtro | outros_campos
+        if filtro is None:
+            return queryset.none()
+
+        resultados = queryset.filter(filtro).annotate(
+            relevancia=Coalesce(self.relevancia(modelo, palavras), Value(0.0), output_field=FloatField())
+        ).order_by('-relevancia', *modelo._meta.ordering)
+        return resultados[:limite] if limite else resultados
+
+
+class BackendMySQLFullText(BackendPadrao):
+    """
+    MATCH ... AGAINST em modo booleano: todas as palavras são obrigatórias e
+    casam por prefixo (`+joao* +silva*`). A relevância é o próprio score do MySQL.
+    Palavras menores que innodb_ft_min_token_size (3 por padrão) são ignoradas
+    pelo FULLTEXT, então elas caem no filtro do BackendPadrao.
+
+    Munícipe fica no índice de tokens do BackendPadrao: ele já é um range scan
+    indexado, e o FULLTEXT mudaria os resultados (descarta as stopwords do
+    InnoDB e segue o innodb_ft_min_token_size em vez das regras dos tokens).
+    """
+    TAMANHO_MINIMO_PALAVRA = 3
+    MODELOS_COM_TOKENS = {'atendimentos.Municipe'}
+
+    def _separar(self, palavras):
+        longas = [p for p in palavras if len(p) >= self.TAMANHO_MINIMO_PALAVRA]
+        curtas = [p for p in palavras if len(p) < self.TAMANHO_MINIMO_PALAVRA]
+        return longas, curtas
+
+    def _match(self, modelo, palavras, output_field):
+        q = connections['default'].ops.quote_name
+        tabela = modelo._meta.db_table
+        colunas = ', '.join(f'{q(tabela)}.{q(c)}' for c in colunas_do_modelo(modelo))
+        expressao = ' '.join(f'+{palavra}*' for palavra in palavras)
+        return RawSQL(f"MATCH ({colunas}) AGAINST (%s IN BOOLEAN MODE)", [expressao], output_field=output_field)
+
+    def filtro(self, modelo, palavras):
+        if modelo._meta.label in self.MODELOS_COM_TOKENS:
+            return super().filtro(modelo, palavras)
+        longas, curtas = self._separar(palavras)
+        filtro_curtas = super().filtro(modelo, curtas)
+        if not longas:
+            return filtro_curtas
+        filtro = Q(self._match(modelo, longas, BooleanField()))
+        return filtro if filtro_curtas is None else filtro & filtro_curtas
+
+    def relevancia(self, modelo, palavras):
+        if modelo._meta.label in self.MODELOS_COM_TOKENS:
+            return super().relevancia(modelo, palavras)
+        longas, curtas = self._separar(palavras)
+        if not longas:
+            return super().relevancia(modelo, curtas)
+        return self._match(modelo, longas, FloatField())
+
+
+class BackendSQLiteFTS5(BackendPadrao):
+    """
+    Tabelas virtuais FTS5 (conteúdo externo, sem acentos) criadas pelas
+    migrações. A relevância é o bm25 invertido (quanto maior, melhor), para
+    manter o mesmo sentido de ordenação do MySQL.
+    """
+
+    def _expressao(self, palavras):
+        return ' AND '.join(f'"{palavra}"*' for palavra in palavras)
+
+    def filtro(self, modelo, palavras):
+        if not palavras:
+            return None
+        indice = nome_indice_textual(modelo._meta.db_table)
+        return Q(id__in=RawSQL(
+            f'SELECT rowid FROM "{indice}" WHERE "{indice}" MATCH %s', [self._expressao(palavras)]
+        ))
+
+    def relevancia(self, modelo, palavras):
+        if not palavras:
+            return Value(0.0)
+        tabela = modelo._meta.db_table
+        indice = nome_indice_textual(tabela)
+        return RawSQL(
+            f'SELECT -bm25("{indice}") FROM "{indice}" '
+            f'WHERE "{indice}" MATCH %s AND "{indice}".rowid = "{tabela}"."id"',
+            [self._expressao(palavras)], output_field=FloatField()
+        )
+
+
+BACKENDS_POR_BANCO = {
+    'mysql': BackendMySQLFullText,
+    'sqlite': BackendSQLiteFTS5,
+}
+
+
+def obter_backend(alias='default'):
+    caminho = configuracao_busca()['BACKEND']
+    if caminho == 'auto':
+        return BACKENDS_POR_BANCO.get(connections[alias].vendor, BackendPadrao)()
+    return import_string(caminho)()
+
+
+def limite_resultados(request):
+    """Limite de resultados da busca: `?limite=` na URL, respeitando o máximo configurado."""
+    configuracao = configuracao_busca()
+    try:
+        limite = int(request.query_params.get('limite', configuracao['LIMITE_RESULTADOS']))
+    except (TypeError, ValueError):
+        limite = configuracao['LIMITE_RESULTADOS']
+    return max(1, min(limite, configuracao['LIMITE_MAXIMO']))
+
+
+def busca_aproximada(request):
+    """`?fuzzy=1`: inclui nomes com a mesma pronúncia (chave fonética dos tokens)."""
+    return request.query_params.get('fuzzy', '').lower() in ('1', 'true')
+
+
+def buscar(queryset, termo, outros_campos=None, limite=None):
+    """
+    Filtra `queryset` pelo termo no índice textual do modelo (mais o filtro
+    opcional `outros_campos`, combinado com "OU") e ordena por relevância.
+    """
+    return obter_backend(queryset.db).buscar(queryset, termo, outros_campos=outros_campos, limite=limite)
@@ -0,0 +1,281 @@
+"""
+Motor da busca global (BuscaGlobalView).
+
+Cada tipo de entidade é uma "fonte" consultada em paralelo, num pool de
+threads compartilhado pelo processo (no máximo MAX_THREADS), com um orçamento
+de tempo: a fonte que estourar o orçamento fica de fora da resposta em vez de
+segurar as demais. No MySQL o mesmo orçamento vai para o banco
+(MAX_EXECUTION_TIME), que interrompe a consulta em vez de deixá-la ocupando
+a thread. Os resultados de todas as fontes são mesclados num ranking único.
+
+Pontuação de cada resultado (0 a ~1, multiplicada pelo peso da fonte):
+- metade vem da relevância do backend de busca, normalizada pela maior da fonte;
+- metade vem da posição dentro da fonte (1, 1/2, 1/3...), para que fontes
+  com escalas de relevância diferentes (bm25, MATCH, contagem) sejam comparáveis.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Q
+
+from eventos.models import Evento
+from oficios.models import Oficio
+
+from .busca import filtro_cpf
+from .busca_backends import buscar, limite_resultados
+from .models import Atendimento, Lembrete, Municipe
+from .permissions import contexto_autorizacao
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACAO_PADRAO = {
+    'ORCAMENTO_MS': 1500,
+    'ORCAMENTO_POR_FONTE_MS': {},
+    'MAX_THREADS': 8,
+}
+
+
+def configuracao_busca_global():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_BUSCA_GLOBAL', {})}
+
+
+class ContextoBusca:
+    """Dados do usuário resolvidos uma vez, na thread da requisição, e lidos pelas fontes."""
+
+    def __init__(self, request):
+        user = request.user
+        self.user = user
+        self.request = request
+        autorizacao = contexto_autorizacao(user)
+        self.tem_perfil = autorizacao.tem_perfil
+        self.contas_ids = list(autorizacao.contas_ids or [])
+        self.grupos = autorizacao.grupos
+        self.pode_gerenciar_oficios = autorizacao.tem_permissao('oficios.pode_gerenciar_oficios')
+        self.pode_gerenciar_eventos = autorizacao.tem_permissao('eventos.pode_gerenciar_eventos')
+        self.limite = limite_resultados(request)
+
+
+class FonteBusca:
+    tipo = None
+    peso = 1.0
+    limite = 10
+
+    def permitida(self, contexto):
+        return True
+
+    def buscar(self, contexto, termo_busca):
+        raise NotImplementedError
+
+    def resultado(self, obj, texto_principal, texto_secundario, url):
+        return {
+            'tipo': self.tipo, 'id': obj.id,
+            'texto_principal': texto_principal,
+            'texto_secundario': texto_secundario or '',
+            'url': url,
+            'relevancia': getattr(obj, 'relevancia', 0.0) or 0.0,
+        }
+
+
+class FonteAtendimentos(FonteBusca):
+    tipo = 'atendimento'
+    limite = 5
+
+    def permitida(self, contexto):
+        return 'Recepção' not in contexto.grupos
+
+    def buscar(self, contexto, termo_busca):
+        atendimento_qs = Atendimento.objects.all()
+        if not contexto.user.is_superuser:
+            if not contexto.tem_perfil:
+                return []
+            atendimento_qs = atendimento_qs.filter(conta__in=contexto.contas_ids).filter(
+                Q(responsavel=contexto.user) | Q(responsavel__isnull=True)
+            )
+        encontrados = buscar(atendimento_qs, termo_busca, outros_campos=Q(protocolo__icontains=termo_busca), limite=self.limite)
+        return [
+            self.resultado(atendimento, f"Protocolo {atendimento.protocolo}", atendimento.titulo, f"/atendimentos/{atendimento.id}")
+            for atendimento in encontrados
+        ]
+
+
+class FonteMunicipes(FonteBusca):
+    tipo = 'municipe'
+
+    def buscar(self, contexto, termo_busca):
+        if contexto.user.is_superuser:
+            municipe_qs = Municipe.objects.all()
+        elif contexto.tem_perfil:
+            municipe_qs = Municipe.objects.visiveis_para_contas(contexto.contas_ids, incluir_publicos=False)
+            # Recepção busca APENAS contatos da categoria 'Munícipe'.
+            if 'Recepção' in contexto.grupos:
+                municipe_qs = municipe_qs.filter(categoria__nome='MUNÍCIPE')
+        else:
+            return []
+
+        # A busca por CPF (coluna indexada cpf_digitos) é unida à busca por nome com um "OU"
+        encontrados = buscar(municipe_qs, termo_busca, outros_campos=filtro_cpf(termo_busca), limite=contexto.limite)
+        return [
+            self.resultado(municipe, municipe.nome_completo, f"CPF: {municipe.cpf or 'Não informado'}", f"/municipes/{municipe.id}/historico")
+            for municipe in encontrados
+        ]
+
+
+class FonteOficios(FonteBusca):
+    tipo = 'oficio'
+    peso = 0.9
+
+    def permitida(self, contexto):
+        return contexto.pode_gerenciar_oficios
+
+    def buscar(self, contexto, termo_busca):
+        if contexto.user.is_superuser:
+            oficio_qs = Oficio.objects.all()
+        elif contexto.tem_perfil:
+            oficio_qs = Oficio.objects.filter(conta__in=contexto.contas_ids)
+        else:
+            return []
+        encontrados = buscar(oficio_qs, termo_busca, outros_campos=Q(numero__icontains=termo_busca), limite=self.limite)
+        return [
+            self.resultado(oficio, f"Ofício {oficio.numero}", oficio.assunto, f"/oficios/{oficio.id}")
+            for oficio in encontrados
+        ]
+
+
+class FonteEventos(FonteBusca):
+    tipo = 'evento'
+    peso = 0.8
+
+    def permitida(self, contexto):
+        return contexto.pode_gerenciar_eventos
+
+    def buscar(self, contexto, termo_busca):
+        if contexto.user.is_superuser:
+            evento_qs = Evento.objects.all()
+        elif contexto.contas_ids:
+            evento_qs = Evento.objects.filter(conta__in=contexto.contas_ids)
+        else:
+            return []
+        encontrados = buscar(evento_qs, termo_busca, limite=self.limite)
+        return [
+            self.resultado(evento, evento.nome, f"{evento.data_evento.strftime('%d/%m/%Y')} - {evento.local}", f"/eventos/{evento.id}")
+            for evento in encontrados
+        ]
+
+
+class FonteLembretes(FonteBusca):
+    tipo = 'lembrete'
+    peso = 0.7
+
+    def permitida(self, contexto):
+        # Mesma regra de CanManageLembretes
+        return contexto.user.is_superuser or 'Secretária' in contexto.grupos
+
+    def buscar(self, contexto, termo_busca):
+        if contexto.user.is_superuser:
+            lembrete_qs = Lembrete.objects.all()
+        elif contexto.tem_perfil:
+            lembrete_qs = Lembrete.objects.filter(conta__in=contexto.contas_ids)
+        else:
+            return []
+        encontrados = buscar(lembrete_qs, termo_busca, limite=self.limite)
+        return [
+            self.resultado(lembrete, lembrete.titulo, (lembrete.conteudo or '')[:120], f"/lembretes/{lembrete.id}")
+            for lembrete in encontrados
+        ]
+
+
+FONTES = [FonteAtendimentos(), FonteMunicipes(), FonteOficios(), FonteEventos(), FonteLembretes()]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obter_executor():
+    """Pool único do processo: a busca global não cria threads por requisição."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=configuracao_busca_global()['MAX_THREADS'], thread_name_prefix='busca-global'
+                )
+    return _executor
+
+
+def _limitar_tempo_no_banco(tempo_ms):
+    """No MySQL, encerra no próprio banco os SELECTs desta conexão que passarem de `tempo_ms`."""
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET SESSION MAX_EXECUTION_TIME = %s', [max(1, int(tempo_ms))])
+
+
+def _executar_fonte(fonte, contexto, termo_busca, limite_tempo):
+    inicio = time.perf_counter()
+    restante_ms = (limite_tempo - inicio) * 1000
+    if restante_ms <= 0:
+        # Ficou na fila do pool além do orçamento: a resposta já saiu sem esta fonte
+        return None, 0.0
+    try:
+        _limitar_tempo_no_banco(restante_ms)
+        return fonte.buscar(contexto, termo_busca), (time.perf_counter() - inicio) * 1000
+    finally:
+        # A conexão da thread é fechada ao terminar: leva junto o MAX_EXECUTION_TIME da sessão.
+        connections.close_all()
+
+
+def pontuar(resultados_por_fonte):
+    """Mescla os resultados de todas as fontes num ranking único (ver docstring do módulo)."""
+    mesclados = []
+    for fonte, resultados in resultados_por_fonte:
+        maior = max((r['relevancia'] for r in resultados), default=0.0)
+        for posicao, resultado in enumerate(resultados):
+            relevancia = resultado['relevancia'] / maior if maior > 0 else 0.0
+            resultado['relevancia'] = round(fonte.peso * (0.5 * relevancia + 0.5 / (posicao + 1)), 4)
+            mesclados.append(resultado)
+    mesclados.sort(key=lambda r: r['relevancia'], reverse=True)
+    return mesclados
+
+
+def busca_global(request, termo_busca, fontes=None):
+    """
+    Executa a busca em todas as fontes permitidas ao usuário.
+    Retorna (resultados, meta), onde meta traz status, tempo e total por fonte.
+    """
+    configuracao = configuracao_busca_global()
+    contexto = ContextoBusca(request)
+    fontes = [fonte for fonte in (fontes or FONTES) if fonte.permitida(contexto)]
+
+    inicio = time.perf_counter()
+    executor = _obter_executor()
+    futuros = []
+    for fonte in fontes:
+        orcamento = configuracao['ORCAMENTO_POR_FONTE_MS'].get(fonte.tipo, configuracao['ORCAMENTO_MS']) / 1000
+        futuros.append((fonte, orcamento, executor.submit(_executar_fonte, fonte, contexto, termo_busca, inicio + orcamento)))
+
+    meta = {'fontes': {}}
+    resultados_por_fonte = []
+    for fonte, orcamento, futuro in futuros:
+        restante = max(0.0, inicio + orcamento - time.perf_counter())
+        try:
+            resultados, tempo_ms = futuro.result(timeout=restante)
+        except FuturesTimeoutError:
+            resultados = None
+        except Exception:
+            logger.exception("Erro na fonte '%s' da busca global.", fonte.tipo)
+            meta['fontes'][fonte.tipo] = {'status': 'erro', 'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1), 'total': 0}
+            continue
+        if resultados is None:
+            # Não espera a fonte: se ainda estiver na fila, sai dela; se já começou, o banco a interrompe.
+            futuro.cancel()
+            meta['fontes'][fonte.tipo] = {'status': 'tempo_esgotado', 'tempo_ms': round(orcamento * 1000, 1), 'total': 0}
+            continue
+        meta['fontes'][fonte.tipo] = {'status': 'ok', 'tempo_ms': round(tempo_ms, 1), 'total': len(resultados)}
+        resultados_por_fonte.append((fonte, resultados))
+
+    meta['tempo_total_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    return pontuar(resultados_por_fonte), meta
@@ -0,0 +1,137 @@
+"""
+Cache de resultados das buscas de Munícipes (listagem com `?q=` e autocomplete).
+
+A chave de cada resultado combina o termo normalizado e os demais parâmetros da
+URL, o escopo de visibilidade de quem buscou (contas e grupos, que mudam o que
+aparece e o `pode_editar`) e a versão global dos dados de munícipes. Qualquer
+alteração (save, delete, mescla, contas vinculadas, categorias) incrementa essa
+versão pelos sinais: as entradas antigas deixam de ser alcançadas e expiram
+sozinhas pelo TTL, sem varrer nem apagar chaves.
+
+Os contadores de acertos e falhas ficam no próprio cache do Django e são
+expostos em /api/municipes/cache-busca/.
+
+Como a versão vive no cache do Django, o cache de buscas só é seguro com um
+cache compartilhado entre os workers (SIGA_CACHE_REDIS_URL): é o único caso em
+que ele vem ligado por padrão (SIGA_CACHE_BUSCA em core/settings.py).
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .permissions import contexto_autorizacao
+
+CHAVE_VERSAO = 'siga:busca_municipes:versao'
+CHAVE_ACERTOS = 'siga:busca_municipes:acertos'
+CHAVE_FALHAS = 'siga:busca_municipes:falhas'
+
+CONFIGURACAO_PADRAO = {
+    'ATIVO': False,
+    'TTL': 300,
+}
+
+
+def configuracao_cache_busca():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_CACHE_BUSCA', {})}
+
+
+def _versao_inicial():
+    # Se a chave de versão for despejada do cache, recomeça de um valor que
+    # nunca foi usado, para não reaproveitar entradas gravadas antes.
+    return time.time_ns() // 1000
+
+
+def versao_dados():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, _versao_inicial(), None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def nova_versao():
+    """Invalida todos os resultados em cache."""
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        cache.add(CHAVE_VERSAO, _versao_inicial(), None)
+
+
+def invalidar():
+    """
+    Troca a versão quando a transação atual for confirmada: assim uma busca
+    concorrente não grava na versão nova um resultado lido antes do commit.
+    """
+    transaction.on_commit(nova_versao)
+
+
+def _contar(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        if not cache.add(chave, 1, None):
+            cache.incr(chave)
+
+
+def escopo_usuario(user):
+    autorizacao = contexto_autorizacao(user)
+    if user.is_superuser and not autorizacao.tem_perfil:
+        return 'superusuario'
+    # Superusuário com perfil tem a listagem filtrada pelas suas contas: entra com elas na chave
+    contas = sorted(autorizacao.contas_ids) if autorizacao.contas_ids is not None else None
+    grupos = sorted(autorizacao.grupos)
+    superusuario = '|superusuario' if user.is_superuser else ''
+    return f'contas={contas}|grupos={grupos}{superusuario}'
+
+
+def chave_resultado(nome, request):
+    # Termo normalizado: sem espaços extras e sem diferença de maiúsculas
+    parametros = sorted((chave, ' '.join(valor.split()).casefold()) for chave, valor in request.query_params.items())
+    conteudo = json.dumps([nome, escopo_usuario(request.user), parametros])
+    return f'siga:busca_municipes:v{versao_dados()}:{hashlib.sha1(conteudo.encode()).hexdigest()}'
+
+
+def resultado_em_cache(nome, request, calcular):
+    """
+    Devolve o resultado da busca `nome` guardado no cache ou executa `calcular()`
+    (sem argumentos) e guarda o que ela devolver.
+    """
+    configuracao = configuracao_cache_busca()
+    if not configuracao['ATIVO']:
+        return calcular()
+
+    # A chave (e a versão) é lida antes de calcular: se os dados mudarem no meio
+    # do caminho, o resultado fica gravado na versão antiga e nunca é servido.
+    chave = chave_resultado(nome, request)
+    resultado = cache.get(chave)
+    if resultado is not None:
+        _contar(CHAVE_ACERTOS)
+        return resultado
+
+    _contar(CHAVE_FALHAS)
+    resultado = calcular()
+    cache.set(chave, resultado, configuracao['TTL'])
+    return resultado
+
+
+def estatisticas():
+    acertos = cache.get(CHAVE_ACERTOS, 0)
+    falhas = cache.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    configuracao = configuracao_cache_busca()
+    return {
+        'ativo': configuracao['ATIVO'],
+        'ttl': configuracao['TTL'],
+        'versao_dados': versao_dados(),
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': round(acertos / total, 4) if total else None,
+    }
+
+
+def zerar_estatisticas():
+    cache.delete_many([CHAVE_ACERTOS, CHAVE_FALHAS])
@@ -0,0 +1,174 @@
+"""
+Cache em disco dos PDFs de documentos (detalhe do atendimento e ofício).
+
+A chave é o SHA-256 do HTML já renderizado (e da base_url): o template mostra
+exatamente o conteúdo que importa (atendimento, tramitações, anexos, munícipe,
+campos do ofício, nome e brasões da conta), então qualquer mudança visível gera
+outra chave, inclusive em modelos sem `data_atualizacao` (Oficio) e em nomes
+de objetos relacionados. Renderizar o template custa milissegundos; o que o
+cache evita é o `write_pdf()` do WeasyPrint.
+
+Os arquivos ficam em DIRETORIO/<2 primeiros dígitos>/<hash>.pdf e são servidos
+como arquivos estáticos (FileResponse). Cada acerto atualiza o mtime do
+arquivo; quando o diretório passa de TAMANHO_MAXIMO_MB, os menos usados
+recentemente são apagados. Os contadores de acertos e falhas ficam no cache do
+Django (como em cache_busca) e são expostos em /api/pdfs/cache/.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse
+
+from . import recursos_pdf
+
+logger = logging.getLogger(__name__)
+
+CHAVE_ACERTOS = 'siga:cache_pdf:acertos'
+CHAVE_FALHAS = 'siga:cache_pdf:falhas'
+
+CONFIGURACAO_PADRAO = {
+    'ATIVO': True,
+    'DIRETORIO': os.path.join(settings.BASE_DIR, 'cache_pdfs'),
+    'TAMANHO_MAXIMO_MB': 256,
+}
+
+
+def configuracao_cache_pdf():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_CACHE_PDF', {})}
+
+
+def impressao_digital(html, base_url):
+    conteudo = f'{base_url}\n{html}'
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def caminho(diretorio, chave):
+    return os.path.join(diretorio, chave[:2], f'{chave}.pdf')
+
+
+def _contar(chave):
+    try:
+        cache.incr(chave)
+    except ValueError:
+        if not cache.add(chave, 1, None):
+            cache.incr(chave)
+
+
+def _resposta(conteudo, nome_arquivo, situacao):
+    if isinstance(conteudo, bytes):
+        response = HttpResponse(conteudo, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    else:
+        response = FileResponse(conteudo, as_attachment=True, filename=nome_arquivo, content_type='application/pdf')
+    response['X-Cache-PDF'] = situacao
+    return response
+
+
+def responder_pdf(html, base_url, nome_arquivo):
+    """
+    Resposta com o PDF de `html`: o arquivo em cache, se já existir, ou o PDF
+    gerado agora (e gravado no cache).
+    """
+    configuracao = configuracao_cache_pdf()
+    if not configuracao['ATIVO']:
+        return _resposta(recursos_pdf.gerar_pdf(html, base_url), nome_arquivo, 'desligado')
+
+    diretorio = configuracao['DIRETORIO']
+    arquivo = caminho(diretorio, impressao_digital(html, base_url))
+    try:
+        os.utime(arquivo)
+        conteudo = open(arquivo, 'rb')
+    except FileNotFoundError:
+        # Ainda não gerado, ou despejado entre o utime e o open
+        pass
+    else:
+        _contar(CHAVE_ACERTOS)
+        return _resposta(conteudo, nome_arquivo, 'acerto')
+
+    _contar(CHAVE_FALHAS)
+    pdf = recursos_pdf.gerar_pdf(html, base_url)
+    try:
+        _gravar(arquivo, pdf)
+        despejar(diretorio, configuracao['TAMANHO_MAXIMO_MB'] * 1024 * 1024)
+    except OSError:
+        # Sem espaço ou sem permissão: o PDF sai do mesmo jeito, só não fica em cache
+        logger.warning('Não foi possível gravar o PDF em cache em %s', arquivo, exc_info=True)
+    return _resposta(pdf, nome_arquivo, 'falha')
+
+
+def _gravar(arquivo, pdf):
+    # Grava num temporário e renomeia: um acerto concorrente nunca lê um PDF pela metade
+    os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(arquivo), suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as destino:
+            destino.write(pdf)
+        os.replace(temporario, arquivo)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+def _arquivos(diretorio):
+    """(mtime, tamanho, caminho) de cada PDF em cache."""
+    if not os.path.isdir(diretorio):
+        return []
+    arquivos = []
+    for pasta in os.scandir(diretorio):
+        if not pasta.is_dir():
+            continue
+        for entrada in os.scandir(pasta.path):
+            if entrada.name.endswith('.pdf'):
+                try:
+                    informacoes = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                arquivos.append((informacoes.st_mtime, informacoes.st_size, entrada.path))
+    return arquivos
+
+
+def despejar(diretorio, limite_bytes):
+    """Apaga os PDFs usados há mais tempo até o diretório caber em `limite_bytes`. Devolve quantos."""
+    arquivos = _arquivos(diretorio)
+    excedente = sum(tamanho for _, tamanho, _ in arquivos) - limite_bytes
+    removidos = 0
+    for _, tamanho, arquivo in sorted(arquivos):
+        if excedente <= 0:
+            break
+        try:
+            os.remove(arquivo)
+        except FileNotFoundError:
+            pass
+        excedente -= tamanho
+        removidos += 1
+    return removidos
+
+
+def limpar():
+    """Apaga todos os PDFs em cache. Devolve quantos."""
+    return despejar(configuracao_cache_pdf()['DIRETORIO'], 0)
+
+
+def estatisticas():
+    acertos = cache.get(CHAVE_ACERTOS, 0)
+    falhas = cache.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    configuracao = configuracao_cache_pdf()
+    arquivos = _arquivos(configuracao['DIRETORIO'])
+    return {
+        'ativo': configuracao['ATIVO'],
+        'tamanho_maximo_mb': configuracao['TAMANHO_MAXIMO_MB'],
+        'arquivos': len(arquivos),
+        'tamanho_bytes': sum(tamanho for _, tamanho, _ in arquivos),
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': round(acertos / total, 4) if total else None,
+    }
+
+
+def zerar_estatisticas():
+    cache.delete_many([CHAVE_ACERTOS, CHAVE_FALHAS])
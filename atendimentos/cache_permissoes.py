@@ -0,0 +1,154 @@
+"""
+Resolução de permissões (`app_label.codename`) com cache e codificação compacta.
+
+As permissões de cada usuário (diretas + dos grupos) ficam no cache do Django
+sob a versão global de permissões. Qualquer mudança em grupos, permissões de
+grupo ou de usuário, superusuário/ativo ou na tabela de Permission incrementa
+essa versão pelos sinais (mesmo esquema do cache_busca), e as entradas antigas
+expiram sozinhas.
+
+Para o token JWT, o conjunto de permissões vira um bitmap sobre a tabela
+ordenada de permissões (`tabela_permissoes`), publicada em
+/api/permissoes/tabela/ junto com a sua versão.
+"""
+import base64
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import transaction
+
+CHAVE_VERSAO = 'siga:permissoes:versao'
+CHAVE_TABELA = 'siga:permissoes:tabela'
+
+CONFIGURACAO_PADRAO = {
+    'TTL': 3600,
+    # Também grava a lista completa `user_permissions` no token, além do bitmap:
+    # opção para clientes antigos, que ainda não decodificam o bitmap.
+    'TOKEN_LISTA_COMPLETA': False,
+}
+
+
+def configuracao_permissoes():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_PERMISSOES', {})}
+
+
+def versao_permissoes():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, time.time_ns() // 1000, None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def nova_versao():
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        cache.add(CHAVE_VERSAO, time.time_ns() // 1000, None)
+
+
+def invalidar(tabela=False):
+    """Troca a versão (e, se pedido, descarta a tabela) quando a transação atual for confirmada."""
+    def _invalidar():
+        if tabela:
+            cache.delete(CHAVE_TABELA)
+        nova_versao()
+    transaction.on_commit(_invalidar)
+
+
+def tabela_permissoes():
+    """
+    Lista ordenada de todas as permissões ('app_label.codename') e a sua versão
+    (hash curto do conteúdo). A posição na lista é o bit no bitmap do token.
+    """
+    tabela = cache.get(CHAVE_TABELA)
+    if tabela is None:
+        codigos = [
+            f'{app_label}.{codename}'
+            for app_label, codename in Permission.objects.order_by('id').values_list('content_type__app_label', 'codename')
+        ]
+        tabela = {
+            'versao': hashlib.sha1('\n'.join(codigos).encode()).hexdigest()[:12],
+            'permissoes': codigos,
+        }
+        cache.set(CHAVE_TABELA, tabela, None)
+    return tabela
+
+
+def _chave_usuario(versao, user_id):
+    return f'siga:permissoes:v{versao}:u{user_id}'
+
+
+def permissoes_de_usuarios(usuarios):
+    """
+    {id do usuário: frozenset de 'app_label.codename'} para vários usuários, com a
+    mesma regra do ModelBackend (inativo: nenhuma; superusuário: todas). As que
+    não estão no cache saem de duas queries para o lote inteiro.
+    """
+    usuarios = list(usuarios)
+    versao = versao_permissoes()
+    chaves = {usuario.pk: _chave_usuario(versao, usuario.pk) for usuario in usuarios}
+    em_cache = cache.get_many(list(chaves.values()))
+
+    resultado = {}
+    faltantes = []
+    for usuario in usuarios:
+        if not usuario.is_active:
+            resultado[usuario.pk] = frozenset()
+        elif chaves[usuario.pk] in em_cache:
+            resultado[usuario.pk] = frozenset(em_cache[chaves[usuario.pk]])
+        elif usuario.is_superuser:
+            resultado[usuario.pk] = frozenset(tabela_permissoes()['permissoes'])
+        else:
+            faltantes.append(usuario.pk)
+
+    if faltantes:
+        encontradas = {user_id: set() for user_id in faltantes}
+        diretas = User.user_permissions.through.objects.filter(user_id__in=faltantes).values_list(
+            'user_id', 'permission__content_type__app_label', 'permission__codename'
+        )
+        dos_grupos = User.groups.through.objects.filter(
+            user_id__in=faltantes, group__permissions__isnull=False
+        ).values_list('user_id', 'group__permissions__content_type__app_label', 'group__permissions__codename')
+        for consulta in (diretas, dos_grupos):
+            for user_id, app_label, codename in consulta:
+                encontradas[user_id].add(f'{app_label}.{codename}')
+        ttl = configuracao_permissoes()['TTL']
+        cache.set_many({chaves[user_id]: sorted(permissoes) for user_id, permissoes in encontradas.items()}, ttl)
+        resultado.update({user_id: frozenset(permissoes) for user_id, permissoes in encontradas.items()})
+    return resultado
+
+
+def permissoes_do_usuario(user):
+    """
+    Permissões de um usuário pelo cache. Também preenche o cache por instância
+    do ModelBackend, para que `user.has_perm()` na mesma requisição não consulte o banco.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+    permissoes = permissoes_de_usuarios([user])[user.pk]
+    user._perm_cache = set(permissoes)
+    return permissoes
+
+
+def codificar_bitmap(permissoes):
+    """Conjunto de permissões -> bitmap (base64 url-safe, sem '=') sobre a tabela_permissoes()."""
+    codigos = tabela_permissoes()['permissoes']
+    bits = bytearray((len(codigos) + 7) // 8)
+    for posicao, codigo in enumerate(codigos):
+        if codigo in permissoes:
+            bits[posicao // 8] |= 1 << (posicao % 8)
+    return base64.urlsafe_b64encode(bytes(bits)).decode().rstrip('=')
+
+
+def decodificar_bitmap(bitmap):
+    """Inverso de codificar_bitmap (precisa da mesma versão da tabela)."""
+    codigos = tabela_permissoes()['permissoes']
+    bits = base64.urlsafe_b64decode(bitmap + '=' * (-len(bitmap) % 4))
+    return {
+        codigo for posicao, codigo in enumerate(codigos)
+        if posicao // 8 < len(bits) and bits[posicao // 8] & (1 << (posicao % 8))
+    }
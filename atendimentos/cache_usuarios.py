@@ -0,0 +1,108 @@
+"""
+Cache do usuário autenticado: os campos do User e do perfil usados na
+autorização, os nomes dos grupos e os ids das contas ficam no cache do Django
+por usuário, com TTL curto, para que a autenticação
+(atendimentos.autenticacao.JWTCacheAuthentication) não consulte o banco a cada
+requisição.
+
+O cache guarda só valores simples (CAMPOS_USUARIO e CAMPOS_PERFIL), nunca o
+objeto inteiro: o hash da senha não sai do banco. O User é remontado a cada
+requisição com os demais campos adiados, como num .only(): lê-los faz uma
+query, e um save() grava apenas os campos carregados.
+
+Os sinais (atendimentos/signals.py) descartam a entrada do usuário quando ele,
+o perfil, os grupos ou as contas mudam. Com vários workers o cache precisa ser
+compartilhado (SIGA_CACHE_REDIS_URL): num cache local cada processo só enxerga
+as próprias invalidações, e o TTL é o único limite para dados antigos.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.contrib.auth.models import Group
+from django.db import router, transaction
+
+from .models import PerfilUsuario
+from .permissions import ContextoAutorizacao
+
+CONFIGURACAO_PADRAO = {
+    'ATIVO': False,
+    'TTL': 60,
+}
+
+
+def configuracao_cache_usuarios():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_CACHE_USUARIO', {})}
+
+
+def _chave(user_id):
+    return f'siga:usuario:{user_id}'
+
+
+CAMPOS_USUARIO = ('id', 'username', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+CAMPOS_PERFIL = ('id', 'usuario_id', 'pode_visualizar_agendas_compartilhadas', 'versao_autorizacao')
+
+
+def _ler_do_banco(user_id):
+    """User + perfil numa query, grupos e contas em mais uma cada."""
+    linha = get_user_model().objects.filter(pk=user_id).values(
+        *CAMPOS_USUARIO, *(f'perfil__{campo}' for campo in CAMPOS_PERFIL)
+    ).get()
+    usuario = {campo: linha[campo] for campo in CAMPOS_USUARIO}
+    perfil = None
+    if linha['perfil__id'] is not None:
+        perfil = {campo: linha[f'perfil__{campo}'] for campo in CAMPOS_PERFIL}
+    return {
+        'usuario': usuario,
+        'perfil': perfil,
+        'grupos': sorted(Group.objects.filter(user=user_id).values_list('name', flat=True)),
+        'contas_ids': sorted(
+            PerfilUsuario.contas.through.objects.filter(perfilusuario_id=perfil['id']).values_list('conta_id', flat=True)
+        ) if perfil is not None else None,
+    }
+
+
+def _instancia(modelo, campos):
+    # Como as instâncias de um .only(): os campos fora de `campos` ficam adiados
+    nomes = [campo.attname for campo in modelo._meta.concrete_fields if campo.attname in campos]
+    return modelo.from_db(router.db_for_read(modelo), nomes, [campos[nome] for nome in nomes])
+
+
+def _montar_usuario(dados):
+    modelo = get_user_model()
+    usuario = _instancia(modelo, dados['usuario'])
+    perfil = None
+    if dados['perfil'] is not None:
+        perfil = _instancia(PerfilUsuario, dados['perfil'])
+        PerfilUsuario.usuario.field.set_cached_value(perfil, usuario)
+    # Como o select_related('perfil'): sem perfil, `usuario.perfil` levanta DoesNotExist sem query
+    modelo.perfil.related.set_cached_value(usuario, perfil)
+    return usuario
+
+
+def carregar_usuario(user_id):
+    """
+    Devolve o usuário com o perfil já carregado. Com o cache ativo, o
+    ContextoAutorizacao também vem preenchido (grupos e contas); sem ele, é uma
+    única query e o contexto carrega sob demanda. Levanta User.DoesNotExist se
+    o usuário não existir.
+    """
+    configuracao = configuracao_cache_usuarios()
+    if not configuracao['ATIVO']:
+        return get_user_model().objects.select_related('perfil').get(pk=user_id)
+
+    dados = cache.get(_chave(user_id))
+    if dados is None:
+        dados = _ler_do_banco(user_id)
+        cache.set(_chave(user_id), dados, configuracao['TTL'])
+    usuario = _montar_usuario(dados)
+    usuario._contexto_autorizacao = ContextoAutorizacao.de_claims(usuario, dados['grupos'], dados['contas_ids'])
+    return usuario
+
+
+def invalidar(usuarios_ids):
+    """Descarta as entradas dos usuários quando a transação atual for confirmada."""
+    if not configuracao_cache_usuarios()['ATIVO']:
+        return
+    chaves = [_chave(user_id) for user_id in usuarios_ids]
+    if chaves:
+        transaction.on_commit(lambda: cache.delete_many(chaves))
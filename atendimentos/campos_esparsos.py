@@ -0,0 +1,40 @@
+"""
+Campos esparsos (`?fields=`) para as respostas da API.
+
+Em uma leitura (GET), `?fields=id,protocolo,status` faz o serializer principal
+da view devolver só esses campos; nomes desconhecidos são ignorados. Os
+serializers aninhados não são afetados, e escritas (POST/PUT/PATCH) sempre
+usam o serializer completo, para não alterar a validação.
+"""
+from rest_framework.permissions import SAFE_METHODS
+
+PARAMETRO_CAMPOS = 'fields'
+
+
+def campos_solicitados(request):
+    """Conjunto de campos pedidos em `?fields=`, ou None quando a resposta deve ser completa."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    valor = request.query_params.get(PARAMETRO_CAMPOS) if hasattr(request, 'query_params') else None
+    if not valor:
+        return None
+    campos = {campo.strip() for campo in valor.split(',') if campo.strip()}
+    return campos or None
+
+
+class CamposEsparsosMixin:
+    """Mixin para ModelSerializer: remove os campos que não foram pedidos em `?fields=`."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = campos_solicitados(self.context.get('request'))
+        if campos is None:
+            return
+        for nome in set(self.fields) - campos:
+            self.fields.pop(nome)
+
+
+def campo_solicitado(request, nome):
+    """True se o campo vai na resposta (sem `?fields=`, todos vão)."""
+    campos = campos_solicitados(request)
+    return campos is None or nome in campos
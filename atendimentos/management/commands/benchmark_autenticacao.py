@@ -0,0 +1,99 @@
+# atendimentos/management/commands/benchmark_autenticacao.py
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from atendimentos.autenticacao import JWTCacheAuthentication, JWTClaimsAuthentication
+from atendimentos.benchmark import ContadorConsultas, medir
+from atendimentos.cache_usuarios import _chave
+from atendimentos.models import Conta, PerfilUsuario
+from atendimentos.permissions import contexto_autorizacao
+from atendimentos.serializers import MyTokenObtainPairSerializer
+from atendimentos.views import MunicipeListCreateView
+
+
+USUARIO_BENCHMARK = 'benchmark.autenticacao'
+CONTA_BENCHMARK = 'BENCHMARK AUTENTICACAO'
+
+# Modos medidos: (nome, classe de autenticação, cache de usuários ativo)
+MODOS = [
+    ('simplejwt padrão', JWTAuthentication, False),
+    ('cache desligado', JWTCacheAuthentication, False),
+    ('cache ligado', JWTCacheAuthentication, True),
+    ('claims + cache', JWTClaimsAuthentication, True),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark da autenticação JWT: queries e latência por requisição até a view '
+        '(autenticação + dados de autorização usados pelas permissões) e na listagem '
+        'de munícipes completa, com e sem o cache de usuários.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=200)
+
+    def handle(self, *args, **options):
+        usuario = self._preparar_usuario()
+        token = str(MyTokenObtainPairSerializer.get_token(usuario).access_token)
+        try:
+            self.stdout.write(
+                f"{'modo':<18} {'queries antes da view':>22} {'queries na listagem':>20} "
+                f"{'p50 (ms)':>9} {'p95 (ms)':>9}"
+            )
+            antes_da_view = {}
+            for nome, classe, ativo in MODOS:
+                with override_settings(SIGA_CACHE_USUARIO={'ATIVO': ativo}):
+                    antes, total, p50, p95 = self._medir(classe, token, usuario, options['repeticoes'])
+                antes_da_view[nome] = antes
+                self.stdout.write(
+                    f"{nome:<18} {antes:>22} {total:>20} {p50:>9.2f} {p95:>9.2f}"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'Queries economizadas por requisição com o cache ligado: '
+                f"{antes_da_view['simplejwt padrão'] - antes_da_view['cache ligado']}."
+            ))
+        finally:
+            cache.delete(_chave(usuario.pk))
+            User.objects.filter(username=USUARIO_BENCHMARK).delete()
+            Conta.objects.filter(nome=CONTA_BENCHMARK).delete()
+
+    def _preparar_usuario(self):
+        usuario, _ = User.objects.get_or_create(username=USUARIO_BENCHMARK)
+        usuario.groups.add(Group.objects.get_or_create(name='Membro do Gabinete')[0])
+        perfil, _ = PerfilUsuario.objects.get_or_create(usuario=usuario)
+        perfil.contas.set([Conta.objects.get_or_create(nome=CONTA_BENCHMARK)[0]])
+        # Relê com a versão de autorização já incrementada pelas mudanças acima
+        return User.objects.select_related('perfil').get(pk=usuario.pk)
+
+    def _autenticar(self, autenticacao, request):
+        """O que acontece antes da query da view: autenticação e checagens de grupo/conta/perfil."""
+        user, _ = autenticacao.authenticate(request)
+        contexto = contexto_autorizacao(user)
+        contexto.tem_grupo('Membro do Gabinete')
+        contexto.contas_filtro
+        contexto.pode_visualizar_agendas_compartilhadas
+        return user
+
+    def _medir(self, classe, token, usuario, repeticoes):
+        autenticacao = classe()
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        view = MunicipeListCreateView.as_view(authentication_classes=[classe])
+
+        # A primeira requisição aquece o cache; as medidas são do caso típico
+        cache.delete(_chave(usuario.pk))
+        self._autenticar(autenticacao, request)
+        with ContadorConsultas() as contador:
+            self._autenticar(autenticacao, request)
+        antes = contador.total
+        with ContadorConsultas() as contador:
+            view(APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')).render()
+        total = contador.total
+
+        p50, p95 = medir(lambda: self._autenticar(autenticacao, request), repeticoes)
+        return antes, total, p50, p95
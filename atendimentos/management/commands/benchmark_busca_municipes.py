@@ -0,0 +1,151 @@
+# atendimentos/management/commands/benchmark_busca_municipes.py
+
+import statistics
+
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from atendimentos import typeahead
+from atendimentos.benchmark import (
+    CONSULTAS_NOME, ContadorConsultas, formatar_cpf_sintetico, gerar_contas_sinteticas,
+    gerar_municipes_sinteticos, medir, recall, relevantes_por_consulta, remover_municipes_sinteticos,
+)
+from atendimentos.busca_backends import configuracao_busca, obter_backend
+from atendimentos.models import Municipe, MunicipeContato, PerfilUsuario
+from atendimentos.views import BuscaGlobalView, MunicipeListCreateView, MunicipeLookupView
+
+
+USUARIO_BENCHMARK = 'benchmark.busca'
+
+# Caminhos medidos: (nome, view, como extrair os IDs de munícipes da resposta, escopo do recall).
+# A listagem e o autocomplete mostram os públicos + os das contas do usuário;
+# a busca global, só os das contas.
+CAMINHOS = [
+    ('lista', MunicipeListCreateView.as_view(), lambda dados: [item['id'] for item in dados], 'visiveis'),
+    ('lookup', MunicipeLookupView.as_view(), lambda dados: [item['id'] for item in dados], 'visiveis'),
+    ('global', BuscaGlobalView.as_view(), lambda dados: [item['id'] for item in dados if item['tipo'] == 'municipe'], 'da_conta'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark da busca de munícipes com dados sintéticos: latência p50/p95, número de queries '
+        'e recall das buscas da listagem, do autocomplete e da busca global. Roda no banco '
+        'configurado (SQLite local ou MySQL).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanhos', nargs='+', type=int, default=[10000, 100000, 1000000],
+                            help='Quantidades de munícipes sintéticos a medir (padrão: 10000 100000 1000000).')
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--sem-recall', action='store_true',
+                            help='Não calcula o recall (evita a varredura dos nomes em Python).')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING(
+            f'Banco: {connection.vendor} | backend de busca: {type(obter_backend()).__name__}. '
+            'Os dados sintéticos são gravados (a busca global consulta em outras conexões) '
+            'e removidos ao final.'
+        ))
+        self.usuario = self._preparar_usuario()
+        primeiro_id = (Municipe.objects.aggregate(maior=Max('id'))['maior'] or 0) + 1
+        contas = gerar_contas_sinteticas()
+        self.usuario.perfil.contas.set(contas[:1])
+
+        # Sem o cache de resultados: cada repetição precisa executar a busca de verdade.
+        # O typeahead fica ligado: o benchmark roda num único processo.
+        try:
+            with override_settings(SIGA_CACHE_BUSCA={'ATIVO': False},
+                                   SIGA_TYPEAHEAD={**typeahead.configuracao_typeahead(), 'ATIVO': True}):
+                inseridos = 0
+                for tamanho in sorted(options['tamanhos']):
+                    self.stdout.write(f'Gerando munícipes sintéticos até {tamanho} registros...')
+                    inseridos += gerar_municipes_sinteticos(
+                        tamanho - inseridos, semente=options['semente'] + inseridos, contas=contas
+                    )
+                    typeahead.reconstruir()
+                    self._medir_consultas(tamanho, primeiro_id, contas[0], options)
+        finally:
+            remover_municipes_sinteticos(primeiro_id)
+            User.objects.filter(username=USUARIO_BENCHMARK).delete()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark concluído. Nenhum dado foi mantido.'))
+
+    def _preparar_usuario(self):
+        usuario, _ = User.objects.get_or_create(username=USUARIO_BENCHMARK)
+        usuario.groups.add(Group.objects.get_or_create(name='Membro do Gabinete')[0])
+        PerfilUsuario.objects.get_or_create(usuario=usuario)
+        return User.objects.select_related('perfil').get(pk=usuario.pk)
+
+    def _consultas(self, primeiro_id):
+        """Consultas por nome + consultas exatas montadas a partir de um munícipe sintético."""
+        consultas = [(descricao, termo, parametros) for descricao, termo, parametros, _ in CONSULTAS_NOME]
+        amostra = Municipe.objects.filter(id__gte=primeiro_id, cpf__isnull=False).order_by('id').first()
+        email = MunicipeContato.objects.filter(municipe_id__gte=primeiro_id, tipo='email').order_by('id').first()
+        if amostra:
+            cpf = formatar_cpf_sintetico(amostra.id)
+            consultas += [('cpf formatado', cpf, {}), ('cpf prefixo', cpf[:7], {})]
+        if email:
+            consultas.append(('e-mail', email.valor, {}))
+        return consultas
+
+    def _escopos(self, conta):
+        """IDs que o usuário do benchmark enxerga em cada escopo de CAMINHOS."""
+        ContaMunicipe = Municipe.contas.through
+        com_conta = set(ContaMunicipe.objects.values_list('municipe_id', flat=True))
+        da_conta = set(ContaMunicipe.objects.filter(conta=conta).values_list('municipe_id', flat=True))
+        publicos = set(Municipe.objects.values_list('id', flat=True)) - com_conta
+        return {'visiveis': publicos | da_conta, 'da_conta': da_conta}
+
+    def _executar(self, view, termo, parametros):
+        request = APIRequestFactory().get('/', {'q': termo, **parametros})
+        force_authenticate(request, user=self.usuario)
+        resposta = view(request)
+        resposta.render()
+        return resposta
+
+    def _medir_consultas(self, tamanho, primeiro_id, conta, options):
+        consultas = self._consultas(primeiro_id)
+        relevantes, escopos = {}, {}
+        if not options['sem_recall']:
+            relevantes = relevantes_por_consulta(CONSULTAS_NOME)
+            escopos = self._escopos(conta)
+        limite = configuracao_busca()['LIMITE_RESULTADOS']
+
+        self.stdout.write(self.style.SUCCESS(f'\n--- {tamanho} munícipes sintéticos ---'))
+        self.stdout.write(
+            f"{'caminho':<8} {'consulta':<18} {'termo':<18} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+            f"{'queries':>8} {'result.':>8} {'recall':>7}"
+        )
+        for nome_caminho, view, extrair_ids, escopo in CAMINHOS:
+            medianas, percentis_95, recalls = [], [], []
+            for indice, (descricao, termo, parametros) in enumerate(consultas):
+                with ContadorConsultas() as contador:
+                    resposta = self._executar(view, termo, parametros)
+                ids = extrair_ids(resposta.data)
+                p50, p95 = medir(lambda: self._executar(view, termo, parametros), options['repeticoes'])
+                valor_recall = None
+                if indice in relevantes:
+                    valor_recall = recall(ids, relevantes[indice] & escopos[escopo], limite)
+                medianas.append(p50)
+                percentis_95.append(p95)
+                if valor_recall is not None:
+                    recalls.append(valor_recall)
+                self.stdout.write(
+                    f"{nome_caminho:<8} {descricao:<18} {termo[:18]:<18} {p50:>9.1f} {p95:>9.1f} "
+                    f"{contador.total:>8} {len(ids):>8} {self._formatar_recall(valor_recall):>7}"
+                )
+            # Resumo do caminho: mediana dos p50, pior p95 e recall médio
+            recall_medio = sum(recalls) / len(recalls) if recalls else None
+            self.stdout.write(self.style.SUCCESS(
+                f"{nome_caminho:<8} {'(resumo)':<18} {'':<18} {statistics.median(medianas):>9.1f} "
+                f"{max(percentis_95):>9.1f} {'':>8} {'':>8} {self._formatar_recall(recall_medio):>7}"
+            ))
+
+    def _formatar_recall(self, valor):
+        return '-' if valor is None else f'{valor:.2f}'
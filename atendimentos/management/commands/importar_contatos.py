@@ -3,6 +3,7 @@ import re
 from datetime import datetime
 from django.core.management.base import BaseCommand
 from atendimentos.models import Municipe, Conta, CategoriaContato
+from atendimentos.busca import normalizar_cpf
 
 def formatar_telefone(numero):
     """Limpa e formata um número de telefone para o padrão (99) 99999-9999."""
@@ -66,11 +67,14 @@ class Command(BaseCommand):
                                 self.stdout.write(self.style.WARNING(f"  - Linha {total_linhas}: Formato de data inválido para '{data_nasc_str}'. Deixando em branco."))
 
                         # Cria ou atualiza o munícipe baseado no CPF (se existir) ou nome completo
+                        # (o CPF é comparado pela coluna indexada cpf_digitos, com ou sem formatação)
                         cpf = row.get('cpf', '').strip()
-                        if cpf:
+                        cpf_digitos = normalizar_cpf(cpf)
+                        if cpf_digitos:
                             municipe, created = Municipe.objects.update_or_create(
-                                cpf=cpf,
+                                cpf_digitos=cpf_digitos,
                                 defaults={
+                                    'cpf': cpf,
                                     'nome_completo': row['nome_completo'],
                                     'data_nascimento': data_nasc_obj,
                                     'email': row.get('email', ''),
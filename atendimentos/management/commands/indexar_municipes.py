@@ -0,0 +1,42 @@
+# atendimentos/management/commands/indexar_municipes.py
+
+from django.core.management.base import BaseCommand
+from atendimentos.models import Municipe, MunicipeContato, MunicipeToken, MunicipeVisibilidade
+from atendimentos.busca import atualizar_indices_municipes, atualizar_visibilidade_municipes, TAMANHO_LOTE
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    def tqdm(iterator, *args, **kwargs):
+        return iterator
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói os índices de busca dos munícipes: tokens de nome (MunicipeToken), contatos '
+        'normalizados (MunicipeContato) e visibilidade por conta (MunicipeVisibilidade).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--somente-faltantes', action='store_true',
+            help='Indexa apenas os munícipes que ainda não possuem nenhum token.'
+        )
+
+    def handle(self, *args, **options):
+        queryset = Municipe.objects.only('id', 'nome_completo', 'nome_de_guerra', 'emails', 'telefones').order_by('id')
+        if options['somente_faltantes']:
+            queryset = queryset.exclude(id__in=MunicipeToken.objects.values('municipe_id'))
+
+        total = queryset.count()
+        self.stdout.write(self.style.SUCCESS(f'Indexando {total} munícipes...'))
+
+        atualizar_indices_municipes(
+            tqdm(queryset.iterator(chunk_size=TAMANHO_LOTE), total=total, desc="Indexando")
+        )
+        atualizar_visibilidade_municipes(queryset.values_list('id', flat=True).iterator(chunk_size=TAMANHO_LOTE))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice concluído! {MunicipeToken.objects.count()} tokens, {MunicipeContato.objects.count()} contatos '
+            f'e {MunicipeVisibilidade.objects.count()} linhas de visibilidade para {Municipe.objects.count()} munícipes.'
+        ))
@@ -0,0 +1,15 @@
+# atendimentos/management/commands/limpar_relatorios.py
+
+from django.core.management.base import BaseCommand
+from atendimentos import relatorios
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove os relatórios em PDF gerados em segundo plano (RelatorioJob) cuja validade já venceu, '
+        'junto com os arquivos. Agende no cron ou no Celery beat (tarefa limpar_relatorios_expirados).'
+    )
+
+    def handle(self, *args, **options):
+        total = relatorios.limpar_expirados()
+        self.stdout.write(self.style.SUCCESS(f'{total} relatório(s) expirado(s) removido(s).'))
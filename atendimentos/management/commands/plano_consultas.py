@@ -0,0 +1,57 @@
+# atendimentos/management/commands/plano_consultas.py
+
+from django.core.management.base import BaseCommand
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from atendimentos.otimizacao_consultas import OtimizacaoConsultasMixin, plano_consultas
+
+
+def _rotas(padroes, prefixo=''):
+    for padrao in padroes:
+        if isinstance(padrao, URLResolver):
+            yield from _rotas(padrao.url_patterns, prefixo + str(padrao.pattern))
+        elif isinstance(padrao, URLPattern):
+            yield prefixo + str(padrao.pattern), padrao.callback
+
+
+class Command(BaseCommand):
+    help = (
+        'Mostra o plano de consultas (select_related, prefetch_related e only) gerado pelo '
+        'OtimizacaoConsultasMixin para cada rota de leitura, a partir do serializer da view.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rota', help='Mostra só as rotas que contêm este trecho.')
+
+    def handle(self, *args, **options):
+        vistas = set()
+        for rota, callback in _rotas(get_resolver().url_patterns):
+            classe = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+            if classe is None or not issubclass(classe, OtimizacaoConsultasMixin):
+                continue
+            if options['rota'] and options['rota'] not in rota:
+                continue
+            acoes = getattr(callback, 'actions', None) or {}
+            if (classe, acoes.get('get')) in vistas:
+                continue
+            vistas.add((classe, acoes.get('get')))
+
+            view = classe(**getattr(callback, 'initkwargs', {}))
+            view.request = Request(APIRequestFactory().get('/' + rota))
+            view.format_kwarg = None
+            view.args, view.kwargs = (), {}
+            if acoes:
+                view.action = acoes.get('get')
+            serializer = view.get_serializer()
+            modelo = getattr(getattr(serializer, 'Meta', None), 'model', None)
+            titulo = f"{classe.__name__}{f' ({view.action})' if acoes else ''} - /{rota}"
+            if modelo is None:
+                self.stdout.write(self.style.WARNING(f'{titulo}\n  sem modelo no serializer\n'))
+                continue
+            queryset = modelo._default_manager.all() if view._somente_serializer() else None
+            self.stdout.write(self.style.SUCCESS(titulo))
+            for linha in plano_consultas(serializer, modelo).descrever(queryset).splitlines():
+                self.stdout.write(f'  {linha}')
+            self.stdout.write('')
@@ -0,0 +1,21 @@
+# atendimentos/management/commands/recalcular_qualidade_municipes.py
+
+from django.core.management.base import BaseCommand
+from atendimentos import qualidade
+from atendimentos.models import Municipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula a pontuação de qualidade dos dados (Municipe.pontuacao_qualidade) de todos os '
+        'munícipes. Use depois de cargas ou alterações feitas fora do ORM (SQL direto, dumps), '
+        'que não passam pelo save() nem pelo MunicipeQuerySet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help='Linhas lidas e gravadas por vez.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Recalculando a qualidade dos dados dos munícipes...'))
+        alterados = qualidade.recalcular(Municipe.objects.all(), lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'Qualidade recalculada! {alterados} munícipes atualizados.'))
@@ -0,0 +1,17 @@
+# atendimentos/management/commands/reconstruir_atividades.py
+
+from django.core.management.base import BaseCommand
+from atendimentos import atividades
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói a linha do tempo dos munícipes (AtividadeMunicipe) a partir de atendimentos, '
+        'tramitações, visitas, agendas, presenças em eventos e comunicações. Use depois de cargas '
+        'ou alterações em massa (update/bulk_create) que não disparam os sinais.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Reconstruindo a linha do tempo dos munícipes...'))
+        total = atividades.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'Linha do tempo concluída! {total} atividades registradas.'))
@@ -5,6 +5,7 @@ from datetime import datetime, date
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction, utils
 from atendimentos.models import Municipe, CategoriaContato, Conta
+from atendimentos.busca import normalizar_cpf
 
 # --- Importações para a barra de progresso e remoção de acentos ---
 try:
@@ -116,7 +117,8 @@ class Command(BaseCommand):
                     }
 
                     municipe = None
-                    if cpf_formatado: municipe = Municipe.objects.filter(cpf=cpf_formatado).first()
+                    # Pela coluna indexada cpf_digitos: encontra também CPFs gravados sem formatação
+                    if cpf_formatado: municipe = Municipe.objects.filter(cpf_digitos=normalizar_cpf(cpf_formatado)).first()
                     if not municipe and matricula: municipe = Municipe.objects.filter(matricula_rh=matricula).first()
 
                     if municipe:
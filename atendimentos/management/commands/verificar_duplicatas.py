@@ -1,37 +1,12 @@
 import uuid
-import re
 import itertools
 from collections import defaultdict
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import BaseCommand
 from django.db.models import Count
 from atendimentos.models import Municipe
 
-try:
-    from unidecode import unidecode
-except ImportError:
-    raise CommandError("A biblioteca 'unidecode' não está instalada. Por favor, rode 'pip install unidecode'.")
-
-def normalizar_nome_para_conjunto(nome):
-    """
-    Função aprimorada que transforma um nome em um conjunto de palavras-chave.
-    Ex: "Glaucia Cristina M. Coutinho" -> {'glaucia', 'cristina', 'm', 'coutinho'}
-    """
-    if not nome:
-        return set()
-    
-    # Remove acentos e converte para minúsculas
-    nome_sem_acentos = unidecode(nome).lower()
-    
-    # Remove caracteres que não sejam letras, números ou espaços
-    nome_limpo = re.sub(r'[^a-z0-9\s]', '', nome_sem_acentos)
-    
-    # Palavras a serem ignoradas (artigos, preposições, etc.)
-    palavras_ignoradas = {'de', 'da', 'do', 'dos', 'das', 'e'}
-    
-    # Divide o nome em palavras e remove as ignoradas
-    palavras = {palavra for palavra in nome_limpo.split() if palavra not in palavras_ignoradas}
-    
-    return palavras
+# A normalização é a mesma usada pelo índice de tokens de busca.
+from atendimentos.busca import normalizar_nome_para_conjunto
 
 class Command(BaseCommand):
     help = 'Verifica duplicatas com lógica de subconjunto de nomes e agrupamento inteligente.'
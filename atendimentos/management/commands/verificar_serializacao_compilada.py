@@ -0,0 +1,98 @@
+# atendimentos/management/commands/verificar_serializacao_compilada.py
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import get_resolver
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from atendimentos.benchmark import ContadorConsultas, medir
+from atendimentos.management.commands.plano_consultas import _rotas
+from atendimentos.renderers import OrjsonRenderer
+from atendimentos.serializacao_compilada import SerializacaoCompiladaMixin
+
+
+class Command(BaseCommand):
+    help = (
+        'Confere, rota a rota, se as listagens com serialização compilada devolvem exatamente os '
+        'mesmos bytes que o caminho padrão do DRF (e o OrjsonRenderer os mesmos do JSONRenderer), '
+        'e mede o tempo e as queries de cada caminho.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', action='append', help='Username (pode repetir). Padrão: o primeiro superusuário.')
+        parser.add_argument('--parametros', action='append',
+                            help='Query string extra, ex.: "fields=id,nome_completo" (pode repetir; "" = sem parâmetros).')
+        parser.add_argument('--repeticoes', type=int, default=10)
+
+    def handle(self, *args, **options):
+        usuarios = self._usuarios(options['usuario'])
+        diferencas = 0
+        self.stdout.write(
+            f"{'rota':<45} {'usuário':<15} {'status':>6} {'bytes':>9} {'drf (ms)':>9} {'compilado (ms)':>15} "
+            f"{'queries':>8}  resultado"
+        )
+        for rota, view in self._listagens():
+            for usuario in usuarios:
+                for parametros in options['parametros'] or ['']:
+                    url = f'/{rota}' + (f'?{parametros}' if parametros else '')
+                    padrao, compilado = (
+                        self._medir(view, url, usuario, ativo, options['repeticoes']) for ativo in (False, True)
+                    )
+                    problemas = []
+                    if padrao['status'] != compilado['status'] or padrao['bytes'] != compilado['bytes']:
+                        problemas.append('serialização difere')
+                    if padrao['json_drf'] is not None and padrao['json_drf'] != padrao['bytes']:
+                        problemas.append('renderer difere')
+                    diferencas += bool(problemas)
+                    resultado = self.style.ERROR(', '.join(problemas)) if problemas else self.style.SUCCESS('igual')
+                    self.stdout.write(
+                        f"{url[:45]:<45} {usuario.username[:15]:<15} {compilado['status']:>6} {len(compilado['bytes']):>9} "
+                        f"{padrao['p50']:>9.2f} {compilado['p50']:>15.2f} {padrao['queries']:>3}->{compilado['queries']:<3}  {resultado}"
+                    )
+        if diferencas:
+            raise CommandError(f'{diferencas} resposta(s) diferente(s) entre os dois caminhos.')
+        self.stdout.write(self.style.SUCCESS('Todas as respostas são idênticas nos dois caminhos.'))
+
+    def _usuarios(self, nomes):
+        if not nomes:
+            usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+            if usuario is None:
+                raise CommandError('Nenhum superusuário encontrado; informe --usuario.')
+            return [usuario]
+        usuarios = list(User.objects.filter(username__in=nomes))
+        if len(usuarios) != len(set(nomes)):
+            raise CommandError(f'Usuário(s) não encontrado(s): {", ".join(set(nomes) - {u.username for u in usuarios})}')
+        return usuarios
+
+    def _listagens(self):
+        """(rota, view) das listagens com SerializacaoCompiladaMixin; ignora rotas com parâmetros."""
+        vistos = set()
+        for rota, callback in _rotas(get_resolver().url_patterns):
+            classe = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+            if classe is None or not issubclass(classe, SerializacaoCompiladaMixin):
+                continue
+            acoes = getattr(callback, 'actions', None)
+            if (acoes is not None and acoes.get('get') != 'list') or '<' in rota or '(?P' in rota or classe in vistos:
+                continue
+            vistos.add(classe)
+            yield rota.replace('^', '').replace('$', ''), callback
+
+    def _medir(self, view, url, usuario, ativo, repeticoes):
+        def requisitar():
+            request = APIRequestFactory().get(url)
+            force_authenticate(request, user=User.objects.select_related('perfil').get(pk=usuario.pk))
+            return view(request).render()
+
+        with override_settings(SIGA_SERIALIZACAO_COMPILADA={'ATIVO': ativo}):
+            with ContadorConsultas() as contador:
+                resposta = requisitar()
+            p50, _ = medir(requisitar, repeticoes)
+        json_drf = None
+        if isinstance(resposta.accepted_renderer, OrjsonRenderer) and resposta.data is not None:
+            json_drf = JSONRenderer().render(resposta.data)
+        return {
+            'status': resposta.status_code, 'bytes': resposta.content, 'json_drf': json_drf,
+            'queries': contador.total, 'p50': p50,
+        }
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:45
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+try:
+    from unidecode import unidecode
+except ImportError:
+    def unidecode(texto):
+        return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+
+PALAVRAS_IGNORADAS = {'de', 'da', 'do', 'dos', 'das', 'e'}
+
+
+# Cópia da normalização de atendimentos/busca.py na data desta migração: a
+# migração não pode depender do código (nem dos modelos) atual do app.
+def normalizar_nome_para_conjunto(nome):
+    if not nome:
+        return set()
+    nome_limpo = re.sub(r'[^a-z0-9\s]', '', unidecode(nome).lower())
+    return {palavra for palavra in nome_limpo.split() if palavra not in PALAVRAS_IGNORADAS}
+
+
+def popular_tokens(apps, schema_editor):
+    Municipe = apps.get_model('atendimentos', 'Municipe')
+    MunicipeToken = apps.get_model('atendimentos', 'MunicipeToken')
+    lote = []
+    for municipe in Municipe.objects.only('id', 'nome_completo', 'nome_de_guerra').iterator(chunk_size=1000):
+        tokens = normalizar_nome_para_conjunto(municipe.nome_completo) | normalizar_nome_para_conjunto(municipe.nome_de_guerra)
+        lote.extend(MunicipeToken(municipe_id=municipe.id, token=token[:100]) for token in tokens)
+        if len(lote) >= 5000:
+            MunicipeToken.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        MunicipeToken.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0014_conta_ano_corrente_oficio_conta_ultimo_numero_oficio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MunicipeToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100)),
+                ('municipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_busca', to='atendimentos.municipe')),
+            ],
+            options={
+                'verbose_name': 'Token de Busca de Munícipe',
+                'verbose_name_plural': 'Tokens de Busca de Munícipes',
+                'indexes': [models.Index(fields=['token', 'municipe'], name='municipe_token_idx')],
+            },
+        ),
+        migrations.RunPython(popular_tokens, migrations.RunPython.noop),
+    ]
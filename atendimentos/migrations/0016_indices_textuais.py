@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:10
+
+from django.db import migrations
+
+from atendimentos.migrations._indice_textual import criar_indice_textual, remover_indice_textual
+
+
+INDICES = [
+    ('atendimentos_municipe', ('nome_completo', 'nome_de_guerra')),
+    ('atendimentos_atendimento', ('titulo', 'descricao')),
+]
+
+
+def criar_indices(apps, schema_editor):
+    for tabela, colunas in INDICES:
+        criar_indice_textual(schema_editor, tabela, colunas)
+
+
+def remover_indices(apps, schema_editor):
+    for tabela, colunas in INDICES:
+        remover_indice_textual(schema_editor, tabela, colunas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0015_municipetoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
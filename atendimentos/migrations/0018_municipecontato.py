@@ -0,0 +1,84 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:40
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+TAMANHO_LOTE = 2000
+
+
+# Cópia da normalização de atendimentos/busca.py na data desta migração: a
+# migração não pode depender do código (nem dos modelos) atual do app.
+def normalizar_telefone(numero):
+    digitos = re.sub(r'\D', '', str(numero or ''))
+    if len(digitos) in (12, 13) and digitos.startswith('55'):
+        digitos = digitos[2:]
+    return digitos
+
+
+def normalizar_email(email):
+    return str(email or '').strip().lower()
+
+
+def contatos_dos_campos(emails, telefones):
+    contatos = []
+    for tipo, itens, chave, normalizar in (
+        ('email', emails, 'email', normalizar_email),
+        ('telefone', telefones, 'numero', normalizar_telefone),
+    ):
+        vistos = set()
+        for item in itens if isinstance(itens, list) else []:
+            if not isinstance(item, dict):
+                continue
+            valor = normalizar(item.get(chave))[:255]
+            if valor and valor not in vistos:
+                contatos.append((tipo, valor, not vistos))
+                vistos.add(valor)
+    return contatos
+
+
+def popular_contatos(apps, schema_editor):
+    """Preenche MunicipeContato a partir dos JSONFields, em lotes."""
+    Municipe = apps.get_model('atendimentos', 'Municipe')
+    MunicipeContato = apps.get_model('atendimentos', 'MunicipeContato')
+    lote = []
+    municipes = Municipe.objects.order_by('id').values_list('id', 'emails', 'telefones')
+    for municipe_id, emails, telefones in municipes.iterator(chunk_size=TAMANHO_LOTE):
+        lote.extend(
+            MunicipeContato(municipe_id=municipe_id, tipo=tipo, valor=valor, principal=principal)
+            for tipo, valor, principal in contatos_dos_campos(emails, telefones)
+        )
+        if len(lote) >= TAMANHO_LOTE:
+            MunicipeContato.objects.bulk_create(lote, batch_size=TAMANHO_LOTE)
+            lote = []
+    if lote:
+        MunicipeContato.objects.bulk_create(lote, batch_size=TAMANHO_LOTE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0017_indice_textual_lembrete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MunicipeContato',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('telefone', 'Telefone'), ('email', 'E-mail')], max_length=10)),
+                ('valor', models.CharField(max_length=255, verbose_name='Valor Normalizado')),
+                ('principal', models.BooleanField(default=False, help_text='Primeiro telefone/e-mail da lista do munícipe.')),
+                ('municipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contatos', to='atendimentos.municipe')),
+            ],
+            options={
+                'verbose_name': 'Contato de Munícipe',
+                'verbose_name_plural': 'Contatos de Munícipes',
+                'indexes': [models.Index(fields=['tipo', 'valor'], name='municipe_contato_busca_idx')],
+                'constraints': [models.UniqueConstraint(fields=('municipe', 'tipo', 'valor'), name='municipe_contato_unico')],
+            },
+        ),
+        migrations.RunPython(popular_contatos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-17 06:10
+
+import re
+
+from django.db import migrations, models
+
+
+TAMANHO_LOTE = 2000
+
+
+# Cópia de atendimentos.busca.normalizar_cpf na data desta migração: a
+# migração não pode depender do código (nem dos modelos) atual do app.
+def normalizar_cpf(cpf):
+    digitos = re.sub(r'\D', '', str(cpf or ''))[:11]
+    return digitos or None
+
+
+def popular_cpf_digitos(apps, schema_editor):
+    """Preenche cpf_digitos a partir do CPF formatado, em lotes."""
+    Municipe = apps.get_model('atendimentos', 'Municipe')
+    lote = []
+    municipes = Municipe.objects.exclude(cpf__isnull=True).exclude(cpf='').order_by('id').only('id', 'cpf')
+    for municipe in municipes.iterator(chunk_size=TAMANHO_LOTE):
+        municipe.cpf_digitos = normalizar_cpf(municipe.cpf)
+        lote.append(municipe)
+        if len(lote) >= TAMANHO_LOTE:
+            Municipe.objects.bulk_update(lote, ['cpf_digitos'], batch_size=TAMANHO_LOTE)
+            lote = []
+    if lote:
+        Municipe.objects.bulk_update(lote, ['cpf_digitos'], batch_size=TAMANHO_LOTE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0018_municipecontato'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='municipe',
+            name='cpf_digitos',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=11, null=True, verbose_name='CPF (somente dígitos)'),
+        ),
+        migrations.RunPython(popular_cpf_digitos, migrations.RunPython.noop),
+    ]
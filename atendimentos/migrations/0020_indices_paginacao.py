@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 06:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0019_municipe_cpf_digitos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='atendimento',
+            index=models.Index(fields=['data_criacao', 'id'], name='atendimento_criacao_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='municipe',
+            index=models.Index(fields=['nome_completo', 'id'], name='municipe_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservaespaco',
+            index=models.Index(fields=['data_inicio', 'id'], name='reserva_inicio_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitacaoagenda',
+            index=models.Index(fields=['data_criacao', 'id'], name='solicitacao_criacao_id_idx'),
+        ),
+    ]
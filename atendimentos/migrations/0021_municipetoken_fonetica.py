@@ -0,0 +1,71 @@
+# Generated by Django 5.2.3 on 2026-10-17 07:05
+
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+TAMANHO_LOTE = 500
+TAMANHO_MAXIMO_TOKEN = 100
+
+# Cópia das regras de atendimentos/busca.py na data desta migração: a
+# migração não pode depender do código (nem dos modelos) atual do app.
+REGRAS_FONETICAS = [
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'lh'), 'l'),
+    (re.compile(r'nh'), 'n'),
+    (re.compile(r'ch|sh'), 'x'),
+    (re.compile(r'[sx]c(?=[ei])'), 's'),
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'qu(?=[ei])|ck|c|q'), 'k'),
+    (re.compile(r'g(u?)(?=[ei])'), lambda m: 'g' if m.group(1) else 'j'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'm(?=[^aeiou]|$)'), 'n'),
+    (re.compile(r'e'), 'i'),
+    (re.compile(r'o'), 'u'),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+
+def chave_fonetica(token):
+    if not token or not token.isalpha():
+        return token
+    for padrao, substituto in REGRAS_FONETICAS:
+        token = padrao.sub(substituto, token)
+    return token[:TAMANHO_MAXIMO_TOKEN]
+
+
+def popular_chaves_foneticas(apps, schema_editor):
+    """Calcula a chave fonética dos tokens já gravados: um UPDATE por chave, com os tokens em lotes."""
+    MunicipeToken = apps.get_model('atendimentos', 'MunicipeToken')
+    tokens_por_chave = defaultdict(list)
+    for token in MunicipeToken.objects.values_list('token', flat=True).distinct().iterator():
+        tokens_por_chave[chave_fonetica(token)].append(token)
+    for chave, tokens in tokens_por_chave.items():
+        for inicio in range(0, len(tokens), TAMANHO_LOTE):
+            MunicipeToken.objects.filter(token__in=tokens[inicio:inicio + TAMANHO_LOTE]).update(fonetica=chave)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0020_indices_paginacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='municipetoken',
+            name='fonetica',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='Chave Fonética'),
+        ),
+        migrations.RunPython(popular_chaves_foneticas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='municipetoken',
+            index=models.Index(fields=['fonetica', 'municipe'], name='municipe_token_fonetica_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0021_municipetoken_fonetica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='versao_autorizacao',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-17 08:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+TAMANHO_LOTE = 2000
+
+
+def popular_visibilidade(apps, schema_editor):
+    """Uma linha por vínculo munícipe-conta e a conta 0 para os munícipes sem conta, em lotes."""
+    Municipe = apps.get_model('atendimentos', 'Municipe')
+    MunicipeVisibilidade = apps.get_model('atendimentos', 'MunicipeVisibilidade')
+    ContaMunicipe = Municipe.contas.through
+
+    def gravar(pares):
+        MunicipeVisibilidade.objects.bulk_create(
+            [MunicipeVisibilidade(municipe_id=municipe_id, conta_id=conta_id) for municipe_id, conta_id in pares],
+            batch_size=TAMANHO_LOTE
+        )
+
+    vinculos = ContaMunicipe.objects.order_by('id').values_list('municipe_id', 'conta_id')
+    lote = []
+    for par in vinculos.iterator(chunk_size=TAMANHO_LOTE):
+        lote.append(par)
+        if len(lote) >= TAMANHO_LOTE:
+            gravar(lote)
+            lote = []
+    publicos = Municipe.objects.exclude(id__in=ContaMunicipe.objects.values('municipe_id')).order_by('id')
+    for municipe_id in publicos.values_list('id', flat=True).iterator(chunk_size=TAMANHO_LOTE):
+        lote.append((municipe_id, 0))
+        if len(lote) >= TAMANHO_LOTE:
+            gravar(lote)
+            lote = []
+    if lote:
+        gravar(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0022_perfilusuario_versao_autorizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MunicipeVisibilidade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conta_id', models.PositiveIntegerField(help_text='0 = público (sem conta vinculada).')),
+                ('municipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visibilidade', to='atendimentos.municipe')),
+            ],
+            options={
+                'verbose_name': 'Visibilidade de Munícipe',
+                'verbose_name_plural': 'Visibilidades de Munícipes',
+                'constraints': [models.UniqueConstraint(fields=('conta_id', 'municipe'), name='municipe_visibilidade_unica')],
+            },
+        ),
+        migrations.RunPython(popular_visibilidade, migrations.RunPython.noop),
+    ]
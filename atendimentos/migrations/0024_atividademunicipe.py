@@ -0,0 +1,82 @@
+# Generated by Django 5.2.3 on 2026-10-17 09:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+TAMANHO_LOTE = 2000
+TAMANHO_RESUMO = 500
+
+
+def popular_atividades(apps, schema_editor):
+    """Uma linha por atividade já existente, com os mesmos textos de atendimentos.atividades."""
+    AtividadeMunicipe = apps.get_model('atendimentos', 'AtividadeMunicipe')
+
+    def origens():
+        for atendimento in apps.get_model('atendimentos', 'Atendimento').objects.order_by('id').iterator(chunk_size=TAMANHO_LOTE):
+            yield ('ATENDIMENTO', atendimento.id, atendimento.municipe_id, None, atendimento.data_criacao,
+                   f'Atendimento {atendimento.protocolo}: {atendimento.titulo}', atendimento.descricao, atendimento.status)
+        tramitacoes = apps.get_model('atendimentos', 'Tramitacao').objects.select_related('atendimento').order_by('id')
+        for tramitacao in tramitacoes.iterator(chunk_size=TAMANHO_LOTE):
+            yield ('TRAMITACAO', tramitacao.id, tramitacao.atendimento.municipe_id, tramitacao.atendimento_id,
+                   tramitacao.data_tramitacao, f'Tramitação do atendimento {tramitacao.atendimento.protocolo}',
+                   tramitacao.despacho, '')
+        visitas = apps.get_model('atendimentos', 'RegistroVisita').objects.select_related('conta_destino').order_by('id')
+        for visita in visitas.iterator(chunk_size=TAMANHO_LOTE):
+            yield ('VISITA', visita.id, visita.municipe_id, None, visita.data_checkin,
+                   f'Visita a {visita.conta_destino.nome}', visita.observacao, '')
+        for agenda in apps.get_model('atendimentos', 'SolicitacaoAgenda').objects.order_by('id').iterator(chunk_size=TAMANHO_LOTE):
+            yield ('AGENDA', agenda.id, agenda.solicitante_id, None, agenda.data_criacao,
+                   f'Solicitação de agenda: {agenda.assunto}', agenda.detalhes, agenda.status)
+        for presenca in apps.get_model('eventos', 'ListaPresenca').objects.select_related('evento').order_by('id').iterator(chunk_size=TAMANHO_LOTE):
+            yield ('PRESENCA', presenca.evento_id, presenca.municipe_id, None, presenca.data_registro,
+                   f'Presença no evento {presenca.evento.nome}', '', '')
+        for destinatario in apps.get_model('eventos', 'Destinatario').objects.select_related('comunicacao').order_by('id').iterator(chunk_size=TAMANHO_LOTE):
+            comunicacao = destinatario.comunicacao
+            yield ('COMUNICACAO', comunicacao.id, destinatario.municipe_id, None,
+                   comunicacao.data_envio or comunicacao.data_criacao, f'Comunicação: {comunicacao.titulo}',
+                   comunicacao.descricao, comunicacao.status)
+
+    lote = []
+    for tipo, objeto_id, municipe_id, referencia_id, data, titulo, resumo, status in origens():
+        lote.append(AtividadeMunicipe(
+            tipo=tipo, objeto_id=objeto_id, municipe_id=municipe_id, referencia_id=referencia_id, data=data,
+            titulo=titulo[:255], resumo=(resumo or '')[:TAMANHO_RESUMO], status=status,
+        ))
+        if len(lote) >= TAMANHO_LOTE:
+            AtividadeMunicipe.objects.bulk_create(lote, ignore_conflicts=True)
+            lote = []
+    AtividadeMunicipe.objects.bulk_create(lote, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0023_municipevisibilidade'),
+        ('eventos', '0016_indices_paginacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtividadeMunicipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ATENDIMENTO', 'Atendimento'), ('TRAMITACAO', 'Tramitação'), ('VISITA', 'Visita'), ('AGENDA', 'Solicitação de Agenda'), ('PRESENCA', 'Presença em Evento'), ('COMUNICACAO', 'Comunicação')], max_length=20)),
+                ('objeto_id', models.PositiveBigIntegerField(help_text='ID do registro de origem (evento/comunicação para presenças e comunicações).')),
+                ('referencia_id', models.PositiveBigIntegerField(blank=True, help_text='Atendimento da tramitação.', null=True)),
+                ('data', models.DateTimeField()),
+                ('titulo', models.CharField(max_length=255)),
+                ('resumo', models.TextField(blank=True, default='')),
+                ('status', models.CharField(blank=True, default='', max_length=20)),
+                ('municipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='atividades', to='atendimentos.municipe')),
+            ],
+            options={
+                'verbose_name': 'Atividade do Munícipe',
+                'verbose_name_plural': 'Atividades dos Munícipes',
+                'ordering': ['-data', '-id'],
+                'indexes': [models.Index(fields=['municipe', 'data', 'id'], name='atividade_municipe_data_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'objeto_id', 'municipe'), name='atividade_municipe_unica')],
+            },
+        ),
+        migrations.RunPython(popular_atividades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:02
+
+from django.db import migrations, models
+
+from atendimentos.migrations._indice_textual import criar_indice_textual, remover_indice_textual
+
+
+TAMANHO_LOTE = 2000
+INDICE_TEXTUAL = ('atendimentos_municipe', ('nome_completo', 'nome_de_guerra'))
+
+
+def recriar_indice_textual(apps, schema_editor):
+    """
+    No SQLite, adicionar (ou remover) a coluna recria a tabela do munícipe e
+    apaga os triggers do índice FTS5 da 0016: sem eles, munícipes novos não
+    aparecem na busca. Recria o índice e os triggers (nos demais bancos o
+    índice sobrevive e nada muda).
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    remover_indice_textual(schema_editor, *INDICE_TEXTUAL)
+    criar_indice_textual(schema_editor, *INDICE_TEXTUAL)
+
+
+def calcular_pontuacoes(apps, schema_editor):
+    """Pontuação dos munícipes existentes, com a mesma regra de atendimentos.qualidade."""
+    Municipe = apps.get_model('atendimentos', 'Municipe')
+
+    def pontuacao(cpf, emails, telefones, endereco):
+        total = 0
+        if cpf and cpf.strip(): total += 1
+        if emails and any(e.get('email') for e in emails if isinstance(e, dict)): total += 1
+        if telefones: total += 1
+        if isinstance(endereco, dict) and endereco.get('cep'): total += 1
+        return total
+
+    pendentes = []
+    linhas = Municipe.objects.order_by('id').values_list('id', 'cpf', 'emails', 'telefones', 'endereco')
+    for municipe_id, *valores in linhas.iterator(chunk_size=TAMANHO_LOTE):
+        valor = pontuacao(*valores)
+        if valor:
+            pendentes.append(Municipe(id=municipe_id, pontuacao_qualidade=valor))
+        if len(pendentes) >= TAMANHO_LOTE:
+            Municipe.objects.bulk_update(pendentes, ['pontuacao_qualidade'])
+            pendentes = []
+    if pendentes:
+        Municipe.objects.bulk_update(pendentes, ['pontuacao_qualidade'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0024_atividademunicipe'),
+    ]
+
+    operations = [
+        # Ao desfazer, depois do RemoveField
+        migrations.RunPython(migrations.RunPython.noop, recriar_indice_textual),
+        migrations.AddField(
+            model_name='municipe',
+            name='pontuacao_qualidade',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='0 a 4: CPF, e-mail, telefone e CEP preenchidos (ver atendimentos.qualidade).', verbose_name='Pontuação de Qualidade dos Dados'),
+        ),
+        migrations.RunPython(recriar_indice_textual, migrations.RunPython.noop),
+        migrations.RunPython(calcular_pontuacoes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='municipe',
+            index=models.Index(fields=['pontuacao_qualidade', 'nome_completo', 'id'], name='municipe_qualidade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='municipe',
+            index=models.Index(fields=['data_atualizacao', 'id'], name='municipe_atualizacao_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-17 13:25
+
+import atendimentos.models
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0025_qualidade_municipe'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatorioJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(max_length=50, verbose_name='Tipo de Relatório')),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('base_url', models.CharField(blank=True, default='', help_text='URL da requisição original, para os links do PDF.', max_length=500)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDO', 'Concluído'), ('ERRO', 'Erro')], default='PENDENTE', max_length=20)),
+                ('progresso', models.PositiveSmallIntegerField(default=0, help_text='0 a 100.')),
+                ('total_linhas', models.PositiveIntegerField(blank=True, null=True)),
+                ('arquivo', models.FileField(blank=True, null=True, storage=atendimentos.models.armazenamento_relatorios, upload_to='%Y/%m/')),
+                ('nome_arquivo', models.CharField(blank=True, default='', max_length=255)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relatorios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Relatório em Processamento',
+                'verbose_name_plural': 'Relatórios em Processamento',
+                'ordering': ['-data_criacao'],
+                'indexes': [models.Index(fields=['usuario', 'data_criacao'], name='relatorio_job_usuario_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0026_relatoriojob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='municipe',
+            index=models.Index(fields=['data_cadastro', 'id'], name='municipe_cadastro_id_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+"""
+DDL dos índices textuais (FULLTEXT no MySQL, FTS5 com triggers no SQLite),
+usada pelas migrações 0016, 0017 e 0025 do atendimentos, 0015 do eventos e
+0004 do oficios.
+
+Congelado junto com essas migrações: não importa nada do código da aplicação
+(modelos, busca, backends) e não deve mudar. Um índice com outra forma precisa
+de uma migração nova, com a sua própria DDL.
+"""
+
+
+def criar_indice_textual(schema_editor, tabela, colunas):
+    """Cria o índice textual adequado ao banco da migração (nos demais bancos não faz nada)."""
+    vendor = schema_editor.connection.vendor
+    q = schema_editor.quote_name
+    indice = f'busca_{tabela}'
+
+    if vendor == 'mysql':
+        schema_editor.execute(
+            f"CREATE FULLTEXT INDEX {q(indice)} ON {q(tabela)} ({', '.join(q(c) for c in colunas)})"
+        )
+    elif vendor == 'sqlite':
+        lista = ', '.join(q(c) for c in colunas)
+        novos = ', '.join(f'new.{q(c)}' for c in colunas)
+        antigos = ', '.join(f'old.{q(c)}' for c in colunas)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {q(indice)} USING fts5({lista}, content={q(tabela)}, "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        # Triggers de sincronização da tabela de conteúdo externo
+        schema_editor.execute(
+            f"CREATE TRIGGER {q(indice + '_ai')} AFTER INSERT ON {q(tabela)} BEGIN "
+            f"INSERT INTO {q(indice)}(rowid, {lista}) VALUES (new.id, {novos}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {q(indice + '_ad')} AFTER DELETE ON {q(tabela)} BEGIN "
+            f"INSERT INTO {q(indice)}({q(indice)}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {q(indice + '_au')} AFTER UPDATE ON {q(tabela)} BEGIN "
+            f"INSERT INTO {q(indice)}({q(indice)}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); "
+            f"INSERT INTO {q(indice)}(rowid, {lista}) VALUES (new.id, {novos}); END"
+        )
+        schema_editor.execute(f"INSERT INTO {q(indice)}({q(indice)}) VALUES ('rebuild')")
+
+
+def remover_indice_textual(schema_editor, tabela, colunas):
+    vendor = schema_editor.connection.vendor
+    q = schema_editor.quote_name
+    indice = f'busca_{tabela}'
+
+    if vendor == 'mysql':
+        schema_editor.execute(f"DROP INDEX {q(indice)} ON {q(tabela)}")
+    elif vendor == 'sqlite':
+        for sufixo in ('_ai', '_ad', '_au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {q(indice + sufixo)}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {q(indice)}")
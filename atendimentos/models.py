@@ -68,8 +68,17 @@ class PerfilUsuario(models.Model):
         default=False,
         verbose_name="Pode visualizar agendas compartilhadas?"
     )
+    # Incrementada sempre que grupos ou contas do usuário mudam: tokens JWT
+    # emitidos com uma versão anterior deixam de valer para as permissões.
+    versao_autorizacao = models.PositiveIntegerField(default=0, editable=False)
     def __str__(self): return f"Perfil de {self.usuario.username}"
 
+    @classmethod
+    def incrementar_versao_autorizacao(cls, usuarios_ids):
+        cls.objects.filter(usuario_id__in=usuarios_ids).update(
+            versao_autorizacao=models.F('versao_autorizacao') + 1
+        )
+
 class CategoriaContato(UppercaseFieldsMixin, models.Model):
     nome = models.CharField(max_length=100, unique=True)
     ativa = models.BooleanField(default=True)
@@ -80,6 +89,113 @@ class CategoriaContato(UppercaseFieldsMixin, models.Model):
     class Meta:
         ordering = ['nome']
 
+class MunicipeQuerySet(models.QuerySet):
+    """
+    QuerySet que mantém os índices de busca (MunicipeToken, MunicipeContato,
+    cpf_digitos e MunicipeVisibilidade), a pontuação de qualidade e os caches de
+    busca sincronizados também nas escritas em lote, que não passam pelo save()
+    nem disparam os sinais de post_save. Também concentra os filtros de
+    visibilidade por conta e de qualidade do cadastro.
+    """
+    CAMPOS_INDEXADOS = ('nome_completo', 'nome_de_guerra', 'emails', 'telefones')
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .busca import atualizar_indices_municipes, atualizar_visibilidade_municipes, normalizar_cpf
+        from .qualidade import pontuacao_do_municipe
+        from . import cache_busca, typeahead
+        objs = list(objs)
+        for obj in objs:
+            obj.cpf_digitos = normalizar_cpf(obj.cpf)
+            obj.pontuacao_qualidade = pontuacao_do_municipe(obj)
+        objs = super().bulk_create(objs, *args, **kwargs)
+        # No MySQL o bulk_create não devolve as PKs geradas; esses registros
+        # ficam para o comando 'indexar_municipes'.
+        atualizar_indices_municipes([obj for obj in objs if obj.pk])
+        atualizar_visibilidade_municipes([obj.pk for obj in objs if obj.pk])
+        typeahead.invalidar()
+        cache_busca.invalidar()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .busca import atualizar_indices_municipes, normalizar_cpf
+        from .qualidade import CAMPOS_QUALIDADE, pontuacao_do_municipe
+        from . import cache_busca, typeahead
+        if 'cpf' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.cpf_digitos = normalizar_cpf(obj.cpf)
+            fields = [*fields, 'cpf_digitos']
+        if set(fields) & set(CAMPOS_QUALIDADE):
+            objs = list(objs)
+            for obj in objs:
+                obj.pontuacao_qualidade = pontuacao_do_municipe(obj)
+            fields = [*fields, 'pontuacao_qualidade']
+        resultado = super().bulk_update(objs, fields, *args, **kwargs)
+        if set(fields) & set(self.CAMPOS_INDEXADOS):
+            atualizar_indices_municipes(objs)
+        typeahead.invalidar()
+        cache_busca.invalidar()
+        return resultado
+
+    def update(self, **kwargs):
+        from .busca import atualizar_indices_municipes, normalizar_cpf
+        from .qualidade import CAMPOS_QUALIDADE, recalcular
+        from . import cache_busca, typeahead
+        if 'cpf' in kwargs and not hasattr(kwargs['cpf'], 'resolve_expression'):
+            kwargs['cpf_digitos'] = normalizar_cpf(kwargs['cpf'])
+        if not set(kwargs) & {*self.CAMPOS_INDEXADOS, *CAMPOS_QUALIDADE}:
+            resultado = super().update(**kwargs)
+            typeahead.invalidar()
+            cache_busca.invalidar()
+            return resultado
+        ids = list(self.values_list('id', flat=True))
+        resultado = super().update(**kwargs)
+        if set(kwargs) & set(CAMPOS_QUALIDADE):
+            recalcular(Municipe.objects.filter(id__in=ids))
+        if set(kwargs) & set(self.CAMPOS_INDEXADOS):
+            atualizar_indices_municipes(Municipe.objects.filter(id__in=ids))
+        typeahead.invalidar()
+        cache_busca.invalidar()
+        return resultado
+
+    def marcar_atualizados(self):
+        """
+        Só troca a `data_atualizacao` (ETag/Last-Modified), sem reindexar nem
+        invalidar os caches de busca: para quem já cuida disso, como os sinais
+        de m2m das contas.
+        """
+        return super().update(data_atualizacao=timezone.now())
+
+    def visiveis_para_contas(self, contas, incluir_publicos=True):
+        """
+        Munícipes vinculados a alguma das `contas` (ids ou queryset de Conta) e,
+        com `incluir_publicos`, os sem conta. Usa a tabela MunicipeVisibilidade
+        num único semi-join indexado, sem JOIN com as contas nem DISTINCT.
+        """
+        filtro = models.Q(conta_id__in=contas)
+        if incluir_publicos:
+            filtro |= models.Q(conta_id=MunicipeVisibilidade.CONTA_PUBLICO)
+        return self.filter(id__in=MunicipeVisibilidade.objects.filter(filtro).values('municipe_id'))
+
+    def visiveis_para(self, user):
+        """Regra padrão de visibilidade: superusuário vê tudo; com perfil, os públicos e os das suas contas."""
+        from .permissions import contexto_autorizacao
+        contexto = contexto_autorizacao(user)
+        if contexto.is_superuser:
+            return self.all()
+        if not contexto.tem_perfil:
+            return self.none()
+        return self.visiveis_para_contas(contexto.contas_ids)
+
+    def com_qualidade(self, pontuacoes):
+        """Munícipes com `pontuacao_qualidade` entre as `pontuacoes` (ver qualidade.pontuacoes_dos_niveis)."""
+        return self.filter(pontuacao_qualidade__in=pontuacoes)
+
+    def desatualizados(self, agora=None):
+        """Munícipes com `alerta_atualizacao`: sem atualização há mais de 180 dias."""
+        from .qualidade import filtro_desatualizados
+        return self.filter(filtro_desatualizados(agora))
+
 class Municipe(UppercaseFieldsMixin, models.Model):
     nome_completo = models.CharField(max_length=255, verbose_name="Nome Completo")
     tratamento = models.CharField(
@@ -109,6 +225,14 @@ class Municipe(UppercaseFieldsMixin, models.Model):
         verbose_name="Contas com Acesso"
     )
     cpf = models.CharField(max_length=14, unique=True, blank=True, null=True, default=None, verbose_name="CPF")
+    cpf_digitos = models.CharField(
+        max_length=11,
+        blank=True,
+        null=True,
+        editable=False,
+        db_index=True, # Busca exata/por prefixo de CPF sem depender da formatação
+        verbose_name="CPF (somente dígitos)"
+    )
     data_nascimento = models.DateField(blank=True, null=True, verbose_name="Data de Nascimento")
     emails = models.JSONField(default=list, blank=True, null=True, verbose_name="Emails")
     cargo = models.CharField(max_length=150, blank=True, null=True, verbose_name="Cargo")
@@ -118,6 +242,12 @@ class Municipe(UppercaseFieldsMixin, models.Model):
     observacoes = models.TextField(blank=True, null=True, verbose_name="Observações")
     data_cadastro = models.DateTimeField(auto_now_add=True, verbose_name="Data de Cadastro")
     data_atualizacao = models.DateTimeField(auto_now=True, verbose_name="Última Atualização")
+    pontuacao_qualidade = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Pontuação de Qualidade dos Dados",
+        help_text="0 a 4: CPF, e-mail, telefone e CEP preenchidos (ver atendimentos.qualidade)."
+    )
     matricula_rh = models.CharField(max_length=50, unique=True, null=True, blank=True, verbose_name="Matrícula RH")
     ativo = models.BooleanField(default=True)
     grupo_duplicado = models.UUIDField(
@@ -126,9 +256,102 @@ class Municipe(UppercaseFieldsMixin, models.Model):
         db_index=True, # Otimiza a busca por este campo
         verbose_name="Grupo de Possíveis Duplicatas"
     )
-    class Meta: verbose_name = "Munícipe"; verbose_name_plural = "Munícipes"; ordering = ['nome_completo']
+
+    objects = MunicipeQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Munícipe"
+        verbose_name_plural = "Munícipes"
+        ordering = ['nome_completo']
+        # Paginação por chave (atendimentos.pagination) nas ordenações da listagem
+        indexes = [
+            models.Index(fields=['nome_completo', 'id'], name='municipe_nome_id_idx'),
+            models.Index(fields=['data_cadastro', 'id'], name='municipe_cadastro_id_idx'),
+            models.Index(fields=['pontuacao_qualidade', 'nome_completo', 'id'], name='municipe_qualidade_idx'),
+            models.Index(fields=['data_atualizacao', 'id'], name='municipe_atualizacao_idx'),
+        ]
     def __str__(self): return self.nome_completo
 
+    def save(self, *args, **kwargs):
+        from .busca import normalizar_cpf
+        from .qualidade import CAMPOS_QUALIDADE, pontuacao_do_municipe
+        self.cpf_digitos = normalizar_cpf(self.cpf)
+        self.pontuacao_qualidade = pontuacao_do_municipe(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'cpf' in update_fields:
+            update_fields = kwargs['update_fields'] = {*update_fields, 'cpf_digitos'}
+        if update_fields is not None and set(update_fields) & set(CAMPOS_QUALIDADE):
+            kwargs['update_fields'] = {*update_fields, 'pontuacao_qualidade'}
+        super().save(*args, **kwargs)
+
+class MunicipeToken(models.Model):
+    """
+    Índice de busca por nome: cada palavra normalizada (sem acentos, minúscula e
+    sem preposições) do nome completo e do nome de guerra vira uma linha aqui,
+    junto com a sua chave fonética (buscas com `fuzzy=1`).
+    Mantido pelos sinais de Municipe e pelo MunicipeQuerySet.
+    """
+    municipe = models.ForeignKey(Municipe, on_delete=models.CASCADE, related_name='tokens_busca')
+    token = models.CharField(max_length=100)
+    fonetica = models.CharField(max_length=100, blank=True, default='', verbose_name="Chave Fonética")
+
+    class Meta:
+        verbose_name = "Token de Busca de Munícipe"
+        verbose_name_plural = "Tokens de Busca de Munícipes"
+        indexes = [
+            models.Index(fields=['token', 'municipe'], name='municipe_token_idx'),
+            models.Index(fields=['fonetica', 'municipe'], name='municipe_token_fonetica_idx'),
+        ]
+
+    def __str__(self): return f"{self.token} -> {self.municipe_id}"
+
+class MunicipeContato(models.Model):
+    """
+    Telefones e e-mails do munícipe em forma normalizada (telefone só com dígitos,
+    e-mail em minúsculas), espelhando os JSONFields `telefones` e `emails` para
+    permitir buscas exatas indexadas. Mantido pelos sinais de Municipe e pelo MunicipeQuerySet.
+    """
+    TIPO_CHOICES = [
+        ('telefone', 'Telefone'),
+        ('email', 'E-mail'),
+    ]
+    municipe = models.ForeignKey(Municipe, on_delete=models.CASCADE, related_name='contatos')
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    valor = models.CharField(max_length=255, verbose_name="Valor Normalizado")
+    principal = models.BooleanField(default=False, help_text="Primeiro telefone/e-mail da lista do munícipe.")
+
+    class Meta:
+        verbose_name = "Contato de Munícipe"
+        verbose_name_plural = "Contatos de Munícipes"
+        constraints = [
+            models.UniqueConstraint(fields=['municipe', 'tipo', 'valor'], name='municipe_contato_unico'),
+        ]
+        indexes = [models.Index(fields=['tipo', 'valor'], name='municipe_contato_busca_idx')]
+
+    def __str__(self): return f"{self.get_tipo_display()}: {self.valor}"
+
+class MunicipeVisibilidade(models.Model):
+    """
+    Visibilidade materializada do Munícipe: uma linha por conta vinculada ou,
+    se ele não tiver nenhuma, uma única linha com a conta sentinela 0 (público).
+    Espelha o M2M `contas` para filtrar "públicos + das minhas contas" com um
+    semi-join no índice (conta_id, municipe). Mantida pelos sinais de m2m_changed
+    de Municipe.contas e pelo MunicipeQuerySet.
+    """
+    CONTA_PUBLICO = 0
+
+    municipe = models.ForeignKey(Municipe, on_delete=models.CASCADE, related_name='visibilidade')
+    conta_id = models.PositiveIntegerField(help_text="0 = público (sem conta vinculada).")
+
+    class Meta:
+        verbose_name = "Visibilidade de Munícipe"
+        verbose_name_plural = "Visibilidades de Munícipes"
+        constraints = [
+            models.UniqueConstraint(fields=['conta_id', 'municipe'], name='municipe_visibilidade_unica'),
+        ]
+
+    def __str__(self): return f"{self.municipe_id} -> conta {self.conta_id or 'pública'}"
+
 class CategoriaAtendimento(UppercaseFieldsMixin, models.Model):
     nome = models.CharField(max_length=100, unique=True, verbose_name="Nome da Categoria")
     descricao = models.TextField(blank=True, null=True, verbose_name="Descrição")
@@ -149,7 +372,12 @@ class Atendimento(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='atendimentos_criados')
     data_criacao = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
     data_atualizacao = models.DateTimeField(auto_now=True, verbose_name="Última Atualização")
-    class Meta: verbose_name = "Atendimento"; verbose_name_plural = "Atendimentos"; ordering = ['-data_criacao']
+    class Meta:
+        verbose_name = "Atendimento"
+        verbose_name_plural = "Atendimentos"
+        ordering = ['-data_criacao']
+        # Paginação por chave (atendimentos.pagination)
+        indexes = [models.Index(fields=['data_criacao', 'id'], name='atendimento_criacao_id_idx')]
     def __str__(self): return f"{self.protocolo} - {self.titulo}"
     def save(self, *args, **kwargs):
         if not self.protocolo:
@@ -238,6 +466,8 @@ class SolicitacaoAgenda(UppercaseFieldsMixin, models.Model):
         verbose_name = "Solicitação de Agenda"
         verbose_name_plural = "Solicitações de Agenda"
         ordering = ['-data_criacao']
+        # Paginação por chave (atendimentos.pagination)
+        indexes = [models.Index(fields=['data_criacao', 'id'], name='solicitacao_criacao_id_idx')]
         
     def __str__(self): 
         return f"Agenda para {self.solicitante.nome_completo} sobre '{self.assunto}'"
@@ -318,6 +548,8 @@ class ReservaEspaco(UppercaseFieldsMixin, models.Model):
         verbose_name = "Reserva de Espaço"
         verbose_name_plural = "Reservas de Espaços"
         ordering = ['data_inicio']
+        # Paginação por chave (atendimentos.pagination)
+        indexes = [models.Index(fields=['data_inicio', 'id'], name='reserva_inicio_id_idx')]
 
     def __str__(self):
         return f"{self.espaco.nome} - {self.titulo} em {self.data_inicio.strftime('%d/%m/%Y %H:%M')}"
@@ -352,4 +584,86 @@ class Lembrete(UppercaseFieldsMixin, models.Model):
     class Meta:
         ordering = ['-data_criacao']
         verbose_name = "Lembrete"
-        verbose_name_plural = "Lembretes"
\ No newline at end of file
+        verbose_name_plural = "Lembretes"
+
+
+class AtividadeMunicipe(models.Model):
+    """
+    Linha do tempo do munícipe: uma linha por atividade (atendimento, tramitação,
+    visita, agenda, presença em evento, comunicação), mantida pelos sinais
+    (atendimentos.atividades). A leitura é uma única consulta no índice
+    (municipe, data, id), sem juntar as tabelas de origem.
+    """
+    ATENDIMENTO = 'ATENDIMENTO'
+    TRAMITACAO = 'TRAMITACAO'
+    VISITA = 'VISITA'
+    AGENDA = 'AGENDA'
+    PRESENCA = 'PRESENCA'
+    COMUNICACAO = 'COMUNICACAO'
+    TIPO_CHOICES = [
+        (ATENDIMENTO, 'Atendimento'), (TRAMITACAO, 'Tramitação'), (VISITA, 'Visita'),
+        (AGENDA, 'Solicitação de Agenda'), (PRESENCA, 'Presença em Evento'), (COMUNICACAO, 'Comunicação'),
+    ]
+
+    municipe = models.ForeignKey(Municipe, on_delete=models.CASCADE, related_name='atividades')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    # Presença e comunicação apontam para o evento e a comunicação (um por munícipe)
+    objeto_id = models.PositiveBigIntegerField(help_text="ID do registro de origem (evento/comunicação para presenças e comunicações).")
+    referencia_id = models.PositiveBigIntegerField(null=True, blank=True, help_text="Atendimento da tramitação.")
+    data = models.DateTimeField()
+    titulo = models.CharField(max_length=255)
+    resumo = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=20, blank=True, default='')
+
+    class Meta:
+        verbose_name = "Atividade do Munícipe"
+        verbose_name_plural = "Atividades dos Munícipes"
+        ordering = ['-data', '-id']
+        indexes = [models.Index(fields=['municipe', 'data', 'id'], name='atividade_municipe_data_idx')]
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id', 'municipe'], name='atividade_municipe_unica'),
+        ]
+
+    def __str__(self): return f"{self.get_tipo_display()} de {self.municipe_id} em {self.data:%d/%m/%Y %H:%M}"
+
+def armazenamento_relatorios():
+    """Relatórios gerados ficam fora do MEDIA_ROOT: só saem pela view de download, para o dono."""
+    from django.conf import settings
+    from django.core.files.storage import FileSystemStorage
+    diretorio = getattr(settings, 'SIGA_RELATORIOS', {}).get('DIRETORIO')
+    return FileSystemStorage(location=diretorio or settings.BASE_DIR / 'relatorios_gerados')
+
+class RelatorioJob(models.Model):
+    """
+    Relatório em PDF gerado fora da requisição, pelo Celery (atendimentos.relatorios).
+    O arquivo fica disponível para download até `expira_em`; o comando
+    `limpar_relatorios` remove os vencidos.
+    """
+    PENDENTE = 'PENDENTE'
+    PROCESSANDO = 'PROCESSANDO'
+    CONCLUIDO = 'CONCLUIDO'
+    ERRO = 'ERRO'
+    STATUS_CHOICES = [(PENDENTE, 'Pendente'), (PROCESSANDO, 'Processando'), (CONCLUIDO, 'Concluído'), (ERRO, 'Erro')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='relatorios')
+    tipo = models.CharField(max_length=50, verbose_name="Tipo de Relatório")
+    parametros = models.JSONField(default=dict, blank=True)
+    base_url = models.CharField(max_length=500, blank=True, default='', help_text="URL da requisição original, para os links do PDF.")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+    progresso = models.PositiveSmallIntegerField(default=0, help_text="0 a 100.")
+    total_linhas = models.PositiveIntegerField(null=True, blank=True)
+    arquivo = models.FileField(upload_to='%Y/%m/', storage=armazenamento_relatorios, blank=True, null=True)
+    nome_arquivo = models.CharField(max_length=255, blank=True, default='')
+    erro = models.TextField(blank=True, default='')
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+    expira_em = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Relatório em Processamento"
+        verbose_name_plural = "Relatórios em Processamento"
+        ordering = ['-data_criacao']
+        indexes = [models.Index(fields=['usuario', 'data_criacao'], name='relatorio_job_usuario_idx')]
+
+    def __str__(self): return f"{self.tipo} de {self.usuario_id} ({self.get_status_display()})"
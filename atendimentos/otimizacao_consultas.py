@@ -0,0 +1,273 @@
+"""
+Otimização automática das consultas das views a partir do serializer.
+
+O plano é montado percorrendo os campos do serializer da view (respeitando
+`?fields=`): `source` com pontos e serializers aninhados em FK/OneToOne viram
+`select_related`; relações many=True (m2m e FK reversa) e tudo o que fica
+abaixo delas viram `prefetch_related`. Quando todos os campos do modelo
+principal são conhecidos, a listagem também usa `only()`.
+
+Um nível do plano fica "opaco" (carrega todos os campos) quando o serializer
+depende de código que não dá para inspecionar: SerializerMethodField,
+`source='*'`, propriedades/métodos do modelo ou `to_representation`
+sobrescrito. Relações usadas só dentro desses métodos continuam sendo
+responsabilidade da view (select_related/prefetch_related manuais somam-se ao
+plano).
+
+O plano de cada view pode ser visto com `python manage.py plano_consultas` ou
+no log `atendimentos.otimizacao_consultas` em nível DEBUG.
+"""
+import logging
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField, SlugRelatedField
+
+logger = logging.getLogger(__name__)
+
+# Planos já calculados por (serializer, campos, modelo, anotações); limitado
+# porque `?fields=` permite combinações arbitrárias.
+_PLANOS = {}
+LIMITE_PLANOS_EM_CACHE = 512
+
+# Módulos cujo `get()`/`list()` só passa as linhas pelo serializer (a
+# serialização compilada e o GET condicional caem na listagem padrão)
+MODULOS_LISTAGEM_PADRAO = (
+    'rest_framework.', 'atendimentos.serializacao_compilada', 'atendimentos.requisicoes_condicionais',
+)
+
+
+class PlanoConsultas:
+    """select_related, prefetch_related e campos usados por nível ('' = modelo principal)."""
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        self.select_related = set()
+        self.prefetch_related = set()
+        # prefixo -> conjunto de campos usados, ou None quando o nível é opaco
+        self.campos = {}
+        self.motivos_opacos = {}
+
+    def usar_campo(self, prefixo, nome):
+        campos = self.campos.setdefault(prefixo, set())
+        if campos is not None:
+            campos.add(nome)
+
+    def tornar_opaco(self, prefixo, motivo):
+        self.campos[prefixo] = None
+        self.motivos_opacos.setdefault(prefixo, motivo)
+
+    def campos_only(self, queryset):
+        """Lista para `only()`, ou (None, motivo) quando não dá para restringir os campos."""
+        raiz = self.campos.get('', set())
+        if raiz is None:
+            return None, f"modelo principal opaco ({self.motivos_opacos.get('')})"
+        if queryset.query.deferred_loading != (frozenset(), True):
+            return None, 'a view já usa only()/defer()'
+        selecionados = queryset.query.select_related
+        if selecionados is True:
+            return None, 'a view usa select_related() sem argumentos'
+        existentes = set(_caminhos_select_related(selecionados or {}))
+        if not existentes <= self.select_related | _ancestrais(self.select_related):
+            return None, f'select_related da view fora do plano: {", ".join(sorted(existentes - self.select_related))}'
+
+        campos = set(raiz)
+        campos.update(_campos_ordenacao(queryset))
+        for caminho in sorted(self.select_related):
+            niveis = _niveis(caminho)
+            # Só restringe um nível quando todos os anteriores também estão restritos
+            if any(self.campos.get(nivel, set()) is None for nivel in [''] + niveis[:-1]):
+                continue
+            nivel = self.campos.get(caminho, set())
+            if nivel is not None:
+                campos.update(f'{caminho}__{nome}' for nome in nivel)
+        return sorted(campos), None
+
+    def descrever(self, queryset=None):
+        linhas = [
+            f'modelo: {self.modelo._meta.label}',
+            f"select_related: {', '.join(sorted(self.select_related)) or '-'}",
+            f"prefetch_related: {', '.join(sorted(self.prefetch_related)) or '-'}",
+        ]
+        if queryset is not None:
+            campos, motivo = self.campos_only(queryset)
+            linhas.append(f"only: {', '.join(campos)}" if campos else f'only: não aplicado ({motivo})')
+        for prefixo, motivo in sorted(self.motivos_opacos.items()):
+            linhas.append(f"opaco: {prefixo or '(principal)'} - {motivo}")
+        return '\n'.join(linhas)
+
+
+def _niveis(caminho):
+    partes = caminho.split('__')
+    return ['__'.join(partes[:indice]) for indice in range(1, len(partes) + 1)]
+
+
+def _ancestrais(caminhos):
+    return {nivel for caminho in caminhos for nivel in _niveis(caminho)[:-1]}
+
+
+def _caminhos_select_related(arvore, prefixo=''):
+    for nome, filhos in arvore.items():
+        caminho = f'{prefixo}__{nome}' if prefixo else nome
+        yield caminho
+        yield from _caminhos_select_related(filhos, caminho)
+
+
+def _campos_ordenacao(queryset):
+    """Campos simples da ordenação, que a paginação por chave lê de cada linha."""
+    ordenacao = queryset.query.order_by or (queryset.model._meta.ordering if queryset.query.default_ordering else ())
+    return {
+        campo.lstrip('-') for campo in ordenacao
+        if isinstance(campo, str) and '__' not in campo and campo.lstrip('-') not in queryset.query.annotations
+    }
+
+
+def _obter_campo(modelo, nome):
+    """Campo do modelo pelo nome, incluindo relações reversas pelo nome do acessor (ex.: `xxx_set`)."""
+    try:
+        return modelo._meta.get_field(nome)
+    except FieldDoesNotExist:
+        for relacao in modelo._meta.related_objects:
+            if relacao.get_accessor_name() == nome:
+                return relacao
+    return None
+
+
+def _seguir_fonte(plano, modelo, prefixo, via_prefetch, atributos, anotacoes, so_chave):
+    """
+    Percorre o `source` de um campo a partir do nível (modelo, prefixo). Devolve
+    o nível da relação final (modelo, caminho, via_prefetch) ou None quando o
+    campo termina num valor simples (ou não pôde ser resolvido).
+    """
+    for indice, atributo in enumerate(atributos):
+        ultimo = indice == len(atributos) - 1
+        campo = _obter_campo(modelo, atributo)
+        if campo is None:
+            if not (ultimo and prefixo == '' and atributo in anotacoes):
+                plano.tornar_opaco(prefixo, f"'{atributo}' não é campo do modelo")
+            return None
+        if not campo.is_relation:
+            plano.usar_campo(prefixo, campo.name)
+            return None
+        if campo.related_model is None:
+            plano.tornar_opaco(prefixo, f"relação genérica '{atributo}'")
+            return None
+
+        concreta = getattr(campo, 'concrete', False) and (campo.many_to_one or campo.one_to_one)
+        if ultimo and so_chave and concreta:
+            # PrimaryKeyRelatedField em FK só precisa da coluna `<campo>_id` (sem join)
+            plano.usar_campo(prefixo, campo.name)
+            return None
+
+        caminho = f'{prefixo}__{atributo}' if prefixo else atributo
+        if campo.many_to_many or campo.one_to_many:
+            plano.prefetch_related.add(caminho)
+            via_prefetch = True
+        elif via_prefetch:
+            plano.prefetch_related.add(caminho)
+        else:
+            plano.select_related.add(caminho)
+        if concreta:
+            plano.usar_campo(prefixo, campo.name)
+        modelo, prefixo = campo.related_model, caminho
+        plano.usar_campo(prefixo, modelo._meta.pk.name)
+    return modelo, prefixo, via_prefetch
+
+
+def _percorrer_serializer(plano, serializer, modelo, prefixo, via_prefetch, anotacoes):
+    plano.usar_campo(prefixo, modelo._meta.pk.name)
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        plano.tornar_opaco(prefixo, f'{type(serializer).__name__}.to_representation sobrescrito')
+
+    for nome, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        if isinstance(campo, serializers.SerializerMethodField):
+            plano.tornar_opaco(prefixo, f"SerializerMethodField '{nome}'")
+            continue
+        if campo.source == '*':
+            if isinstance(campo, serializers.Serializer):
+                _percorrer_serializer(plano, campo, modelo, prefixo, via_prefetch, anotacoes)
+            else:
+                plano.tornar_opaco(prefixo, f"'{nome}' usa source='*'")
+            continue
+
+        destino = _seguir_fonte(
+            plano, modelo, prefixo, via_prefetch, campo.source_attrs,
+            anotacoes if prefixo == '' else (), so_chave=isinstance(campo, PrimaryKeyRelatedField)
+        )
+        if destino is None:
+            continue
+        modelo_relacionado, caminho, relacao_via_prefetch = destino
+
+        if isinstance(campo, serializers.ListSerializer):
+            _percorrer_serializer(plano, campo.child, modelo_relacionado, caminho, True, ())
+        elif isinstance(campo, serializers.Serializer):
+            _percorrer_serializer(plano, campo, modelo_relacionado, caminho, relacao_via_prefetch, ())
+        elif isinstance(campo, (ManyRelatedField, RelatedField)):
+            relacionado = campo.child_relation if isinstance(campo, ManyRelatedField) else campo
+            if isinstance(relacionado, SlugRelatedField):
+                plano.usar_campo(caminho, relacionado.slug_field)
+            elif not isinstance(relacionado, PrimaryKeyRelatedField):
+                plano.tornar_opaco(caminho, f"'{nome}' usa {type(relacionado).__name__}")
+        else:
+            plano.tornar_opaco(caminho, f"'{nome}' representa o objeto relacionado inteiro")
+
+
+def plano_consultas(serializer, modelo, anotacoes=()):
+    """PlanoConsultas para `serializer` (instância, já com os campos de `?fields=` aplicados)."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    chave = (type(serializer), tuple(serializer.fields), modelo, frozenset(anotacoes))
+    plano = _PLANOS.get(chave)
+    if plano is None:
+        plano = PlanoConsultas(modelo)
+        _percorrer_serializer(plano, serializer, modelo, '', False, frozenset(anotacoes))
+        if len(_PLANOS) >= LIMITE_PLANOS_EM_CACHE:
+            _PLANOS.clear()
+        _PLANOS[chave] = plano
+    return plano
+
+
+def otimizar_queryset(queryset, serializer, restringir_campos=False):
+    """Aplica o plano do serializer ao queryset (e `only()`, se pedido e possível)."""
+    if not isinstance(queryset, QuerySet) or queryset._fields is not None or queryset.query.combinator:
+        return queryset
+    plano = plano_consultas(serializer, queryset.model, queryset.query.annotations)
+    if plano.select_related:
+        queryset = queryset.select_related(*sorted(plano.select_related))
+    if plano.prefetch_related:
+        queryset = queryset.prefetch_related(*sorted(plano.prefetch_related))
+    if restringir_campos:
+        campos, _ = plano.campos_only(queryset)
+        if campos:
+            queryset = queryset.only(*campos)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Plano de consultas de %s:\n%s', type(serializer).__name__, plano.descrever(queryset))
+    return queryset
+
+
+class OtimizacaoConsultasMixin:
+    """
+    Mixin para as views genéricas/viewsets do DRF: aplica o plano do serializer
+    nas leituras. Entra em `filter_queryset()`, por onde passam `list()` e
+    `get_object()`, porque as views costumam sobrescrever o `get_queryset()`.
+    O `only()` só é usado na listagem padrão do DRF (`list` sem sobrescrita),
+    em que as linhas só passam pelo serializer.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return otimizar_queryset(queryset, self.get_serializer(), restringir_campos=self._somente_serializer())
+
+    def _somente_serializer(self):
+        if not hasattr(type(self), 'list') or getattr(self, 'action', 'list') != 'list':
+            return False
+        return all(
+            getattr(type(self), nome).__module__.startswith(MODULOS_LISTAGEM_PADRAO)
+            for nome in ('get', 'list') if hasattr(type(self), nome)
+        )
@@ -0,0 +1,159 @@
+"""
+Paginação por chave (keyset) para as listagens grandes.
+
+Em vez de OFFSET, o cursor guarda os valores da última linha da página na
+ordenação da view (ex.: `data_criacao` e `id`), e a página seguinte é buscada
+com `WHERE (data_criacao, id) < (valores do cursor)`. Com um índice composto
+nesses campos, qualquer página custa o mesmo que a primeira, e inserções feitas
+enquanto o usuário navega não deslocam as páginas seguintes (nada repete nem
+some, como aconteceria com OFFSET).
+
+A view declara a ordenação em `ordenacao_paginacao` (campos não nulos, o
+último deles único, normalmente `id`). Resposta:
+    {"next": url | null, "previous": url | null, "results": [...]}
+"""
+import base64
+import binascii
+import json
+import operator
+import uuid
+from datetime import date, datetime
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-id',)
+    mensagem_cursor_invalido = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordenacao = [
+            (campo.lstrip('-'), campo.startswith('-'))
+            for campo in getattr(view, 'ordenacao_paginacao', self.ordering)
+        ]
+        self.campos = [queryset.model._meta.get_field(campo) for campo, _ in self.ordenacao]
+
+        valores, voltando = self.decodificar_cursor(request)
+        if valores is not None:
+            queryset = queryset.filter(self.filtro_apos(valores, voltando))
+        queryset = queryset.order_by(*self.ordem(voltando))
+
+        # Uma linha a mais indica se existe página depois desta (na direção da navegação)
+        resultados = list(queryset[:self.page_size + 1])
+        tem_mais = len(resultados) > self.page_size
+        resultados = resultados[:self.page_size]
+        if voltando:
+            resultados.reverse()
+            self.tem_anterior, self.tem_proxima = tem_mais, True
+        else:
+            self.tem_anterior, self.tem_proxima = valores is not None, tem_mais
+
+        self.primeiro = resultados[0] if resultados else None
+        self.ultimo = resultados[-1] if resultados else None
+        return resultados
+
+    def get_page_size(self, request):
+        try:
+            tamanho = int(request.query_params[self.page_size_query_param])
+        except (KeyError, TypeError, ValueError):
+            return self.page_size
+        return max(1, min(tamanho, self.max_page_size))
+
+    def ordem(self, voltando):
+        # Voltando uma página, a consulta percorre o índice no sentido contrário
+        return [f"{'-' if decrescente != voltando else ''}{campo}" for campo, decrescente in self.ordenacao]
+
+    def filtro_apos(self, valores, voltando):
+        """
+        Comparação de tuplas expandida: (a, b) < (x, y) vira
+        a <= x AND (a < x OR (a = x AND b < y)). O `a <= x` redundante
+        permite ao banco resolver o filtro com um range scan no índice.
+        """
+        condicoes = []
+        iguais = {}
+        for (campo, decrescente), valor in zip(self.ordenacao, valores):
+            operador = 'lt' if decrescente != voltando else 'gt'
+            condicoes.append(Q(**iguais, **{f'{campo}__{operador}': valor}))
+            iguais[campo] = valor
+        campo, decrescente = self.ordenacao[0]
+        operador = 'lte' if decrescente != voltando else 'gte'
+        return Q(**{f'{campo}__{operador}': valores[0]}) & reduce(operator.or_, condicoes)
+
+    # --- Cursor ---
+
+    def _valor_para_cursor(self, valor):
+        if isinstance(valor, (datetime, date)):
+            return valor.isoformat()
+        if isinstance(valor, uuid.UUID):
+            return str(valor)
+        return valor
+
+    def _valor_da_linha(self, obj, campo):
+        # Linhas de `.values()` (serialização compilada) chegam como dicionários
+        if isinstance(obj, dict):
+            return obj[campo.name]
+        return getattr(obj, campo.attname)
+
+    def codificar_cursor(self, obj, voltando):
+        valores = [self._valor_para_cursor(self._valor_da_linha(obj, campo)) for campo in self.campos]
+        conteudo = json.dumps({'v': valores, 'r': int(voltando)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(conteudo.encode()).decode().rstrip('=')
+
+    def decodificar_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            conteudo = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            valores = conteudo['v']
+            if len(valores) != len(self.campos):
+                raise ValueError
+            return [campo.to_python(valor) for campo, valor in zip(self.campos, valores)], bool(conteudo.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.mensagem_cursor_invalido)
+
+    # --- Links e resposta ---
+
+    def get_next_link(self):
+        if not self.tem_proxima or self.ultimo is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.codificar_cursor(self.ultimo, False))
+
+    def get_previous_link(self):
+        if not self.tem_anterior:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.primeiro is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.codificar_cursor(self.primeiro, True))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,5 +1,121 @@
+from django.utils.functional import cached_property
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+
+class ContextoAutorizacao:
+    """
+    Dados de autorização do usuário carregados uma única vez por requisição:
+    grupos, perfil e ids das contas (uma query cada, no primeiro uso). Fica
+    guardado no próprio objeto do usuário, que a autenticação recria a cada
+    requisição; permissões, querysets e serializers consultam este contexto
+    em vez de voltar ao banco.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.autenticado = bool(user and user.is_authenticated)
+        self.is_superuser = self.autenticado and user.is_superuser
+
+    @classmethod
+    def de_claims(cls, user, grupos, contas_ids):
+        """
+        Contexto montado com grupos e contas já conhecidos (claims de um token
+        validado ou o cache de usuários, ver atendimentos.autenticacao), sem
+        consultar o banco.
+        """
+        contexto = cls(user)
+        contexto.__dict__['grupos'] = frozenset(grupos)
+        contexto.__dict__['contas_ids'] = frozenset(contas_ids) if contas_ids is not None else None
+        return contexto
+
+    @cached_property
+    def grupos(self):
+        if not self.autenticado:
+            return frozenset()
+        return frozenset(self.user.groups.values_list('name', flat=True))
+
+    @cached_property
+    def perfil(self):
+        return getattr(self.user, 'perfil', None) if self.autenticado else None
+
+    @property
+    def tem_perfil(self):
+        return self.perfil is not None
+
+    @cached_property
+    def contas_ids(self):
+        """Ids das contas do perfil; None quando o usuário não tem perfil (diferente de um perfil sem contas)."""
+        if not self.tem_perfil:
+            return None
+        return frozenset(self.perfil.contas.values_list('id', flat=True))
+
+    @property
+    def contas_filtro(self):
+        """
+        Contas para usar em filtros `conta__in=`: a lista de ids quando ela já
+        foi carregada (ou veio do token), senão a subconsulta do perfil, que
+        vai junto na mesma query. None quando o usuário não tem perfil.
+        """
+        if 'contas_ids' in self.__dict__ or not self.tem_perfil:
+            return self.contas_ids
+        return self.perfil.contas.all()
+
+    @property
+    def pode_visualizar_agendas_compartilhadas(self):
+        return self.tem_perfil and self.perfil.pode_visualizar_agendas_compartilhadas
+
+    @cached_property
+    def permissoes(self):
+        """Permissões 'app_label.codename' do usuário, pelo cache de permissões."""
+        from .cache_permissoes import permissoes_do_usuario
+        return permissoes_do_usuario(self.user) if self.autenticado else frozenset()
+
+    def tem_permissao(self, permissao):
+        """Equivale a `user.has_perm(permissao)`, sem consultar o banco a cada requisição."""
+        return self.is_superuser or (self.user.is_active and permissao in self.permissoes)
+
+    def tem_grupo(self, *nomes):
+        """True se o usuário pertence a pelo menos um dos grupos."""
+        return not self.grupos.isdisjoint(nomes)
+
+    def tem_conta(self, conta_id):
+        return self.contas_ids is not None and conta_id in self.contas_ids
+
+    def compartilha_conta(self, contas_ids):
+        """True se alguma das contas informadas é do usuário."""
+        return self.contas_ids is not None and not self.contas_ids.isdisjoint(contas_ids)
+
+    def pode_editar_municipe(self, municipe):
+        """
+        Regra do `pode_editar` dos serializers de Munícipe. Usa `municipe.contas.all()`,
+        que não consulta o banco quando o queryset fez prefetch das contas.
+        """
+        if self.is_superuser:
+            return True
+        categoria = municipe.categoria
+        return pode_editar_municipe(
+            self.user, self.grupos, self.contas_ids,
+            categoria.nome if categoria is not None else None,
+            {conta.id for conta in municipe.contas.all()},
+        )
+
+
+def contexto_autorizacao(user):
+    """Devolve o ContextoAutorizacao do usuário, criando-o no primeiro uso da requisição."""
+    if user is None:
+        return ContextoAutorizacao(None)
+    contexto = getattr(user, '_contexto_autorizacao', None)
+    if contexto is None:
+        contexto = ContextoAutorizacao(user)
+        user._contexto_autorizacao = contexto
+    return contexto
+
+
+def invalidar_contexto_autorizacao(user):
+    """Descarta o contexto guardado (ex.: depois de alterar grupos ou contas do próprio usuário)."""
+    user.__dict__.pop('_contexto_autorizacao', None)
+
+
 def is_in_group(user, group_names):
     """
     Função auxiliar para verificar se um usuário pertence a um ou mais grupos.
@@ -8,9 +124,100 @@ def is_in_group(user, group_names):
     if user and user.is_authenticated:
         if not isinstance(group_names, list):
             group_names = [group_names]
-        return user.groups.filter(name__in=group_names).exists()
+        return contexto_autorizacao(user).tem_grupo(*group_names)
+    return False
+
+def pode_editar_municipe(user, grupos, contas_usuario, categoria_nome, contas_municipe):
+    """
+    Mesma regra de MunicipeSerializer.get_pode_editar, mas sobre dados já carregados:
+    `grupos` é o conjunto de nomes de grupos do usuário, `contas_usuario` o conjunto de
+    ids das contas do perfil (None se o usuário não tiver perfil) e `contas_municipe`
+    os ids das contas do munícipe. Não faz consultas ao banco.
+    """
+    if user.is_superuser:
+        return True
+
+    if 'Recepção' in grupos:
+        # O contato DEVE ser da categoria 'Munícipe'.
+        if categoria_nome != 'MUNÍCIPE':
+            return False
+        if not contas_municipe:
+            return True
+        if contas_usuario is not None:
+            return not contas_usuario.isdisjoint(contas_municipe)
+        return False
+
+    if grupos & {'Membro do Gabinete', 'Secretária'}:
+        if not contas_municipe:
+            return True
+        if contas_usuario is not None:
+            return not contas_usuario.isdisjoint(contas_municipe)
+
     return False
 
+def pode_editar_municipes(user, municipes):
+    """
+    `pode_editar` de uma lista de munícipes de uma vez, com o mesmo resultado
+    de ContextoAutorizacao.pode_editar_municipe para cada um. Devolve {id: bool}.
+    As contas vêm do prefetch, quando houver, ou de uma única query na tabela
+    de ligação; as categorias, de uma query só para as que não estão em cache.
+    """
+    from .models import CategoriaContato, Municipe
+
+    contexto = contexto_autorizacao(user)
+    if contexto.is_superuser:
+        return {municipe.pk: True for municipe in municipes}
+    if not contexto.tem_grupo('Recepção', 'Membro do Gabinete', 'Secretária'):
+        return {municipe.pk: False for municipe in municipes}
+
+    contas_por_municipe = {}
+    sem_prefetch = []
+    for municipe in municipes:
+        if 'contas' in getattr(municipe, '_prefetched_objects_cache', {}):
+            contas_por_municipe[municipe.pk] = {conta.id for conta in municipe.contas.all()}
+        else:
+            contas_por_municipe[municipe.pk] = set()
+            sem_prefetch.append(municipe.pk)
+    if sem_prefetch:
+        ligacoes = Municipe.contas.through.objects.filter(municipe_id__in=sem_prefetch)
+        for municipe_id, conta_id in ligacoes.values_list('municipe_id', 'conta_id'):
+            contas_por_municipe[municipe_id].add(conta_id)
+
+    # A categoria só importa para a Recepção
+    categorias = {}
+    if 'Recepção' in contexto.grupos:
+        faltantes = set()
+        for municipe in municipes:
+            if municipe.categoria_id is None:
+                continue
+            if Municipe.categoria.is_cached(municipe):
+                categorias[municipe.categoria_id] = municipe.categoria.nome
+            else:
+                faltantes.add(municipe.categoria_id)
+        if faltantes - categorias.keys():
+            categorias.update(CategoriaContato.objects.filter(id__in=faltantes - categorias.keys()).values_list('id', 'nome'))
+
+    return pode_editar_municipes_por_dados(user, {
+        municipe.pk: (categorias.get(municipe.categoria_id), contas_por_municipe[municipe.pk])
+        for municipe in municipes
+    })
+
+
+def pode_editar_municipes_por_dados(user, dados):
+    """
+    Como pode_editar_municipes, mas sobre dados já lidos (serialização compilada):
+    `dados` é {id: (nome da categoria, ids das contas)}. Não faz consultas ao banco.
+    """
+    contexto = contexto_autorizacao(user)
+    if contexto.is_superuser:
+        return {municipe_id: True for municipe_id in dados}
+    if not contexto.tem_grupo('Recepção', 'Membro do Gabinete', 'Secretária'):
+        return {municipe_id: False for municipe_id in dados}
+    return {
+        municipe_id: pode_editar_municipe(user, contexto.grupos, contexto.contas_ids, categoria_nome, contas)
+        for municipe_id, (categoria_nome, contas) in dados.items()
+    }
+
 # --- NOSSAS LEIS FINAIS E REFINADAS ---
 
 class CanManageAgendas(BasePermission):
@@ -31,7 +238,7 @@ class CanAccessObjectByConta(BasePermission):
             return True
 
         if hasattr(user, 'perfil') and hasattr(obj, 'conta'):
-            return obj.conta in user.perfil.contas.all()
+            return contexto_autorizacao(user).tem_conta(obj.conta_id)
 
         return False
 
@@ -54,7 +261,7 @@ class CanInteractWithAtendimento(BasePermission):
         # 3. Regras para Membro do Gabinete e Secretária
         if is_in_group(user, 'Membro do Gabinete') or is_in_group(user, 'Secretária'):
             # Primeiro, o atendimento DEVE pertencer ao seu gabinete.
-            if not (hasattr(user, 'perfil') and obj.conta in user.perfil.contas.all()):
+            if not contexto_autorizacao(user).tem_conta(obj.conta_id):
                 return False # Se não for, bloqueia.
 
             # Se for do seu gabinete, ele pode ver/editar/excluir?
@@ -111,12 +318,10 @@ class CanEditMunicipeDetails(BasePermission):
             return True
 
         # --- NOVA LÓGICA DE PERMISSÃO UNIFICADA ---
-        if hasattr(user, 'perfil'):
-            user_contas = set(user.perfil.contas.all())
-            municipe_contas = set(obj.contas.all())
-            
+        contexto = contexto_autorizacao(user)
+        if contexto.tem_perfil:
             # 1. CONDIÇÃO BÁSICA: O usuário compartilha pelo menos uma conta com o contato?
-            if user_contas.isdisjoint(municipe_contas):
+            if not contexto.compartilha_conta(conta.id for conta in obj.contas.all()):
                 return False # Se não, nega o acesso para todos os perfis.
 
             # 2. CONDIÇÃO ESPECÍFICA PARA RECEPÇÃO:
@@ -165,9 +370,10 @@ class CanViewSharedAgenda(BasePermission):
             return False
 
         # Verifica as 3 condições
-        tem_grupo = is_in_group(user, 'Membro do Gabinete')
-        tem_flag = user.perfil.pode_visualizar_agendas_compartilhadas
-        esta_vinculado_a_conta = user.perfil.contas.filter(id=conta_id_alvo).exists()
+        contexto = contexto_autorizacao(user)
+        tem_grupo = contexto.tem_grupo('Membro do Gabinete')
+        tem_flag = contexto.pode_visualizar_agendas_compartilhadas
+        esta_vinculado_a_conta = contexto.tem_conta(conta_id_alvo)
 
         return tem_grupo and tem_flag and esta_vinculado_a_conta
 
@@ -194,10 +400,8 @@ class CanAccessEspaco(BasePermission):
             return True
 
         if hasattr(user, 'perfil'):
-            user_contas = set(user.perfil.contas.all())
-            espaco_contas = set(obj.contas.all())
             # Retorna True se houver pelo menos uma conta em comum
-            return not user_contas.isdisjoint(espaco_contas)
+            return contexto_autorizacao(user).compartilha_conta(conta.id for conta in obj.contas.all())
 
         return False
 
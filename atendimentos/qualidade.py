@@ -0,0 +1,145 @@
+"""
+Qualidade do cadastro de munícipes.
+
+A pontuação (0 a 4: CPF, e-mail, telefone e CEP preenchidos) fica gravada em
+`Municipe.pontuacao_qualidade`, indexada, para que "contatos com dados
+incompletos" possa ser filtrado e ordenado no banco. É recalculada no save() e
+nas escritas em lote do MunicipeQuerySet; cargas feitas fora do ORM ficam para
+o comando `recalcular_qualidade_municipes`.
+
+O alerta de atualização depende do dia de hoje, então não é gravado: o filtro
+compara `data_atualizacao` (indexada) com o limite calculado na hora.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+CAMPOS_QUALIDADE = ('cpf', 'emails', 'telefones', 'endereco')
+PONTUACAO_MAXIMA = 4
+DIAS_ALERTA_ATUALIZACAO = 180
+
+# Nível exibido -> pontuações que ele cobre
+NIVEIS = {
+    'Baixo': (0, 1),
+    'Parcial': (2, 3),
+    'Completo': (4,),
+}
+
+
+def calcular_pontuacao(cpf, emails, telefones, endereco):
+    pontuacao = 0
+    if cpf and cpf.strip(): pontuacao += 1
+    if emails and any(e.get('email') for e in emails if isinstance(e, dict)): pontuacao += 1
+    if telefones: pontuacao += 1
+    if isinstance(endereco, dict) and endereco.get('cep'): pontuacao += 1
+    return pontuacao
+
+
+def pontuacao_do_municipe(municipe):
+    return calcular_pontuacao(municipe.cpf, municipe.emails, municipe.telefones, municipe.endereco)
+
+
+def nivel(pontuacao):
+    """'Completo', 'Parcial' ou 'Baixo', como exibido em `qualidade_dados`."""
+    if pontuacao >= PONTUACAO_MAXIMA: return "Completo"
+    if pontuacao >= 2: return "Parcial"
+    return "Baixo"
+
+
+def pontuacoes_dos_niveis(valores):
+    """
+    Pontuações para um filtro `?qualidade=` (níveis ou números separados por
+    vírgula, ex.: "baixo,parcial" ou "0,1"). Valores desconhecidos são ignorados;
+    None quando nenhum valor é válido.
+    """
+    niveis = {nome.lower(): pontuacoes for nome, pontuacoes in NIVEIS.items()}
+    pontuacoes = set()
+    for valor in valores.split(','):
+        valor = valor.strip().lower()
+        if valor in niveis:
+            pontuacoes.update(niveis[valor])
+        elif valor.isdigit() and int(valor) <= PONTUACAO_MAXIMA:
+            pontuacoes.add(int(valor))
+    return sorted(pontuacoes) or None
+
+
+# --- Alerta de atualização ---
+
+def limite_atualizacao(agora=None):
+    """
+    Cadastros atualizados até este instante (inclusive) estão desatualizados:
+    mais de DIAS_ALERTA_ATUALIZACAO dias completos desde a última atualização.
+    """
+    return (agora or timezone.now()) - timedelta(days=DIAS_ALERTA_ATUALIZACAO + 1)
+
+
+def desatualizado(data_atualizacao, agora=None):
+    return not data_atualizacao or data_atualizacao <= limite_atualizacao(agora)
+
+
+def filtro_desatualizados(agora=None):
+    return Q(data_atualizacao__isnull=True) | Q(data_atualizacao__lte=limite_atualizacao(agora))
+
+
+# --- Manutenção ---
+
+def recalcular(queryset, lote=2000):
+    """Regrava `pontuacao_qualidade` das linhas de `queryset` que mudaram. Devolve quantas."""
+    from .models import Municipe
+    alterados = 0
+    pendentes = []
+    linhas = queryset.order_by().values_list('id', 'pontuacao_qualidade', *CAMPOS_QUALIDADE)
+    for municipe_id, atual, *valores in linhas.iterator(chunk_size=lote):
+        pontuacao = calcular_pontuacao(*valores)
+        if pontuacao != atual:
+            pendentes.append(Municipe(id=municipe_id, pontuacao_qualidade=pontuacao))
+        if len(pendentes) >= lote:
+            alterados += _gravar(pendentes, lote)
+            pendentes = []
+    return alterados + _gravar(pendentes, lote)
+
+
+def _gravar(municipes, lote):
+    from .models import Municipe
+    if municipes:
+        Municipe.objects.bulk_update(municipes, ['pontuacao_qualidade'], batch_size=lote)
+    return len(municipes)
+
+
+# --- Distribuição ---
+
+def histograma(contas_ids=None, incluir_publicos=True, agora=None):
+    """
+    Distribuição das pontuações por conta, a partir da tabela MunicipeVisibilidade
+    (um munícipe conta uma vez em cada conta vinculada; os sem conta entram na
+    conta 0, "públicos"). `contas_ids=None` traz todas as contas.
+    Devolve {conta_id: {'total', 'desatualizados', 'pontuacoes': {0..4: n}}}.
+    """
+    from .models import MunicipeVisibilidade
+    visibilidade = MunicipeVisibilidade.objects.all()
+    if contas_ids is not None:
+        filtro = Q(conta_id__in=contas_ids)
+        if incluir_publicos:
+            filtro |= Q(conta_id=MunicipeVisibilidade.CONTA_PUBLICO)
+        visibilidade = visibilidade.filter(filtro)
+    elif not incluir_publicos:
+        visibilidade = visibilidade.exclude(conta_id=MunicipeVisibilidade.CONTA_PUBLICO)
+
+    desatualizados = Q(municipe__data_atualizacao__isnull=True) | Q(
+        municipe__data_atualizacao__lte=limite_atualizacao(agora)
+    )
+    linhas = (
+        visibilidade.order_by()
+        .values('conta_id', 'municipe__pontuacao_qualidade')
+        .annotate(total=Count('id'), desatualizados=Count('id', filter=desatualizados))
+    )
+    resultado = {}
+    for linha in linhas:
+        conta = resultado.setdefault(linha['conta_id'], {
+            'total': 0, 'desatualizados': 0, 'pontuacoes': dict.fromkeys(range(PONTUACAO_MAXIMA + 1), 0),
+        })
+        conta['total'] += linha['total']
+        conta['desatualizados'] += linha['desatualizados']
+        conta['pontuacoes'][linha['municipe__pontuacao_qualidade']] += linha['total']
+    return resultado
@@ -0,0 +1,195 @@
+"""
+Geração de PDF com o WeasyPrint sem buscar os próprios arquivos por HTTP.
+
+Os templates apontam brasões, logos e imagens estáticas para URLs absolutas
+(`request.build_absolute_uri(...)`), então cada PDF fazia requisições ao
+próprio domínio público durante a renderização. `buscar_recurso` é o
+`url_fetcher` do WeasyPrint: URLs de um host do ALLOWED_HOSTS com caminho em
+STATIC_URL ou MEDIA_URL são lidas do disco (STATIC_ROOT e os finders do
+staticfiles; MEDIA_ROOT); as demais seguem para o `default_url_fetcher`.
+
+Os bytes buscados (imagens, fontes e folhas de estilo, locais ou remotas)
+ficam num cache em memória do processo, compartilhado entre as
+renderizações: os locais valem enquanto o arquivo não mudar (mtime e tamanho),
+os remotos por TTL_REMOTO segundos. As imagens já decodificadas ficam no
+`cache` do próprio WeasyPrint, também compartilhado. Toda geração de PDF deve
+passar por `gerar_pdf()`.
+"""
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http.request import validate_host
+from django.utils._os import safe_join
+from weasyprint import HTML, default_url_fetcher
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACAO_PADRAO = {
+    'LOCAL': True,
+    'TAMANHO_CACHE_MB': 32,
+    'TTL_REMOTO': 3600,  # segundos
+    'IMAGENS_DECODIFICADAS': 200,  # entradas no cache do WeasyPrint
+}
+
+_recursos = OrderedDict()  # chave -> (validade, resultado, tamanho)
+_bytes_em_cache = 0
+_trava = threading.Lock()
+
+# Passado como `cache` ao write_pdf: o WeasyPrint guarda ali as imagens decodificadas
+_imagens = {}
+
+
+def configuracao_recursos_pdf():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_RECURSOS_PDF', {})}
+
+
+def gerar_pdf(html_string, base_url=None):
+    """Bytes do PDF de `html_string`, com recursos locais e em cache."""
+    configuracao = configuracao_recursos_pdf()
+    if len(_imagens) > configuracao['IMAGENS_DECODIFICADAS']:
+        _imagens.clear()
+    return HTML(string=html_string, base_url=base_url, url_fetcher=buscar_recurso).write_pdf(cache=_imagens)
+
+
+# --- url_fetcher ---
+
+def buscar_recurso(url, *args, **kwargs):
+    configuracao = configuracao_recursos_pdf()
+    arquivo = _arquivo_local(url) if configuracao['LOCAL'] else None
+    if arquivo is not None:
+        try:
+            informacoes = os.stat(arquivo)
+        except OSError:
+            arquivo = None
+        else:
+            validade = (informacoes.st_mtime_ns, informacoes.st_size)
+            resultado = _do_cache(arquivo, validade)
+            if resultado is None:
+                with open(arquivo, 'rb') as origem:
+                    conteudo = origem.read()
+                resultado = {
+                    'string': conteudo,
+                    'mime_type': mimetypes.guess_type(arquivo)[0],
+                    'redirected_url': url,
+                    'filename': os.path.basename(arquivo),
+                }
+                _guardar(arquivo, validade, resultado, len(conteudo), configuracao)
+            return dict(resultado)
+
+    if not url.startswith(('http://', 'https://')):
+        # data:, file: etc.: nada a ganhar com o cache
+        return default_url_fetcher(url, *args, **kwargs)
+
+    resultado = _do_cache(url, None)
+    if resultado is None:
+        resultado = default_url_fetcher(url, *args, **kwargs)
+        if 'file_obj' in resultado:
+            conteudo = _ler(resultado)
+            resultado = {chave: valor for chave, valor in resultado.items() if chave != 'file_obj'}
+            resultado['string'] = conteudo
+        _guardar(url, time.monotonic() + configuracao['TTL_REMOTO'], resultado, len(resultado['string']), configuracao)
+    return dict(resultado)
+
+
+def _ler(resultado):
+    # default_url_fetcher devolve o corpo da resposta como arquivo; no cache precisa ser bytes
+    arquivo = resultado['file_obj']
+    try:
+        return arquivo.read()
+    finally:
+        arquivo.close()
+
+
+def _hosts_locais():
+    hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not hosts:
+        hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return hosts
+
+
+def _prefixo(url):
+    caminho = urlsplit(url or '').path
+    return '/' + caminho.strip('/') + '/' if caminho.strip('/') else None
+
+
+def _arquivo_local(url):
+    """Caminho no disco do arquivo estático ou de mídia de `url`; None se não for um."""
+    partes = urlsplit(url)
+    if partes.scheme not in ('http', 'https') or not partes.hostname:
+        return None
+    if not validate_host(partes.hostname, _hosts_locais()):
+        return None
+
+    caminho = unquote(partes.path)
+    prefixo_static = _prefixo(settings.STATIC_URL)
+    prefixo_media = _prefixo(settings.MEDIA_URL)
+    try:
+        if prefixo_static and caminho.startswith(prefixo_static):
+            relativo = caminho[len(prefixo_static):]
+            if settings.STATIC_ROOT:
+                arquivo = safe_join(settings.STATIC_ROOT, relativo)
+                if os.path.isfile(arquivo):
+                    return arquivo
+            return finders.find(relativo)
+        if prefixo_media and caminho.startswith(prefixo_media):
+            arquivo = safe_join(settings.MEDIA_ROOT, caminho[len(prefixo_media):])
+            return arquivo if os.path.isfile(arquivo) else None
+    except SuspiciousFileOperation:
+        logger.warning('Caminho fora da pasta de arquivos ignorado no PDF: %s', url)
+    return None
+
+
+# --- Cache em memória ---
+
+def _do_cache(chave, validade):
+    """
+    Resultado guardado para `chave`. Arquivos locais: só se `validade` (mtime e
+    tamanho) for a mesma; URLs remotas (`validade` None): até o TTL.
+    """
+    with _trava:
+        entrada = _recursos.get(chave)
+        if entrada is None:
+            return None
+        guardada, resultado, _ = entrada
+        valida = guardada == validade if validade is not None else guardada > time.monotonic()
+        if not valida:
+            _remover(chave)
+            return None
+        _recursos.move_to_end(chave)
+        return resultado
+
+
+def _guardar(chave, validade, resultado, tamanho, configuracao):
+    global _bytes_em_cache
+    limite = configuracao['TAMANHO_CACHE_MB'] * 1024 * 1024
+    if tamanho > limite:
+        return
+    with _trava:
+        _remover(chave)
+        _recursos[chave] = (validade, resultado, tamanho)
+        _bytes_em_cache += tamanho
+        while _bytes_em_cache > limite:
+            _remover(next(iter(_recursos)))
+
+
+def _remover(chave):
+    global _bytes_em_cache
+    entrada = _recursos.pop(chave, None)
+    if entrada is not None:
+        _bytes_em_cache -= entrada[2]
+
+
+def limpar_cache():
+    global _bytes_em_cache
+    with _trava:
+        _recursos.clear()
+        _bytes_em_cache = 0
+    _imagens.clear()
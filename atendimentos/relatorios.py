@@ -0,0 +1,520 @@
+"""
+Relatórios em PDF, na requisição ou pelo Celery.
+
+Cada relatório é uma subclasse de `Relatorio`, registrada pelo `tipo`, que
+monta o contexto do template a partir do usuário e dos parâmetros da
+requisição (só dados serializáveis em JSON, para poderem ir para a fila). As
+views chamam `responder()`: relatórios pequenos (até LIMITE_SINCRONO linhas)
+saem na hora, como antes; os maiores, ou com `?assincrono=true`, viram um
+RelatorioJob, e a resposta é 202 com o id e as URLs de status e de download.
+O worker gera o PDF (`processar()`, chamado por tasks.gerar_relatorio), grava
+o arquivo fora do MEDIA_ROOT e o disponibiliza até `expira_em`. Se a fila
+estiver indisponível, o relatório é gerado na requisição.
+
+Relatórios de outros apps ficam nos seus módulos `relatorios`, carregados na
+primeira consulta ao registro (ex.: eventos/relatorios.py).
+"""
+import calendar
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from urllib.parse import urljoin
+
+from dateutil.parser import parse as parse_datetime
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import recursos_pdf
+from .models import (Atendimento, Conta, GoogleApiToken, Lembrete, RegistroVisita, RelatorioJob,
+                     SolicitacaoAgenda)
+from .permissions import contexto_autorizacao, is_in_group
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACAO_PADRAO = {
+    'ASSINCRONO': True,
+    'LIMITE_SINCRONO': 300,
+    'VALIDADE_HORAS': 24,
+}
+
+RELATORIOS = {}
+_descobertos = False
+
+
+def configuracao_relatorios():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_RELATORIOS', {})}
+
+
+def validade():
+    return timedelta(hours=configuracao_relatorios()['VALIDADE_HORAS'])
+
+
+class RelatorioInvalido(Exception):
+    """Parâmetros inválidos: `dados` e `status` viram a resposta da view."""
+
+    def __init__(self, dados, status=status.HTTP_400_BAD_REQUEST):
+        super().__init__(next(iter(dados.values()), ''))
+        self.dados = dados
+        self.status = status
+
+
+def registrar(classe):
+    RELATORIOS[classe.tipo] = classe
+    return classe
+
+
+def obter(tipo):
+    global _descobertos
+    if tipo not in RELATORIOS and not _descobertos:
+        autodiscover_modules('relatorios')
+        _descobertos = True
+    return RELATORIOS[tipo]
+
+
+class Relatorio:
+    """
+    Um relatório em PDF. `preparar()` valida os parâmetros (RelatorioInvalido);
+    `total_linhas()` decide entre gerar na hora e enfileirar (None = sempre na hora).
+    """
+    tipo = None
+    template = None
+
+    def __init__(self, usuario, parametros, base_url=''):
+        self.usuario = usuario
+        self.parametros = parametros
+        self.base_url = base_url
+        self.preparar()
+
+    def preparar(self):
+        pass
+
+    def total_linhas(self):
+        return None
+
+    def contexto(self):
+        raise NotImplementedError
+
+    def nome_arquivo(self):
+        raise NotImplementedError
+
+    def url(self, caminho):
+        """Como request.build_absolute_uri(caminho) na requisição que pediu o relatório."""
+        return urljoin(self.base_url, caminho) if self.base_url else caminho
+
+    def gerar(self, progresso=None):
+        html_string = render_to_string(self.template, self.contexto())
+        if progresso:
+            progresso(40)
+        return recursos_pdf.gerar_pdf(html_string, self.base_url or None)
+
+    # --- Identidade visual da conta (cabeçalho dos relatórios) ---
+
+    def conta_contexto(self):
+        conta_id = self.parametros.get('conta_id')
+        if conta_id:
+            return Conta.objects.filter(id=conta_id).first()
+        if not self.usuario.is_superuser and hasattr(self.usuario, 'perfil'):
+            return self.usuario.perfil.contas.first()
+        return None
+
+    def identidade_visual(self):
+        conta_contexto = self.conta_contexto()
+        nome_instituicao = "Prefeitura Municipal" # Valor padrão
+        brasao_url = ''
+        logo_conta_url = ''
+
+        if conta_contexto:
+            nome_instituicao = conta_contexto.nome_instituicao or nome_instituicao
+            if conta_contexto.brasao_instituicao:
+                brasao_url = self.url(conta_contexto.brasao_instituicao.url)
+            if conta_contexto.logo_conta:
+                logo_conta_url = self.url(conta_contexto.logo_conta.url)
+
+        return {
+            'nome_instituicao': nome_instituicao,
+            'brasao_url': brasao_url,
+            'logo_conta_url': logo_conta_url,
+            'logo_siga_url': self.url('/static/images/logo-siga-gab.png'),
+        }
+
+
+def periodo_do_dia(data_inicio_str, data_fim_str):
+    """(início, fim) com datas AAAA-MM-DD, do primeiro ao último instante; ValueError/TypeError se inválidas."""
+    inicio_date = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
+    fim_date = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
+    return (
+        timezone.make_aware(datetime.combine(inicio_date, time.min)),
+        timezone.make_aware(datetime.combine(fim_date, time.max)),
+    )
+
+
+# -----------------------------------------------------------------------------
+# Relatórios de atendimentos, agendas, visitas e lembretes
+# -----------------------------------------------------------------------------
+
+@registrar
+class RelatorioAtendimentos(Relatorio):
+    tipo = 'atendimentos'
+    template = 'atendimentos/relatorio_atendimentos.html'
+
+    def queryset(self):
+        user = self.usuario
+        queryset = Atendimento.objects.all()
+
+        if not (user.is_superuser or is_in_group(user, 'Recepção')):
+            if hasattr(user, 'perfil'):
+                queryset = queryset.filter(conta__in=contexto_autorizacao(user).contas_filtro)
+                queryset = queryset.filter(Q(responsavel=user) | Q(responsavel__isnull=True))
+            else:
+                queryset = Atendimento.objects.none()
+
+        status = self.parametros.get('status')
+        conta_id = self.parametros.get('conta_id')
+        data_inicio = self.parametros.get('data_inicio')
+        data_fim = self.parametros.get('data_fim')
+
+        if status:
+            queryset = queryset.filter(status=status)
+        if conta_id:
+            queryset = queryset.filter(conta_id=conta_id)
+        if data_inicio:
+            queryset = queryset.filter(data_criacao__date__gte=data_inicio)
+        if data_fim:
+            queryset = queryset.filter(data_criacao__date__lte=data_fim)
+        return queryset
+
+    def total_linhas(self):
+        return self.queryset().count()
+
+    def contexto(self):
+        return {
+            'atendimentos': self.queryset().select_related('municipe', 'conta', 'responsavel').prefetch_related('categorias'),
+            **self.identidade_visual(),
+        }
+
+    def nome_arquivo(self):
+        return 'relatorio_atendimentos.pdf'
+
+
+@registrar
+class RelatorioAgendas(Relatorio):
+    tipo = 'agendas'
+    template = 'agendas/relatorio_agendas.html'
+
+    def queryset(self):
+        user = self.usuario
+        queryset = SolicitacaoAgenda.objects.select_related('solicitante', 'conta').order_by('data_criacao')
+
+        if not user.is_superuser:
+            if hasattr(user, 'perfil'):
+                # Mostra apenas solicitações das contas vinculadas ao usuário
+                queryset = queryset.filter(conta__in=contexto_autorizacao(user).contas_filtro)
+            else:
+                # Se não for superusuário e não tiver perfil, não vê nada.
+                queryset = SolicitacaoAgenda.objects.none()
+
+        data_inicio = self.parametros.get('data_inicio')
+        data_fim = self.parametros.get('data_fim')
+        conta_id = self.parametros.get('conta_id')
+        status_param = self.parametros.get('status')
+
+        if data_inicio and data_fim:
+            queryset = queryset.filter(data_criacao__range=[data_inicio, data_fim])
+        if conta_id:
+            queryset = queryset.filter(conta_id=conta_id)
+        if status_param:
+            queryset = queryset.filter(status=status_param)
+        return queryset
+
+    def total_linhas(self):
+        return self.queryset().count()
+
+    def contexto(self):
+        return {
+            'solicitacoes': self.queryset(),
+            'data_emissao': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+            'usuario_emissao': self.usuario.get_full_name() or self.usuario.username,
+            **self.identidade_visual(),
+        }
+
+    def nome_arquivo(self):
+        return f'relatorio_agendas_{datetime.now().strftime("%Y%m%d")}.pdf'
+
+
+@registrar
+class RelatorioCheckins(Relatorio):
+    tipo = 'checkins'
+    template = 'relatorios/relatorio_checkins.html'
+
+    def queryset(self):
+        # Começa com todos os registros, otimizando com select_related
+        queryset = RegistroVisita.objects.select_related(
+            'municipe', 'conta_destino', 'registrado_por'
+        ).all()
+
+        data_inicio_str = self.parametros.get('data_inicio')
+        data_fim_str = self.parametros.get('data_fim')
+        if data_inicio_str and data_fim_str:
+            try:
+                queryset = queryset.filter(data_checkin__range=periodo_do_dia(data_inicio_str, data_fim_str))
+            except (ValueError, TypeError):
+                # Se as datas forem inválidas, retorna uma lista vazia
+                queryset = RegistroVisita.objects.none()
+        return queryset
+
+    def total_linhas(self):
+        return self.queryset().count()
+
+    def contexto(self):
+        return {'visitas': self.queryset(), **self.identidade_visual()}
+
+    def nome_arquivo(self):
+        return f'relatorio_checkins_{datetime.now().strftime("%Y%m%d")}.pdf'
+
+
+@registrar
+class RelatorioLembretes(Relatorio):
+    tipo = 'lembretes'
+    template = 'relatorios/relatorio_lembretes.html'
+
+    def queryset(self):
+        user = self.usuario
+        # Mesma lógica de permissão da listagem
+        if user.is_superuser:
+            queryset = Lembrete.objects.all()
+        elif hasattr(user, 'perfil'):
+            queryset = Lembrete.objects.filter(conta__in=contexto_autorizacao(user).contas_filtro)
+        else:
+            queryset = Lembrete.objects.none()
+
+        data_inicio_str = self.parametros.get('data_inicio')
+        data_fim_str = self.parametros.get('data_fim')
+        if data_inicio_str and data_fim_str:
+            try:
+                queryset = queryset.filter(data_criacao__range=periodo_do_dia(data_inicio_str, data_fim_str))
+            except (ValueError, TypeError):
+                queryset = Lembrete.objects.none()
+        return queryset
+
+    def total_linhas(self):
+        return self.queryset().count()
+
+    def conta_contexto(self):
+        return self.usuario.perfil.contas.first() if hasattr(self.usuario, 'perfil') else None
+
+    def contexto(self):
+        data_inicio_str = self.parametros.get('data_inicio')
+        data_fim_str = self.parametros.get('data_fim')
+        return {
+            'lembretes': self.queryset().select_related('conta', 'usuario').order_by('-data_criacao'),
+            'data_inicio': datetime.strptime(data_inicio_str, '%Y-%m-%d') if data_inicio_str else None,
+            'data_fim': datetime.strptime(data_fim_str, '%Y-%m-%d') if data_fim_str else None,
+            'data_emissao': timezone.now(),
+            'usuario_emissao': self.usuario.get_full_name() or self.usuario.username,
+            **self.identidade_visual(),
+        }
+
+    def nome_arquivo(self):
+        return f'relatorio_lembretes_{timezone.now().strftime("%Y%m%d")}.pdf'
+
+
+@registrar
+class RelatorioGoogleAgenda(Relatorio):
+    """Calendário mensal com os eventos da agenda Google do usuário no período."""
+    tipo = 'google_agenda'
+    template = 'agendas/relatorio_google_agenda.html'
+
+    NOMES_DOS_MESES = [
+        'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+        'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
+    ]
+
+    def preparar(self):
+        try:
+            self.token_google = GoogleApiToken.objects.get(usuario=self.usuario)
+        except GoogleApiToken.DoesNotExist:
+            raise RelatorioInvalido({'detail': 'Autorização do Google não encontrada.'})
+        self.data_inicio = parse_datetime(self.parametros.get('data_inicio'))
+        self.data_fim = parse_datetime(self.parametros.get('data_fim'))
+
+    def total_linhas(self):
+        # Os eventos só são conhecidos depois da chamada à API: estima pelo número de dias do calendário
+        return (self.data_fim.date() - self.data_inicio.date()).days + 1
+
+    def eventos(self):
+        token_google = self.token_google
+        credentials = Credentials(
+            token=token_google.access_token,
+            refresh_token=token_google.refresh_token,
+            token_uri='https://oauth2.googleapis.com/token',
+            client_id=settings.GOOGLE_CLIENT_ID,
+            client_secret=settings.GOOGLE_CLIENT_SECRET
+        )
+        if credentials.expired and credentials.refresh_token:
+            credentials.refresh(GoogleAuthRequest())
+            token_google.access_token = credentials.token
+            token_google.save()
+
+        service = build('calendar', 'v3', credentials=credentials)
+        end_date = self.data_fim + timedelta(days=1, seconds=-1)
+        events_result = service.events().list(
+            calendarId='primary',
+            timeMin=self.data_inicio.isoformat() + "Z", # Adicione "Z" para UTC
+            timeMax=end_date.isoformat() + "Z",   # Adicione "Z" para UTC
+            singleEvents=True,
+            orderBy='startTime'
+        ).execute()
+        return events_result.get('items', [])
+
+    def contexto(self):
+        eventos_por_dia = defaultdict(list)
+        for event in self.eventos():
+            if 'dateTime' not in event['start']:
+                continue
+            start_obj = parse_datetime(event['start'].get('dateTime'))
+            dia = start_obj.date()
+            if 'dateTime' in event['start']: event['start']['dateTime'] = start_obj
+            if 'date' in event['start']: event['start']['date'] = start_obj.date()
+            eventos_por_dia[dia].append(event)
+
+        meses_do_relatorio = []
+        data_corrente = self.data_inicio.date()
+        data_final_loop = self.data_fim.date()
+
+        while data_corrente <= data_final_loop:
+            mes_ano_atual = (data_corrente.year, data_corrente.month)
+            cal = calendar.Calendar()
+            semanas_com_eventos = [
+                [{'data': dia, 'eventos': eventos_por_dia.get(dia, [])} for dia in semana]
+                for semana in cal.monthdatescalendar(data_corrente.year, data_corrente.month)
+            ]
+            # Nome do mês em português usando o número do mês como índice
+            nome_mes_pt = self.NOMES_DOS_MESES[data_corrente.month - 1]
+
+            meses_do_relatorio.append({
+                'nome_mes': f"{nome_mes_pt} de {data_corrente.year}",
+                'mes_numero': data_corrente.month,
+                'semanas': semanas_com_eventos
+            })
+
+            proximo_mes = (data_corrente.replace(day=28) + timedelta(days=4)).replace(day=1)
+            if (proximo_mes.year, proximo_mes.month) == mes_ano_atual: break
+            data_corrente = proximo_mes
+
+        return {
+            'hoje': timezone.now().date(),
+            'meses_do_relatorio': meses_do_relatorio,
+            'logo_gestao_url': self.url('/static/images/logo-brasao-prefeitura.png'),
+        }
+
+    def nome_arquivo(self):
+        return 'relatorio_google_agenda.pdf'
+
+
+# -----------------------------------------------------------------------------
+# Views: PDF na hora ou RelatorioJob
+# -----------------------------------------------------------------------------
+
+def resposta_pdf(conteudo, nome_arquivo):
+    response = HttpResponse(conteudo, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
+
+
+def responder(request, classe, parametros=None):
+    """
+    Resposta de uma view de relatório: o PDF, para relatórios até LIMITE_SINCRONO
+    linhas, ou 202 com o RelatorioJob enfileirado (`?assincrono=true` força a fila).
+    `parametros` padrão: a query string.
+    """
+    from .serializers import RelatorioJobSerializer
+
+    parametros = request.query_params.dict() if parametros is None else parametros
+    try:
+        relatorio = classe(request.user, parametros, request.build_absolute_uri())
+    except RelatorioInvalido as exc:
+        return Response(exc.dados, status=exc.status)
+
+    configuracao = configuracao_relatorios()
+    if configuracao['ASSINCRONO']:
+        forcado = request.query_params.get('assincrono') == 'true'
+        total_linhas = relatorio.total_linhas()
+        if forcado or (total_linhas is not None and total_linhas > configuracao['LIMITE_SINCRONO']):
+            job = enfileirar(relatorio, total_linhas)
+            if job is not None:
+                serializer = RelatorioJobSerializer(job, context={'request': request})
+                return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    return resposta_pdf(relatorio.gerar(), relatorio.nome_arquivo())
+
+
+def enfileirar(relatorio, total_linhas=None):
+    """Cria o RelatorioJob e manda para o Celery; None se a fila estiver indisponível."""
+    from .tasks import gerar_relatorio
+
+    job = RelatorioJob.objects.create(
+        usuario=relatorio.usuario,
+        tipo=relatorio.tipo,
+        parametros=relatorio.parametros,
+        base_url=relatorio.base_url,
+        total_linhas=total_linhas,
+        nome_arquivo=relatorio.nome_arquivo(),
+        expira_em=timezone.now() + validade(),
+    )
+    try:
+        # Sem novas tentativas de publicação: com a fila fora do ar, o relatório sai na hora
+        gerar_relatorio.apply_async((str(job.pk),), retry=False)
+    except Exception:
+        logger.warning('Fila indisponível; relatório "%s" gerado na requisição.', relatorio.tipo, exc_info=True)
+        job.delete()
+        return None
+    return job
+
+
+# -----------------------------------------------------------------------------
+# Worker
+# -----------------------------------------------------------------------------
+
+def processar(job_id):
+    """Gera o PDF de um RelatorioJob pendente (tasks.gerar_relatorio)."""
+    if not RelatorioJob.objects.filter(pk=job_id, status=RelatorioJob.PENDENTE).update(
+        status=RelatorioJob.PROCESSANDO, progresso=10
+    ):
+        return f"Relatório {job_id} não está pendente."
+    job = RelatorioJob.objects.select_related('usuario').get(pk=job_id)
+
+    def progresso(valor):
+        RelatorioJob.objects.filter(pk=job_id).update(progresso=valor)
+
+    campos = ['status', 'erro', 'data_conclusao', 'expira_em']
+    try:
+        relatorio = obter(job.tipo)(job.usuario, job.parametros, job.base_url)
+        conteudo = relatorio.gerar(progresso)
+        progresso(90)
+        job.arquivo.save(f'{job.pk}.pdf', ContentFile(conteudo), save=False)
+    except Exception as exc:
+        logger.exception('Erro ao gerar o relatório %s (%s).', job.pk, job.tipo)
+        job.status, job.erro = RelatorioJob.ERRO, str(exc) or type(exc).__name__
+    else:
+        job.status, job.progresso = RelatorioJob.CONCLUIDO, 100
+        campos += ['arquivo', 'progresso']
+    job.data_conclusao = timezone.now()
+    job.expira_em = job.data_conclusao + validade()
+    job.save(update_fields=campos)
+    return f"Relatório {job.pk}: {job.get_status_display()}."
+
+
+def limpar_expirados(agora=None):
+    """Remove os RelatorioJob vencidos (o arquivo sai no post_delete). Devolve quantos."""
+    total, _ = RelatorioJob.objects.filter(expira_em__lte=agora or timezone.now()).delete()
+    return total
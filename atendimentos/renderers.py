@@ -0,0 +1,46 @@
+"""
+Renderer JSON com orjson.
+
+Gera a mesma saída do JSONRenderer do DRF (compacto, UTF-8 sem escapes e com
+U+2028/U+2029 escapados), só que bem mais rápido nas listagens grandes. Datas e
+horas passam pelo encoder do DRF (mesmo formato, com 'Z' para UTC). Diferenças
+conhecidas, só em floats: números menores que 1e-4 saem sem notação
+científica (0.00001 em vez de 1e-05) e NaN/Infinity viram null em vez de erro.
+
+Sem o orjson instalado, com `?indent=`/`; indent=` ou com UNICODE_JSON/
+COMPACT_JSON desligados, e em qualquer erro do orjson (ex.: inteiros acima de
+64 bits), a renderização cai no JSONRenderer padrão.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+OPCOES_ORJSON = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    if orjson is not None else 0
+)
+
+SEPARADORES_DE_LINHA = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class OrjsonRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=OPCOES_ORJSON)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Como o DRF: JSON que também é JavaScript válido
+        for separador, escapado in SEPARADORES_DE_LINHA:
+            if separador in ret:
+                ret = ret.replace(separador, escapado)
+        return ret
@@ -17,5 +17,8 @@ class RequestMiddleware:
 
     def __call__(self, request):
         _request_storage.request = request
-        response = self.get_response(request)
-        return response
+        try:
+            return self.get_response(request)
+        finally:
+            # A thread é reaproveitada: sinais fora de uma requisição não podem ver o usuário da anterior
+            _request_storage.request = None
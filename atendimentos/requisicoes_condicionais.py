@@ -0,0 +1,99 @@
+"""
+GET condicional (ETag e Last-Modified) para listagens e detalhes.
+
+Os validadores saem de uma consulta barata, sem serializar a resposta: nas
+listagens, `count` e `max(data_atualizacao)` do queryset filtrado; nos
+detalhes, a `data_atualizacao` da própria linha (tramitações e anexos
+atualizam a do atendimento, ver signals.py). O ETag (fraco) também leva a URL
+completa, o formato da resposta, o usuário e a versão de autorização do perfil,
+porque campos como `pode_editar` e a visibilidade dependem de quem pede.
+Quando `If-None-Match`/`If-Modified-Since` batem, a view devolve 304 sem montar
+o payload.
+
+As respostas saem com `Cache-Control: private, no-cache`: o navegador guarda a
+resposta, mas sempre revalida, em vez de aplicar a heurística de validade
+sobre o Last-Modified. Mudanças que não alteram a linha (ex.: renomear a conta
+ou a categoria exibida por nome) só aparecem quando a linha muda.
+"""
+import hashlib
+
+from django.db.models import Count, Max, QuerySet, prefetch_related_objects
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .permissions import contexto_autorizacao
+
+METODOS_CONDICIONAIS = ('GET', 'HEAD')
+
+
+class RequisicaoCondicionalMixin:
+    """
+    Mixin para as views genéricas do DRF: ETag/Last-Modified e 304 em `list()`
+    e `retrieve()`. `campo_versao` é o campo de data de atualização do modelo.
+    """
+    campo_versao = 'data_atualizacao'
+
+    def componentes_etag(self):
+        """Valores extras do ETag (ex.: a data, para campos calculados a partir do dia)."""
+        return ()
+
+    def queryset_condicional(self):
+        """Queryset dos validadores da listagem (None desliga o GET condicional)."""
+        return self.filter_queryset(self.get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.queryset_condicional() if request.method in METODOS_CONDICIONAIS else None
+        if not isinstance(queryset, QuerySet):
+            return super().list(request, *args, **kwargs)
+
+        if not queryset.query.is_sliced:
+            queryset = queryset.order_by()
+        resumo = queryset.aggregate(total=Count('pk'), ultima=Max(self.campo_versao))
+        etag = self._etag('lista', resumo['total'], resumo['ultima'])
+        resposta = self._nao_modificado(request, etag, resumo['ultima'])
+        if resposta is None:
+            resposta = super().list(request, *args, **kwargs)
+        return self._marcar(resposta, etag, resumo['ultima'])
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.method not in METODOS_CONDICIONAIS:
+            return super().retrieve(request, *args, **kwargs)
+
+        # Como get_object(), mas sem os prefetch: no 304 eles não são necessários
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        objeto = get_object_or_404(queryset.prefetch_related(None), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, objeto)
+
+        ultima = getattr(objeto, self.campo_versao)
+        etag = self._etag('objeto', objeto.pk, ultima)
+        resposta = self._nao_modificado(request, etag, ultima)
+        if resposta is None:
+            prefetch_related_objects([objeto], *queryset._prefetch_related_lookups)
+            resposta = Response(self.get_serializer(objeto).data)
+        return self._marcar(resposta, etag, ultima)
+
+    def _etag(self, *valores):
+        user = self.request.user
+        perfil = contexto_autorizacao(user).perfil
+        componentes = (
+            type(self).__name__, self.request.get_full_path(), self.request.accepted_renderer.format,
+            user.pk, user.is_superuser, perfil.versao_autorizacao if perfil is not None else None,
+            *self.componentes_etag(), *valores,
+        )
+        return 'W/"%s"' % hashlib.md5(repr(componentes).encode()).hexdigest()
+
+    def _nao_modificado(self, request, etag, ultima):
+        return get_conditional_response(
+            request, etag=etag, last_modified=int(ultima.timestamp()) if ultima is not None else None
+        )
+
+    def _marcar(self, resposta, etag, ultima):
+        if resposta.status_code == 304 or 200 <= resposta.status_code < 300:
+            resposta['ETag'] = etag
+            if ultima is not None:
+                resposta['Last-Modified'] = http_date(ultima.timestamp())
+            patch_cache_control(resposta, private=True, no_cache=True)
+        return resposta
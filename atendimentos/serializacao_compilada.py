@@ -0,0 +1,260 @@
+"""
+Serialização compilada para as listagens mais pesadas.
+
+Em vez de instanciar um modelo por linha e passar cada campo pelo serializer
+do DRF, a listagem lê as linhas com `.values()` e monta os dicionários direto,
+com as mesmas conversões (`to_representation`) dos campos do serializer e as
+mesmas regras para valores nulos. A saída é a mesma, byte a byte; o comando
+`verificar_serializacao_compilada` compara os dois caminhos em cada rota.
+
+O plano de cada serializer (colunas do `.values()` e o que fazer com cada
+campo) é calculado uma vez por combinação de campos. Compilam sozinhos: campos
+simples do modelo (inclusive arquivos/imagens), anotações do queryset,
+PrimaryKeyRelatedField em FK, `source` com pontos através de FK/OneToOne e
+serializers aninhados em FK/OneToOne. SerializerMethodField e relações
+many=True precisam de um método `compilado_<campo>(self, linha)` no
+serializer, que recebe a linha do `.values()` e declara as colunas que lê com
+`@colunas(...)`; `preparar_compilado(self, linhas)` roda uma vez por página,
+para os cálculos em lote. Um `to_representation` sobrescrito só é aceito
+quando a classe define `preparar_compilado` (é ele quem reproduz a
+sobrescrita). Qualquer outro caso segue pelo caminho normal do DRF.
+"""
+import logging
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import QuerySet
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACAO_PADRAO = {'ATIVO': True}
+
+# Planos já calculados (ou o motivo de não compilar), como em otimizacao_consultas
+_COMPILADOS = {}
+LIMITE_COMPILADOS_EM_CACHE = 512
+
+# O que fazer com cada campo
+VALOR, CHAVE, ANINHADO, METODO = 'valor', 'chave', 'aninhado', 'metodo'
+
+
+def configuracao_serializacao_compilada():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_SERIALIZACAO_COMPILADA', {})}
+
+
+class NaoCompilavel(Exception):
+    """O serializer usa algo que o caminho compilado não reproduz."""
+
+
+def colunas(*nomes):
+    """Declara as colunas do `.values()` lidas por um `compilado_<campo>`."""
+    def decorador(metodo):
+        metodo.colunas = nomes
+        return metodo
+    return decorador
+
+
+def _relacao_direta(modelo, nome):
+    try:
+        campo = modelo._meta.get_field(nome)
+    except FieldDoesNotExist:
+        raise NaoCompilavel(f"'{nome}' não é campo de {modelo._meta.label}")
+    if not (campo.is_relation and campo.concrete and (campo.many_to_one or campo.one_to_one)):
+        raise NaoCompilavel(f"'{nome}' não é FK/OneToOne de {modelo._meta.label}")
+    return campo
+
+
+class SerializadorCompilado:
+    """Colunas do `.values()` e instruções por campo de um serializer."""
+
+    def __init__(self, serializer, modelo, anotacoes=()):
+        self.modelo = modelo
+        self.colunas = []
+        self._usar_coluna(modelo._meta.pk.name)
+        self.instrucoes = self._compilar(serializer, modelo, '', frozenset(anotacoes))
+
+    def _usar_coluna(self, coluna):
+        if coluna not in self.colunas:
+            self.colunas.append(coluna)
+        return coluna
+
+    def _compilar(self, serializer, modelo, prefixo, anotacoes):
+        classe = type(serializer)
+        sobrescrito = classe.to_representation is not serializers.Serializer.to_representation
+        if sobrescrito and not hasattr(classe, 'preparar_compilado'):
+            raise NaoCompilavel(f'{classe.__name__}.to_representation sobrescrito')
+
+        instrucoes = []
+        for nome, campo in serializer.fields.items():
+            if campo.write_only:
+                continue
+            metodo = getattr(classe, f'compilado_{nome}', None)
+            if metodo is not None:
+                if prefixo:
+                    raise NaoCompilavel(f'compilado_{nome} em serializer aninhado ({classe.__name__})')
+                for coluna in getattr(metodo, 'colunas', ()):
+                    self._usar_coluna(coluna)
+                instrucoes.append((nome, METODO, None, (), None))
+            elif campo.source == '*' or isinstance(campo, (
+                serializers.SerializerMethodField, serializers.ModelField,
+                serializers.ListSerializer, ManyRelatedField,
+            )):
+                raise NaoCompilavel(f"'{nome}' de {classe.__name__} precisa de compilado_{nome}")
+            else:
+                instrucoes.append(self._compilar_campo(nome, campo, modelo, prefixo, anotacoes))
+        return instrucoes
+
+    def _compilar_campo(self, nome, campo, modelo, prefixo, anotacoes):
+        atributos = campo.source_attrs
+        caminho = prefixo
+        # FKs anuláveis no meio do `source`: se alguma for nula, o DRF usa o default, None ou omite o campo
+        guardas = []
+        for atributo in atributos[:-1]:
+            relacao = _relacao_direta(modelo, atributo)
+            if relacao.null:
+                guardas.append(self._usar_coluna(caminho + atributo))
+            caminho, modelo = f'{caminho}{atributo}__', relacao.related_model
+        if guardas and campo.default is empty and not campo.allow_null and campo.required:
+            raise NaoCompilavel(f"'{nome}' é obrigatório e passa por uma relação anulável")
+
+        ultimo = atributos[-1]
+        if not prefixo and len(atributos) == 1 and ultimo in anotacoes:
+            return (nome, VALOR, self._usar_coluna(ultimo), (), None)
+        try:
+            campo_modelo = modelo._meta.get_field(ultimo)
+        except FieldDoesNotExist:
+            raise NaoCompilavel(f"'{ultimo}' não é campo de {modelo._meta.label}")
+
+        if not campo_modelo.is_relation:
+            if not campo_modelo.concrete:
+                raise NaoCompilavel(f"'{ultimo}' não é coluna de {modelo._meta.label}")
+            # Arquivos chegam como o nome gravado; o campo do DRF precisa do FieldFile (para a URL)
+            arquivo = campo_modelo if isinstance(campo_modelo, models.FileField) else None
+            return (nome, VALOR, self._usar_coluna(caminho + ultimo), tuple(guardas), arquivo)
+
+        relacao = _relacao_direta(modelo, ultimo)
+        coluna = self._usar_coluna(caminho + ultimo)
+        if isinstance(campo, PrimaryKeyRelatedField):
+            return (nome, CHAVE, coluna, tuple(guardas), None)
+        if isinstance(campo, serializers.Serializer):
+            aninhadas = self._compilar(campo, relacao.related_model, f'{caminho}{ultimo}__', ())
+            return (nome, ANINHADO, coluna, tuple(guardas), aninhadas)
+        raise NaoCompilavel(f"'{nome}' usa {type(campo).__name__}")
+
+    # --- Execução ---
+
+    def queryset(self, queryset, extras=()):
+        """O queryset da view como `.values()` com as colunas do plano (e `extras`, ex.: a ordenação)."""
+        return queryset.prefetch_related(None).values(*self.colunas, *(c for c in extras if c not in self.colunas))
+
+    def serializar(self, linhas, serializer):
+        """Lista de dicionários, na ordem de `linhas`, iguais aos de `serializer` (o `child`, em many=True)."""
+        linhas = list(linhas)
+        if hasattr(serializer, 'preparar_compilado'):
+            serializer.preparar_compilado(linhas)
+        vinculadas = _vincular(self.instrucoes, serializer)
+        return [_montar(linha, vinculadas) for linha in linhas]
+
+
+def _vincular(instrucoes, serializer):
+    """Liga as instruções aos campos do serializer desta requisição (o contexto muda a cada uma)."""
+    vinculadas = []
+    for nome, tipo, coluna, guardas, extra in instrucoes:
+        campo = serializer.fields[nome]
+        if tipo == METODO:
+            extra = getattr(serializer, f'compilado_{nome}')
+        elif tipo == ANINHADO:
+            extra = _vincular(extra, campo)
+        elif tipo == CHAVE:
+            extra = campo.pk_field
+        vinculadas.append((nome, tipo, coluna, guardas, extra, campo))
+    return vinculadas
+
+
+def _montar(linha, vinculadas):
+    """Mesmo resultado de Serializer.to_representation, a partir de uma linha do `.values()`."""
+    dados = {}
+    for nome, tipo, coluna, guardas, extra, campo in vinculadas:
+        if tipo == METODO:
+            dados[nome] = extra(linha)
+            continue
+        if guardas and any(linha[guarda] is None for guarda in guardas):
+            if campo.default is not empty:
+                valor = campo.get_default()
+            elif campo.allow_null:
+                valor = None
+            else:
+                continue
+        else:
+            valor = linha[coluna]
+
+        if valor is None:
+            dados[nome] = None
+        elif tipo == VALOR:
+            dados[nome] = campo.to_representation(extra.attr_class(None, extra, valor) if extra else valor)
+        elif tipo == CHAVE:
+            dados[nome] = extra.to_representation(valor) if extra else valor
+        else:
+            dados[nome] = _montar(linha, extra)
+    return dados
+
+
+def compilar(serializer, modelo, anotacoes=()):
+    """SerializadorCompilado de `serializer` (já com `?fields=` aplicado); NaoCompilavel quando não dá."""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    chave = (type(serializer), tuple(serializer.fields), modelo, frozenset(anotacoes))
+    compilado = _COMPILADOS.get(chave)
+    if compilado is None:
+        try:
+            compilado = SerializadorCompilado(serializer, modelo, anotacoes)
+        except NaoCompilavel as exc:
+            compilado = exc
+        if len(_COMPILADOS) >= LIMITE_COMPILADOS_EM_CACHE:
+            _COMPILADOS.clear()
+        _COMPILADOS[chave] = compilado
+    if isinstance(compilado, NaoCompilavel):
+        raise compilado
+    return compilado
+
+
+class SerializacaoCompiladaMixin:
+    """
+    Mixin para as listagens (ListAPIView/ViewSet): `list()` pelo caminho
+    compilado quando o serializer permite e SIGA_SERIALIZACAO_COMPILADA
+    está ativo; caso contrário, exatamente a listagem padrão do DRF.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        compilado = self._serializador_compilado(queryset)
+        if compilado is None:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+
+        serializer = self.get_serializer()
+        ordenacao = [campo.lstrip('-') for campo in getattr(self, 'ordenacao_paginacao', ())]
+        linhas = compilado.queryset(queryset, extras=ordenacao)
+        page = self.paginate_queryset(linhas)
+        if page is not None:
+            return self.get_paginated_response(compilado.serializar(page, serializer))
+        return Response(compilado.serializar(linhas, serializer))
+
+    def _serializador_compilado(self, queryset):
+        if not configuracao_serializacao_compilada()['ATIVO']:
+            return None
+        if not isinstance(queryset, QuerySet) or queryset._fields is not None or queryset.query.combinator:
+            return None
+        try:
+            return compilar(self.get_serializer(), queryset.model, queryset.query.annotations)
+        except NaoCompilavel as exc:
+            logger.debug('%s sem serialização compilada: %s', type(self).__name__, exc)
+            return None
@@ -1,10 +1,25 @@
 from .models import *
+from django.db import models
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.reverse import reverse
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth.models import User
-from .permissions import is_in_group, CanEditMunicipeDetails
+from .permissions import contexto_autorizacao, pode_editar_municipes, pode_editar_municipes_por_dados, CanEditMunicipeDetails
+from .campos_esparsos import CamposEsparsosMixin
+from .serializacao_compilada import colunas, compilar
+from . import qualidade
+from .cache_permissoes import (codificar_bitmap, configuracao_permissoes, permissoes_de_usuarios,
+                               permissoes_do_usuario, tabela_permissoes)
 from datetime import date
-from django.utils import timezone
+
+class UserListSerializer(serializers.ListSerializer):
+    """Lista de usuários com as permissões de todos resolvidas de uma vez pelo cache_permissoes."""
+    def to_representation(self, data):
+        itens = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.permissoes_em_lote = permissoes_de_usuarios(itens)
+        return super().to_representation(itens)
 
 class UserSerializer(serializers.ModelSerializer):
     contas = serializers.PrimaryKeyRelatedField(
@@ -22,11 +37,15 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'is_superuser', 'first_name', 'last_name', 'contas', 'groups', 'user_permissions']
+        list_serializer_class = UserListSerializer
 
     def get_user_permissions(self, user):
         if user.is_superuser:
             return []
-        return user.get_all_permissions()
+        em_lote = getattr(self, 'permissoes_em_lote', None)
+        if em_lote is not None and user.pk in em_lote:
+            return sorted(em_lote[user.pk])
+        return sorted(permissoes_do_usuario(user))
 
 class ContaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -74,7 +93,27 @@ class TramitacaoSerializer(serializers.ModelSerializer):
         full_name = obj.usuario.get_full_name()
         return full_name if full_name else obj.usuario.username
 
-class MunicipeSerializer(serializers.ModelSerializer):
+class MunicipeListSerializer(serializers.ListSerializer):
+    """
+    Lista de munícipes com o `pode_editar` calculado para todos de uma vez
+    (pode_editar_municipes), em vez de uma avaliação com queries por linha.
+    """
+    def to_representation(self, data):
+        itens = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        request = self.context.get('request')
+        if request and 'pode_editar' in self.child.fields:
+            self.child.pode_editar_em_lote = pode_editar_municipes(request.user, itens)
+        else:
+            self.child.pode_editar_em_lote = {}
+        return super().to_representation(itens)
+
+def pode_editar_serializado(serializer, obj):
+    em_lote = getattr(serializer, 'pode_editar_em_lote', None)
+    if em_lote is not None and obj.pk in em_lote:
+        return em_lote[obj.pk]
+    return contexto_autorizacao(serializer.context['request'].user).pode_editar_municipe(obj)
+
+class MunicipeSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     pode_editar = serializers.SerializerMethodField()
     contas = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -95,6 +134,7 @@ class MunicipeSerializer(serializers.ModelSerializer):
             'qualidade_dados', 'alerta_atualizacao',
             'pode_editar', 'grupo_duplicado'
         ]
+        list_serializer_class = MunicipeListSerializer
         extra_kwargs = {
             'categoria': {'required': False, 'allow_null': True}
         }
@@ -115,69 +155,65 @@ class MunicipeSerializer(serializers.ModelSerializer):
         Ele pega a saída padrão e substitui os IDs das contas pelos detalhes completos.
         """
         representation = super().to_representation(instance)
-        representation['contas'] = ContaSerializer(instance.contas.all(), many=True).data
+        if 'contas' in representation:
+            representation['contas'] = ContaSerializer(instance.contas.all(), many=True).data
         return representation
 
     def get_pode_editar(self, obj):
-        request = self.context.get('request')
-        if not request:
-            return False
-        
-        user = request.user
-
-        if user.is_superuser:
-            return True
-
-        if is_in_group(user, 'Recepção'):
-            # Regra 1: O contato DEVE ser da categoria 'Munícipe'.
-            if not (obj.categoria is not None and obj.categoria.nome == 'MUNÍCIPE'):
-                return False
-            
-            # Regra 2: Pode editar se o munícipe for público (sem conta vinculada).
-            if not obj.contas.exists():
-                return True
-            
-            # Regra 3: Se tiver conta, pode editar se houver uma conta em comum.
-            if hasattr(user, 'perfil'):
-                user_contas = set(user.perfil.contas.all())
-                municipe_contas = set(obj.contas.all())
-                return not user_contas.isdisjoint(municipe_contas)
-            
+        if not self.context.get('request'):
             return False
-
-        if is_in_group(user, 'Membro do Gabinete') or is_in_group(user, 'Secretária'):
-            if not obj.contas.exists():
-                return True
-            
-            if hasattr(user, 'perfil'):
-                user_contas = set(user.perfil.contas.all())
-                municipe_contas = set(obj.contas.all())
-                return not user_contas.isdisjoint(municipe_contas)
-        
-        return False
+        return pode_editar_serializado(self, obj)
 
     def get_qualidade_dados(self, obj):
-        score = 0
-        if obj.cpf and obj.cpf.strip(): score += 1
-        if obj.emails and any(e.get('email') for e in obj.emails if isinstance(e, dict)): score += 1
-        if obj.telefones: score += 1
-        if obj.endereco and obj.endereco.get('cep'): score += 1
-        if score == 4: return "Completo"
-        if score >= 2: return "Parcial"
-        return "Baixo"
+        return qualidade.nivel(obj.pontuacao_qualidade)
 
     def get_alerta_atualizacao(self, obj):
-        if not obj.data_atualizacao: return True
-        hoje = timezone.now()
-        diferenca = hoje - obj.data_atualizacao
-        return diferenca.days > 180
+        return qualidade.desatualizado(obj.data_atualizacao)
 
     def to_internal_value(self, data):
         if 'cpf' in data and data['cpf'] == '':
             data['cpf'] = None
         return super().to_internal_value(data)
 
-class AtendimentoSerializer(serializers.ModelSerializer):
+    # --- Serialização compilada (atendimentos/serializacao_compilada.py) ---
+
+    def preparar_compilado(self, linhas):
+        """Contas detalhadas e pode_editar da página inteira, como o to_representation e o MunicipeListSerializer."""
+        ids = [linha['id'] for linha in linhas]
+        self.contas_compiladas = {municipe_id: [] for municipe_id in ids}
+        contas_ids = {municipe_id: set() for municipe_id in ids}
+        if ids and ('contas' in self.fields or 'pode_editar' in self.fields):
+            conta_serializer = ContaSerializer()
+            compilado = compilar(conta_serializer, Conta)
+            linhas_contas = list(compilado.queryset(Conta.objects.filter(municipes__id__in=ids), extras=['municipes__id']))
+            for linha, conta in zip(linhas_contas, compilado.serializar(linhas_contas, conta_serializer)):
+                self.contas_compiladas[linha['municipes__id']].append(conta)
+                contas_ids[linha['municipes__id']].add(linha['id'])
+
+        request = self.context.get('request')
+        if request and 'pode_editar' in self.fields:
+            self.pode_editar_compilado = pode_editar_municipes_por_dados(request.user, {
+                linha['id']: (linha['categoria__nome'], contas_ids[linha['id']]) for linha in linhas
+            })
+
+    def compilado_contas(self, linha):
+        return self.contas_compiladas[linha['id']]
+
+    @colunas('categoria__nome')
+    def compilado_pode_editar(self, linha):
+        if not self.context.get('request'):
+            return False
+        return self.pode_editar_compilado[linha['id']]
+
+    @colunas('pontuacao_qualidade')
+    def compilado_qualidade_dados(self, linha):
+        return qualidade.nivel(linha['pontuacao_qualidade'])
+
+    @colunas('data_atualizacao')
+    def compilado_alerta_atualizacao(self, linha):
+        return qualidade.desatualizado(linha['data_atualizacao'])
+
+class AtendimentoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     # Seus campos de leitura, que já estavam corretos
     nome_municipe = serializers.CharField(source='municipe.nome_completo', read_only=True)
     nome_conta = serializers.CharField(source='conta.nome', read_only=True)
@@ -220,7 +256,41 @@ class AtendimentoSerializer(serializers.ModelSerializer):
             instance.categorias.set(categorias_data)
         return instance
 
-class SolicitacaoAgendaSerializer(serializers.ModelSerializer):
+class AtendimentoResumoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
+    """
+    Representação enxuta para a listagem de atendimentos: sem tramitações,
+    anexos e categorias aninhados, só as contagens (anotadas pela view).
+    O detalhe continua usando o AtendimentoSerializer completo.
+    """
+    nome_municipe = serializers.CharField(source='municipe.nome_completo', read_only=True)
+    nome_conta = serializers.CharField(source='conta.nome', read_only=True)
+    responsavel_nome = serializers.SerializerMethodField()
+    total_tramitacoes = serializers.IntegerField(read_only=True)
+    total_anexos = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Atendimento
+        fields = [
+            'id', 'protocolo', 'titulo', 'status', 'conta', 'nome_conta',
+            'municipe', 'nome_municipe', 'responsavel', 'responsavel_nome',
+            'data_criacao', 'data_atualizacao', 'total_tramitacoes', 'total_anexos'
+        ]
+        read_only_fields = fields
+
+    def get_responsavel_nome(self, obj):
+        if obj.responsavel:
+            return obj.responsavel.get_full_name() or obj.responsavel.username
+        return None
+
+    @colunas('responsavel', 'responsavel__first_name', 'responsavel__last_name', 'responsavel__username')
+    def compilado_responsavel_nome(self, linha):
+        # Mesmo resultado de User.get_full_name() or username
+        if linha['responsavel'] is None:
+            return None
+        nome_completo = f"{linha['responsavel__first_name']} {linha['responsavel__last_name']}".strip()
+        return nome_completo or linha['responsavel__username']
+
+class SolicitacaoAgendaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     solicitante_nome = serializers.CharField(source='solicitante.nome_completo', read_only=True)
     conta_nome = serializers.CharField(source='conta.nome', read_only=True)
     # Adicionamos um campo para mostrar os detalhes do espaço na leitura
@@ -267,29 +337,52 @@ class SolicitacaoAgendaSerializer(serializers.ModelSerializer):
             
         return data
 
+def preencher_claims_autorizacao(token, user):
+    """
+    Grava no token os dados do usuário e perfil usados pelo frontend e pela
+    JWTClaimsAuthentication (grupos, contas e a versão de autorização).
+    """
+    token['username'] = user.username
+    token['is_superuser'] = user.is_superuser
+    token['groups'] = list(user.groups.values_list('name', flat=True))
+
+    # Permissões como bitmap sobre a tabela de /api/permissoes/tabela/ (versão em 'permissoes_tabela')
+    permissoes = permissoes_do_usuario(user)
+    token['permissoes'] = codificar_bitmap(permissoes)
+    token['permissoes_tabela'] = tabela_permissoes()['versao']
+    if configuracao_permissoes()['TOKEN_LISTA_COMPLETA']:
+        token['user_permissions'] = sorted(permissoes)
+
+    if hasattr(user, 'perfil'):
+        perfil_data = {
+            "id": user.perfil.id,
+
+            # --- A LÓGICA CORRETA E DEFINITIVA ---
+            # Pega uma lista de TODOS os IDs de contas associadas ao perfil.
+            "contas": list(user.perfil.contas.all().values_list('id', flat=True)),
+            "versao_autorizacao": user.perfil.versao_autorizacao,
+        }
+        token['perfil'] = perfil_data
+    return token
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
-        # Pega o token padrão
-        token = super().get_token(user)
-
-        # Adiciona dados customizados do usuário e perfil ao token
-        token['username'] = user.username
-        token['is_superuser'] = user.is_superuser
-        token['groups'] = list(user.groups.values_list('name', flat=True))
-        token['user_permissions'] = list(user.get_all_permissions())
-
-        if hasattr(user, 'perfil'):
-            perfil_data = {
-                "id": user.perfil.id,
-                
-                # --- A LÓGICA CORRETA E DEFINITIVA ---
-                # Pega uma lista de TODOS os IDs de contas associadas ao perfil.
-                "contas": list(user.perfil.contas.all().values_list('id', flat=True))
-            }
-            token['perfil'] = perfil_data
-        
-        return token
+        # Pega o token padrão e adiciona os dados customizados do usuário e perfil
+        return preencher_claims_autorizacao(super().get_token(user), user)
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Renova o access token com grupos, contas e versão de autorização atuais,
+    e não com as claims copiadas do refresh token (que podem estar defasadas).
+    """
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'], verify=False)
+        user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: access[jwt_settings.USER_ID_CLAIM]}).first()
+        if user is not None:
+            data['access'] = str(preencher_claims_autorizacao(access, user))
+        return data
     
 class CategoriaContatoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -311,6 +404,33 @@ class MunicipeDetailSerializer(serializers.ModelSerializer):
             'atendimentos', 'solicitacoes_agenda'
         ]
     
+class AtividadeMunicipeSerializer(serializers.ModelSerializer):
+    tipo_display = serializers.CharField(source='get_tipo_display', read_only=True)
+
+    class Meta:
+        model = AtividadeMunicipe
+        fields = ['id', 'tipo', 'tipo_display', 'objeto_id', 'referencia_id', 'data', 'titulo', 'resumo', 'status']
+
+class RelatorioJobSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    url_status = serializers.SerializerMethodField()
+    url_download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RelatorioJob
+        fields = [
+            'id', 'tipo', 'status', 'status_display', 'progresso', 'total_linhas', 'nome_arquivo', 'erro',
+            'data_criacao', 'data_conclusao', 'expira_em', 'url_status', 'url_download',
+        ]
+
+    def get_url_status(self, obj):
+        return reverse('relatorio-job-detail', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+    def get_url_download(self, obj):
+        if obj.status != RelatorioJob.CONCLUIDO:
+            return None
+        return reverse('relatorio-job-download', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
 class BuscaGlobalSerializer(serializers.Serializer):
     """
     Um serializer para formatar os resultados da busca global,
@@ -319,12 +439,16 @@ class BuscaGlobalSerializer(serializers.Serializer):
     TIPO_CHOICES = (
         ('atendimento', 'Atendimento'),
         ('municipe', 'Munícipe'),
+        ('oficio', 'Ofício'),
+        ('evento', 'Evento'),
+        ('lembrete', 'Lembrete'),
     )
     tipo = serializers.ChoiceField(choices=TIPO_CHOICES)
     id = serializers.IntegerField()
     texto_principal = serializers.CharField(max_length=255)
     texto_secundario = serializers.CharField(max_length=255)
     url = serializers.CharField(max_length=255)
+    relevancia = serializers.FloatField(required=False)
 
 class NotificacaoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -341,58 +465,16 @@ class MunicipeLookupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Municipe
         fields = ['id', 'nome_completo', 'nome_de_guerra', 'contas', 'categoria', 'cargo', 'emails', 'pode_editar', 'qualidade_dados', 'alerta_atualizacao']
+        list_serializer_class = MunicipeListSerializer
 
     def get_pode_editar(self, obj):
-        user = self.context['request'].user
-
-        if user.is_superuser:
-            return True
-
-        if is_in_group(user, 'Recepção'):
-            # Regra 1: O contato DEVE ser da categoria 'Munícipe'.
-            if not (obj.categoria is not None and obj.categoria.nome == 'MUNÍCIPE'):
-                return False
-            
-            # Regra 2: Pode editar se o munícipe for público (sem conta vinculada).
-            if not obj.contas.exists():
-                return True
-            
-            # Regra 3: Se tiver conta, pode editar se houver uma conta em comum.
-            if hasattr(user, 'perfil'):
-                user_contas = set(user.perfil.contas.all())
-                municipe_contas = set(obj.contas.all())
-                return not user_contas.isdisjoint(municipe_contas)
-            
-            return False
-
-        if is_in_group(user, 'Membro do Gabinete') or is_in_group(user, 'Secretária'):
-            # Pode editar se for público
-            if not obj.contas.exists():
-                return True
-            
-            # Pode editar se houver intersecção entre as contas do usuário e as do munícipe
-            if hasattr(user, 'perfil'):
-                user_contas = set(user.perfil.contas.all())
-                municipe_contas = set(obj.contas.all())
-                return not user_contas.isdisjoint(municipe_contas) # Retorna True se houver pelo menos uma conta em comum
-
-        return False
+        return pode_editar_serializado(self, obj)
     
     def get_qualidade_dados(self, obj):
-        score = 0
-        if obj.cpf and obj.cpf.strip(): score += 1
-        if obj.emails and obj.emails[0].get('email'): score += 1
-        if obj.telefones: score += 1
-        if obj.endereco and obj.endereco.get('cep'): score += 1
-
-        if score == 4: return "Completo"
-        if score >= 2: return "Parcial"
-        return "Baixo"
+        return qualidade.nivel(obj.pontuacao_qualidade)
 
     def get_alerta_atualizacao(self, obj):
-        if not obj.data_atualizacao: return True
-        diferenca = timezone.now() - obj.data_atualizacao
-        return diferenca.days > 180
+        return qualidade.desatualizado(obj.data_atualizacao)
     
 class EspacoAgendaSerializer(serializers.ModelSerializer):
     """
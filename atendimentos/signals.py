@@ -1,9 +1,13 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
-from .models import Atendimento, LogDeAtividade, Tramitacao, PerfilUsuario, SolicitacaoAgenda, Notificacao
+from django.utils import timezone
+from .models import (Anexo, Atendimento, AtividadeMunicipe, LogDeAtividade, Tramitacao, PerfilUsuario, SolicitacaoAgenda, Notificacao,
+                     Municipe, Conta, CategoriaContato, RegistroVisita, RelatorioJob)
+from .busca import atualizar_indices_municipes, atualizar_visibilidade_municipes
+from . import atividades, cache_busca, cache_permissoes, cache_usuarios, typeahead
 from .request_middleware import get_current_user
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
@@ -208,4 +212,241 @@ def enviar_email_confirmacao_reserva(sender, instance, created, **kwargs):
                 )
             except Exception as e:
                 # Em caso de falha, o sistema não quebra, apenas registra o erro (idealmente em um log)
-                print(f"ERRO ao enviar e-mail de confirmação de reserva para {solicitante.email}: {e}")
\ No newline at end of file
+                print(f"ERRO ao enviar e-mail de confirmação de reserva para {solicitante.email}: {e}")
+
+
+# Sinal para manter o índice de tokens de busca do Munícipe
+@receiver(post_save, sender=Municipe)
+def atualizar_indice_busca_municipe(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    atualizar_indices_municipes([instance])
+    if created:
+        # Nasce público; as contas vinculadas depois chegam pelo m2m_changed
+        atualizar_visibilidade_municipes([instance.pk])
+    typeahead.atualizar_municipes([instance.pk])
+    cache_busca.invalidar()
+
+
+# Sinais para manter o índice de autocomplete (typeahead) e o cache de buscas de munícipes
+@receiver(post_delete, sender=Municipe)
+def remover_municipe_typeahead(sender, instance, **kwargs):
+    typeahead.remover_municipe(instance.pk)
+    cache_busca.invalidar()
+
+
+@receiver(m2m_changed, sender=Municipe.contas.through)
+def atualizar_contas_municipe_typeahead(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    cache_busca.invalidar()
+    if not reverse:
+        typeahead.atualizar_municipes([instance.pk])
+    elif pk_set:
+        typeahead.atualizar_municipes(pk_set)
+    else:
+        # conta.municipes.clear(): não sabemos quais munícipes foram afetados
+        typeahead.invalidar()
+
+
+# Sinais para manter a tabela de visibilidade (MunicipeVisibilidade) igual ao M2M `contas`
+@receiver(m2m_changed, sender=Municipe.contas.through)
+def atualizar_visibilidade_contas_municipe(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            atualizar_visibilidade_municipes([instance.pk])
+    elif action == 'pre_clear':
+        # conta.municipes.clear(): guarda quem estava vinculado antes de apagar
+        instance._municipes_visibilidade = list(instance.municipes.values_list('id', flat=True))
+    elif action == 'post_clear':
+        atualizar_visibilidade_municipes(getattr(instance, '_municipes_visibilidade', []))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        atualizar_visibilidade_municipes(pk_set)
+
+
+@receiver(pre_delete, sender=Conta)
+def guardar_municipes_da_conta(sender, instance, **kwargs):
+    # A exclusão da conta apaga as ligações em cascata, sem m2m_changed
+    instance._municipes_visibilidade = list(instance.municipes.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Conta)
+def atualizar_visibilidade_conta_excluida(sender, instance, **kwargs):
+    atualizar_visibilidade_municipes(getattr(instance, '_municipes_visibilidade', []))
+
+
+@receiver(post_save, sender=Conta)
+@receiver(post_delete, sender=Conta)
+@receiver(post_save, sender=CategoriaContato)
+@receiver(post_delete, sender=CategoriaContato)
+def invalidar_typeahead(sender, **kwargs):
+    typeahead.invalidar()
+    cache_busca.invalidar()
+
+
+# --- Versão de autorização (invalida as permissões embutidas nos tokens JWT) ---
+
+def _autorizacao_alterada(usuarios_ids):
+    """Grupos ou contas mudaram: nova versão de autorização e fora do cache de usuários."""
+    usuarios_ids = list(usuarios_ids)
+    PerfilUsuario.incrementar_versao_autorizacao(usuarios_ids)
+    cache_usuarios.invalidar(usuarios_ids)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def versao_autorizacao_grupos(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear') or (action != 'pre_clear' and not pk_set):
+        return
+    if not reverse:
+        usuarios_ids = [instance.pk]
+    elif action == 'pre_clear':
+        usuarios_ids = list(instance.user_set.values_list('id', flat=True))
+    else:
+        usuarios_ids = list(pk_set)
+    _autorizacao_alterada(usuarios_ids)
+
+
+@receiver(m2m_changed, sender=PerfilUsuario.contas.through)
+def versao_autorizacao_contas(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear') or (action != 'pre_clear' and not pk_set):
+        return
+    if not reverse:
+        _autorizacao_alterada([instance.usuario_id])
+        return
+    perfis = instance.perfilusuario_set.all() if action == 'pre_clear' else PerfilUsuario.objects.filter(pk__in=pk_set)
+    _autorizacao_alterada(perfis.values_list('usuario_id', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+@receiver(pre_delete, sender=Conta)
+def versao_autorizacao_exclusao(sender, instance, **kwargs):
+    # A exclusão remove as ligações em cascata, sem disparar o m2m_changed
+    if sender is Group:
+        usuarios_ids = instance.user_set.values_list('id', flat=True)
+    else:
+        usuarios_ids = instance.perfilusuario_set.values_list('usuario_id', flat=True)
+    _autorizacao_alterada(usuarios_ids)
+
+
+# --- Cache do usuário autenticado (atendimentos/cache_usuarios.py) ---
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_cache_usuario(sender, instance, **kwargs):
+    cache_usuarios.invalidar([instance.pk])
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def invalidar_cache_usuario_perfil(sender, instance, **kwargs):
+    cache_usuarios.invalidar([instance.usuario_id])
+
+
+@receiver(post_save, sender=Group)
+def invalidar_cache_usuarios_grupo(sender, instance, created, **kwargs):
+    # O nome do grupo vai no cache; um grupo novo ainda não tem usuários
+    if not created:
+        cache_usuarios.invalidar(instance.user_set.values_list('id', flat=True))
+
+
+# --- Cache de permissões (atendimentos/cache_permissoes.py) ---
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidar_permissoes_vinculos(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cache_permissoes.invalidar()
+
+
+@receiver(post_save, sender=User)
+def invalidar_permissoes_usuario(sender, instance, created, update_fields=None, **kwargs):
+    # O login só grava o last_login: não muda permissões
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    cache_permissoes.invalidar()
+
+
+@receiver(post_delete, sender=Group)
+def invalidar_permissoes_grupo(sender, **kwargs):
+    cache_permissoes.invalidar()
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidar_tabela_permissoes(sender, **kwargs):
+    cache_permissoes.invalidar(tabela=True)
+
+
+# --- Linha do tempo do munícipe (atendimentos/atividades.py) ---
+
+TIPOS_DE_ATIVIDADE = {
+    Atendimento: AtividadeMunicipe.ATENDIMENTO,
+    Tramitacao: AtividadeMunicipe.TRAMITACAO,
+    RegistroVisita: AtividadeMunicipe.VISITA,
+    SolicitacaoAgenda: AtividadeMunicipe.AGENDA,
+}
+
+
+@receiver(post_save, sender=Atendimento)
+@receiver(post_save, sender=Tramitacao)
+@receiver(post_save, sender=RegistroVisita)
+@receiver(post_save, sender=SolicitacaoAgenda)
+def registrar_atividade_municipe(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    atividades.registrar(TIPOS_DE_ATIVIDADE[sender], instance)
+    if sender is Atendimento:
+        atividades.atualizar_tramitacoes(instance)
+
+
+@receiver(post_delete, sender=Atendimento)
+@receiver(post_delete, sender=Tramitacao)
+@receiver(post_delete, sender=RegistroVisita)
+@receiver(post_delete, sender=SolicitacaoAgenda)
+def remover_atividade_municipe(sender, instance, **kwargs):
+    atividades.remover(TIPOS_DE_ATIVIDADE[sender], instance)
+
+
+# --- GET condicional (atendimentos/requisicoes_condicionais.py) ---
+
+@receiver(post_save, sender=Tramitacao)
+@receiver(post_delete, sender=Tramitacao)
+@receiver(post_save, sender=Anexo)
+@receiver(post_delete, sender=Anexo)
+def atualizar_data_do_atendimento(sender, instance, raw=False, **kwargs):
+    """Tramitações e anexos fazem parte do detalhe do atendimento: mudam o seu ETag/Last-Modified."""
+    if not raw:
+        Atendimento.objects.filter(pk=instance.atendimento_id).update(data_atualizacao=timezone.now())
+
+
+def _atualizar_data_dos_municipes(municipes_ids):
+    # Os índices e caches de busca já são atualizados pelos outros receptores do m2m
+    if municipes_ids:
+        Municipe.objects.filter(pk__in=municipes_ids).marcar_atualizados()
+
+
+@receiver(m2m_changed, sender=Municipe.contas.through)
+def atualizar_data_contas_municipe(sender, instance, action, reverse, pk_set, **kwargs):
+    """As contas fazem parte do munícipe (e da sua visibilidade): mudam o seu ETag/Last-Modified."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _atualizar_data_dos_municipes([instance.pk])
+    elif action == 'post_clear':
+        # Guardados no pre_clear por atualizar_visibilidade_contas_municipe
+        _atualizar_data_dos_municipes(getattr(instance, '_municipes_visibilidade', []))
+    elif action in ('post_add', 'post_remove'):
+        _atualizar_data_dos_municipes(pk_set)
+
+
+@receiver(post_delete, sender=Conta)
+def atualizar_data_municipes_conta_excluida(sender, instance, **kwargs):
+    _atualizar_data_dos_municipes(getattr(instance, '_municipes_visibilidade', []))
+
+
+# --- Relatórios em segundo plano (atendimentos/relatorios.py) ---
+
+@receiver(post_delete, sender=RelatorioJob)
+def remover_arquivo_do_relatorio(sender, instance, **kwargs):
+    if instance.arquivo:
+        instance.arquivo.delete(save=False)
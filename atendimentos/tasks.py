@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from . import relatorios
+
+
+# O estado fica no RelatorioJob: sem resultado no backend do Celery
+@shared_task(ignore_result=True)
+def gerar_relatorio(job_id):
+    return relatorios.processar(job_id)
+
+
+@shared_task
+def limpar_relatorios_expirados():
+    total = relatorios.limpar_expirados()
+    return f"{total} relatório(s) expirado(s) removido(s)."
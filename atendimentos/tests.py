@@ -1,3 +1,960 @@
-from django.test import TestCase
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from .models import (Atendimento, CategoriaContato, Conta, Espaco, Lembrete, Municipe, PerfilUsuario,
+                     RelatorioJob, SolicitacaoAgenda, Tramitacao)
+
+
+class DadosBaseMixin:
+    """
+    Contas A e B, um superusuário, um membro do gabinete da conta A, uma
+    recepcionista da conta A e munícipes públicos, da conta A, da conta B e das duas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.conta_a = Conta.objects.create(nome='GABINETE A')
+        cls.conta_b = Conta.objects.create(nome='GABINETE B')
+        cls.categoria_municipe = CategoriaContato.objects.create(nome='MUNÍCIPE')
+        cls.categoria_lideranca = CategoriaContato.objects.create(nome='LIDERANÇA')
+
+        cls.superusuario = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        cls.membro = cls.criar_usuario('membro', 'Membro do Gabinete', [cls.conta_a])
+        cls.recepcao = cls.criar_usuario('recepcao', 'Recepção', [cls.conta_a])
+        cls.secretaria = cls.criar_usuario('secretaria', 'Secretária', [cls.conta_b])
+
+        cls.publico = cls.criar_municipe('João da Silva', categoria=cls.categoria_municipe, cpf='123.456.789-01')
+        cls.da_conta_a = cls.criar_municipe('Maria Souza', [cls.conta_a], categoria=cls.categoria_municipe)
+        cls.da_conta_b = cls.criar_municipe('Mário Sousa', [cls.conta_b], categoria=cls.categoria_lideranca)
+        cls.das_duas = cls.criar_municipe('Joana Prado', [cls.conta_a, cls.conta_b])
+        cls.municipes = [cls.publico, cls.da_conta_a, cls.da_conta_b, cls.das_duas]
+
+    @classmethod
+    def criar_usuario(cls, username, grupo, contas):
+        usuario = User.objects.create_user(username, f'{username}@example.com', 'senha')
+        usuario.groups.add(Group.objects.get_or_create(name=grupo)[0])
+        PerfilUsuario.objects.create(usuario=usuario).contas.set(contas)
+        return usuario
+
+    @classmethod
+    def criar_municipe(cls, nome, contas=(), **campos):
+        municipe = Municipe.objects.create(
+            nome_completo=nome,
+            emails=[{'tipo': 'PESSOAL', 'email': f'{nome.split()[0].lower()}@example.com'}],
+            telefones=[{'tipo': 'CELULAR', 'numero': '(11) 99999-0001'}],
+            **campos,
+        )
+        municipe.contas.set(contas)
+        return municipe
+
+    @classmethod
+    def criar_linhas(cls, quantidade):
+        """Munícipes, atendimentos (com tramitação), agendas e lembretes nas duas contas."""
+        for indice in range(quantidade):
+            for conta in (cls.conta_a, cls.conta_b):
+                municipe = cls.criar_municipe(f'Souza {conta.nome} {indice}', [conta], categoria=cls.categoria_municipe)
+                atendimento = Atendimento.objects.create(
+                    municipe=municipe, conta=conta, titulo=f'Atendimento {indice}', descricao='Pedido'
+                )
+                Tramitacao.objects.create(atendimento=atendimento, usuario=cls.membro, despacho='Encaminhado')
+                SolicitacaoAgenda.objects.create(
+                    conta=conta, solicitante=municipe, assunto=f'Agenda {indice}',
+                )
+                Lembrete.objects.create(conta=conta, titulo=f'Lembrete {indice}', conteudo='Ligar', usuario=cls.membro)
+            Espaco.objects.create(nome=f'Sala {Espaco.objects.count()}').contas.add(cls.conta_a)
+        return Atendimento.objects.filter(conta=cls.conta_a).latest('id')
+
+    def setUp(self):
+        cache.clear()
+
+    def cliente(self, usuario):
+        # Usuário recarregado a cada cliente: o contexto de autorização fica no objeto do usuário
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=usuario.pk))
+        return client
+
+
+class ConsultasPorRequisicaoTests(DadosBaseMixin, TestCase):
+    """
+    Orçamento de queries das listagens e detalhes que usam o contexto de
+    autorização: grupos, perfil e contas são lidos uma vez por requisição, e o
+    total não cresce com o número de linhas.
+    """
+
+    # (usuário, rota) -> queries; a autenticação (force_authenticate) fica de fora
+    ORCAMENTO = {
+        ('admin', 'municipes'): 4,
+        ('membro', 'municipes'): 6,
+        ('recepcao', 'municipes'): 6,
+        ('secretaria', 'municipes'): 6,
+        ('membro', 'municipes_busca'): 5,
+        ('membro', 'municipe'): 6,
+        ('recepcao', 'municipe'): 6,
+        ('membro', 'lookup'): 5,
+        ('recepcao', 'lookup'): 5,
+        ('admin', 'atendimentos'): 3,
+        ('membro', 'atendimentos'): 4,
+        ('secretaria', 'atendimentos'): 4,
+        ('membro', 'atendimento'): 8,
+        ('membro', 'agendas'): 4,
+        ('secretaria', 'lembretes'): 4,
+        ('membro', 'espacos'): 3,
+    }
+
+    ROTAS = {
+        'municipes': '/api/municipes/',
+        'municipes_busca': '/api/municipes/?q=souza',
+        'municipe': '/api/municipes/{municipe}/',
+        # fuzzy=1: pelo banco; o índice do typeahead guarda estado entre requisições
+        'lookup': '/api/municipes/lookup/?q=souza&fuzzy=1',
+        'atendimentos': '/api/atendimentos/',
+        'atendimento': '/api/atendimentos/{atendimento}/',
+        'agendas': '/api/agendas/',
+        'lembretes': '/api/lembretes/',
+        'espacos': '/api/espacos/',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.atendimento = cls.criar_linhas(3)
+
+    def url(self, rota):
+        return self.ROTAS[rota].format(municipe=self.da_conta_a.pk, atendimento=self.atendimento.pk)
+
+    def contar(self, username, rota):
+        client = self.cliente(User.objects.get(username=username))
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = client.get(self.url(rota))
+        self.assertEqual(resposta.status_code, 200, resposta.content[:200])
+        return len(consultas)
+
+    def test_orcamento_de_consultas(self):
+        for (username, rota), esperado in self.ORCAMENTO.items():
+            with self.subTest(usuario=username, rota=rota):
+                self.assertEqual(self.contar(username, rota), esperado)
+
+    def test_consultas_nao_crescem_com_as_linhas(self):
+        antes = {chave: self.contar(*chave) for chave in self.ORCAMENTO}
+        self.criar_linhas(10)
+        for chave, total in antes.items():
+            with self.subTest(usuario=chave[0], rota=chave[1]):
+                self.assertEqual(self.contar(*chave), total)
+
+    def test_grupos_e_contas_lidos_uma_vez(self):
+        from .permissions import contexto_autorizacao, is_in_group
+        usuario = User.objects.get(pk=self.membro.pk)
+        # Grupos, perfil e contas: uma query cada, no primeiro uso
+        with self.assertNumQueries(3):
+            for _ in range(5):
+                self.assertTrue(is_in_group(usuario, 'Membro do Gabinete'))
+                self.assertFalse(is_in_group(usuario, 'Recepção'))
+                self.assertEqual(contexto_autorizacao(usuario).contas_ids, {self.conta_a.pk})
+
+
+def pode_editar_original(user, municipe):
+    """
+    Regra de MunicipeSerializer.get_pode_editar antes do cálculo em lote,
+    objeto a objeto e consultando o banco: é a referência do teste de paridade.
+    """
+    if user.is_superuser:
+        return True
+
+    grupos = set(user.groups.values_list('name', flat=True))
+    if 'Recepção' in grupos:
+        if not (municipe.categoria is not None and municipe.categoria.nome == 'MUNÍCIPE'):
+            return False
+        if not municipe.contas.exists():
+            return True
+        if hasattr(user, 'perfil'):
+            return not set(user.perfil.contas.all()).isdisjoint(set(municipe.contas.all()))
+        return False
+
+    if grupos & {'Membro do Gabinete', 'Secretária'}:
+        if not municipe.contas.exists():
+            return True
+        if hasattr(user, 'perfil'):
+            return not set(user.perfil.contas.all()).isdisjoint(set(municipe.contas.all()))
+
+    return False
+
+
+class PodeEditarParidadeTests(DadosBaseMixin, TestCase):
+    """
+    O `pode_editar` calculado em lote (pode_editar_municipes e
+    pode_editar_municipes_por_dados) e o das listagens dá o mesmo resultado da
+    regra original para cada combinação de usuário e munícipe.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.sem_grupo = cls.criar_usuario('sem_grupo', 'Outro Grupo', [cls.conta_a])
+        cls.membro_sem_perfil = User.objects.create_user('membro_sem_perfil', 'msp@example.com', 'senha')
+        cls.membro_sem_perfil.groups.add(Group.objects.get(name='Membro do Gabinete'))
+        cls.recepcao_sem_perfil = User.objects.create_user('recepcao_sem_perfil', 'rsp@example.com', 'senha')
+        cls.recepcao_sem_perfil.groups.add(Group.objects.get(name='Recepção'))
+        cls.recepcao_e_membro = cls.criar_usuario('recepcao_e_membro', 'Recepção', [cls.conta_b])
+        cls.recepcao_e_membro.groups.add(Group.objects.get(name='Membro do Gabinete'))
+        cls.membro_sem_contas = cls.criar_usuario('membro_sem_contas', 'Membro do Gabinete', [])
+
+        cls.municipes = cls.municipes + [
+            cls.criar_municipe('Pedro Público', categoria=cls.categoria_lideranca),
+            cls.criar_municipe('Paulo Sem Categoria'),
+            cls.criar_municipe('Ana Liderança', [cls.conta_a], categoria=cls.categoria_lideranca),
+            cls.criar_municipe('Bia Munícipe', [cls.conta_b], categoria=cls.categoria_municipe),
+            cls.criar_municipe('Carla Duas', [cls.conta_a, cls.conta_b], categoria=cls.categoria_municipe),
+        ]
+        cls.usuarios = [
+            cls.superusuario, cls.membro, cls.recepcao, cls.secretaria, cls.sem_grupo, cls.membro_sem_perfil,
+            cls.recepcao_sem_perfil, cls.recepcao_e_membro, cls.membro_sem_contas,
+        ]
+
+    def esperado(self, usuario):
+        usuario = User.objects.get(pk=usuario.pk)
+        return {
+            municipe.pk: pode_editar_original(usuario, Municipe.objects.get(pk=municipe.pk))
+            for municipe in self.municipes
+        }
+
+    def test_matriz_cobre_os_dois_resultados(self):
+        resultados = {valor for usuario in self.usuarios for valor in self.esperado(usuario).values()}
+        self.assertEqual(resultados, {True, False})
+
+    def test_pode_editar_municipes(self):
+        from .permissions import pode_editar_municipes
+        ids = [municipe.pk for municipe in self.municipes]
+        for usuario in self.usuarios:
+            esperado = self.esperado(usuario)
+            for prefetch in (False, True):
+                with self.subTest(usuario=usuario.username, prefetch=prefetch):
+                    municipes = Municipe.objects.filter(pk__in=ids).select_related('categoria')
+                    if prefetch:
+                        municipes = municipes.prefetch_related('contas')
+                    resultado = pode_editar_municipes(User.objects.get(pk=usuario.pk), list(municipes))
+                    self.assertEqual(resultado, esperado)
+
+    def test_pode_editar_municipes_por_dados(self):
+        from .permissions import pode_editar_municipes_por_dados
+        dados = {
+            municipe.pk: (
+                municipe.categoria.nome if municipe.categoria else None,
+                set(municipe.contas.values_list('id', flat=True)),
+            )
+            for municipe in Municipe.objects.filter(pk__in=[m.pk for m in self.municipes])
+        }
+        for usuario in self.usuarios:
+            with self.subTest(usuario=usuario.username):
+                resultado = pode_editar_municipes_por_dados(User.objects.get(pk=usuario.pk), dados)
+                self.assertEqual(resultado, self.esperado(usuario))
+
+    def test_pode_editar_da_listagem(self):
+        for usuario in self.usuarios:
+            esperado = self.esperado(usuario)
+            for rota in ('/api/municipes/?page_size=500', '/api/municipes/lookup/'):
+                with self.subTest(usuario=usuario.username, rota=rota):
+                    resposta = self.cliente(usuario).get(rota)
+                    self.assertEqual(resposta.status_code, 200)
+                    dados = resposta.json()
+                    linhas = [linha for linha in (dados['results'] if isinstance(dados, dict) else dados) if linha['id'] in esperado]
+                    if usuario.is_superuser or hasattr(usuario, 'perfil'):
+                        self.assertTrue(linhas)
+                    for linha in linhas:
+                        self.assertEqual(linha['pode_editar'], esperado[linha['id']], linha['nome_completo'])
+
+
+class TokenPermissoesTests(DadosBaseMixin, TestCase):
+    """O JWT leva as permissões só como bitmap; a lista completa é opcional."""
+
+    def token(self, usuario):
+        from .serializers import MyTokenObtainPairSerializer
+        return MyTokenObtainPairSerializer.get_token(User.objects.get(pk=usuario.pk))
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        from django.contrib.auth.models import Permission
+        cls.membro.groups.get().permissions.add(Permission.objects.get(codename='view_municipe'))
+
+    def test_so_bitmap_por_padrao(self):
+        from .cache_permissoes import decodificar_bitmap, permissoes_do_usuario
+        token = self.token(self.membro)
+        self.assertNotIn('user_permissions', token.payload)
+        esperado = set(permissoes_do_usuario(User.objects.get(pk=self.membro.pk)))
+        self.assertIn('atendimentos.view_municipe', esperado)
+        self.assertEqual(decodificar_bitmap(token['permissoes']), esperado)
+
+    @override_settings(SIGA_PERMISSOES={'TOKEN_LISTA_COMPLETA': True})
+    def test_lista_completa_opcional(self):
+        from .cache_permissoes import decodificar_bitmap
+        token = self.token(self.membro)
+        self.assertEqual(set(token['user_permissions']), decodificar_bitmap(token['permissoes']))
+
+
+@override_settings(SIGA_CACHE_USUARIO={'ATIVO': True})
+class CacheUsuariosTests(DadosBaseMixin, TestCase):
+
+    def test_cache_sem_hash_da_senha(self):
+        import pickle
+        from .cache_usuarios import _chave, carregar_usuario
+        carregar_usuario(self.membro.pk)
+        senha = User.objects.get(pk=self.membro.pk).password
+        guardado = cache.get(_chave(self.membro.pk))
+        self.assertNotIn('password', repr(guardado))
+        self.assertNotIn(senha.encode(), pickle.dumps(guardado))
+
+    def test_usuario_remontado_do_cache(self):
+        from .cache_usuarios import carregar_usuario
+        from .permissions import contexto_autorizacao
+        carregar_usuario(self.membro.pk)
+        carregar_usuario(self.superusuario.pk)
+        with self.assertNumQueries(0):
+            membro = carregar_usuario(self.membro.pk)
+            self.assertEqual(membro.username, 'membro')
+            self.assertTrue(membro.is_active)
+            self.assertEqual(membro.perfil.usuario_id, membro.pk)
+            contexto = contexto_autorizacao(membro)
+            self.assertEqual(contexto.grupos, {'Membro do Gabinete'})
+            self.assertEqual(contexto.contas_ids, {self.conta_a.pk})
+            superusuario = carregar_usuario(self.superusuario.pk)
+            self.assertTrue(superusuario.is_superuser)
+            self.assertIsNone(getattr(superusuario, 'perfil', None))
+
+    def test_save_nao_apaga_a_senha(self):
+        from .cache_usuarios import carregar_usuario
+        carregar_usuario(self.membro.pk)
+        membro = carregar_usuario(self.membro.pk)
+        membro.first_name = 'Novo'
+        membro.save()
+        atualizado = User.objects.get(pk=self.membro.pk)
+        self.assertEqual(atualizado.first_name, 'Novo')
+        self.assertTrue(atualizado.check_password('senha'))
+
+
+class SerializacaoCompiladaTests(DadosBaseMixin, TestCase):
+    """
+    As listagens com serialização compilada devolvem os mesmos bytes que o
+    caminho padrão do DRF, e o OrjsonRenderer os mesmos do JSONRenderer (como
+    no comando verificar_serializacao_compilada).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        from django.utils import timezone
+        from eventos.models import Convidado, Evento, ListaPresenca
+        cls.criar_linhas(2)
+        for conta in (cls.conta_a, cls.conta_b):
+            evento = Evento.objects.create(conta=conta, nome='Audiência', data_evento=timezone.now(), local='Sede')
+            for municipe in cls.municipes:
+                Convidado.objects.create(evento=evento, municipe=municipe)
+                ListaPresenca.objects.create(
+                    evento=evento, municipe=municipe, nome_completo=municipe.nome_completo, telefone='11999990001'
+                )
+
+    def listagens(self):
+        from .management.commands.verificar_serializacao_compilada import Command
+        rotas = [f'/{rota}' for rota, _ in Command()._listagens()]
+        self.assertIn('/api/municipes/', rotas)
+        return rotas
+
+    def requisitar(self, usuario, url, ativo):
+        with override_settings(SIGA_SERIALIZACAO_COMPILADA={'ATIVO': ativo}):
+            cache.clear()
+            return self.cliente(usuario).get(url)
+
+    def comparar(self, usuario, url):
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import OrjsonRenderer
+        padrao = self.requisitar(usuario, url, False)
+        compilado = self.requisitar(usuario, url, True)
+        self.assertEqual(compilado.status_code, padrao.status_code)
+        self.assertEqual(compilado.content, padrao.content)
+        if isinstance(padrao.accepted_renderer, OrjsonRenderer) and padrao.data is not None:
+            self.assertEqual(JSONRenderer().render(padrao.data), padrao.content)
+        return padrao
+
+    def linhas(self, resposta):
+        dados = resposta.json()
+        return dados['results'] if isinstance(dados, dict) else dados
+
+    def test_mesmos_bytes_nos_dois_caminhos(self):
+        for url in self.listagens():
+            for usuario in (self.superusuario, self.membro, self.recepcao):
+                with self.subTest(url=url, usuario=usuario.username):
+                    resposta = self.comparar(usuario, url)
+                    if usuario.is_superuser:
+                        self.assertEqual(resposta.status_code, 200)
+                        self.assertTrue(self.linhas(resposta))
+
+    def test_mesmos_bytes_com_fields(self):
+        for url in self.listagens():
+            campos = list(self.linhas(self.requisitar(self.superusuario, url, False))[0])
+            for selecao in (campos[:1], campos[:3], campos[-2:] + ['inexistente']):
+                parametros = f"?fields={','.join(selecao)}"
+                for usuario in (self.superusuario, self.membro, self.recepcao):
+                    with self.subTest(url=url + parametros, usuario=usuario.username):
+                        self.comparar(usuario, url + parametros)
+
+
+class RequisicaoCondicionalMunicipeTests(DadosBaseMixin, TestCase):
+    """Mudanças nas contas do munícipe mudam o ETag da listagem e do detalhe."""
+
+    def revalidar(self, url, alterar):
+        client = self.cliente(self.superusuario)
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        alterar()
+        resposta = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_contas_adicionadas_pelo_municipe(self):
+        for url in ('/api/municipes/', f'/api/municipes/{self.da_conta_a.pk}/'):
+            with self.subTest(url=url):
+                self.revalidar(url, lambda: self.da_conta_a.contas.add(Conta.objects.create(nome=f'GABINETE {url}')))
+
+    def test_contas_alteradas_pela_conta(self):
+        url = f'/api/municipes/{self.das_duas.pk}/'
+        self.revalidar(url, lambda: self.conta_b.municipes.remove(self.das_duas))
+        self.revalidar(url, lambda: self.conta_b.municipes.add(self.das_duas))
+        self.revalidar(url, lambda: self.conta_b.municipes.clear())
+        self.revalidar(url, lambda: self.conta_a.delete())
+
+
+class IndiceTextualMunicipeTests(TransactionTestCase):
+    """
+    Munícipes gravados depois das migrações entram no índice textual (no
+    SQLite, pelos triggers do FTS5). TransactionTestCase: a busca global lê
+    cada fonte noutra thread, que só enxerga dados confirmados.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+
+    def ids_da_busca(self, termo):
+        resposta = self.client.get('/api/municipes/', {'q': termo})
+        self.assertEqual(resposta.status_code, 200)
+        return {linha['id'] for linha in resposta.json()['results']}
+
+    def ids_da_busca_global(self, termo):
+        resposta = self.client.get('/api/busca/', {'q': termo})
+        self.assertEqual(resposta.status_code, 200)
+        return {linha['id'] for linha in resposta.json() if linha['tipo'] == 'municipe'}
+
+    def test_municipe_novo_encontrado_pelo_nome(self):
+        municipe = Municipe.objects.create(nome_completo='Antônio da Silva')
+        self.assertEqual(self.ids_da_busca('silva'), {municipe.pk})
+        self.assertEqual(self.ids_da_busca_global('silva'), {municipe.pk})
+
+    def test_nome_alterado_e_municipe_excluido(self):
+        municipe = Municipe.objects.create(nome_completo='Antônio da Silva')
+        municipe.nome_completo = 'Antônio Pereira'
+        municipe.save()
+        self.assertEqual(self.ids_da_busca('silva'), set())
+        self.assertEqual(self.ids_da_busca('pereira'), {municipe.pk})
+        municipe.delete()
+        self.assertEqual(self.ids_da_busca('pereira'), set())
+
+
+@override_settings(SIGA_CACHE_BUSCA={'ATIVO': True})
+class CacheBuscaTests(DadosBaseMixin, TestCase):
+    """Resultados de busca em cache: reaproveitados até a próxima alteração de munícipes."""
+
+    ROTAS = ('/api/municipes/?q=souza', '/api/municipes/lookup/?q=souza&fuzzy=1')
+
+    def ids(self, usuario, url):
+        dados = self.cliente(usuario).get(url).json()
+        return {linha['id'] for linha in (dados['results'] if isinstance(dados, dict) else dados)}
+
+    def test_resultado_reaproveitado(self):
+        from . import cache_busca
+        for url in self.ROTAS:
+            self.assertEqual(self.ids(self.membro, url), self.ids(self.membro, url))
+        self.assertEqual(cache_busca.estatisticas()['acertos'], 2)
+
+    def test_escopo_por_usuario(self):
+        for url in self.ROTAS:
+            self.ids(self.secretaria, url)
+        for url in self.ROTAS:
+            with self.subTest(url=url):
+                self.assertIn(self.da_conta_a.pk, self.ids(self.membro, url))
+                self.assertNotIn(self.da_conta_a.pk, self.ids(self.secretaria, url))
+
+    def test_contas_alteradas_invalidam(self):
+        for url in self.ROTAS:
+            self.ids(self.membro, url)
+            self.ids(self.secretaria, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.da_conta_a.contas.set([self.conta_b])
+        for url in self.ROTAS:
+            with self.subTest(url=url):
+                self.assertNotIn(self.da_conta_a.pk, self.ids(self.membro, url))
+                self.assertIn(self.da_conta_a.pk, self.ids(self.secretaria, url))
+
+    def test_nome_alterado_invalida(self):
+        for url in self.ROTAS:
+            self.ids(self.membro, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.publico.nome_completo = 'João Souza'
+            self.publico.save()
+        for url in self.ROTAS:
+            with self.subTest(url=url):
+                self.assertIn(self.publico.pk, self.ids(self.membro, url))
+
+    def test_superusuario_com_perfil(self):
+        # Na listagem o superusuário com perfil vê só os públicos e os das suas contas;
+        # o lookup continua sem filtro. O cache não mistura os dois superusuários.
+        superusuario_a = User.objects.create_superuser('admin_a', 'admin_a@example.com', 'senha')
+        PerfilUsuario.objects.create(usuario=superusuario_a).contas.set([self.conta_a])
+        listagem, lookup = '/api/municipes/?q=s', '/api/municipes/lookup/?q=s'
+        todos = {self.publico.pk, self.da_conta_a.pk, self.da_conta_b.pk}
+        self.assertEqual(self.ids(self.superusuario, listagem), todos)
+        self.assertEqual(self.ids(superusuario_a, listagem), {self.publico.pk, self.da_conta_a.pk})
+        self.assertEqual(self.ids(superusuario_a, lookup), todos)
+
+
+@override_settings(SIGA_TYPEAHEAD={'ATIVO': True, 'BACKEND': 'memoria'})
+class TypeaheadTests(DadosBaseMixin, TestCase):
+    """
+    Autocomplete pelo índice de prefixos em memória: mesmas linhas e mesma
+    visibilidade do caminho pelo banco, também depois de alterações.
+    """
+
+    def setUp(self):
+        super().setUp()
+        from . import typeahead
+        typeahead._indice = None
+        typeahead.reconstruir()
+
+    def buscar(self, usuario, termo):
+        resposta = self.cliente(usuario).get('/api/municipes/lookup/', {'q': termo})
+        self.assertEqual(resposta.status_code, 200)
+        return {linha['id']: linha for linha in resposta.json()}
+
+    def test_visibilidade_por_conta(self):
+        esperados = {
+            self.superusuario: {self.da_conta_a, self.da_conta_b},
+            self.membro: {self.da_conta_a},
+            self.recepcao: {self.da_conta_a},
+            self.secretaria: {self.da_conta_b},
+        }
+        for usuario, municipes in esperados.items():
+            with self.subTest(usuario=usuario.username):
+                self.assertEqual(set(self.buscar(usuario, 'ma')), {municipe.pk for municipe in municipes})
+                self.assertIn(self.publico.pk, self.buscar(usuario, 'joao'))
+        sem_perfil = User.objects.create_user('sem_perfil', 'sem_perfil@example.com', 'senha')
+        self.assertEqual(self.buscar(sem_perfil, 'joao'), {})
+
+    def test_mesmas_linhas_do_banco(self):
+        from . import typeahead
+        for usuario in (self.superusuario, self.membro, self.recepcao, self.secretaria):
+            for termo in ('ma', 'joa', 'souza', str(self.da_conta_b.pk)):
+                with self.subTest(usuario=usuario.username, termo=termo):
+                    pelo_indice = self.buscar(usuario, termo)
+                    with override_settings(SIGA_TYPEAHEAD={'ATIVO': False}):
+                        self.assertIsNone(typeahead.obter_indice())
+                        pelo_banco = self.buscar(usuario, termo)
+                    self.assertEqual(pelo_indice, pelo_banco)
+
+    def test_contas_alteradas(self):
+        from . import typeahead
+        self.buscar(self.membro, 'maria')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.da_conta_a.contas.set([self.conta_b])
+        # A alteração foi aplicada no índice deste processo, que segue em uso
+        self.assertIsNotNone(typeahead.obter_indice())
+        self.assertEqual(self.buscar(self.membro, 'maria'), {})
+        self.assertEqual(set(self.buscar(self.secretaria, 'maria')), {self.da_conta_a.pk})
+
+    def test_alteracao_em_outro_processo_usa_o_banco(self):
+        from unittest import mock
+        from . import typeahead
+        # Outro worker tirou o munícipe da conta A e trocou a versão (sem executar
+        # os on_commit, o índice deste processo não recebe a alteração)
+        self.da_conta_a.contas.set([self.conta_b])
+        typeahead._nova_versao()
+        with mock.patch.object(typeahead, '_reconstruir_em_segundo_plano') as reconstruir:
+            self.assertIsNone(typeahead.obter_indice())
+            self.assertEqual(self.buscar(self.membro, 'maria'), {})
+        reconstruir.assert_called()
+
+    def test_indice_montado_fora_da_requisicao(self):
+        from unittest import mock
+        from . import typeahead
+        typeahead._indice = None
+        with mock.patch.object(typeahead, '_reconstruir_em_segundo_plano') as reconstruir:
+            with self.assertNumQueries(0):
+                self.assertIsNone(typeahead.obter_indice())
+            self.assertIn(self.da_conta_a.pk, self.buscar(self.membro, 'maria'))
+        reconstruir.assert_called()
+
+
+@override_settings(SIGA_BUSCA={'BACKEND': 'atendimentos.busca_backends.BackendPadrao'})
+class BuscaPorPrefixoTests(DadosBaseMixin, TestCase):
+    """
+    Prefixos viram intervalos no índice de tokens. O limite superior só usa
+    letras e dígitos: com pontuação ('{' depois de 'z'), o intervalo ficaria
+    vazio nas collations que ordenam a pontuação antes (MySQL 8 padrão).
+    """
+
+    def limites(self, filtro):
+        return dict(filtro.children)
+
+    def test_limite_superior_sem_pontuacao(self):
+        from .busca import ALFABETO_TOKEN, filtro_prefixo_token
+        casos = {'souz': 'sov', 'ab9': 'aba', 'a': 'b', 'mz9': 'mza', 'szz': 't'}
+        for prefixo, esperado in casos.items():
+            with self.subTest(prefixo=prefixo):
+                limites = self.limites(filtro_prefixo_token(prefixo))
+                self.assertEqual(limites, {'token__gte': prefixo, 'token__lt': esperado})
+                self.assertTrue(set(limites['token__lt']) <= set(ALFABETO_TOKEN))
+        self.assertEqual(self.limites(filtro_prefixo_token('zz')), {'token__gte': 'zz'})
+
+    def ids(self, termo):
+        resposta = self.cliente(self.superusuario).get('/api/municipes/', {'q': termo})
+        self.assertEqual(resposta.status_code, 200)
+        return {linha['id'] for linha in resposta.json()['results']}
+
+    def test_prefixos_terminados_em_z_e_9(self):
+        escola = self.criar_municipe('Escola Estadual 1990')
+        self.assertEqual(self.ids('souz'), {self.da_conta_a.pk})
+        self.assertEqual(self.ids('maria souz'), {self.da_conta_a.pk})
+        self.assertEqual(self.ids('escola 199'), {escola.pk})
+        self.assertEqual(self.ids('199'), {escola.pk})
+
+    def test_prefixo_de_cpf_terminado_em_9(self):
+        from .busca import filtro_cpf
+        self.assertEqual(self.limites(filtro_cpf('129')), {'cpf_digitos__gte': '129', 'cpf_digitos__lt': '13'})
+        self.assertEqual(self.limites(filtro_cpf('999.9')), {'cpf_digitos__gte': '9999'})
+        outro = self.criar_municipe('Pedro Alves', cpf='129.999.000-11')
+        for termo, esperado in (('129', {outro.pk}), ('129.99', {outro.pk}), ('123', {self.publico.pk})):
+            with self.subTest(termo=termo):
+                self.assertEqual(set(Municipe.objects.filter(filtro_cpf(termo)).values_list('id', flat=True)), esperado)
+        self.assertIsNone(filtro_cpf('12'))
+
+
+class BackendMySQLMunicipeTests(DadosBaseMixin, TestCase):
+    """No MySQL, Munícipe continua no índice de tokens (sem MATCH ... AGAINST)."""
+
+    def test_municipe_pelo_indice_de_tokens(self):
+        from .busca_backends import BackendMySQLFullText, BackendPadrao
+        com_stopwords = self.criar_municipe('Will The Cruz')
+        for termo in ('souz', 'maria souza', 'will', 'the cruz', 'jo'):
+            with self.subTest(termo=termo):
+                mysql = BackendMySQLFullText().buscar(Municipe.objects.all(), termo)
+                padrao = BackendPadrao().buscar(Municipe.objects.all(), termo)
+                self.assertNotIn('MATCH', str(mysql.query))
+                self.assertEqual(str(mysql.query), str(padrao.query))
+                self.assertEqual(list(mysql), list(padrao))
+        self.assertIn(com_stopwords, BackendMySQLFullText().buscar(Municipe.objects.all(), 'the cruz'))
+
+    def test_demais_modelos_pelo_fulltext(self):
+        from .busca_backends import BackendMySQLFullText
+        self.assertIn('MATCH', str(BackendMySQLFullText().buscar(Atendimento.objects.all(), 'buraco').query))
+
+
+class VerificacaoDuplicadosTests(DadosBaseMixin, TestCase):
+    """check-duplicates: telefone comparado pelos dígitos, com ou sem máscara."""
+
+    def ids(self, telefone):
+        resposta = self.cliente(self.membro).get(
+            '/api/municipes/check-duplicates/', {'telefone': telefone, 'conta_id': self.conta_a.pk}
+        )
+        dados = resposta.json()
+        return {linha['id'] for linha in (dados['results'] if isinstance(dados, dict) else dados)}
+
+    def test_telefone_pelos_digitos(self):
+        fixo = Municipe.objects.create(nome_completo='Carlos Lima', telefones=[{'tipo': 'FIXO', 'numero': '(11) 3333-4444'}])
+        fixo.contas.set([self.conta_a])
+        celulares = {self.da_conta_a.pk, self.das_duas.pk}
+        self.assertEqual(self.ids('(11) 99999-0001'), celulares)
+        self.assertEqual(self.ids('+55 11 99999-0001'), celulares)
+        self.assertEqual(self.ids('1133334444'), {fixo.pk})
+        # Máscara longa com poucos dígitos não é um telefone completo
+        self.assertEqual(self.ids('(11) 9999-0'), set())
+
+
+class BuscaGlobalExecucaoTests(DadosBaseMixin, TestCase):
+    """Fontes da busca global num pool compartilhado, com o orçamento também no banco."""
+
+    def executar(self, *fontes):
+        from types import SimpleNamespace
+        from .busca_global import busca_global
+        return busca_global(SimpleNamespace(user=self.superusuario, query_params={}), 'termo', fontes=list(fontes))
+
+    def fontes(self, liberar):
+        from .busca_global import FonteBusca
+
+        class FonteRapida(FonteBusca):
+            tipo = 'rapida'
+
+            def buscar(self, contexto, termo_busca):
+                return [{'tipo': self.tipo, 'id': 1, 'relevancia': 1.0}]
+
+        class FonteLenta(FonteBusca):
+            tipo = 'lenta'
+
+            def buscar(self, contexto, termo_busca):
+                liberar.wait(5)
+                return []
+
+        return FonteRapida(), FonteLenta()
+
+    @override_settings(SIGA_BUSCA_GLOBAL={'ORCAMENTO_MS': 100})
+    def test_pool_compartilhado_e_fonte_lenta(self):
+        import threading
+        from . import busca_global
+        liberar = threading.Event()
+        rapida, lenta = self.fontes(liberar)
+        try:
+            for _ in range(3):
+                resultados, meta = self.executar(rapida, lenta)
+                self.assertEqual([r['id'] for r in resultados], [1])
+                self.assertEqual(meta['fontes']['rapida']['status'], 'ok')
+                self.assertEqual(meta['fontes']['lenta']['status'], 'tempo_esgotado')
+        finally:
+            liberar.set()
+        self.assertIs(busca_global._obter_executor(), busca_global._obter_executor())
+        self.assertLessEqual(busca_global._obter_executor()._max_workers, busca_global.CONFIGURACAO_PADRAO['MAX_THREADS'])
+
+    def test_max_execution_time_no_mysql(self):
+        from unittest import mock
+        from . import busca_global
+        with mock.patch.object(busca_global, 'connection') as conexao:
+            conexao.vendor = 'mysql'
+            busca_global._limitar_tempo_no_banco(1500.7)
+        conexao.cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+            'SET SESSION MAX_EXECUTION_TIME = %s', [1500]
+        )
+        with mock.patch.object(busca_global, 'connection') as conexao:
+            conexao.vendor = 'sqlite'
+            busca_global._limitar_tempo_no_banco(1500)
+        conexao.cursor.assert_not_called()
+
+
+class PaginacaoPorChaveTests(DadosBaseMixin, TestCase):
+    """Cursores da KeysetPagination: ida e volta pelas páginas sem repetir nem perder linhas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.criar_linhas(5)
+
+    def paginas(self, url, chave):
+        """Segue os links `chave` ('next' ou 'previous') a partir de `url`; devolve os ids de cada página."""
+        paginas = []
+        cliente = self.cliente(self.superusuario)
+        while url:
+            # Um cursor que não avança repetiria a mesma página para sempre
+            self.assertLess(len(paginas), 20)
+            resposta = cliente.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            dados = resposta.json()
+            paginas.append([linha['id'] for linha in dados['results']])
+            url = dados[chave]
+            ultima = dados
+        return paginas, ultima
+
+    def test_ida_e_volta(self):
+        from .views import MunicipeListCreateView
+        for ordenar in ('nome', '-cadastro', '-qualidade'):
+            with self.subTest(ordenar=ordenar):
+                campos = MunicipeListCreateView.ORDENACOES[ordenar]
+                esperado = list(Municipe.objects.order_by(*campos).values_list('id', flat=True))
+                ida, ultima = self.paginas(f'/api/municipes/?ordenar={ordenar}&page_size=4', 'next')
+                self.assertEqual([id_ for pagina in ida for id_ in pagina], esperado)
+                self.assertTrue(all(len(pagina) == 4 for pagina in ida[:-1]))
+                # Da última página de volta à primeira: as mesmas páginas, na ordem inversa
+                volta, primeira = self.paginas(ultima['previous'], 'previous')
+                self.assertEqual(volta, ida[-2::-1])
+                self.assertIsNotNone(primeira['next'])
+
+    def test_insercao_nao_desloca_as_paginas(self):
+        cliente = self.cliente(self.superusuario)
+        primeira = cliente.get('/api/municipes/?ordenar=nome&page_size=4').json()
+        segunda = cliente.get(primeira['next']).json()['results']
+        self.criar_municipe('Aaron Abreu')
+        self.assertEqual(cliente.get(primeira['next']).json()['results'], segunda)
+
+    def test_cursor_invalido(self):
+        resposta = self.cliente(self.superusuario).get('/api/municipes/', {'ordenar': 'nome', 'cursor': 'invalido'})
+        self.assertEqual(resposta.status_code, 404)
+
+
+class BuscaFoneticaTests(DadosBaseMixin, TestCase):
+    """fuzzy=1: grafias diferentes do mesmo nome pela chave fonética dos tokens."""
+
+    ROTAS = ('/api/municipes/', '/api/municipes/lookup/')
+
+    def ids(self, url, **parametros):
+        dados = self.cliente(self.superusuario).get(url, parametros).json()
+        return {linha['id'] for linha in (dados['results'] if isinstance(dados, dict) else dados)}
+
+    def test_chaves_foneticas(self):
+        from .busca import chave_fonetica
+        for grafias in (('luiz', 'luis'), ('souza', 'sousa'), ('thiago', 'tiago')):
+            with self.subTest(grafias=grafias):
+                self.assertEqual(len({chave_fonetica(grafia) for grafia in grafias}), 1)
+        self.assertNotEqual(chave_fonetica('souza'), chave_fonetica('silva'))
+
+    def test_luiz_e_luis(self):
+        luiz = self.criar_municipe('Luiz Fernandes')
+        for url in self.ROTAS:
+            with self.subTest(url=url):
+                self.assertNotIn(luiz.pk, self.ids(url, q='luis fernandes'))
+                self.assertIn(luiz.pk, self.ids(url, q='luis fernandes', fuzzy='1'))
+
+    def test_souza_e_sousa(self):
+        for url in self.ROTAS:
+            with self.subTest(url=url):
+                self.assertEqual(self.ids(url, q='sousa'), {self.da_conta_b.pk})
+                self.assertEqual(self.ids(url, q='sousa', fuzzy='1'), {self.da_conta_a.pk, self.da_conta_b.pk})
+
+
+class RelatorioJobTests(DadosBaseMixin, TestCase):
+    """Relatório em segundo plano: 202 com o job, processamento pelo worker, status e download."""
+
+    URL = '/api/relatorios/atendimentos/pdf/'
+
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from django.core.files.storage import FileSystemStorage
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        # O storage do campo é resolvido na carga do modelo: troca pelo diretório temporário
+        for alvo in (
+            mock.patch.object(RelatorioJob._meta.get_field('arquivo'), 'storage', FileSystemStorage(location=diretorio.name)),
+            mock.patch('atendimentos.recursos_pdf.gerar_pdf', return_value=b'%PDF-relatorio'),
+        ):
+            alvo.start()
+            self.addCleanup(alvo.stop)
+
+    def enfileirar(self, usuario):
+        from unittest import mock
+        with mock.patch('atendimentos.tasks.gerar_relatorio.apply_async') as apply_async:
+            resposta = self.cliente(usuario).get(self.URL, {'assincrono': 'true'})
+        self.assertEqual(resposta.status_code, 202)
+        apply_async.assert_called_once_with((resposta.json()['id'],), retry=False)
+        return resposta.json()
+
+    def test_ciclo_de_vida(self):
+        from . import relatorios
+        dados = self.enfileirar(self.membro)
+        self.assertEqual(dados['status'], RelatorioJob.PENDENTE)
+        self.assertIsNone(dados['url_download'])
+        cliente = self.cliente(self.membro)
+        download = f"/api/relatorios/jobs/{dados['id']}/download/"
+        self.assertEqual(cliente.get(download).status_code, 409)
+
+        relatorios.processar(dados['id'])
+        status_job = cliente.get(f"/api/relatorios/jobs/{dados['id']}/").json()
+        self.assertEqual((status_job['status'], status_job['progresso']), (RelatorioJob.CONCLUIDO, 100))
+        self.assertTrue(status_job['url_download'].endswith(download))
+        resposta = cliente.get(download)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(b''.join(resposta.streaming_content), b'%PDF-relatorio')
+        self.assertEqual([job['id'] for job in cliente.get('/api/relatorios/jobs/').json()], [dados['id']])
+
+        # Reentrega da task não gera de novo; outro usuário não enxerga o job
+        self.assertIn('não está pendente', relatorios.processar(dados['id']))
+        self.assertEqual(self.cliente(self.secretaria).get(download).status_code, 404)
+
+        # Vencido: 410 no download e removido pela limpeza, junto com o arquivo
+        job = RelatorioJob.objects.get(pk=dados['id'])
+        RelatorioJob.objects.filter(pk=job.pk).update(expira_em=timezone.now())
+        self.assertEqual(cliente.get(download).status_code, 410)
+        self.assertEqual(relatorios.limpar_expirados(), 1)
+        self.assertFalse(job.arquivo.storage.exists(job.arquivo.name))
+
+    def test_erro_na_geracao(self):
+        from unittest import mock
+        from . import relatorios
+        dados = self.enfileirar(self.membro)
+        with mock.patch('atendimentos.recursos_pdf.gerar_pdf', side_effect=RuntimeError('falhou')), \
+                self.assertLogs('atendimentos.relatorios', 'ERROR'):
+            relatorios.processar(dados['id'])
+        job = RelatorioJob.objects.get(pk=dados['id'])
+        self.assertEqual((job.status, job.erro), (RelatorioJob.ERRO, 'falhou'))
+        resposta = self.cliente(self.membro).get(f"/api/relatorios/jobs/{dados['id']}/download/")
+        self.assertEqual(resposta.status_code, 409)
+        self.assertIn('falhou', resposta.json()['error'])
+
+    def test_fila_indisponivel_gera_na_requisicao(self):
+        from unittest import mock
+        with mock.patch('atendimentos.tasks.gerar_relatorio.apply_async', side_effect=ConnectionError), \
+                self.assertLogs('atendimentos.relatorios', 'WARNING'):
+            resposta = self.cliente(self.membro).get(self.URL, {'assincrono': 'true'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.content, b'%PDF-relatorio')
+        self.assertFalse(RelatorioJob.objects.exists())
+
+
+class CachePdfTests(DadosBaseMixin, TestCase):
+    """PDF do atendimento servido do cache em disco enquanto o HTML renderizado não muda."""
+
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(SIGA_CACHE_PDF={'ATIVO': True, 'DIRETORIO': diretorio.name, 'TAMANHO_MAXIMO_MB': 1})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        gerar_pdf = mock.patch('atendimentos.recursos_pdf.gerar_pdf', side_effect=lambda html, base_url: b'%PDF-' + html.encode())
+        self.gerar_pdf = gerar_pdf.start()
+        self.addCleanup(gerar_pdf.stop)
+        self.atendimento = Atendimento.objects.create(
+            municipe=self.da_conta_a, conta=self.conta_a, titulo='Buraco na rua', descricao='Pedido'
+        )
+
+    def baixar(self):
+        resposta = self.cliente(self.superusuario).get(f'/api/atendimentos/{self.atendimento.pk}/pdf/')
+        self.assertEqual(resposta.status_code, 200)
+        # Acerto sai como FileResponse (streaming); falha, como HttpResponse
+        conteudo = b''.join(resposta.streaming_content) if resposta.streaming else resposta.content
+        return resposta['X-Cache-PDF'], conteudo
+
+    def test_acerto_e_mudanca_no_documento(self):
+        situacao, gerado = self.baixar()
+        self.assertEqual(situacao, 'falha')
+        self.assertEqual(self.baixar(), ('acerto', gerado))
+        self.assertEqual(self.gerar_pdf.call_count, 1)
+
+        self.atendimento.titulo = 'Buraco na calçada'
+        self.atendimento.save()
+        situacao, novo = self.baixar()
+        self.assertEqual(situacao, 'falha')
+        self.assertNotEqual(novo, gerado)
+        self.assertEqual(self.gerar_pdf.call_count, 2)
+
+        estatisticas = self.cliente(self.superusuario).get('/api/pdfs/cache/').json()
+        self.assertEqual((estatisticas['acertos'], estatisticas['falhas'], estatisticas['arquivos']), (1, 2, 2))
+
+    def test_limpeza_e_despejo(self):
+        import os
+        from . import cache_pdf
+        self.baixar()
+        resposta = self.cliente(self.superusuario).delete('/api/pdfs/cache/?arquivos=true')
+        self.assertEqual(resposta.status_code, 204)
+        self.assertEqual(self.baixar()[0], 'falha')
+        # Acima do limite, sai o arquivo usado há mais tempo
+        diretorio = cache_pdf.configuracao_cache_pdf()['DIRETORIO']
+        antigo = cache_pdf.caminho(diretorio, 'a' * 64)
+        cache_pdf._gravar(antigo, b'x' * 10)
+        os.utime(antigo, (0, 0))
+        ocupado = sum(tamanho for _, tamanho, _ in cache_pdf._arquivos(diretorio))
+        self.assertEqual(cache_pdf.despejar(diretorio, ocupado - 1), 1)
+        self.assertFalse(os.path.exists(antigo))
+        self.assertEqual(self.baixar()[0], 'acerto')
@@ -0,0 +1,599 @@
+"""
+Índice de prefixos para o autocomplete de Munícipes (MunicipeLookupView).
+
+Cada escopo de visibilidade (os munícipes públicos, sem conta, e os de cada
+conta) guarda seus tokens de nome em ordem alfabética; um prefixo vira uma
+busca binária seguida de uma varredura curta, a mesma ideia de um trie, mas
+sem o custo de memória de um nó por letra (no Redis o equivalente é um
+ZRANGEBYLEX em um sorted set). Os dados exibidos de cada munícipe ficam em
+um cache de registros, preenchido sob demanda.
+
+O índice é atualizado pelos sinais de Municipe (save, delete e m2m de contas),
+depois do commit. No backend 'memoria' cada processo tem o seu índice: a
+alteração feita em um processo incrementa a versão guardada no cache do
+Django, e os demais, ao perceberem a troca, respondem pelo banco enquanto
+reconstroem o índice em segundo plano. Isso só funciona com o cache do Django
+compartilhado entre os workers (SIGA_CACHE_REDIS_URL); por isso o índice vem
+ligado por padrão apenas com esse cache ou com o backend 'redis' (ver
+SIGA_TYPEAHEAD em core/settings.py). Desligado, o autocomplete usa o banco.
+
+O índice nunca é montado dentro da requisição: enquanto não estiver pronto, a
+busca vai ao banco e a montagem corre numa thread.
+"""
+import bisect
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import qualidade
+from .busca import normalizar_nome_para_conjunto, tokens_dos_nomes
+from .models import Conta, Municipe
+from .permissions import contexto_autorizacao, pode_editar_municipe
+from .serializers import ContaSerializer
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Escopo dos munícipes públicos (sem nenhuma conta vinculada)
+ESCOPO_PUBLICO = 0
+
+CHAVE_VERSAO = 'siga:typeahead:versao'
+
+CONFIGURACAO_PADRAO = {
+    'ATIVO': False,
+    'BACKEND': 'memoria',
+    'REDIS_URL': 'redis://localhost:6379/1',
+    'TTL': 300,
+    'TAMANHO_CACHE_REGISTROS': 20000,
+}
+
+CAMPOS_REGISTRO = (
+    'id', 'nome_completo', 'nome_de_guerra', 'categoria_id', 'categoria__nome', 'cargo',
+    'emails', 'pontuacao_qualidade', 'data_atualizacao',
+)
+
+
+def configuracao_typeahead():
+    return {**CONFIGURACAO_PADRAO, **getattr(settings, 'SIGA_TYPEAHEAD', {})}
+
+
+# -----------------------------------------------------------------------------
+# Leitura do banco
+# -----------------------------------------------------------------------------
+
+def _contas_por_municipe(ids=None):
+    through = Municipe.contas.through.objects.order_by('id')
+    if ids is not None:
+        through = through.filter(municipe_id__in=ids)
+    contas = defaultdict(list)
+    for municipe_id, conta_id in through.values_list('municipe_id', 'conta_id').iterator(chunk_size=5000):
+        contas[municipe_id].append(conta_id)
+    return contas
+
+
+def _itens_do_banco():
+    """(id, nome_completo, tokens, contas) de todos os munícipes, em duas consultas."""
+    contas = _contas_por_municipe()
+    municipes = Municipe.objects.order_by().values_list('id', 'nome_completo', 'nome_de_guerra')
+    for municipe_id, nome_completo, nome_de_guerra in municipes.iterator(chunk_size=5000):
+        yield municipe_id, nome_completo, tokens_dos_nomes(nome_completo, nome_de_guerra), tuple(contas.get(municipe_id, ()))
+
+
+def _registros_do_banco(ids):
+    contas = _contas_por_municipe(ids)
+    registros = {}
+    for valores in Municipe.objects.filter(id__in=ids).order_by().values(*CAMPOS_REGISTRO):
+        registros[valores['id']] = {
+            'id': valores['id'],
+            'nome_completo': valores['nome_completo'],
+            'nome_de_guerra': valores['nome_de_guerra'],
+            'contas': contas.get(valores['id'], []),
+            'categoria': valores['categoria_id'],
+            'categoria_nome': valores['categoria__nome'],
+            'cargo': valores['cargo'],
+            'emails': valores['emails'],
+            'qualidade_dados': qualidade.nivel(valores['pontuacao_qualidade']),
+            'data_atualizacao': valores['data_atualizacao'],
+        }
+    return registros
+
+
+# -----------------------------------------------------------------------------
+# Backend em memória
+# -----------------------------------------------------------------------------
+
+class EscopoPrefixos:
+    """Tokens de um escopo em ordem alfabética + ids de munícipes por token."""
+    __slots__ = ('tokens', 'ids_por_token')
+
+    def __init__(self, ids_por_token=None):
+        self.ids_por_token = ids_por_token or {}
+        self.tokens = sorted(self.ids_por_token)
+
+    def adicionar(self, token, municipe_id):
+        ids = self.ids_por_token.get(token)
+        if ids is None:
+            ids = self.ids_por_token[token] = set()
+            bisect.insort(self.tokens, token)
+        ids.add(municipe_id)
+
+    def remover(self, token, municipe_id):
+        ids = self.ids_por_token.get(token)
+        if ids is None:
+            return
+        ids.discard(municipe_id)
+        if not ids:
+            del self.ids_por_token[token]
+            posicao = bisect.bisect_left(self.tokens, token)
+            if posicao < len(self.tokens) and self.tokens[posicao] == token:
+                del self.tokens[posicao]
+
+    def ids_com_prefixo(self, prefixo):
+        ids = set()
+        posicao = bisect.bisect_left(self.tokens, prefixo)
+        while posicao < len(self.tokens) and self.tokens[posicao].startswith(prefixo):
+            ids |= self.ids_por_token[self.tokens[posicao]]
+            posicao += 1
+        return ids
+
+
+class IndiceMemoria:
+
+    def __init__(self, tamanho_cache_registros):
+        self.escopos = {}
+        self.municipes = {}  # id -> (nome_completo, tokens, contas)
+        self.registros = OrderedDict()
+        self.tamanho_cache_registros = tamanho_cache_registros
+        self.versao = None
+        self.construido_em = None
+        self.lock = threading.Lock()
+
+    def pronto(self):
+        return self.construido_em is not None
+
+    def carregar(self, itens):
+        ids_por_escopo = defaultdict(lambda: defaultdict(set))
+        municipes = {}
+        for municipe_id, nome_completo, tokens, contas in itens:
+            tokens = tuple(tokens)
+            municipes[municipe_id] = (nome_completo, tokens, contas)
+            for escopo in (contas or (ESCOPO_PUBLICO,)):
+                for token in tokens:
+                    ids_por_escopo[escopo][token].add(municipe_id)
+        escopos = {escopo: EscopoPrefixos(dict(ids)) for escopo, ids in ids_por_escopo.items()}
+        with self.lock:
+            self.escopos, self.municipes = escopos, municipes
+            self.registros = OrderedDict()
+            self.construido_em = time.monotonic()
+
+    def atualizar(self, municipe_id, nome_completo, tokens, contas):
+        with self.lock:
+            self._remover(municipe_id)
+            tokens = tuple(tokens)
+            self.municipes[municipe_id] = (nome_completo, tokens, contas)
+            for escopo in (contas or (ESCOPO_PUBLICO,)):
+                indice_escopo = self.escopos.setdefault(escopo, EscopoPrefixos())
+                for token in tokens:
+                    indice_escopo.adicionar(token, municipe_id)
+
+    def remover(self, municipe_id):
+        with self.lock:
+            self._remover(municipe_id)
+
+    def _remover(self, municipe_id):
+        self.registros.pop(municipe_id, None)
+        anterior = self.municipes.pop(municipe_id, None)
+        if anterior is None:
+            return
+        _, tokens, contas = anterior
+        for escopo in (contas or (ESCOPO_PUBLICO,)):
+            indice_escopo = self.escopos.get(escopo)
+            if indice_escopo is not None:
+                for token in tokens:
+                    indice_escopo.remover(token, municipe_id)
+
+    def todos_escopos(self):
+        with self.lock:
+            return list(self.escopos)
+
+    # As leituras também tomam o lock: `atualizar` altera os mesmos conjuntos
+    # (e `obter_registros` reordena o cache de registros).
+
+    def ids_com_prefixo(self, escopo, prefixo):
+        with self.lock:
+            indice_escopo = self.escopos.get(escopo)
+            return indice_escopo.ids_com_prefixo(prefixo) if indice_escopo else set()
+
+    def dados_municipes(self, ids):
+        with self.lock:
+            return {municipe_id: self.municipes[municipe_id] for municipe_id in ids if municipe_id in self.municipes}
+
+    def obter_registros(self, ids):
+        encontrados = {}
+        with self.lock:
+            for municipe_id in ids:
+                registro = self.registros.get(municipe_id)
+                if registro is not None:
+                    self.registros.move_to_end(municipe_id)
+                    encontrados[municipe_id] = registro
+        return encontrados
+
+    def guardar_registros(self, registros):
+        with self.lock:
+            self.registros.update(registros)
+            while len(self.registros) > self.tamanho_cache_registros:
+                self.registros.popitem(last=False)
+
+    def limpar_registros(self):
+        with self.lock:
+            self.registros = OrderedDict()
+
+
+# -----------------------------------------------------------------------------
+# Backend Redis
+# -----------------------------------------------------------------------------
+
+class IndiceRedis:
+    """
+    Um sorted set por escopo com membros "token:id" (score 0), consultado com
+    ZRANGEBYLEX; hashes com os dados de busca e os registros de exibição.
+    Compartilhado entre todos os processos, então não depende de versão.
+    """
+    PREFIXO = 'siga:typeahead'
+
+    def __init__(self, url):
+        self.cliente = redis.Redis.from_url(url, decode_responses=True)
+
+    def _chave_escopo(self, escopo):
+        return f'{self.PREFIXO}:escopo:{escopo}'
+
+    def pronto(self):
+        return bool(self.cliente.exists(f'{self.PREFIXO}:pronto'))
+
+    def carregar(self, itens):
+        chaves_antigas = list(self.cliente.scan_iter(f'{self.PREFIXO}:*'))
+        if chaves_antigas:
+            self.cliente.delete(*chaves_antigas)
+        pipe = self.cliente.pipeline(transaction=False)
+        for quantidade, (municipe_id, nome_completo, tokens, contas) in enumerate(itens, start=1):
+            self._adicionar(pipe, municipe_id, nome_completo, tokens, contas)
+            if quantidade % 5000 == 0:
+                pipe.execute()
+        pipe.set(f'{self.PREFIXO}:pronto', 1)
+        pipe.execute()
+
+    def _adicionar(self, pipe, municipe_id, nome_completo, tokens, contas):
+        tokens = list(tokens)
+        for escopo in (contas or (ESCOPO_PUBLICO,)):
+            if tokens:
+                pipe.zadd(self._chave_escopo(escopo), {f'{token}:{municipe_id}': 0 for token in tokens})
+            pipe.sadd(f'{self.PREFIXO}:escopos', escopo)
+        pipe.hset(f'{self.PREFIXO}:municipes', municipe_id, json.dumps([nome_completo, tokens, list(contas)]))
+
+    def atualizar(self, municipe_id, nome_completo, tokens, contas):
+        pipe = self.cliente.pipeline()
+        self._remover(pipe, municipe_id)
+        self._adicionar(pipe, municipe_id, nome_completo, tokens, contas)
+        pipe.execute()
+
+    def remover(self, municipe_id):
+        pipe = self.cliente.pipeline()
+        self._remover(pipe, municipe_id)
+        pipe.execute()
+
+    def _remover(self, pipe, municipe_id):
+        anterior = self.cliente.hget(f'{self.PREFIXO}:municipes', municipe_id)
+        if anterior:
+            _, tokens, contas = json.loads(anterior)
+            for escopo in (contas or (ESCOPO_PUBLICO,)):
+                if tokens:
+                    pipe.zrem(self._chave_escopo(escopo), *[f'{token}:{municipe_id}' for token in tokens])
+        pipe.hdel(f'{self.PREFIXO}:municipes', municipe_id)
+        pipe.hdel(f'{self.PREFIXO}:registros', municipe_id)
+
+    def todos_escopos(self):
+        return [int(escopo) for escopo in self.cliente.smembers(f'{self.PREFIXO}:escopos')]
+
+    def ids_com_prefixo(self, escopo, prefixo):
+        membros = self.cliente.zrangebylex(self._chave_escopo(escopo), f'[{prefixo}', f'[{prefixo}\xff')
+        return {int(membro.rsplit(':', 1)[1]) for membro in membros}
+
+    def dados_municipes(self, ids):
+        ids = list(ids)
+        if not ids:
+            return {}
+        valores = self.cliente.hmget(f'{self.PREFIXO}:municipes', ids)
+        dados = {}
+        for municipe_id, valor in zip(ids, valores):
+            if valor:
+                nome_completo, tokens, contas = json.loads(valor)
+                dados[municipe_id] = (nome_completo, tuple(tokens), tuple(contas))
+        return dados
+
+    def obter_registros(self, ids):
+        ids = list(ids)
+        if not ids:
+            return {}
+        encontrados = {}
+        for municipe_id, valor in zip(ids, self.cliente.hmget(f'{self.PREFIXO}:registros', ids)):
+            if valor:
+                registro = json.loads(valor)
+                if registro['data_atualizacao']:
+                    registro['data_atualizacao'] = datetime.fromisoformat(registro['data_atualizacao'])
+                encontrados[municipe_id] = registro
+        return encontrados
+
+    def guardar_registros(self, registros):
+        if not registros:
+            return
+        self.cliente.hset(f'{self.PREFIXO}:registros', mapping={
+            municipe_id: json.dumps({
+                **registro,
+                'data_atualizacao': registro['data_atualizacao'].isoformat() if registro['data_atualizacao'] else None,
+            })
+            for municipe_id, registro in registros.items()
+        })
+
+    def limpar_registros(self):
+        self.cliente.delete(f'{self.PREFIXO}:registros')
+
+
+# -----------------------------------------------------------------------------
+# Ciclo de vida do índice
+# -----------------------------------------------------------------------------
+
+_indice = None
+_lock = threading.Lock()
+_reconstruindo = threading.Event()
+
+
+def _criar_indice():
+    configuracao = configuracao_typeahead()
+    if configuracao['BACKEND'] == 'redis':
+        if redis is None:
+            logger.warning("Typeahead configurado para Redis, mas a biblioteca 'redis' não está instalada. Usando memória.")
+        else:
+            return IndiceRedis(configuracao['REDIS_URL'])
+    return IndiceMemoria(configuracao['TAMANHO_CACHE_REGISTROS'])
+
+
+def _versao_inicial():
+    # Como em cache_busca: se a chave for despejada, recomeça de um valor nunca usado
+    return time.time_ns() // 1000
+
+
+def versao_dados():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, _versao_inicial(), None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def _nova_versao():
+    """Incrementa a versão e devolve a nova (None se a chave tinha sumido)."""
+    try:
+        return cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        cache.add(CHAVE_VERSAO, _versao_inicial(), None)
+        return None
+
+
+def _reconstruir(indice):
+    # A versão é lida antes dos dados: uma alteração no meio do caminho deixa o
+    # índice com a versão antiga, e ele é reconstruído de novo
+    versao = versao_dados()
+    indice.carregar(_itens_do_banco())
+    indice.versao = versao
+
+
+def _reconstruir_em_segundo_plano(indice):
+    if _reconstruindo.is_set():
+        return
+    _reconstruindo.set()
+
+    def executar():
+        from django.db import connection
+        try:
+            _reconstruir(indice)
+        except Exception:
+            logger.exception("Falha ao reconstruir o índice de typeahead de munícipes.")
+        finally:
+            connection.close()
+            _reconstruindo.clear()
+
+    threading.Thread(target=executar, daemon=True).start()
+
+
+def _obter_ou_criar():
+    global _indice
+    with _lock:
+        if _indice is None:
+            _indice = _criar_indice()
+        return _indice
+
+
+def obter_indice():
+    """Devolve o índice pronto e atualizado para consulta, ou None (a busca vai ao banco)."""
+    if not configuracao_typeahead()['ATIVO']:
+        return None
+    try:
+        indice = _obter_ou_criar()
+        if isinstance(indice, IndiceMemoria):
+            if not indice.pronto() or indice.versao != versao_dados():
+                # Outro processo alterou munícipes (ou o índice ainda não existe):
+                # responder pelo índice antigo poderia mostrar quem o usuário não vê mais
+                _reconstruir_em_segundo_plano(indice)
+                return None
+            if time.monotonic() - indice.construido_em > configuracao_typeahead()['TTL']:
+                # Sem troca de versão: continua respondendo enquanto o novo é montado
+                _reconstruir_em_segundo_plano(indice)
+            return indice
+        if not indice.pronto():
+            _reconstruir_em_segundo_plano(indice)
+            return None
+        return indice
+    except Exception:
+        logger.exception("Índice de typeahead de munícipes indisponível; usando o banco.")
+        return None
+
+
+def reconstruir():
+    """Reconstrói o índice agora, na thread atual (comandos de manutenção, benchmark e testes)."""
+    indice = _obter_ou_criar()
+    _reconstruir(indice)
+    return indice
+
+
+def _depois_do_commit(funcao):
+    # Os demais processos só podem reconstruir (e este só pode ler) o que já foi confirmado
+    if configuracao_typeahead()['ATIVO']:
+        transaction.on_commit(funcao)
+
+
+def _aplicar(alterar):
+    """Aplica `alterar(indice)` ao índice deste processo e troca a versão para os demais."""
+    indice = _indice
+    versao_anterior = indice.versao if isinstance(indice, IndiceMemoria) else None
+    versao = _nova_versao()
+    if indice is None or not indice.pronto():
+        return
+    alterar(indice)
+    if isinstance(indice, IndiceMemoria) and versao is not None and versao_anterior == versao - 1:
+        # Só adota a versão nova se o índice estava em dia antes desta alteração
+        indice.versao = versao
+
+
+def atualizar_municipes(ids):
+    """Reflete no índice os munícipes informados (chamado pelos sinais)."""
+    ids = set(ids)
+
+    def alterar(indice):
+        contas = _contas_por_municipe(ids)
+        encontrados = set()
+        for municipe_id, nome_completo, nome_de_guerra in Municipe.objects.filter(id__in=ids).values_list('id', 'nome_completo', 'nome_de_guerra'):
+            encontrados.add(municipe_id)
+            indice.atualizar(municipe_id, nome_completo, tokens_dos_nomes(nome_completo, nome_de_guerra), tuple(contas.get(municipe_id, ())))
+        for municipe_id in ids - encontrados:
+            indice.remover(municipe_id)
+
+    _depois_do_commit(lambda: _aplicar(alterar))
+
+
+def remover_municipe(municipe_id):
+    _depois_do_commit(lambda: _aplicar(lambda indice: indice.remover(municipe_id)))
+
+
+def invalidar():
+    """Força a reconstrução completa (alterações em lote, contas ou categorias)."""
+    def executar():
+        _nova_versao()
+        indice = _indice
+        if indice is not None:
+            indice.limpar_registros()
+            if isinstance(indice, IndiceRedis):
+                indice.cliente.delete(f'{IndiceRedis.PREFIXO}:pronto')
+
+    _depois_do_commit(executar)
+
+
+# -----------------------------------------------------------------------------
+# Consulta
+# -----------------------------------------------------------------------------
+
+def buscar(request, termo_busca, limite):
+    """
+    Resposta do MunicipeLookupView para `termo_busca`, no mesmo formato do
+    MunicipeLookupSerializer, ou None quando o índice não está disponível.
+    Aplica a mesma regra de visibilidade da view: superusuário vê tudo, quem
+    tem perfil vê os públicos e os das suas contas, os demais não veem nada.
+    """
+    user = request.user
+    if not user.is_superuser and not hasattr(user, 'perfil'):
+        return []
+
+    indice = obter_indice()
+    if indice is None:
+        return None
+
+    autorizacao = contexto_autorizacao(user)
+    contas_usuario = autorizacao.contas_ids
+    escopos = indice.todos_escopos() if user.is_superuser else [ESCOPO_PUBLICO, *contas_usuario]
+
+    if termo_busca.isdigit():
+        municipe_id = int(termo_busca)
+        dados = indice.dados_municipes([municipe_id])
+        if municipe_id not in dados:
+            return []
+        contas = dados[municipe_id][2]
+        if not user.is_superuser and contas and contas_usuario.isdisjoint(contas):
+            return []
+        escolhidos = [municipe_id]
+    else:
+        palavras = normalizar_nome_para_conjunto(termo_busca)
+        if not palavras:
+            return []
+        encontrados = set()
+        for escopo in escopos:
+            ids_escopo = None
+            for palavra in sorted(palavras, key=len, reverse=True):
+                ids_palavra = indice.ids_com_prefixo(escopo, palavra)
+                ids_escopo = ids_palavra if ids_escopo is None else ids_escopo & ids_palavra
+                if not ids_escopo:
+                    break
+            encontrados |= ids_escopo or set()
+
+        # Mesma ordem do backend de busca: palavras inteiras primeiro, depois o nome.
+        dados = indice.dados_municipes(encontrados)
+        escolhidos = heapq.nsmallest(
+            limite, dados,
+            key=lambda municipe_id: (-len(palavras.intersection(dados[municipe_id][1])), dados[municipe_id][0])
+        )
+
+    registros = indice.obter_registros(escolhidos)
+    faltantes = [municipe_id for municipe_id in escolhidos if municipe_id not in registros]
+    if faltantes:
+        novos = _registros_do_banco(faltantes)
+        indice.guardar_registros(novos)
+        registros.update(novos)
+
+    # Lidas a cada busca (são poucas): um mapa em memória ficaria defasado nos outros processos
+    ids_contas = {conta_id for municipe_id in escolhidos if municipe_id in registros for conta_id in registros[municipe_id]['contas']}
+    contas = Conta.objects.in_bulk(ids_contas) if ids_contas else {}
+    contas_serializadas = {}
+    agora = timezone.now()
+    resultado = []
+    for municipe_id in escolhidos:
+        registro = registros.get(municipe_id)
+        if registro is None:
+            continue
+        for conta_id in registro['contas']:
+            if conta_id not in contas_serializadas and conta_id in contas:
+                contas_serializadas[conta_id] = ContaSerializer(contas[conta_id], context={'request': request}).data
+        data_atualizacao = registro['data_atualizacao']
+        resultado.append({
+            'id': registro['id'],
+            'nome_completo': registro['nome_completo'],
+            'nome_de_guerra': registro['nome_de_guerra'],
+            'contas': [contas_serializadas[conta_id] for conta_id in registro['contas'] if conta_id in contas_serializadas],
+            'categoria': registro['categoria'],
+            'cargo': registro['cargo'],
+            'emails': registro['emails'],
+            'pode_editar': pode_editar_municipe(user, autorizacao.grupos, contas_usuario, registro['categoria_nome'], set(registro['contas'])),
+            'qualidade_dados': registro['qualidade_dados'],
+            'alerta_atualizacao': qualidade.desatualizado(data_atualizacao, agora),
+        })
+    return resultado
@@ -9,6 +9,8 @@ from .views import (
     AtendimentoDetailView,
     AtendimentoListCreateView,
     BuscaGlobalView,
+    CacheBuscaMunicipesView,
+    CachePdfView,
     CategoriaAtendimentoListView,
     CategoriaContatoListView,
     ContaListView,
@@ -34,6 +36,7 @@ from .views import (
     ListarEventosGoogleView,
     MarcarNotificacaoComoLidaView,
     MesclarDuplicatasView,
+    MunicipeAtividadesView,
     MunicipeCheckDuplicatesView,
     MunicipeDetailDataView,
     MunicipeDetailView,
@@ -41,17 +44,22 @@ from .views import (
     MunicipeLookupView,
     MyTokenObtainPairView,
     NotificacaoListView,
+    QualidadeMunicipesView,
     RegistroVisitaListCreateView,
     RegistroVisitaDetailView,
     RelatorioAtendimentosPorCategoriaView,
     RelatorioAtendimentosPorContaView,
     RelatorioAtendimentosPorStatusView,
+    RelatorioJobDetailView,
+    RelatorioJobDownloadView,
+    RelatorioJobListView,
     RemoverLinkGoogleView,
     ReservaEspacoListCreateView,
     ReservaEspacoDetailView,
     SharedGoogleAgendaView,
     SolicitacaoAgendaDetailView,
     SolicitacaoAgendaListCreateView,
+    TabelaPermissoesView,
     TramitacaoDetailView,
     TramitacaoListCreateView,
     UserListView,
@@ -67,10 +75,13 @@ urlpatterns = [
     # --- Munícipes ---
     path('municipes/', MunicipeListCreateView.as_view(), name='municipe-list-create'),
     path('municipes/lookup/', MunicipeLookupView.as_view(), name='municipe-lookup'),
+    path('municipes/cache-busca/', CacheBuscaMunicipesView.as_view(), name='municipe-cache-busca'),
+    path('municipes/qualidade/', QualidadeMunicipesView.as_view(), name='municipe-qualidade'),
     path('municipes/export/excel/', ExportMunicipesExcelView.as_view(), name='export-municipes-excel'),
     path('municipes/aniversariantes-do-dia/', AniversariantesDoDiaView.as_view(), name='municipes-aniversariantes-dia'),
     path('municipes/<int:pk>/', MunicipeDetailView.as_view(), name='municipe-detail'),
     path('municipes/<int:pk>/historico/', MunicipeDetailDataView.as_view(), name='municipe-historico'),
+    path('municipes/<int:pk>/atividades/', MunicipeAtividadesView.as_view(), name='municipe-atividades'),
     path('municipes/check-duplicates/', MunicipeCheckDuplicatesView.as_view(), name='municipe-check-duplicates'),
     path('municipes/mesclar-duplicatas/', MesclarDuplicatasView.as_view(), name='municipe-mesclar-duplicatas'), 
     
@@ -106,9 +117,11 @@ urlpatterns = [
     path('relatorios/agendas/pdf/', GerarPdfAgendasReportView.as_view(), name='relatorio-agendas-pdf'),
     path('dashboard/summary/', DashboardSummaryView.as_view(), name='dashboard-summary'),
     path('relatorios/google-agenda/pdf/', GerarPdfGoogleAgendaView.as_view(), name='relatorio-google-agenda-pdf'),
+    path('pdfs/cache/', CachePdfView.as_view(), name='pdf-cache'),
 
     # --- Listas Gerais e Utilitários ---
     path('usuarios/', UserListView.as_view(), name='usuario-list'),
+    path('permissoes/tabela/', TabelaPermissoesView.as_view(), name='permissoes-tabela'),
     path('contas/', ContaListView.as_view(), name='conta-list'),
     path('categorias/', CategoriaAtendimentoListView.as_view(), name='categoria-list'),
     path('contatos/categorias/', CategoriaContatoListView.as_view(), name='categoriacontato-list'),
@@ -120,6 +133,9 @@ urlpatterns = [
     path('lembretes/', LembreteListCreateView.as_view(), name='lembrete-list-create'),
     path('lembretes/<int:pk>/', LembreteDetailView.as_view(), name='lembrete-detail'),
     path('relatorios/lembretes/pdf/', GerarPdfLembretesView.as_view(), name='relatorio-lembretes-pdf'),
+    path('relatorios/jobs/', RelatorioJobListView.as_view(), name='relatorio-job-list'),
+    path('relatorios/jobs/<uuid:pk>/', RelatorioJobDetailView.as_view(), name='relatorio-job-detail'),
+    path('relatorios/jobs/<uuid:pk>/download/', RelatorioJobDownloadView.as_view(), name='relatorio-job-download'),
 
     # --- Integração Google ---
     path('google/auth/initiate/', GoogleAuthInitiateView.as_view(), name='google-auth-initiate'),
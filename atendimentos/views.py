@@ -1,8 +1,4 @@
-import os
-import base64
 import openpyxl
-import calendar
-import operator
 import traceback
 import logging
 
@@ -15,22 +11,18 @@ from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from google.auth.transport.requests import Request as GoogleAuthRequest
-from weasyprint import HTML
-from functools import reduce
-from collections import defaultdict
-from dateutil.parser import parse as parse_datetime
 
 
 # Imports do Django
-from django.db.models.functions import Trim
+from django.db.models.functions import Coalesce, Trim
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.contrib.auth.forms import PasswordResetForm, SetPasswordForm
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
-from django.db.models import Count, Q, Value
-from django.http import HttpResponse
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import redirect, get_object_or_404
 from django.template.loader import render_to_string
 from django.utils import timezone
@@ -47,7 +39,6 @@ from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.generics import ListAPIView
@@ -58,19 +49,57 @@ from .models import *
 from .permissions import (CanAccessContacts, CanAccessObjectByConta, CanViewSharedAgenda, CanAccessEspaco,
                           CanInteractWithAtendimento, CanManageAgendas, CanCreateGoogleEvent, CanManageReservas,
                           CanViewAgendaReports, CanViewAtendimentoReports, CanEditMunicipeDetails, CanManageCheckIn, CanManageLembretes,
-                          is_in_group)
+                          contexto_autorizacao, is_in_group)
 from .serializers import *
+from .busca import filtro_contato, filtro_cpf, filtro_nome_fonetico, normalizar_cpf, normalizar_telefone
+from .busca_backends import busca_aproximada, buscar, limite_resultados
+from . import cache_busca, cache_pdf, cache_permissoes, qualidade, relatorios, typeahead
+from .pagination import KeysetPagination
+from .campos_esparsos import campo_solicitado
+from .otimizacao_consultas import OtimizacaoConsultasMixin
+from .serializacao_compilada import SerializacaoCompiladaMixin
+from .requisicoes_condicionais import RequisicaoCondicionalMixin
+from .busca_global import busca_global
 
 
 # -----------------------------------------------------------------------------
 # Views de Atendimento
 # -----------------------------------------------------------------------------
 
-class AtendimentoListCreateView(generics.ListCreateAPIView):
+def contagem_relacionados(modelo, campo):
+    """Subconsulta com o número de linhas de `modelo` ligadas ao objeto da linha por `campo` (0 se nenhuma)."""
+    contagem = modelo.objects.filter(**{campo: OuterRef('pk')}).order_by().values(campo).annotate(total=Count('pk'))
+    return Coalesce(Subquery(contagem.values('total')), 0)
+
+
+class AtendimentoListCreateView(RequisicaoCondicionalMixin, SerializacaoCompiladaMixin, OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     serializer_class = AtendimentoSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordenacao_paginacao = ('-data_criacao', '-id')
+
+    def get_serializer_class(self):
+        # A listagem usa a representação enxuta; a criação devolve o atendimento completo
+        if self.request.method == 'GET':
+            return AtendimentoResumoSerializer
+        return AtendimentoSerializer
 
     def get_queryset(self):
+        queryset = self.get_queryset_visiveis()
+        if self.request.method != 'GET':
+            return queryset
+        queryset = queryset.select_related('conta', 'municipe', 'responsavel')
+        if campo_solicitado(self.request, 'total_tramitacoes'):
+            queryset = queryset.annotate(total_tramitacoes=contagem_relacionados(Tramitacao, 'atendimento'))
+        if campo_solicitado(self.request, 'total_anexos'):
+            queryset = queryset.annotate(total_anexos=contagem_relacionados(Anexo, 'atendimento'))
+        return queryset
+
+    def queryset_condicional(self):
+        # Sem as contagens anotadas: para o ETag bastam as linhas visíveis
+        return self.get_queryset_visiveis()
+
+    def get_queryset_visiveis(self):
         user = self.request.user
 
         # REGRA 1: Superusuário vê tudo.
@@ -81,14 +110,14 @@ class AtendimentoListCreateView(generics.ListCreateAPIView):
         # REGRA 2: Se for da Recepção, mostra TODOS os atendimentos das contas vinculadas.
         if is_in_group(user, 'Recepção'):
             if hasattr(user, 'perfil'):
-                return Atendimento.objects.filter(conta__in=user.perfil.contas.all()).order_by('-data_criacao')
+                return Atendimento.objects.filter(conta__in=contexto_autorizacao(user).contas_filtro).order_by('-data_criacao')
             else:
                 return Atendimento.objects.none() # Se não tem perfil, não vê nada.
         # --- FIM DA CORREÇÃO ---
 
         # REGRA 3: A regra para Membros e Secretárias continua a mesma
         if hasattr(user, 'perfil'):
-            atendimentos_da_conta = Atendimento.objects.filter(conta__in=user.perfil.contas.all())
+            atendimentos_da_conta = Atendimento.objects.filter(conta__in=contexto_autorizacao(user).contas_filtro)
             return atendimentos_da_conta.filter(
                 Q(responsavel=user) | Q(responsavel__isnull=True)
             ).order_by('-data_criacao')
@@ -100,13 +129,16 @@ class AtendimentoListCreateView(generics.ListCreateAPIView):
         serializer.save(created_by=self.request.user)
 
 
-class AtendimentoDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Atendimento.objects.all()
+class AtendimentoDetailView(RequisicaoCondicionalMixin, OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
+    # O detalhe mantém o payload completo, com os aninhados carregados em lote
+    queryset = Atendimento.objects.select_related('conta', 'municipe', 'responsavel__perfil').prefetch_related(
+        'categorias', 'tramitacoes__usuario', 'anexos__usuario', 'responsavel__groups', 'responsavel__perfil__contas'
+    )
     serializer_class = AtendimentoSerializer
     permission_classes = [permissions.IsAuthenticated, CanInteractWithAtendimento]
 
 
-class RegistroVisitaListCreateView(generics.ListCreateAPIView):
+class RegistroVisitaListCreateView(OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     serializer_class = RegistroVisitaSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageCheckIn]
 
@@ -119,7 +151,7 @@ class RegistroVisitaListCreateView(generics.ListCreateAPIView):
         # --- LÓGICA DE PERMISSÃO COM INDENTAÇÃO CORRIGIDA ---
         if not user.is_superuser:
             if hasattr(user, 'perfil'):
-                queryset = queryset.filter(conta_destino__in=user.perfil.contas.all())
+                queryset = queryset.filter(conta_destino__in=contexto_autorizacao(user).contas_filtro)
             else:
                 queryset = RegistroVisita.objects.none()
         # --- FIM DA CORREÇÃO ---
@@ -147,7 +179,7 @@ class RegistroVisitaListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(registrado_por=self.request.user)
 
-class RegistroVisitaDetailView(generics.RetrieveUpdateDestroyAPIView):
+class RegistroVisitaDetailView(OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     View para ver, atualizar e deletar um Registro de Visita específico.
     """
@@ -160,9 +192,11 @@ class RegistroVisitaDetailView(generics.RetrieveUpdateDestroyAPIView):
 # Views de Solicitação de Agenda
 # -----------------------------------------------------------------------------
 
-class SolicitacaoAgendaListCreateView(generics.ListCreateAPIView):
+class SolicitacaoAgendaListCreateView(RequisicaoCondicionalMixin, OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     serializer_class = SolicitacaoAgendaSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageAgendas]
+    pagination_class = KeysetPagination
+    ordenacao_paginacao = ('-data_criacao', '-id')
 
     def get_queryset(self):
         # A base da sua consulta continua a mesma
@@ -185,14 +219,14 @@ class SolicitacaoAgendaListCreateView(generics.ListCreateAPIView):
         user = self.request.user
         if not user.is_superuser:
             if hasattr(user, 'perfil'):
-                queryset = queryset.filter(conta__in=user.perfil.contas.all())
+                queryset = queryset.filter(conta__in=contexto_autorizacao(user).contas_filtro)
             else:
                 return SolicitacaoAgenda.objects.none()
 
         return queryset.order_by('-data_criacao')
 
 
-class SolicitacaoAgendaDetailView(generics.RetrieveUpdateDestroyAPIView):
+class SolicitacaoAgendaDetailView(OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = SolicitacaoAgenda.objects.all()
     serializer_class = SolicitacaoAgendaSerializer
     permission_classes = [IsAuthenticated, CanManageAgendas, CanAccessObjectByConta]
@@ -202,12 +236,26 @@ class SolicitacaoAgendaDetailView(generics.RetrieveUpdateDestroyAPIView):
 # Views de Usuários, Contas e Categorias
 # -----------------------------------------------------------------------------
 
-class UserListView(generics.ListAPIView):
+class UserListView(OtimizacaoConsultasMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
-    queryset = User.objects.filter(is_active=True).order_by('username')
+    # As permissões de cada usuário vêm do cache_permissoes (UserListSerializer)
+    queryset = User.objects.filter(is_active=True).select_related('perfil').prefetch_related(
+        'groups', 'perfil__contas'
+    ).order_by('username')
     serializer_class = UserSerializer
 
-class EspacoListCreateView(generics.ListCreateAPIView):
+class TabelaPermissoesView(APIView):
+    """
+    Tabela ordenada de permissões usada para decodificar o bitmap `permissoes`
+    do token JWT (o bit N corresponde à posição N da lista). A `versao` é a
+    mesma gravada no token em `permissoes_tabela`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response(cache_permissoes.tabela_permissoes())
+
+class EspacoListCreateView(OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     """
     View para listar e criar Espaços.
     """
@@ -222,7 +270,7 @@ class EspacoListCreateView(generics.ListCreateAPIView):
         
         if hasattr(user, 'perfil'):
             # Mostra apenas espaços vinculados às contas do usuário
-            return Espaco.objects.filter(ativo=True, contas__in=user.perfil.contas.all()).distinct().order_by('nome')
+            return Espaco.objects.filter(ativo=True, contas__in=contexto_autorizacao(user).contas_filtro).distinct().order_by('nome')
             
         return Espaco.objects.none()
 
@@ -234,7 +282,7 @@ class EspacoListCreateView(generics.ListCreateAPIView):
             if primeira_conta:
                 espaco.contas.add(primeira_conta)
 
-class EspacoDetailView(generics.RetrieveUpdateDestroyAPIView):
+class EspacoDetailView(OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     View para ver, editar e deletar um Espaço específico.
     """
@@ -242,18 +290,18 @@ class EspacoDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = EspacoSerializer
     permission_classes = [permissions.IsAuthenticated, CanAccessEspaco]
 
-class ContaListView(generics.ListAPIView):
+class ContaListView(OtimizacaoConsultasMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     queryset = Conta.objects.all().order_by('nome')
     serializer_class = ContaSerializer
 
 
-class CategoriaAtendimentoListView(generics.ListAPIView):
+class CategoriaAtendimentoListView(OtimizacaoConsultasMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     queryset = CategoriaAtendimento.objects.filter(ativa=True)
     serializer_class = CategoriaAtendimentoSerializer
 
-class CategoriaContatoListView(generics.ListAPIView):
+class CategoriaContatoListView(OtimizacaoConsultasMixin, generics.ListAPIView):
     queryset = CategoriaContato.objects.filter(ativa=True)
     serializer_class = CategoriaContatoSerializer
     permission_classes = [IsAuthenticated]
@@ -262,9 +310,68 @@ class CategoriaContatoListView(generics.ListAPIView):
 # Views de Munícipe
 # -----------------------------------------------------------------------------
 
-class MunicipeListCreateView(generics.ListCreateAPIView):
+class MunicipeListCreateView(RequisicaoCondicionalMixin, SerializacaoCompiladaMixin, OtimizacaoConsultasMixin, generics.ListCreateAPIView):
+    """
+    Filtros de qualidade do cadastro: `?qualidade=baixo,parcial` (níveis ou
+    pontuações 0-4) e `?desatualizado=true|false` (o `alerta_atualizacao`).
+    Sem `?q=`, a ordem padrão é a dos cadastros mais recentes (alfabética com
+    `?letra=` ou `?grupo=`); `?ordenar=nome|cadastro|-cadastro|qualidade|
+    -qualidade|atualizacao|-atualizacao` troca a ordem.
+
+    A resposta tem sempre o envelope da KeysetPagination. Na busca por termo
+    (`?q=`), os resultados vêm por relevância, limitados por `?limite=`, numa
+    página única (`next` e `previous` nulos).
+    """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = MunicipeSerializer
+    pagination_class = KeysetPagination
+
+    # ?ordenar= -> ordenação da paginação por chave (ver os índices de Municipe)
+    ORDENACOES = {
+        'nome': ('nome_completo', 'id'),
+        'cadastro': ('data_cadastro', 'id'),
+        '-cadastro': ('-data_cadastro', '-id'),
+        'qualidade': ('pontuacao_qualidade', 'nome_completo', 'id'),
+        '-qualidade': ('-pontuacao_qualidade', 'nome_completo', 'id'),
+        'atualizacao': ('data_atualizacao', 'id'),
+        '-atualizacao': ('-data_atualizacao', '-id'),
+    }
+
+    @property
+    def ordenacao_paginacao(self):
+        if self.request.query_params.get('tem_grupo_duplicado', None) == 'true':
+            return ('grupo_duplicado', 'nome_completo', 'id')
+        ordenar = self.request.query_params.get('ordenar')
+        if ordenar in self.ORDENACOES:
+            return self.ORDENACOES[ordenar]
+        if self.request.query_params.get('letra') or self.request.query_params.get('grupo'):
+            return self.ORDENACOES['nome']
+        return self.ORDENACOES['-cadastro']
+
+    def paginate_queryset(self, queryset):
+        # A busca por termo já vem ordenada por relevância e limitada por ?limite=
+        if self.request.query_params.get('q', None):
+            return None
+        return super().paginate_queryset(queryset)
+
+    def list(self, request, *args, **kwargs):
+        # Buscas por termo se repetem muito ao longo do dia (ex.: recepção);
+        # o resultado fica em cache até a próxima alteração de munícipes.
+        if request.query_params.get('q'):
+            listar = super().list
+            resultados = cache_busca.resultado_em_cache('municipes', request, lambda: listar(request, *args, **kwargs).data)
+            return Response({'next': None, 'previous': None, 'results': resultados})
+        return super().list(request, *args, **kwargs)
+
+    def queryset_condicional(self):
+        # A busca por termo já tem o cache de resultados (cache_busca)
+        if self.request.query_params.get('q'):
+            return None
+        return super().queryset_condicional()
+
+    def componentes_etag(self):
+        # `alerta_atualizacao` depende da data de hoje
+        return (timezone.localdate(),)
 
     def get_queryset(self):
         user = self.request.user
@@ -273,7 +380,8 @@ class MunicipeListCreateView(generics.ListCreateAPIView):
         grupo_id = self.request.query_params.get('grupo', None)
         tem_grupo_duplicado = self.request.query_params.get('tem_grupo_duplicado', None)
 
-        base_queryset = Municipe.objects.prefetch_related('contas', 'categoria')
+        # contas e categoria entram pelo plano do serializer (OtimizacaoConsultasMixin)
+        base_queryset = Municipe.objects.all()
 
         if grupo_id:
             return base_queryset.filter(grupo_duplicado=grupo_id).order_by('nome_completo')
@@ -282,72 +390,176 @@ class MunicipeListCreateView(generics.ListCreateAPIView):
             return base_queryset.exclude(grupo_duplicado__isnull=True).order_by('grupo_duplicado', 'nome_completo')
 
         if hasattr(user, 'perfil'):
-            contas_usuario = user.perfil.contas.all()
             # Mostra contatos que são públicos (sem conta) OU que pertencem a uma das contas do usuário.
-            base_queryset = base_queryset.filter(
-                Q(contas__isnull=True) | Q(contas__in=contas_usuario)
-            ).distinct()
+            # Vale também para superusuário com perfil: aqui ele vê só as suas contas.
+            base_queryset = base_queryset.visiveis_para_contas(contexto_autorizacao(user).contas_filtro)
             
             if is_in_group(user, 'Recepção'):
                 base_queryset = base_queryset.filter(categoria__nome='MUNÍCIPE')
         elif not user.is_superuser:
             return Municipe.objects.none()
 
+        base_queryset = self.filtrar_qualidade(base_queryset)
+
         if termo_busca:
             # --- INÍCIO DA LÓGICA DE BUSCA INTELIGENTE ---
             
-            # 1. Lógica para buscar por cada palavra no nome
-            query_palavras_nome = Q()
-            for palavra in termo_busca.split():
-                query_palavras_nome &= (Q(nome_completo__icontains=palavra) | Q(nome_de_guerra__icontains=palavra))
-
-            # 2. Lógica para buscar o termo completo em outros campos
+            # 1. Lógica para buscar o termo completo em outros campos
             query_outros_campos = (
-                Q(cpf__icontains=termo_busca) |
-                Q(emails__contains=[{'email': termo_busca}]) |
                 Q(cargo__icontains=termo_busca) |
                 Q(orgao__icontains=termo_busca) |
                 Q(categoria__nome__icontains=termo_busca)
             )
-
-            # 3. Combina as duas lógicas com "OU"
-            final_query = query_palavras_nome | query_outros_campos
-            
-            return base_queryset.filter(final_query).distinct().order_by('nome_completo')
+            # E-mail exato pela tabela de contatos normalizados (indexada)
+            query_email = filtro_contato('email', termo_busca)
+            if query_email is not None:
+                query_outros_campos |= query_email
+            # CPF exato ou por prefixo na coluna indexada cpf_digitos
+            query_cpf = filtro_cpf(termo_busca)
+            if query_cpf is not None:
+                query_outros_campos |= query_cpf
+            # fuzzy=1: grafias diferentes do mesmo nome (Luiz/Luis, Souza/Sousa) pela chave fonética
+            query_fonetica = filtro_nome_fonetico(termo_busca) if busca_aproximada(self.request) else None
+            if query_fonetica is not None:
+                query_outros_campos |= query_fonetica
+
+            # 2. O nome é resolvido no índice textual, combinado com "OU" e ordenado por relevância
+            #    (quem casa pela grafia exata vem antes de quem casa só pela pronúncia)
+            return buscar(
+                base_queryset.distinct(), termo_busca,
+                outros_campos=query_outros_campos, limite=limite_resultados(self.request)
+            )
             # --- FIM DA LÓGICA DE BUSCA INTELIGENTE ---
         
         if letra_inicial:
             return base_queryset.filter(nome_completo__istartswith=letra_inicial).order_by('nome_completo')
         
-        return base_queryset.order_by('-data_cadastro')[:100]
+        return base_queryset
+
+    def filtrar_qualidade(self, queryset):
+        niveis = self.request.query_params.get('qualidade')
+        pontuacoes = qualidade.pontuacoes_dos_niveis(niveis) if niveis else None
+        if pontuacoes is not None:
+            queryset = queryset.com_qualidade(pontuacoes)
+        desatualizado = self.request.query_params.get('desatualizado')
+        if desatualizado == 'true':
+            queryset = queryset.desatualizados()
+        elif desatualizado == 'false':
+            queryset = queryset.exclude(qualidade.filtro_desatualizados())
+        return queryset
 
-class MunicipeDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MunicipeDetailView(RequisicaoCondicionalMixin, OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated, CanEditMunicipeDetails]
     queryset = Municipe.objects.all()
     serializer_class = MunicipeSerializer
 
+    def componentes_etag(self):
+        # `alerta_atualizacao` depende da data de hoje
+        return (timezone.localdate(),)
 
-class MunicipeDetailDataView(generics.RetrieveAPIView):
+
+class MunicipeDetailDataView(OtimizacaoConsultasMixin, generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated, CanAccessContacts]
     serializer_class = MunicipeDetailSerializer
     queryset = Municipe.objects.all()
 
 
-class MunicipeLookupView(generics.ListAPIView):
+class MunicipeAtividadesView(OtimizacaoConsultasMixin, generics.ListAPIView):
+    """
+    Linha do tempo do munícipe: atendimentos, tramitações, visitas, agendas,
+    presenças em eventos e comunicações, da mais recente para a mais antiga,
+    lidas da tabela AtividadeMunicipe (paginação por chave). `?tipo=` filtra
+    por um ou mais tipos separados por vírgula.
+    """
+    permission_classes = [permissions.IsAuthenticated, CanAccessContacts]
+    serializer_class = AtividadeMunicipeSerializer
+    pagination_class = KeysetPagination
+    ordenacao_paginacao = ('-data', '-id')
+
+    def get_queryset(self):
+        municipe = get_object_or_404(Municipe.objects.visiveis_para(self.request.user), pk=self.kwargs['pk'])
+        queryset = AtividadeMunicipe.objects.filter(municipe_id=municipe.pk)
+        tipos = self.request.query_params.get('tipo')
+        if tipos:
+            queryset = queryset.filter(tipo__in=[tipo.strip() for tipo in tipos.split(',') if tipo.strip()])
+        return queryset
+
+
+class QualidadeMunicipesView(APIView):
+    """
+    Distribuição da qualidade do cadastro por conta: quantos munícipes em cada
+    pontuação (0-4) e nível, e quantos com alerta de atualização. Superusuário
+    vê todas as contas; os demais, as suas e os públicos (conta `null`).
+    `?conta=` limita a uma conta.
+    """
+    permission_classes = [permissions.IsAuthenticated, CanAccessContacts]
+
+    def get(self, request, *args, **kwargs):
+        contexto = contexto_autorizacao(request.user)
+        # Mesma visibilidade de Municipe.objects.visiveis_para
+        contas = None if contexto.is_superuser else set(contexto.contas_ids)
+        incluir_publicos = contexto.is_superuser or contexto.tem_perfil
+        conta_id = request.query_params.get('conta')
+        if conta_id:
+            try:
+                conta_id = int(conta_id)
+            except ValueError:
+                return Response({'error': 'Parâmetro "conta" inválido.'}, status=status.HTTP_400_BAD_REQUEST)
+            if contas is not None and conta_id not in contas:
+                return Response({'error': 'Conta não encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+            contas, incluir_publicos = {conta_id}, False
+
+        distribuicao = qualidade.histograma(contas, incluir_publicos=incluir_publicos)
+        nomes = dict(Conta.objects.filter(id__in=distribuicao).values_list('id', 'nome'))
+        resultado = []
+        for conta, dados in distribuicao.items():
+            publico = conta == MunicipeVisibilidade.CONTA_PUBLICO
+            if not publico and conta not in nomes:
+                continue
+            resultado.append({
+                'conta': None if publico else conta,
+                'nome_conta': 'Públicos (sem conta)' if publico else nomes[conta],
+                'total': dados['total'],
+                'desatualizados': dados['desatualizados'],
+                'pontuacoes': {str(pontuacao): total for pontuacao, total in dados['pontuacoes'].items()},
+                'niveis': {
+                    nivel: sum(dados['pontuacoes'][pontuacao] for pontuacao in pontuacoes)
+                    for nivel, pontuacoes in qualidade.NIVEIS.items()
+                },
+            })
+        resultado.sort(key=lambda item: (item['conta'] is not None, item['nome_conta']))
+        return Response({'dias_alerta_atualizacao': qualidade.DIAS_ALERTA_ATUALIZACAO, 'contas': resultado})
+
+
+class MunicipeLookupView(OtimizacaoConsultasMixin, generics.ListAPIView):
     serializer_class = MunicipeLookupSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        # Com termo de busca, responde pelo cache de resultados ou pelo índice de
+        # prefixos em memória/Redis; o banco fica como fallback caso o índice não
+        # esteja disponível.
+        termo_busca = request.query_params.get('q', None)
+        if not termo_busca:
+            return super().list(request, *args, **kwargs)
+        return Response(cache_busca.resultado_em_cache('municipes_lookup', request, lambda: self._buscar(request, termo_busca)))
+
+    def _buscar(self, request, termo_busca):
+        # A busca fonética (fuzzy=1) não está no índice de prefixos; vai direto ao banco.
+        if not busca_aproximada(request):
+            resultados = typeahead.buscar(request, termo_busca, limite_resultados(request))
+            if resultados is not None:
+                return resultados
+        return self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data
+
     def get_queryset(self):
         user = self.request.user
-        queryset = Municipe.objects.all()
+        queryset = Municipe.objects.select_related('categoria').prefetch_related('contas')
 
         if not user.is_superuser:
             if hasattr(user, 'perfil'):
-                contas_usuario = user.perfil.contas.all()
                 # Mostra contatos que são públicos (sem conta) OU que pertencem a uma das contas do usuário.
-                queryset = queryset.filter(
-                    Q(contas__isnull=True) | Q(contas__in=contas_usuario)
-                ).distinct()
+                queryset = queryset.visiveis_para(user)
             else:
                 return Municipe.objects.none()
 
@@ -359,18 +571,51 @@ class MunicipeLookupView(generics.ListAPIView):
         if termo_busca.isdigit():
             return queryset.filter(id=termo_busca)
 
-        palavras = termo_busca.split()
-        
-        query_parts = [
-            Q(nome_completo__icontains=palavra) | Q(nome_de_guerra__icontains=palavra)
-            for palavra in palavras
-        ]
-        
-        final_query = reduce(operator.and_, query_parts)
-        
-        resultados = queryset.filter(final_query)
-            
-        return resultados.order_by('nome_completo')[:100]
+        # Todas as palavras precisam casar (sem acentos, por prefixo); os mais relevantes primeiro.
+        # Com fuzzy=1 entram também os nomes com a mesma pronúncia.
+        outros_campos = filtro_nome_fonetico(termo_busca) if busca_aproximada(self.request) else None
+        return buscar(queryset, termo_busca, outros_campos=outros_campos, limite=limite_resultados(self.request))
+
+class CacheBuscaMunicipesView(APIView):
+    """
+    Contadores de acerto/falha do cache de buscas de munícipes (GET) e
+    zeragem dos contadores (DELETE). Apenas para superusuários.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return Response({'error': 'Apenas administradores podem ver as estatísticas do cache.'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(cache_busca.estatisticas())
+
+    def delete(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return Response({'error': 'Apenas administradores podem zerar as estatísticas do cache.'}, status=status.HTTP_403_FORBIDDEN)
+        cache_busca.zerar_estatisticas()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class CachePdfView(APIView):
+    """
+    Contadores de acerto/falha e ocupação do cache de PDFs de documentos (GET) e
+    zeragem dos contadores (DELETE; `?arquivos=true` também apaga os PDFs).
+    Apenas para superusuários.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return Response({'error': 'Apenas administradores podem ver as estatísticas do cache.'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(cache_pdf.estatisticas())
+
+    def delete(self, request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return Response({'error': 'Apenas administradores podem zerar as estatísticas do cache.'}, status=status.HTTP_403_FORBIDDEN)
+        cache_pdf.zerar_estatisticas()
+        if request.query_params.get('arquivos', '').lower() == 'true':
+            cache_pdf.limpar()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+MODELOS_DE_INDICE_MUNICIPE = (MunicipeToken, MunicipeContato, MunicipeVisibilidade)
 
 class MesclarDuplicatasView(APIView):
     permission_classes = [permissions.IsAuthenticated, CanEditMunicipeDetails]
@@ -415,6 +660,10 @@ class MesclarDuplicatasView(APIView):
                     if rel.many_to_many and rel.field.model == Municipe:
                         continue
 
+                    # Tabelas de índice são reconstruídas pelo save() e pelo contas.add() do principal e apagadas junto com o duplicado.
+                    if rel.related_model in MODELOS_DE_INDICE_MUNICIPE:
+                        continue
+
                     try:
                         accessor_name = rel.get_accessor_name()
                         if not hasattr(municipe_duplicado, accessor_name):
@@ -469,7 +718,7 @@ class MesclarDuplicatasView(APIView):
 # Views de Tramitação e Anexos
 # -----------------------------------------------------------------------------
 
-class TramitacaoListCreateView(generics.ListCreateAPIView):
+class TramitacaoListCreateView(OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = TramitacaoSerializer
 
@@ -531,13 +780,13 @@ class TramitacaoListCreateView(generics.ListCreateAPIView):
                 print(f"ERRO ao enviar e-mail de andamento: {e}")
 
 
-class TramitacaoDetailView(generics.RetrieveUpdateDestroyAPIView):
+class TramitacaoDetailView(OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Tramitacao.objects.all()
     serializer_class = TramitacaoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
 
-class AnexoListCreateView(generics.ListCreateAPIView):
+class AnexoListCreateView(OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = AnexoSerializer
     parser_classes = [MultiPartParser, FormParser]
@@ -556,25 +805,6 @@ class AnexoListCreateView(generics.ListCreateAPIView):
 # Views de Autenticação e Senha
 # -----------------------------------------------------------------------------
 
-class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
-    @classmethod
-    def get_token(cls, user):
-        token = super().get_token(user)
-
-        # Adiciona dados customizados ao token
-        token['username'] = user.username
-        token['is_superuser'] = user.is_superuser
-        token['groups'] = list(user.groups.values_list('name', flat=True))
-        token['user_permissions'] = list(user.get_all_permissions())
-
-        if hasattr(user, 'perfil'):
-            token['perfil'] = {
-                "id": user.perfil.id,
-                "contas": list(user.perfil.contas.all().values_list('id', flat=True))
-            }
-        
-        return token
-
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
@@ -651,7 +881,7 @@ class RelatorioAtendimentosPorStatusView(APIView):
         # Lógica de permissão UNIFICADA
         if not user.is_superuser:
             if hasattr(user, 'perfil'):
-                queryset = queryset.filter(conta__in=user.perfil.contas.all())
+                queryset = queryset.filter(conta__in=contexto_autorizacao(user).contas_filtro)
             else:
                 queryset = Atendimento.objects.none()
 
@@ -677,7 +907,7 @@ class RelatorioAtendimentosPorContaView(APIView):
         # Lógica de permissão UNIFICADA
         if not user.is_superuser:
             if hasattr(user, 'perfil'):
-                queryset = queryset.filter(conta__in=user.perfil.contas.all())
+                queryset = queryset.filter(conta__in=contexto_autorizacao(user).contas_filtro)
             else:
                 queryset = Atendimento.objects.none()
 
@@ -703,7 +933,7 @@ class RelatorioAtendimentosPorCategoriaView(APIView):
         # Lógica de permissão UNIFICADA
         if not user.is_superuser:
             if hasattr(user, 'perfil'):
-                queryset = queryset.filter(conta__in=user.perfil.contas.all())
+                queryset = queryset.filter(conta__in=contexto_autorizacao(user).contas_filtro)
             else:
                 queryset = Atendimento.objects.none()
 
@@ -741,7 +971,7 @@ class DashboardSummaryView(APIView):
             ).count()
 
         if hasattr(user, 'perfil') and (is_in_group(user, 'Membro do Gabinete') or is_in_group(user, 'Secretária')):
-            atendimentos_do_usuario = Atendimento.objects.filter(conta__in=user.perfil.contas.all())
+            atendimentos_do_usuario = Atendimento.objects.filter(conta__in=contexto_autorizacao(user).contas_filtro)
 
             data['novos_atendimentos'] = atendimentos_do_usuario.filter(responsavel=user, status='ABERTO').count()
             data['atendimentos_em_aberto'] = atendimentos_do_usuario.filter(status='ABERTO').count()
@@ -751,7 +981,7 @@ class DashboardSummaryView(APIView):
             ).count()
 
         if hasattr(user, 'perfil') and is_in_group(user, 'Secretária'):
-            agendas_da_secretaria = SolicitacaoAgenda.objects.filter(conta__in=user.perfil.contas.all())
+            agendas_da_secretaria = SolicitacaoAgenda.objects.filter(conta__in=contexto_autorizacao(user).contas_filtro)
             data['agendas_em_aberto'] = agendas_da_secretaria.filter(status='SOLICITADO').count()
             data['agendas_em_analise'] = agendas_da_secretaria.filter(status='EM_ANALISE').count()
 
@@ -766,63 +996,8 @@ class GerarPdfAtendimentosView(APIView):
     permission_classes = [permissions.IsAuthenticated, CanViewAtendimentoReports]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        queryset = Atendimento.objects.all()
-
-        if not (user.is_superuser or is_in_group(user, 'Recepção')):
-            if hasattr(user, 'perfil'):
-                queryset = queryset.filter(conta__in=user.perfil.contas.all())
-                queryset = queryset.filter(Q(responsavel=user) | Q(responsavel__isnull=True))
-            else:
-                queryset = Atendimento.objects.none()
-
-        status = request.query_params.get('status', None)
-        conta_id = request.query_params.get('conta_id', None)
-        data_inicio = request.query_params.get('data_inicio', None)
-        data_fim = request.query_params.get('data_fim', None)
-
-        if status:
-            queryset = queryset.filter(status=status)
-        if conta_id:
-            queryset = queryset.filter(conta_id=conta_id)
-        if data_inicio:
-            queryset = queryset.filter(data_criacao__date__gte=data_inicio)
-        if data_fim:
-            queryset = queryset.filter(data_criacao__date__lte=data_fim)
-
-        conta_id = request.query_params.get('conta_id', None)
-        conta_contexto = None
-        
-        if conta_id:
-            conta_contexto = Conta.objects.filter(id=conta_id).first()
-        elif not request.user.is_superuser and hasattr(request.user, 'perfil'):
-            conta_contexto = request.user.perfil.contas.first()
-        
-        # Prepara as informações de personalização
-        nome_instituicao = "Prefeitura Municipal" # Valor padrão
-        brasao_url = ''
-        logo_conta_url = ''
-
-        if conta_contexto:
-            nome_instituicao = conta_contexto.nome_instituicao or nome_instituicao
-            if conta_contexto.brasao_instituicao:
-                brasao_url = request.build_absolute_uri(conta_contexto.brasao_instituicao.url)
-            if conta_contexto.logo_conta:
-                logo_conta_url = request.build_absolute_uri(conta_contexto.logo_conta.url)
-
-        context = {
-            'atendimentos': queryset.select_related('municipe', 'conta', 'responsavel').prefetch_related('categorias'),
-            'nome_instituicao': nome_instituicao,
-            'brasao_url': brasao_url,
-            'logo_conta_url': logo_conta_url,
-            'logo_siga_url': request.build_absolute_uri('/static/images/logo-siga-gab.png'),
-        }
-        html_string = render_to_string('atendimentos/relatorio_atendimentos.html', context)
-        pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="relatorio_atendimentos.pdf"'
-        return response
+        # Acima do limite de linhas, o PDF é gerado pelo Celery (atendimentos/relatorios.py)
+        return relatorios.responder(request, relatorios.RelatorioAtendimentos)
 
 
 class GerarPdfAtendimentoDetailView(APIView):
@@ -861,11 +1036,9 @@ class GerarPdfAtendimentoDetailView(APIView):
                 'logo_siga_url': request.build_absolute_uri('/static/images/logo-siga-gab.png'),
             }
             html_string = render_to_string('atendimentos/relatorio_atendimento_detalhe.html', context)
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="atendimento_{atendimento.protocolo}.pdf"'
-            return response
+            return cache_pdf.responder_pdf(
+                html_string, request.build_absolute_uri(), f'atendimento_{atendimento.protocolo}.pdf'
+            )
         except Exception as e:
             print(f"ERRO INESPERADO AO GERAR PDF: {e}")
             return Response({'detail': f'Ocorreu um erro interno ao gerar o PDF: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -875,66 +1048,8 @@ class GerarPdfAgendasReportView(APIView):
     permission_classes = [IsAuthenticated, CanViewAgendaReports]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        queryset = SolicitacaoAgenda.objects.select_related('solicitante', 'conta').order_by('data_criacao')
-
-        if not user.is_superuser:
-            if hasattr(user, 'perfil'):
-                # Mostra apenas solicitações das contas vinculadas ao usuário
-                queryset = queryset.filter(conta__in=user.perfil.contas.all())
-            else:
-                # Se não for superusuário e não tiver perfil, não vê nada.
-                queryset = SolicitacaoAgenda.objects.none()
-
-        data_inicio = request.query_params.get('data_inicio')
-        data_fim = request.query_params.get('data_fim')
-        conta_id = request.query_params.get('conta_id')
-        status_param = request.query_params.get('status')
-
-        if data_inicio and data_fim:
-            queryset = queryset.filter(data_criacao__range=[data_inicio, data_fim])
-        if conta_id:
-            queryset = queryset.filter(conta_id=conta_id)
-        if status_param:
-            queryset = queryset.filter(status=status_param)
-
-        conta_id = request.query_params.get('conta_id', None)
-        conta_contexto = None
-        
-        if conta_id:
-            conta_contexto = Conta.objects.filter(id=conta_id).first()
-        elif not request.user.is_superuser and hasattr(request.user, 'perfil'):
-            conta_contexto = request.user.perfil.contas.first()
-        
-        # Prepara as informações de personalização
-        nome_instituicao = "Prefeitura Municipal" # Valor padrão
-        brasao_url = ''
-        logo_conta_url = ''
-
-        if conta_contexto:
-            nome_instituicao = conta_contexto.nome_instituicao or nome_instituicao
-            if conta_contexto.brasao_instituicao:
-                brasao_url = request.build_absolute_uri(conta_contexto.brasao_instituicao.url)
-            if conta_contexto.logo_conta:
-                logo_conta_url = request.build_absolute_uri(conta_contexto.logo_conta.url)
-
-        context = {
-            'solicitacoes': queryset,
-            'data_emissao': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-            'usuario_emissao': request.user.get_full_name() or request.user.username,
-            'nome_instituicao': nome_instituicao,
-            'brasao_url': brasao_url,
-            'logo_conta_url': logo_conta_url,
-            'logo_siga_url': request.build_absolute_uri('/static/images/logo-siga-gab.png'),
-        }
-
         try:
-            html_string = render_to_string('agendas/relatorio_agendas.html', context)
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-            
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="relatorio_agendas_{datetime.now().strftime("%Y%m%d")}.pdf"'
-            return response
+            return relatorios.responder(request, relatorios.RelatorioAgendas)
         except Exception as e:
             print(f"ERRO INESPERADO AO GERAR PDF DE AGENDAS: {e}")
             return Response(
@@ -952,27 +1067,26 @@ class ExportMunicipesExcelView(APIView):
 
         if is_in_group(user, 'Membro do Gabinete') or is_in_group(user, 'Secretária'):
             if hasattr(user, 'perfil'):
-                contas_usuario = user.perfil.contas.all()
-                queryset = queryset.filter(
-                    Q(contas__isnull=True) | Q(contas__in=contas_usuario)
-                ).distinct()
+                queryset = queryset.visiveis_para_contas(contexto_autorizacao(user).contas_filtro)
             else:
-                queryset = queryset.filter(contas__isnull=True)
+                queryset = queryset.visiveis_para_contas([])
 
         termo_busca = self.request.query_params.get('q', None)
         if termo_busca:
-            palavras = termo_busca.split()
-            query_palavras_nome = reduce(operator.and_, [
-                (Q(nome_completo__icontains=p) | Q(nome_de_guerra__icontains=p)) for p in palavras
-            ])
             query_outros_campos = (
-                Q(cpf__icontains=termo_busca) |
-                Q(emails__contains=[{'email': termo_busca}]) |
                 Q(cargo__icontains=termo_busca) |
                 Q(orgao__icontains=termo_busca) |
                 Q(categoria__nome__icontains=termo_busca)
             )
-            queryset = queryset.filter(query_palavras_nome | query_outros_campos).distinct()
+            # E-mail exato pela tabela de contatos normalizados (indexada)
+            query_email = filtro_contato('email', termo_busca)
+            if query_email is not None:
+                query_outros_campos |= query_email
+            # CPF exato ou por prefixo na coluna indexada cpf_digitos
+            query_cpf = filtro_cpf(termo_busca)
+            if query_cpf is not None:
+                query_outros_campos |= query_cpf
+            queryset = buscar(queryset.distinct(), termo_busca, outros_campos=query_outros_campos)
 
         workbook = openpyxl.Workbook()
         sheet = workbook.active
@@ -1018,119 +1132,8 @@ class GerarPdfGoogleAgendaView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        # Envolva TODO o código da função em um bloco try...except
         try:
-            # --------------------------------------------------------------------
-            # A PARTIR DAQUI, TODO O SEU CÓDIGO ORIGINAL DA FUNÇÃO get VEM AQUI,
-            # COM UMA INDENTAÇÃO ADICIONAL.
-            # --------------------------------------------------------------------
-            
-            user = request.user
-            
-            # --- ETAPA 1: BUSCAR CREDENCIAIS ---
-            try:
-                token_google = GoogleApiToken.objects.get(usuario=user)
-            except GoogleApiToken.DoesNotExist:
-                return Response({'detail': 'Autorização do Google não encontrada.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            credentials = Credentials(
-                token=token_google.access_token,
-                refresh_token=token_google.refresh_token,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=settings.GOOGLE_CLIENT_ID,
-                client_secret=settings.GOOGLE_CLIENT_SECRET
-            )
-            if credentials.expired and credentials.refresh_token:
-                credentials.refresh(Request())
-                token_google.access_token = credentials.token
-                token_google.save()
-
-            # --- ETAPA 2: BUSCAR EVENTOS ---
-            service = build('calendar', 'v3', credentials=credentials)
-            
-            start_date_str = request.query_params.get('data_inicio')
-            end_date_str = request.query_params.get('data_fim')
-            
-            start_date = parse_datetime(start_date_str)
-            end_date = parse_datetime(end_date_str) + timedelta(days=1, seconds=-1)
-            
-            events_result = service.events().list(
-                calendarId='primary', 
-                timeMin=start_date.isoformat() + "Z", # Adicione "Z" para UTC
-                timeMax=end_date.isoformat() + "Z",   # Adicione "Z" para UTC
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
-            
-            # --- ETAPA 3: RENDERIZAR O PDF ---
-            eventos_por_dia = defaultdict(list)
-            for event in events:
-                if 'dateTime' not in event['start']:
-                    continue
-                start_str = event['start'].get('dateTime')
-                start_obj = parse_datetime(start_str)
-                dia = start_obj.date()
-                if 'dateTime' in event['start']: event['start']['dateTime'] = start_obj
-                if 'date' in event['start']: event['start']['date'] = start_obj.date()
-                eventos_por_dia[dia].append(event)
-            
-            meses_do_relatorio = []
-            data_corrente = parse_datetime(start_date_str).date()
-            data_final_loop = parse_datetime(end_date_str).date()
-
-            while data_corrente <= data_final_loop:
-                mes_ano_atual = (data_corrente.year, data_corrente.month)
-                cal = calendar.Calendar()
-                semanas_do_mes = cal.monthdatescalendar(data_corrente.year, data_corrente.month)
-                semanas_com_eventos = []
-                for semana in semanas_do_mes:
-                    dias_da_semana_com_eventos = []
-                    for dia in semana:
-                        dias_da_semana_com_eventos.append({
-                            'data': dia,
-                            'eventos': eventos_por_dia.get(dia, [])
-                        })
-                    semanas_com_eventos.append(dias_da_semana_com_eventos)
-                
-                nomes_dos_meses = [
-                    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-                    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
-                ]
-                # Pega o nome do mês em português usando o número do mês como índice
-                nome_mes_pt = nomes_dos_meses[data_corrente.month - 1]
-
-                meses_do_relatorio.append({
-                    'nome_mes': f"{nome_mes_pt} de {data_corrente.year}", # Usa o nome traduzido
-                    'mes_numero': data_corrente.month,
-                    'semanas': semanas_com_eventos
-                })
-                
-                proximo_mes = (data_corrente.replace(day=28) + timedelta(days=4)).replace(day=1)
-                if (proximo_mes.year, proximo_mes.month) == mes_ano_atual: break
-                data_corrente = proximo_mes
-
-            logo_path = os.path.join(settings.BASE_DIR, 'static', 'images', 'logo-brasao-prefeitura.png')
-            logo_data = ""
-            try:
-                with open(logo_path, "rb") as image_file:
-                    logo_data = base64.b64encode(image_file.read()).decode('utf-8')
-            except FileNotFoundError:
-                print(f"ARQUIVO DE LOGO NÃO ENCONTRADO EM: {logo_path}")
-
-            context = { 
-                'hoje': timezone.now().date(),
-                'meses_do_relatorio': meses_do_relatorio, 
-                'logo_gestao_url': f"data:image/png;base64,{logo_data}", 
-            }
-            html_string = render_to_string('agendas/relatorio_google_agenda.html', context)
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-            
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="relatorio_google_agenda.pdf"'
-            return response
-
+            return relatorios.responder(request, relatorios.RelatorioGoogleAgenda)
         except Exception as e:
             # Se QUALQUER erro acontecer no bloco 'try', este código será executado.
             tb_string = traceback.format_exc()
@@ -1146,70 +1149,46 @@ class GerarPdfCheckinsView(APIView):
     permission_classes = [permissions.IsAuthenticated, CanManageCheckIn]
 
     def get(self, request, *args, **kwargs):
-        # Começa com todos os registros, otimizando com select_related
-        queryset = RegistroVisita.objects.select_related(
-            'municipe', 'conta_destino', 'registrado_por'
-        ).all()
+        return relatorios.responder(request, relatorios.RelatorioCheckins)
 
-        # Pega os filtros de data da URL
-        data_inicio_str = self.request.query_params.get('data_inicio', None)
-        data_fim_str = self.request.query_params.get('data_fim', None)
 
-        # Aplica o filtro de data, se fornecido
-        if data_inicio_str and data_fim_str:
-            try:
-                inicio_date = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
-                fim_date = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
-                inicio_datetime = timezone.make_aware(datetime.combine(inicio_date, time.min))
-                fim_datetime = timezone.make_aware(datetime.combine(fim_date, time.max))
-                queryset = queryset.filter(data_checkin__range=(inicio_datetime, fim_datetime))
-            except (ValueError, TypeError):
-                # Se as datas forem inválidas, retorna uma lista vazia
-                queryset = RegistroVisita.objects.none()
+class RelatorioJobListView(OtimizacaoConsultasMixin, generics.ListAPIView):
+    """Relatórios em PDF gerados em segundo plano pelo usuário e ainda disponíveis."""
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = RelatorioJobSerializer
 
-        conta_id = request.query_params.get('conta_id', None)
-        conta_contexto = None
-        
-        if conta_id:
-            conta_contexto = Conta.objects.filter(id=conta_id).first()
-        elif not request.user.is_superuser and hasattr(request.user, 'perfil'):
-            conta_contexto = request.user.perfil.contas.first()
-        
-        # Prepara as informações de personalização
-        nome_instituicao = "Prefeitura Municipal" # Valor padrão
-        brasao_url = ''
-        logo_conta_url = ''
-
-        if conta_contexto:
-            nome_instituicao = conta_contexto.nome_instituicao or nome_instituicao
-            if conta_contexto.brasao_instituicao:
-                brasao_url = request.build_absolute_uri(conta_contexto.brasao_instituicao.url)
-            if conta_contexto.logo_conta:
-                logo_conta_url = request.build_absolute_uri(conta_contexto.logo_conta.url)
-
-        # Prepara o contexto para o template
-        context = {
-            'visitas': queryset,
-            'nome_instituicao': nome_instituicao,
-            'brasao_url': brasao_url,
-            'logo_conta_url': logo_conta_url,
-            'logo_siga_url': request.build_absolute_uri('/static/images/logo-siga-gab.png'),
-        }
+    def get_queryset(self):
+        return RelatorioJob.objects.filter(usuario=self.request.user, expira_em__gt=timezone.now())
 
-        # Renderiza o HTML e converte para PDF
-        html_string = render_to_string('relatorios/relatorio_checkins.html', context)
-        pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
 
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="relatorio_checkins_{datetime.now().strftime("%Y%m%d")}.pdf"'
-        return response
+class RelatorioJobDetailView(generics.RetrieveDestroyAPIView):
+    """Status e progresso de um relatório em segundo plano; DELETE descarta o job e o arquivo."""
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = RelatorioJobSerializer
+
+    def get_queryset(self):
+        return RelatorioJob.objects.filter(usuario=self.request.user)
+
+
+class RelatorioJobDownloadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(RelatorioJob, pk=pk, usuario=request.user)
+        if job.status == RelatorioJob.ERRO:
+            return Response({'error': f'Erro ao gerar o relatório: {job.erro}'}, status=status.HTTP_409_CONFLICT)
+        if job.status != RelatorioJob.CONCLUIDO:
+            return Response({'error': 'O relatório ainda está sendo gerado.'}, status=status.HTTP_409_CONFLICT)
+        if job.expira_em <= timezone.now() or not job.arquivo:
+            return Response({'error': 'O relatório expirou. Gere-o novamente.'}, status=status.HTTP_410_GONE)
+        return FileResponse(job.arquivo.open('rb'), as_attachment=True, filename=job.nome_arquivo, content_type='application/pdf')
 
 
 # -----------------------------------------------------------------------------
 # Views de Notificação e Busca
 # -----------------------------------------------------------------------------
 
-class NotificacaoListView(generics.ListAPIView):
+class NotificacaoListView(OtimizacaoConsultasMixin, generics.ListAPIView):
     serializer_class = NotificacaoSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -1230,7 +1209,7 @@ class MarcarNotificacaoComoLidaView(APIView):
             return Response(status=status.HTTP_404_NOT_FOUND)
 
 
-class AniversariantesDoDiaView(generics.ListAPIView):
+class AniversariantesDoDiaView(OtimizacaoConsultasMixin, generics.ListAPIView):
     serializer_class = MunicipeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -1244,7 +1223,7 @@ class AniversariantesDoDiaView(generics.ListAPIView):
             base_queryset = Municipe.objects.all()
         elif hasattr(user, 'perfil'):
             # Filtra apenas os contatos das contas vinculadas ao usuário
-            base_queryset = Municipe.objects.filter(contas__in=user.perfil.contas.all()).distinct()
+            base_queryset = Municipe.objects.visiveis_para_contas(contexto_autorizacao(user).contas_filtro, incluir_publicos=False)
         else:
             # Se não for superusuário e não tiver perfil, não vê nenhum contato
             return Municipe.objects.none()
@@ -1259,6 +1238,12 @@ class AniversariantesDoDiaView(generics.ListAPIView):
 
 
 class BuscaGlobalView(APIView):
+    """
+    Busca em Atendimentos, Munícipes, Ofícios, Eventos e Lembretes em paralelo
+    (ver atendimentos/busca_global.py). O corpo continua sendo a lista de
+    resultados, agora num ranking único; os tempos de cada fonte vão no
+    cabeçalho Server-Timing e, com ?meta=1, também no corpo.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
@@ -1266,80 +1251,24 @@ class BuscaGlobalView(APIView):
         if not termo_busca or len(termo_busca) < 3:
             return Response([])
 
-        user = self.request.user
-        resultados = []
+        resultados, meta = busca_global(request, termo_busca)
+        dados = BuscaGlobalSerializer(resultados, many=True).data
 
-        # Busca de Atendimentos (sem alteração)
-        if not is_in_group(user, 'Recepção'):
-            atendimento_qs = Atendimento.objects.all()
-            if not user.is_superuser:
-                if hasattr(user, 'perfil'):
-                    atendimento_qs = atendimento_qs.filter(conta__in=user.perfil.contas.all())
-                    atendimento_qs = atendimento_qs.filter(Q(responsavel=user) | Q(responsavel__isnull=True))
-                else:
-                    atendimento_qs = Atendimento.objects.none()
-            
-            atendimentos_encontrados = atendimento_qs.filter(
-                Q(titulo__icontains=termo_busca) | Q(protocolo__icontains=termo_busca)
-            )[:5]
-
-            for atendimento in atendimentos_encontrados:
-                resultados.append({
-                    'tipo': 'atendimento', 'id': atendimento.id,
-                    'texto_principal': f"Protocolo {atendimento.protocolo}",
-                    'texto_secundario': atendimento.titulo,
-                    'url': f"/atendimentos/{atendimento.id}"
-                })
-
-        # Lógica de permissão para Munícipes (sem alteração)
-        if user.is_superuser:
-            municipe_qs = Municipe.objects.all()
-        # REGRA NOVA: Recepção busca APENAS contatos da categoria 'Munícipe'.
-        elif hasattr(user, 'perfil'):
-            contas_usuario = user.perfil.contas.all()
-            municipe_qs = Municipe.objects.filter(contas__in=contas_usuario).distinct()
-            
-            # Se for da Recepção, aplica o filtro adicional de categoria
-            if is_in_group(user, 'Recepção'):
-                municipe_qs = municipe_qs.filter(categoria__nome='MUNÍCIPE')
-        elif hasattr(user, 'perfil'):
-            contas_usuario = user.perfil.contas.all()
-            municipe_qs = Municipe.objects.filter(
-                Q(contas__isnull=True) | Q(contas__in=contas_usuario)
-            ).distinct()
+        if request.query_params.get('meta') in ('1', 'true'):
+            response = Response({'resultados': dados, 'meta': meta})
         else:
-            municipe_qs = Municipe.objects.none()
-
-        # --- AQUI ESTÁ A CORREÇÃO DA BUSCA POR MUNÍCIPES ---
-        query_palavras = Q()
-        for palavra in termo_busca.split():
-            # Agora, cada palavra é buscada no nome completo OU no nome de guerra
-            query_palavras &= (Q(nome_completo__icontains=palavra) | Q(nome_de_guerra__icontains=palavra))
-        
-        # A busca por CPF continua separada
-        query_cpf = Q(cpf__icontains=termo_busca)
-        
-        # A consulta final une as duas buscas com um "OU"
-        municipes_encontrados = municipe_qs.filter(query_palavras | query_cpf).distinct()[:100]
-        # --- FIM DA CORREÇÃO ---
-
-        for municipe in municipes_encontrados:
-            resultados.append({
-                'tipo': 'municipe', 'id': municipe.id,
-                'texto_principal': municipe.nome_completo,
-                'texto_secundario': f"CPF: {municipe.cpf or 'Não informado'}",
-                'url': f"/municipes/{municipe.id}/historico"
-            })
-
-        serializer = BuscaGlobalSerializer(resultados, many=True)
-        return Response(serializer.data)
+            response = Response(dados)
+        response['Server-Timing'] = ', '.join(
+            f'{tipo};dur={info["tempo_ms"]};desc="{info["status"]}"' for tipo, info in meta['fontes'].items()
+        )
+        return response
 
 
 # -----------------------------------------------------------------------------
 # Views de Lembretes
 # -----------------------------------------------------------------------------
 
-class LembreteListCreateView(generics.ListCreateAPIView):
+class LembreteListCreateView(OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     serializer_class = LembreteSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageLembretes]
     pagination_class = None
@@ -1352,7 +1281,7 @@ class LembreteListCreateView(generics.ListCreateAPIView):
         if user.is_superuser:
             queryset = Lembrete.objects.all()
         elif hasattr(user, 'perfil'):
-            user_contas = user.perfil.contas.all()
+            user_contas = contexto_autorizacao(user).contas_filtro
             queryset = Lembrete.objects.filter(conta__in=user_contas)
         else:
             return Lembrete.objects.none()
@@ -1391,63 +1320,9 @@ class GerarPdfLembretesView(APIView):
     permission_classes = [permissions.IsAuthenticated, CanManageLembretes]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        
-        # Inicia a queryset com a mesma lógica de permissão da listagem
-        if user.is_superuser:
-            queryset = Lembrete.objects.all()
-        elif hasattr(user, 'perfil'):
-            queryset = Lembrete.objects.filter(conta__in=user.perfil.contas.all())
-        else:
-            queryset = Lembrete.objects.none()
+        return relatorios.responder(request, relatorios.RelatorioLembretes)
 
-        # Reaproveita a mesma lógica de filtro de data que já validamos
-        data_inicio_str = self.request.query_params.get('data_inicio', None)
-        data_fim_str = self.request.query_params.get('data_fim', None)
-
-        if data_inicio_str and data_fim_str:
-            try:
-                inicio_date = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
-                fim_date = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
-                inicio_datetime = timezone.make_aware(datetime.combine(inicio_date, time.min))
-                fim_datetime = timezone.make_aware(datetime.combine(fim_date, time.max))
-                queryset = queryset.filter(data_criacao__range=(inicio_datetime, fim_datetime))
-            except (ValueError, TypeError):
-                queryset = Lembrete.objects.none()
-
-        # Preparação do contexto para o template
-        conta_contexto = request.user.perfil.contas.first() if hasattr(request.user, 'perfil') else None
-        nome_instituicao = "Prefeitura Municipal" # Valor padrão
-        brasao_url = ''
-        logo_conta_url = ''
-
-        if conta_contexto:
-            nome_instituicao = conta_contexto.nome_instituicao or nome_instituicao
-            if conta_contexto.brasao_instituicao:
-                brasao_url = request.build_absolute_uri(conta_contexto.brasao_instituicao.url)
-            if conta_contexto.logo_conta:
-                logo_conta_url = request.build_absolute_uri(conta_contexto.logo_conta.url)
-        
-        context = {
-            'lembretes': queryset.select_related('conta', 'usuario').order_by('-data_criacao'),
-            'data_inicio': datetime.strptime(data_inicio_str, '%Y-%m-%d') if data_inicio_str else None,
-            'data_fim': datetime.strptime(data_fim_str, '%Y-%m-%d') if data_fim_str else None,
-            'nome_instituicao': nome_instituicao,
-            'brasao_url': brasao_url,
-            'logo_conta_url': logo_conta_url,
-            'data_emissao': timezone.now(),
-            'usuario_emissao': request.user.get_full_name() or request.user.username,
-            'logo_siga_url': request.build_absolute_uri('/static/images/logo-siga-gab.png'),
-        }
-
-        html_string = render_to_string('relatorios/relatorio_lembretes.html', context)
-        pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="relatorio_lembretes_{timezone.now().strftime("%Y%m%d")}.pdf"'
-        return response
-
-class LembreteDetailView(generics.RetrieveUpdateDestroyAPIView):
+class LembreteDetailView(OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = LembreteSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageLembretes]
 
@@ -1458,7 +1333,7 @@ class LembreteDetailView(generics.RetrieveUpdateDestroyAPIView):
             return Lembrete.objects.all()
 
         if hasattr(user, 'perfil'):
-            return Lembrete.objects.filter(conta__in=user.perfil.contas.all())
+            return Lembrete.objects.filter(conta__in=contexto_autorizacao(user).contas_filtro)
             
         return Lembrete.objects.none()
 
@@ -1879,7 +1754,7 @@ class SharedGoogleAgendaView(APIView):
         except Exception as e:
             return Response({'detail': f'Ocorreu um erro inesperado: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class AgendasCompartilhadasListView(generics.ListAPIView):
+class AgendasCompartilhadasListView(OtimizacaoConsultasMixin, generics.ListAPIView):
     """
     Retorna uma lista de Contas cujas agendas o usuário logado
     tem permissão explícita para visualizar.
@@ -1901,7 +1776,7 @@ class AgendasCompartilhadasListView(generics.ListAPIView):
             perfilusuario__pode_visualizar_agendas_compartilhadas=True
         ).distinct()
 
-class EspacoAgendaView(generics.ListAPIView):
+class EspacoAgendaView(RequisicaoCondicionalMixin, OtimizacaoConsultasMixin, generics.ListAPIView):
     """
     Retorna todas as agendas confirmadas para um espaço específico,
     em um formato compatível com calendários.
@@ -1922,7 +1797,7 @@ class EspacoAgendaView(generics.ListAPIView):
             data_agendada_fim__isnull=False
         )
     
-class MunicipeCheckDuplicatesView(ListAPIView):
+class MunicipeCheckDuplicatesView(OtimizacaoConsultasMixin, ListAPIView):
     """
     Endpoint para verificar a existência de contatos duplicados antes da criação,
     agora com a regra de negócio correta baseada no contexto da Conta.
@@ -1940,14 +1815,24 @@ class MunicipeCheckDuplicatesView(ListAPIView):
 
         # 2. Constrói a primeira parte da consulta: encontrar por dados pessoais
         query_dados_pessoais = Q()
-        if cpf and len(cpf) > 10:
-            query_dados_pessoais |= Q(cpf=cpf)
+        cpf_digitos = normalizar_cpf(cpf)
+        if cpf_digitos and len(cpf_digitos) == 11:
+            query_dados_pessoais |= Q(cpf_digitos=cpf_digitos)
         if nome:
             query_dados_pessoais |= Q(nome_completo__iexact=nome)
-        if email:
-            query_dados_pessoais |= Q(emails__contains=[{'email': email}])
-        if telefone_str and len(telefone_str) > 10:
-             query_dados_pessoais |= Q(telefones__contains=[{'numero': telefone_str}])
+            # fuzzy=1: também nomes com a mesma pronúncia, pelo índice fonético dos tokens
+            query_fonetica = filtro_nome_fonetico(nome) if busca_aproximada(self.request) else None
+            if query_fonetica is not None:
+                query_dados_pessoais |= query_fonetica
+        # E-mail e telefone pela tabela de contatos normalizados (indexada)
+        query_email = filtro_contato('email', email) if email else None
+        if query_email is not None:
+            query_dados_pessoais |= query_email
+        # Telefone completo, com DDD: 10 dígitos (fixo) ou 11 (celular), sem contar a máscara
+        telefone_digitos = normalizar_telefone(telefone_str)
+        query_telefone = filtro_contato('telefone', telefone_digitos) if len(telefone_digitos) >= 10 else None
+        if query_telefone is not None:
+            query_dados_pessoais |= query_telefone
 
         # Se nenhum critério de busca foi fornecido, não há duplicatas a verificar
         if not query_dados_pessoais:
@@ -1968,9 +1853,9 @@ class MunicipeCheckDuplicatesView(ListAPIView):
             # 4. A MÁGICA FINAL: Combina as duas consultas com um "E" (AND).
             #    A busca final é: "Encontre um munícipe que corresponda aos dados pessoais
             #    E que esteja vinculado a pelo menos uma das contas do contexto."
-            queryset = Municipe.objects.filter(
-                query_dados_pessoais & Q(contas__id__in=contas_ids)
-            ).distinct()
+            queryset = Municipe.objects.visiveis_para_contas(contas_ids, incluir_publicos=False).filter(
+                query_dados_pessoais
+            )
             
             return queryset
             
@@ -1979,9 +1864,11 @@ class MunicipeCheckDuplicatesView(ListAPIView):
             return Municipe.objects.none()
         # --- FIM DA LÓGICA CORRETA ---
 
-class ReservaEspacoListCreateView(generics.ListCreateAPIView):
+class ReservaEspacoListCreateView(OtimizacaoConsultasMixin, generics.ListCreateAPIView):
     serializer_class = ReservaEspacoSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageReservas]
+    pagination_class = KeysetPagination
+    ordenacao_paginacao = ('data_inicio', 'id')
 
     def get_queryset(self):
         user = self.request.user
@@ -1991,7 +1878,7 @@ class ReservaEspacoListCreateView(generics.ListCreateAPIView):
         # Filtra para mostrar apenas reservas de espaços que o usuário pode ver
         if not user.is_superuser:
             if hasattr(user, 'perfil'):
-                queryset = queryset.filter(espaco__contas__in=user.perfil.contas.all()).distinct()
+                queryset = queryset.filter(espaco__contas__in=contexto_autorizacao(user).contas_filtro).distinct()
             else:
                 queryset = ReservaEspaco.objects.none()
 
@@ -2005,7 +1892,7 @@ class ReservaEspacoListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(responsavel=self.request.user)
 
-class ReservaEspacoDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ReservaEspacoDetailView(OtimizacaoConsultasMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = ReservaEspaco.objects.all()
     serializer_class = ReservaEspacoSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageReservas]
@@ -2055,12 +1942,9 @@ class GerarPdfOficioView(APIView):
             }
 
             html_string = render_to_string('oficios/oficio_template.html', context)
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="oficio_{oficio.numero.replace("/", "-")}.pdf"'
-            
-            return response
+            return cache_pdf.responder_pdf(
+                html_string, request.build_absolute_uri(), f'oficio_{oficio.numero.replace("/", "-")}.pdf'
+            )
 
         except Exception as e:
             traceback.print_exc()
@@ -153,8 +153,106 @@ CSRF_TRUSTED_ORIGINS = ['https://gabinete.mogidascruzes.sp.gov.br']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'atendimentos.autenticacao.JWTCacheAuthentication',
+    ),
+    # Mesma saída do JSONRenderer, gerada com orjson (atendimentos/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'atendimentos.renderers.OrjsonRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# --- SERIALIZAÇÃO COMPILADA ---
+# Listagens grandes (munícipes, atendimentos, convidados, lista de presença)
+# montadas direto de `.values()`; confira com `manage.py verificar_serializacao_compilada`.
+SIGA_SERIALIZACAO_COMPILADA = {
+    'ATIVO': os.environ.get('SIGA_SERIALIZACAO_COMPILADA_ATIVO', 'True') == 'True',
+}
+
+# Modo opcional: grupos e contas lidos das claims do token (sem consultas por
+# requisição), validados pela versão de autorização do perfil.
+if os.environ.get('SIGA_JWT_CLAIMS', 'False') == 'True':
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = (
+        'atendimentos.autenticacao.JWTClaimsAuthentication',
     )
+
+# --- CONFIGURAÇÃO DA BUSCA TEXTUAL ---
+# 'auto' escolhe o backend pelo banco: FULLTEXT no MySQL, FTS5 no SQLite e o
+# índice de tokens nos demais. Também aceita o caminho de uma classe de atendimentos.busca_backends.
+SIGA_BUSCA = {
+    'BACKEND': os.environ.get('SIGA_BUSCA_BACKEND', 'auto'),
+    'LIMITE_RESULTADOS': 100,  # padrão quando a URL não informa ?limite=
+    'LIMITE_MAXIMO': 500,
+}
+
+# --- CONFIGURAÇÃO DA BUSCA GLOBAL ---
+# Tempo máximo (ms) que cada fonte pode levar; a fonte que estourar fica fora da resposta
+# (no MySQL, a consulta também é interrompida pelo banco). As fontes de todas as
+# requisições dividem um pool de MAX_THREADS threads por processo.
+SIGA_BUSCA_GLOBAL = {
+    'ORCAMENTO_MS': 1500,
+    'ORCAMENTO_POR_FONTE_MS': {'municipe': 2000},
+    'MAX_THREADS': int(os.environ.get('SIGA_BUSCA_GLOBAL_MAX_THREADS', '8')),
+}
+
+# --- CONFIGURAÇÃO DO AUTOCOMPLETE DE MUNÍCIPES ---
+# 'memoria' mantém um índice por processo; 'redis' compartilha o índice entre os workers.
+# Ligado por padrão só quando as invalidações chegam a todos os workers: com o
+# cache compartilhado (Redis) ou com o índice no próprio Redis. Sem isso, o
+# autocomplete consulta o banco.
+SIGA_TYPEAHEAD = {
+    'ATIVO': os.environ.get(
+        'SIGA_TYPEAHEAD_ATIVO',
+        'True' if os.environ.get('SIGA_CACHE_REDIS_URL') or os.environ.get('SIGA_TYPEAHEAD_BACKEND') == 'redis' else 'False'
+    ) == 'True',
+    'BACKEND': os.environ.get('SIGA_TYPEAHEAD_BACKEND', 'memoria'),
+    'REDIS_URL': os.environ.get('SIGA_TYPEAHEAD_REDIS_URL', 'redis://localhost:6379/1'),
+    'TTL': 300,  # segundos até o índice em memória ser reconstruído
+    'TAMANHO_CACHE_REGISTROS': 20000,
+}
+
+# --- CONFIGURAÇÃO DO CACHE ---
+# O cache de buscas de munícipes é invalidado por uma versão guardada aqui; com
+# vários workers ele precisa ser compartilhado (Redis), senão cada processo só
+# enxerga as próprias invalidações. Sem a variável, usa o cache local em memória.
+if os.environ.get('SIGA_CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('SIGA_CACHE_REDIS_URL'),
+        }
+    }
+
+# --- CONFIGURAÇÃO DO CACHE DE BUSCAS DE MUNÍCIPES ---
+# Ligado por padrão só com o cache compartilhado (Redis): a invalidação troca
+# uma versão no cache do Django, e no cache local de cada worker os demais
+# processos continuariam servindo resultados (e visibilidade) antigos até o TTL.
+SIGA_CACHE_BUSCA = {
+    'ATIVO': os.environ.get(
+        'SIGA_CACHE_BUSCA_ATIVO', 'True' if os.environ.get('SIGA_CACHE_REDIS_URL') else 'False'
+    ) == 'True',
+    'TTL': 300,  # segundos; cobre também o alerta de atualização, que depende da data
+}
+
+# --- CACHE DO USUÁRIO AUTENTICADO ---
+# Usuário, perfil, grupos e contas por usuário, para a autenticação JWT não
+# consultar o banco a cada requisição. Ligado por padrão só com o cache
+# compartilhado (Redis): no cache local de cada worker, as invalidações feitas
+# por outro processo só valeriam depois do TTL.
+SIGA_CACHE_USUARIO = {
+    'ATIVO': os.environ.get(
+        'SIGA_CACHE_USUARIO_ATIVO', 'True' if os.environ.get('SIGA_CACHE_REDIS_URL') else 'False'
+    ) == 'True',
+    'TTL': 60,  # segundos
+}
+
+# --- CACHE DE PERMISSÕES ---
+# O token JWT leva as permissões como bitmap ('permissoes'); a lista completa
+# 'user_permissions' só vai junto com SIGA_TOKEN_LISTA_PERMISSOES=True, para
+# clientes antigos que ainda não decodificam o bitmap.
+SIGA_PERMISSOES = {
+    'TTL': 3600,
+    'TOKEN_LISTA_COMPLETA': os.environ.get('SIGA_TOKEN_LISTA_PERMISSOES', 'False') == 'True',
 }
 
 # --- CONFIGURAÇÃO DE E-MAIL SMTP (MAILGRID - TI) ---
@@ -206,6 +304,8 @@ SIMPLE_JWT = {
 
     # Garante que nosso gerador de token customizado seja usado
     "TOKEN_OBTAIN_SERIALIZER": "atendimentos.serializers.MyTokenObtainPairSerializer",
+    # A renovação grava grupos, contas e versão de autorização atuais no novo access token
+    "TOKEN_REFRESH_SERIALIZER": "atendimentos.serializers.MyTokenRefreshSerializer",
 }
 
 # --- CREDENCIAIS DO GOOGLE ---
@@ -239,6 +339,32 @@ os.makedirs(LOGS_DIR, exist_ok=True)
 
 SITE_ID = 1  # <-- 2. ADICIONE ESTA LINHA
 
+# Relatórios em PDF (atendimentos/relatorios.py): acima de LIMITE_SINCRONO linhas,
+# o relatório vira um RelatorioJob gerado pelo Celery e baixado depois.
+SIGA_RELATORIOS = {
+    'ASSINCRONO': os.environ.get('SIGA_RELATORIOS_ASSINCRONO', 'True') == 'True',
+    'LIMITE_SINCRONO': int(os.environ.get('SIGA_RELATORIOS_LIMITE_SINCRONO', '300')),
+    'VALIDADE_HORAS': int(os.environ.get('SIGA_RELATORIOS_VALIDADE_HORAS', '24')),
+    'DIRETORIO': os.environ.get('SIGA_RELATORIOS_DIRETORIO', str(BASE_DIR / 'relatorios_gerados')),
+}
+
+# Cache em disco dos PDFs de atendimento e ofício (atendimentos/cache_pdf.py),
+# chaveado pelo hash do HTML renderizado; despeja os menos usados acima do limite.
+SIGA_CACHE_PDF = {
+    'ATIVO': os.environ.get('SIGA_CACHE_PDF_ATIVO', 'True') == 'True',
+    'DIRETORIO': os.environ.get('SIGA_CACHE_PDF_DIRETORIO', str(BASE_DIR / 'cache_pdfs')),
+    'TAMANHO_MAXIMO_MB': int(os.environ.get('SIGA_CACHE_PDF_TAMANHO_MAXIMO_MB', '256')),
+}
+
+# Recursos dos PDFs (atendimentos/recursos_pdf.py): /static/ e MEDIA_URL dos
+# hosts do ALLOWED_HOSTS são lidos do disco, sem HTTP; o que é buscado fica em
+# cache na memória de cada processo.
+SIGA_RECURSOS_PDF = {
+    'LOCAL': os.environ.get('SIGA_RECURSOS_PDF_LOCAL', 'True') == 'True',
+    'TAMANHO_CACHE_MB': int(os.environ.get('SIGA_RECURSOS_PDF_TAMANHO_CACHE_MB', '32')),
+    'TTL_REMOTO': 3600,  # segundos, para URLs externas (ex.: Google Fonts)
+}
+
 # --- CONFIGURAÇÃO DO CELERY ---
 # URL do Broker (gerente da fila). 'redis://localhost:6379/0' é o padrão.
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:02
+
+from django.db import migrations
+
+from atendimentos.migrations._indice_textual import criar_indice_textual, remover_indice_textual
+
+
+COLUNAS = ('nome', 'local', 'descricao')
+
+
+def criar_indice(apps, schema_editor):
+    criar_indice_textual(schema_editor, 'eventos_evento', COLUNAS)
+
+
+def remover_indice(apps, schema_editor):
+    remover_indice_textual(schema_editor, 'eventos_evento', COLUNAS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eventos', '0014_alter_evento_status'),
+        ('atendimentos', '0016_indices_textuais'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
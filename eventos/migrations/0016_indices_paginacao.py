@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atendimentos', '0020_indices_paginacao'),
+        ('eventos', '0015_indice_textual_evento'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='convidado',
+            index=models.Index(fields=['evento', 'ordem', 'id'], name='convidado_evento_ordem_idx'),
+        ),
+    ]
@@ -88,6 +88,8 @@ class Convidado(models.Model):
         verbose_name = "Convidado"
         verbose_name_plural = "Convidados"
         ordering = ['ordem']
+        # Paginação por chave da lista de convidados de um evento
+        indexes = [models.Index(fields=['evento', 'ordem', 'id'], name='convidado_evento_ordem_idx')]
 
     def __str__(self):
         return f"{self.municipe.nome_completo} no evento {self.evento.nome}"
@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from atendimentos.permissions import contexto_autorizacao
+
 class PodeGerenciarEventos(BasePermission):
     """
     Permissão customizada que verifica se o usuário:
@@ -12,4 +14,4 @@ class PodeGerenciarEventos(BasePermission):
 
         # Verifica se o usuário tem a permissão específica, 
         # seja diretamente ou através de um grupo.
-        return request.user.has_perm('eventos.pode_gerenciar_eventos')
\ No newline at end of file
+        return contexto_autorizacao(request.user).tem_permissao('eventos.pode_gerenciar_eventos')
\ No newline at end of file
@@ -1,6 +1,6 @@
 # (dentro de eventos/relatorios.py)
 import io
-from datetime import datetime
+from datetime import datetime, time
 from django.utils import timezone
 from django.conf import settings
 import os
@@ -11,6 +11,8 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.lib.units import inch
 from reportlab.lib import colors
+from atendimentos.relatorios import Relatorio, RelatorioInvalido, registrar
+from .models import Convidado, Evento, EventoChecklist
 
 def gerar_pdf_checklist(checklist):
     buffer = io.BytesIO()
@@ -177,4 +179,155 @@ def gerar_pdf_eventos_periodo(eventos, data_inicio, data_fim, logo_path):
     doc.build(elements, onFirstPage=footer, onLaterPages=footer)
     
     buffer.seek(0)
-    return buffer
\ No newline at end of file
+    return buffer
+
+# -----------------------------------------------------------------------------
+# Relatórios em HTML/WeasyPrint, na requisição ou pelo Celery (atendimentos/relatorios.py).
+# Os relatórios de um evento ou checklist recebem o id já conferido pela view (get_object).
+# -----------------------------------------------------------------------------
+
+
+@registrar
+class RelatorioEventosPeriodo(Relatorio):
+    tipo = 'eventos_periodo'
+    template = 'eventos/relatorio_eventos.html'
+
+    def preparar(self):
+        self.data_inicio_str = self.parametros.get('data_inicio')
+        self.data_fim_str = self.parametros.get('data_fim')
+        if not self.data_inicio_str or not self.data_fim_str:
+            raise RelatorioInvalido({'error': 'As datas de início e fim são obrigatórias.'})
+        try:
+            self.data_inicio = datetime.strptime(self.data_inicio_str, '%Y-%m-%d').date()
+            self.data_fim = datetime.strptime(self.data_fim_str, '%Y-%m-%d').date()
+        except ValueError:
+            raise RelatorioInvalido({'error': 'Formato de data inválido. Use AAAA-MM-DD.'})
+
+    def queryset(self):
+        # Mesma regra de EventoViewSet.get_queryset
+        user = self.usuario
+        if user.is_superuser:
+            eventos = Evento.objects.all()
+        elif hasattr(user, 'perfil'):
+            eventos = Evento.objects.filter(conta__in=user.perfil.contas.all())
+        else:
+            eventos = Evento.objects.none()
+        inicio = datetime.combine(self.data_inicio, time.min)
+        fim = datetime.combine(self.data_fim, time.max)
+        return eventos.filter(data_evento__range=[inicio, fim]).order_by('data_evento')
+
+    def total_linhas(self):
+        return self.queryset().count()
+
+    def contexto(self):
+        return {
+            'eventos': self.queryset(),
+            'data_inicio': self.data_inicio,
+            'data_fim': self.data_fim,
+            'data_emissao': timezone.now(),
+            'hoje': timezone.now(),
+            'logo_url': self.url('/static/images/logo-siga-gab.png')
+        }
+
+    def nome_arquivo(self):
+        return f'relatorio_eventos_{self.data_inicio_str}_a_{self.data_fim_str}.pdf'
+
+
+class RelatorioDeEvento(Relatorio):
+    """Relatórios de um evento (`parametros['evento']`), com as marcas da conta."""
+
+    def preparar(self):
+        self.evento = Evento.objects.select_related('conta').get(pk=self.parametros['evento'])
+
+    def convidados(self):
+        raise NotImplementedError
+
+    def total_linhas(self):
+        return self.convidados().count()
+
+    def marcas(self):
+        conta = self.evento.conta
+        return {
+            'logo_url': self.url(conta.logo_conta.url) if conta.logo_conta else '',
+            'brasao_url': self.url(conta.brasao_instituicao.url) if conta.brasao_instituicao else '',
+        }
+
+
+@registrar
+class RelatorioConvidadosPresentes(RelatorioDeEvento):
+    tipo = 'evento_convidados_presentes'
+    template = 'eventos/relatorio_convidados.html'
+
+    def convidados(self):
+        return self.evento.convidados.filter(status='Presente').order_by('ordem')
+
+    def contexto(self):
+        return {
+            'evento': self.evento,
+            'convidados': self.convidados(),
+            'data_emissao': timezone.now(),
+            **self.marcas(),
+        }
+
+    def nome_arquivo(self):
+        return f'relatorio_convidados_{self.evento.nome}.pdf'
+
+
+class RelatorioDeConvidadosSelecionados(RelatorioDeEvento):
+    """Crachás e prismas: os convidados de `parametros['convidado_ids']`, na ordem manual."""
+
+    def convidados(self):
+        return Convidado.objects.filter(id__in=self.parametros['convidado_ids'], evento=self.evento).order_by('ordem')
+
+
+@registrar
+class RelatorioCrachas(RelatorioDeConvidadosSelecionados):
+    tipo = 'evento_crachas'
+    template = 'eventos/relatorio_crachas.html'
+
+    def contexto(self):
+        marcas = self.marcas()
+        if self.base_url.startswith('https://'):
+            marcas = {chave: url.replace('http://', 'https://') for chave, url in marcas.items()}
+        return {'evento': self.evento, 'convidados': self.convidados(), **marcas}
+
+    def nome_arquivo(self):
+        return f'crachas_{self.evento.nome}.pdf'
+
+
+@registrar
+class RelatorioPrismas(RelatorioDeConvidadosSelecionados):
+    tipo = 'evento_prismas'
+    template = 'eventos/relatorio_prismas.html'
+
+    def contexto(self):
+        return {'evento': self.evento, 'convidados': self.convidados()}
+
+    def nome_arquivo(self):
+        return f'prismas_{self.evento.nome}.pdf'
+
+
+@registrar
+class RelatorioChecklist(Relatorio):
+    tipo = 'evento_checklist'
+    template = 'eventos/relatorio_checklist.html'
+
+    def preparar(self):
+        self.checklist = EventoChecklist.objects.select_related('evento').get(pk=self.parametros['checklist'])
+
+    def itens_status(self):
+        return self.checklist.itens_status.all().order_by('item_mestre__nome')
+
+    def total_linhas(self):
+        return self.itens_status().count()
+
+    def contexto(self):
+        return {
+            'checklist': self.checklist,
+            'itens_status': self.itens_status(),
+            'data_emissao': timezone.now(),
+            'logo_url': self.url('/static/images/logo-siga-gab.png')
+        }
+
+    def nome_arquivo(self):
+        return f'relatorio_checklist_{self.checklist.evento.nome}.pdf'
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Evento, Convidado, EventoChecklist, Comunicacao, Destinatario, LogDeEnvio, ListaPresenca, ChecklistItem, EventoChecklistItemStatus, MailingList
 from atendimentos.models import Municipe 
+from atendimentos.campos_esparsos import CamposEsparsosMixin
 
 class EventoChecklistSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,7 +9,7 @@ class EventoChecklistSerializer(serializers.ModelSerializer):
         fields = ['token']
 
 
-class EventoSerializer(serializers.ModelSerializer):
+class EventoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     checklist = EventoChecklistSerializer(read_only=True)
 
     class Meta:
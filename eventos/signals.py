@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Evento, EventoChecklist, ChecklistItem, EventoChecklistItemStatus
+from atendimentos import atividades
+from atendimentos.models import AtividadeMunicipe
+from .models import Evento, EventoChecklist, ChecklistItem, EventoChecklistItemStatus, ListaPresenca, Comunicacao, Destinatario
 
 @receiver(post_save, sender=Evento)
 def criar_checklist_para_novo_evento(sender, instance, created, **kwargs):
@@ -19,4 +21,41 @@ def criar_checklist_para_novo_evento(sender, instance, created, **kwargs):
             EventoChecklistItemStatus.objects.create(
                 evento_checklist=checklist_do_evento,
                 item_mestre=item
-            )
\ No newline at end of file
+            )
+
+
+# --- Linha do tempo do munícipe (atendimentos/atividades.py) ---
+
+@receiver(post_save, sender=ListaPresenca)
+def registrar_presenca_na_linha_do_tempo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        atividades.registrar(AtividadeMunicipe.PRESENCA, instance)
+
+
+@receiver(post_delete, sender=ListaPresenca)
+def remover_presenca_da_linha_do_tempo(sender, instance, **kwargs):
+    atividades.remover(AtividadeMunicipe.PRESENCA, instance)
+
+
+@receiver(post_save, sender=Destinatario)
+def registrar_comunicacao_na_linha_do_tempo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        atividades.registrar(AtividadeMunicipe.COMUNICACAO, instance)
+
+
+@receiver(post_delete, sender=Destinatario)
+def remover_comunicacao_da_linha_do_tempo(sender, instance, **kwargs):
+    atividades.remover(AtividadeMunicipe.COMUNICACAO, instance)
+
+
+@receiver(post_save, sender=Comunicacao)
+def atualizar_comunicacao_na_linha_do_tempo(sender, instance, created, raw=False, **kwargs):
+    # Uma comunicação nova ainda não tem destinatários
+    if not created and not raw:
+        atividades.atualizar_comunicacao(instance)
+
+
+@receiver(post_save, sender=Evento)
+def atualizar_evento_na_linha_do_tempo(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        atividades.atualizar_evento(instance)
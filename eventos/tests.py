@@ -1,3 +1,56 @@
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from atendimentos.models import Conta, PerfilUsuario
+
+from .models import Evento
+
+
+class EventoViewSetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.conta_a = Conta.objects.create(nome='GABINETE A')
+        cls.conta_b = Conta.objects.create(nome='GABINETE B')
+        cls.gestor = User.objects.create_user('gestor', 'gestor@example.com', 'senha')
+        cls.gestor.user_permissions.add(Permission.objects.get(codename='pode_gerenciar_eventos'))
+        PerfilUsuario.objects.create(usuario=cls.gestor).contas.add(cls.conta_a)
+        cls.sem_contas = User.objects.create_user('sem_contas', 'sem@example.com', 'senha')
+        cls.sem_contas.user_permissions.add(Permission.objects.get(codename='pode_gerenciar_eventos'))
+        PerfilUsuario.objects.create(usuario=cls.sem_contas)
+        for indice in range(3):
+            for conta in (cls.conta_a, cls.conta_b):
+                Evento.objects.create(
+                    conta=conta, nome=f'Evento {indice}', data_evento=timezone.now(), local='Sede', ativo=False
+                )
+
+    def setUp(self):
+        # Permissões e contas ficam em cache por id de usuário, e os ids se repetem entre as classes de teste
+        cache.clear()
+
+    def listar(self, usuario):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=usuario.pk))
+        return client.get('/api/eventos/')
+
+    def test_lista_so_os_eventos_das_contas_do_usuario(self):
+        resposta = self.listar(self.gestor)
+        self.assertEqual(resposta.status_code, 200)
+        resultados = resposta.json()
+        resultados = resultados['results'] if isinstance(resultados, dict) else resultados
+        self.assertEqual(len(resultados), 3)
+        self.assertEqual({evento['conta'] for evento in resultados}, {self.conta_a.pk})
+
+    def test_perfil_sem_contas_nao_ve_eventos(self):
+        resposta = self.listar(self.sem_contas)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()), 0)
+
+    def test_contas_filtradas_na_mesma_query_dos_eventos(self):
+        # Permissões, perfil e a listagem com a subconsulta das contas
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.gestor.pk))
+        with self.assertNumQueries(4):
+            self.assertEqual(client.get('/api/eventos/').status_code, 200)
@@ -1,30 +1,35 @@
 # eventos/views.py
 import uuid
-from datetime import datetime, time
+import operator
+from functools import reduce
 from openpyxl import Workbook
-from weasyprint import HTML
 from django.http import HttpResponse
 from django.db.models import Q
 from django.shortcuts import render, get_object_or_404, redirect
 from django.db import transaction, models
 from django.utils import timezone
 from django.contrib.staticfiles import finders
-from django.template.loader import render_to_string
 from rest_framework.views import APIView
 from rest_framework import viewsets, permissions, serializers, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .relatorios import gerar_pdf_checklist, gerar_pdf_eventos_periodo
+from .relatorios import (gerar_pdf_checklist, gerar_pdf_eventos_periodo, RelatorioChecklist, RelatorioConvidadosPresentes,
+                         RelatorioCrachas, RelatorioEventosPeriodo, RelatorioPrismas)
 from .models import Evento, ListaPresenca, EventoChecklist, Convidado, Comunicacao, Destinatario, LogDeEnvio, EventoChecklistItemStatus, ChecklistItem, MailingList, Municipe
-from atendimentos.models import Municipe, CategoriaContato 
+from atendimentos.models import AtividadeMunicipe, Municipe, CategoriaContato
 from .forms import ListaPresencaForm
 from .serializers import EventoSerializer, ConvidadoSerializer, ComunicacaoSerializer, DestinatarioSerializer, LogDeEnvioSerializer, ListaPresencaSerializer, EventoChecklistSerializer, EventoChecklistItemStatusSerializer, ChecklistItemSerializer, MailingListSerializer, MunicipeForConvidadoSerializer
 from .utils import gerar_e_enviar_certificado
 from .permissions import PodeGerenciarEventos
 from eventos.tasks import enviar_comunicacao_em_massa, gerar_e_enviar_certificado
-from atendimentos.management.commands.verificar_duplicatas import normalizar_nome_para_conjunto
-
-class EventoViewSet(viewsets.ModelViewSet):
+from atendimentos import atividades, relatorios
+from atendimentos.busca import normalizar_nome_para_conjunto, filtro_contato
+from atendimentos.pagination import KeysetPagination
+from atendimentos.permissions import contexto_autorizacao
+from atendimentos.otimizacao_consultas import OtimizacaoConsultasMixin
+from atendimentos.serializacao_compilada import SerializacaoCompiladaMixin
+
+class EventoViewSet(OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     serializer_class = EventoSerializer
     permission_classes = [PodeGerenciarEventos]
 
@@ -34,9 +39,8 @@ class EventoViewSet(viewsets.ModelViewSet):
         if user.is_superuser:
             return Evento.objects.all().order_by('-data_evento')
         if hasattr(user, 'perfil'):
-            contas_do_usuario = user.perfil.contas.all()
-            if contas_do_usuario.exists():
-                return Evento.objects.filter(conta__in=contas_do_usuario).order_by('-data_evento')
+            contas_do_usuario = contexto_autorizacao(user).contas_filtro
+            return Evento.objects.filter(conta__in=contas_do_usuario).order_by('-data_evento')
         return Evento.objects.none()
 
     def perform_create(self, serializer):
@@ -144,78 +148,18 @@ class EventoViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='gerar-relatorio-periodo')
     def gerar_relatorio_periodo(self, request):
-        data_inicio_str = request.query_params.get('data_inicio')
-        data_fim_str = request.query_params.get('data_fim')
-
-        if not data_inicio_str or not data_fim_str:
-            return Response({'error': 'As datas de início e fim são obrigatórias.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        try:
-            data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
-            data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
-        except ValueError:
-            return Response({'error': 'Formato de data inválido. Use AAAA-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        start_datetime = datetime.combine(data_inicio, time.min)
-        end_datetime = datetime.combine(data_fim, time.max)
-        
-        # Filtra os eventos e ordena por data
-        queryset = self.get_queryset().filter(data_evento__range=[start_datetime, end_datetime]).order_by('data_evento')
-
-        # Contexto que será enviado para o template HTML
-        context = {
-            'eventos': queryset,
-            'data_inicio': data_inicio,
-            'data_fim': data_fim,
-            'data_emissao': timezone.now(),
-            'hoje': timezone.now(),
-            'logo_url': request.build_absolute_uri('/static/images/logo-siga-gab.png')
-        }
-        
-        # Renderiza o template HTML para uma string
-        html_string = render_to_string('eventos/relatorio_eventos.html', context)
-        
-        # Gera o PDF a partir do HTML
-        pdf_file = HTML(string=html_string).write_pdf()
-        
-        # Cria a resposta HTTP
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="relatorio_eventos_{data_inicio_str}_a_{data_fim_str}.pdf"'
-        
-        return response
+        # Acima do limite de linhas, o PDF é gerado pelo Celery (atendimentos/relatorios.py)
+        return relatorios.responder(request, RelatorioEventosPeriodo)
 
     @action(detail=True, methods=['get'], url_path='relatorio-convidados-presentes')
     def relatorio_convidados_presentes(self, request, pk=None):
         """
-        Gera um relatório em PDF com a lista de TODOS os convidados do evento,
+        Gera um relatório em PDF com a lista dos convidados presentes no evento,
         respeitando a ordem manual.
         """
         try:
             evento = self.get_object()
-            
-            # CORREÇÃO: Remove o filtro de status='presente' para incluir todos os convidados.
-            todos_convidados = evento.convidados.filter(status='Presente').order_by('ordem')
-            
-            conta = evento.conta
-            logo_url = request.build_absolute_uri(conta.logo_conta.url) if conta.logo_conta else ''
-            brasao_url = request.build_absolute_uri(conta.brasao_instituicao.url) if conta.brasao_instituicao else ''
-
-            context = {
-                'evento': evento,
-                'convidados': todos_convidados,
-                'logo_url': logo_url,
-                'brasao_url': brasao_url,
-                'data_emissao': timezone.now(),
-            }
-
-            html_string = render_to_string('eventos/relatorio_convidados.html', context)
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            # Ajuste no nome do arquivo para refletir o novo conteúdo
-            response['Content-Disposition'] = f'attachment; filename="relatorio_convidados_{evento.nome}.pdf"'
-            
-            return response
+            return relatorios.responder(request, RelatorioConvidadosPresentes, {'evento': evento.pk})
         except Exception as e:
             # Log do erro no servidor para facilitar a depuração
             print(f"Erro ao gerar relatório de convidados: {e}")
@@ -233,31 +177,7 @@ class EventoViewSet(viewsets.ModelViewSet):
 
         try:
             evento = self.get_object()
-            
-            # Busca os convidados selecionados, mantendo a ordem manual
-            convidados_selecionados = Convidado.objects.filter(id__in=convidado_ids, evento=evento).order_by('ordem')
-            
-            conta = evento.conta
-            logo_url = request.build_absolute_uri(conta.logo_conta.url) if conta.logo_conta else ''
-            brasao_url = request.build_absolute_uri(conta.brasao_instituicao.url) if conta.brasao_instituicao else ''
-            if request.is_secure():
-                logo_url = logo_url.replace('http://', 'https://')
-                brasao_url = brasao_url.replace('http://', 'https://')
-
-            context = {
-                'evento': evento,
-                'convidados': convidados_selecionados,
-                'logo_url': logo_url,
-                'brasao_url': brasao_url,
-            }
-
-            html_string = render_to_string('eventos/relatorio_crachas.html', context)
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="crachas_{evento.nome}.pdf"'
-            
-            return response
+            return relatorios.responder(request, RelatorioCrachas, {'evento': evento.pk, 'convidado_ids': convidado_ids})
         except Exception as e:
             print(f"Erro ao gerar crachás: {e}")
             return Response({'error': 'Ocorreu um erro interno ao gerar o relatório.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -274,21 +194,7 @@ class EventoViewSet(viewsets.ModelViewSet):
 
         try:
             evento = self.get_object()
-            
-            convidados_selecionados = Convidado.objects.filter(id__in=convidado_ids, evento=evento).order_by('ordem')
-
-            context = {
-                'evento': evento,
-                'convidados': convidados_selecionados,
-            }
-
-            html_string = render_to_string('eventos/relatorio_prismas.html', context)
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="prismas_{evento.nome}.pdf"'
-            
-            return response
+            return relatorios.responder(request, RelatorioPrismas, {'evento': evento.pk, 'convidado_ids': convidado_ids})
         except Exception as e:
             print(f"Erro ao gerar prismas: {e}")
             return Response({'error': 'Ocorreu um erro interno ao gerar o relatório.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -372,13 +278,15 @@ def preencher_checklist(request, token):
     }
     return render(request, 'eventos/formulario_checklist.html', context)
 
-class ConvidadoViewSet(viewsets.ModelViewSet):
+class ConvidadoViewSet(SerializacaoCompiladaMixin, OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     """
     API para gerenciar os Convidados de um evento.
     - Filtra por evento: /api/convidados/?evento=1
     """
     serializer_class = ConvidadoSerializer
     permission_classes = [PodeGerenciarEventos]
+    pagination_class = KeysetPagination
+    ordenacao_paginacao = ('ordem', 'id')
 
     def get_queryset(self):
         # A ordenação agora é feita pelo 'ordering' no modelo, então o queryset já vem ordenado.
@@ -388,7 +296,7 @@ class ConvidadoViewSet(viewsets.ModelViewSet):
         if usuario.is_superuser:
             qs = Convidado.objects.all()
         elif hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
             qs = Convidado.objects.filter(evento__conta__in=contas_do_usuario)
         
         evento_id = self.request.query_params.get('evento')
@@ -446,7 +354,7 @@ class ConvidadoViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class ComunicacaoViewSet(viewsets.ModelViewSet):
+class ComunicacaoViewSet(OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     serializer_class = ComunicacaoSerializer
     permission_classes = [PodeGerenciarEventos]
     filterset_fields = ['evento']
@@ -458,7 +366,7 @@ class ComunicacaoViewSet(viewsets.ModelViewSet):
         if usuario.is_superuser:
             qs = Comunicacao.objects.all()
         elif hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
             qs = Comunicacao.objects.filter(evento__conta__in=contas_do_usuario)
 
         evento_id = self.request.query_params.get('evento')
@@ -469,11 +377,10 @@ class ComunicacaoViewSet(viewsets.ModelViewSet):
 
         # Se não for superusuário, filtramos pelas contas do perfil.
         if hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
-            if contas_do_usuario.exists():
-                # Retorna todas as comunicações cujo evento pertence a uma das contas do usuário.
-                # Esta é a lógica que funciona tanto para a lista quanto para os detalhes.
-                return Comunicacao.objects.filter(evento__conta__in=contas_do_usuario).order_by('-data_criacao')
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
+            # Retorna todas as comunicações cujo evento pertence a uma das contas do usuário.
+            # Esta é a lógica que funciona tanto para a lista quanto para os detalhes.
+            return Comunicacao.objects.filter(evento__conta__in=contas_do_usuario).order_by('-data_criacao')
         
         # Se o usuário não for superuser ou não tiver contas, não retorna nada.
         return Comunicacao.objects.none()
@@ -482,7 +389,7 @@ class ComunicacaoViewSet(viewsets.ModelViewSet):
         evento_id = self.request.data.get('evento_id')
         try:
             evento = Evento.objects.get(id=evento_id)
-            if not self.request.user.is_superuser and evento.conta not in self.request.user.perfil.contas.all():
+            if not self.request.user.is_superuser and evento.conta_id not in (contexto_autorizacao(self.request.user).contas_ids or ()):
                  raise serializers.ValidationError("Você não tem permissão para criar uma comunicação para este evento.")
             serializer.save(evento=evento)
         except Evento.DoesNotExist:
@@ -519,6 +426,8 @@ class ComunicacaoViewSet(viewsets.ModelViewSet):
         
         if novos_destinatarios:
             Destinatario.objects.bulk_create(novos_destinatarios)
+            # bulk_create não dispara sinais
+            atividades.registrar_em_lote(AtividadeMunicipe.COMUNICACAO, novos_destinatarios)
 
         return Response(
             {'status': f'{len(novos_destinatarios)} novo(s) destinatário(s) com e-mail foram adicionado(s).'},
@@ -552,6 +461,8 @@ class ComunicacaoViewSet(viewsets.ModelViewSet):
         
         if novos_destinatarios:
             Destinatario.objects.bulk_create(novos_destinatarios)
+            # bulk_create não dispara sinais
+            atividades.registrar_em_lote(AtividadeMunicipe.COMUNICACAO, novos_destinatarios)
 
         return Response(
             {'status': f'{len(novos_destinatarios)} novo(s) destinatário(s) da lista "{mailing_list.nome}" foram adicionado(s).'},
@@ -585,7 +496,7 @@ class ComunicacaoViewSet(viewsets.ModelViewSet):
             status=status.HTTP_202_ACCEPTED
         )
 
-class DestinatarioViewSet(viewsets.ModelViewSet):
+class DestinatarioViewSet(OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     serializer_class = DestinatarioSerializer
     permission_classes = [PodeGerenciarEventos]
 
@@ -601,7 +512,7 @@ class DestinatarioViewSet(viewsets.ModelViewSet):
         if usuario.is_superuser:
             qs = Destinatario.objects.all()
         elif hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
             # O caminho correto: Destinatario -> comunicacao -> evento -> conta
             qs = Destinatario.objects.filter(comunicacao__evento__conta__in=contas_do_usuario)
         
@@ -614,7 +525,7 @@ class DestinatarioViewSet(viewsets.ModelViewSet):
         # Retorna a base de permissão se nenhum filtro específico for aplicado
         return qs.select_related('municipe')        
 
-class LogDeEnvioViewSet(viewsets.ReadOnlyModelViewSet):
+class LogDeEnvioViewSet(OtimizacaoConsultasMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = LogDeEnvioSerializer
     permission_classes = [PodeGerenciarEventos]
     filterset_fields = ['comunicacao']
@@ -627,7 +538,7 @@ class LogDeEnvioViewSet(viewsets.ReadOnlyModelViewSet):
         if usuario.is_superuser:
             qs = LogDeEnvio.objects.all()
         elif hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
             qs = LogDeEnvio.objects.filter(comunicacao__evento__conta__in=contas_do_usuario)
         
         # O frontend envia '?comunicacao=ID', então filtramos por isso.
@@ -688,10 +599,15 @@ class PublicCheckInView(APIView):
         
         # --- LÓGICA DE BUSCA INTELIGENTE ---
         # 1. Busca por contatos que compartilham o mesmo telefone ou e-mail na mesma conta
-        candidatos = Municipe.objects.filter(
-            Q(telefones__contains=[{'numero': telefone}]) | Q(emails__contains=[{'email': email}]),
-            contas=conta
-        ).distinct()
+        #    (telefone e e-mail pela tabela de contatos normalizados, que é indexada)
+        filtros_contato = [
+            filtro for filtro in (filtro_contato('telefone', telefone), filtro_contato('email', email))
+            if filtro is not None
+        ]
+        if filtros_contato:
+            candidatos = Municipe.objects.filter(reduce(operator.or_, filtros_contato), contas=conta).distinct()
+        else:
+            candidatos = Municipe.objects.none()
 
         if candidatos.exists():
             nome_form_normalizado = normalizar_nome_para_conjunto(nome_completo)
@@ -756,7 +672,7 @@ class PublicCheckInView(APIView):
 
         return Response({'status': 'Presença registrada com sucesso!'}, status=status.HTTP_201_CREATED)
 
-class ListaPresencaViewSet(viewsets.ReadOnlyModelViewSet):
+class ListaPresencaViewSet(SerializacaoCompiladaMixin, OtimizacaoConsultasMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para visualizar a Lista de Presença de um evento.
     """
@@ -777,7 +693,7 @@ class ListaPresencaViewSet(viewsets.ReadOnlyModelViewSet):
         if usuario.is_superuser:
             qs = ListaPresenca.objects.all()
         elif hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
             qs = ListaPresenca.objects.filter(evento__conta__in=contas_do_usuario)
 
         # 2. APLICA O FILTRO DO EVENTO ESPECÍFICO
@@ -827,7 +743,7 @@ class ListaPresencaViewSet(viewsets.ReadOnlyModelViewSet):
         
         return response
 
-class EventoChecklistViewSet(viewsets.ModelViewSet):
+class EventoChecklistViewSet(OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     """
     API para gerenciar os Checklists dos Eventos.
     """
@@ -845,7 +761,7 @@ class EventoChecklistViewSet(viewsets.ModelViewSet):
         if usuario.is_superuser:
             qs = EventoChecklist.objects.all()
         elif hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
             qs = EventoChecklist.objects.filter(evento__conta__in=contas_do_usuario)
             
         # Se a ação for a 'list', filtramos pelo parâmetro 'evento'.
@@ -865,26 +781,7 @@ class EventoChecklistViewSet(viewsets.ModelViewSet):
         """
         try:
             checklist = self.get_object()
-            
-            # Contexto para o template HTML
-            context = {
-                'checklist': checklist,
-                'itens_status': checklist.itens_status.all().order_by('item_mestre__nome'),
-                'data_emissao': timezone.now(),
-                'logo_url': request.build_absolute_uri('/static/images/logo-siga-gab.png')
-            }
-
-            # Renderiza o template HTML para uma string
-            html_string = render_to_string('eventos/relatorio_checklist.html', context)
-            
-            # Gera o PDF a partir do HTML
-            pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-            
-            # Cria a resposta HTTP
-            response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="relatorio_checklist_{checklist.evento.nome}.pdf"'
-            
-            return response
+            return relatorios.responder(request, RelatorioChecklist, {'checklist': checklist.pk})
         except EventoChecklist.DoesNotExist:
             return Response({'error': 'Checklist não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -974,7 +871,7 @@ class PublicChecklistView(APIView):
 
 
 
-class ChecklistItemViewSet(viewsets.ReadOnlyModelViewSet):
+class ChecklistItemViewSet(OtimizacaoConsultasMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para listar e gerenciar (CRUD) os Itens Mestres de Checklist.
     """
@@ -982,7 +879,7 @@ class ChecklistItemViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.AllowAny]
     queryset = ChecklistItem.objects.all()
 
-class EventoChecklistItemStatusViewSet(viewsets.ModelViewSet):
+class EventoChecklistItemStatusViewSet(OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     """
     API para gerenciar os itens individuais (status) de um checklist de evento.
     """
@@ -995,11 +892,11 @@ class EventoChecklistItemStatusViewSet(viewsets.ModelViewSet):
         if usuario.is_superuser:
             return EventoChecklistItemStatus.objects.all()
         if hasattr(usuario, 'perfil'):
-            contas_do_usuario = usuario.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(usuario).contas_filtro
             return EventoChecklistItemStatus.objects.filter(evento_checklist__evento__conta__in=contas_do_usuario)
         return EventoChecklistItemStatus.objects.none()
 
-class MailingListViewSet(viewsets.ModelViewSet):
+class MailingListViewSet(OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     """
     API para gerenciar Listas de Mailing.
     """
@@ -1011,7 +908,7 @@ class MailingListViewSet(viewsets.ModelViewSet):
         if user.is_superuser:
             return MailingList.objects.all().prefetch_related('municipes')
         if hasattr(user, 'perfil'):
-            contas_do_usuario = user.perfil.contas.all()
+            contas_do_usuario = contexto_autorizacao(user).contas_filtro
             return MailingList.objects.filter(conta__in=contas_do_usuario).prefetch_related('municipes')
         return MailingList.objects.none()
 
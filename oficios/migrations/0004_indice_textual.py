@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:10
+
+from django.db import migrations
+
+from atendimentos.migrations._indice_textual import criar_indice_textual, remover_indice_textual
+
+
+COLUNAS = ('assunto', 'destinatario_nome', 'destinatario_orgao', 'corpo')
+
+
+def criar_indice(apps, schema_editor):
+    criar_indice_textual(schema_editor, 'oficios_oficio', COLUNAS)
+
+
+def remover_indice(apps, schema_editor):
+    remover_indice_textual(schema_editor, 'oficios_oficio', COLUNAS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oficios', '0003_oficio_destinatario_tratamento'),
+        ('atendimentos', '0016_indices_textuais'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
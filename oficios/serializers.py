@@ -2,8 +2,9 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Oficio
 from atendimentos.models import Conta
+from atendimentos.campos_esparsos import CamposEsparsosMixin
 
-class OficioSerializer(serializers.ModelSerializer):
+class OficioSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """
     Serializer para listar e detalhar os Ofícios.
     """
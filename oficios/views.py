@@ -1,5 +1,6 @@
 from rest_framework import viewsets, permissions
 from django.shortcuts import get_object_or_404
+from django.db.models import Q
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.http import HttpResponse
@@ -9,6 +10,10 @@ import os # Adicionar este import
 import google.generativeai as genai
 from django.conf import settings # Adicionar este import
 
+from atendimentos.busca_backends import buscar, limite_resultados
+from atendimentos.permissions import contexto_autorizacao
+from atendimentos.otimizacao_consultas import OtimizacaoConsultasMixin
+
 from .models import Oficio
 from .serializers import OficioSerializer
 from .permissions import CanManageOficiosPermission
@@ -20,7 +25,7 @@ except Exception as e:
     print(f"ERRO ao configurar a API do Gemini: {e}")
     model = None
 
-class OficioViewSet(viewsets.ModelViewSet):
+class OficioViewSet(OtimizacaoConsultasMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciar Ofícios.
     Oferece funcionalidades completas de CRUD (Create, Retrieve, Update, Destroy).
@@ -38,16 +43,27 @@ class OficioViewSet(viewsets.ModelViewSet):
 
         # Superusuários têm acesso a todos os ofícios de todas as contas.
         if user.is_superuser:
-            return Oficio.objects.all()
+            queryset = Oficio.objects.all()
 
         # Usuários com perfil associado veem apenas os ofícios
         # das contas às quais estão vinculados.
-        if hasattr(user, 'perfil'):
-            return Oficio.objects.filter(conta__in=user.perfil.contas.all())
+        elif hasattr(user, 'perfil'):
+            queryset = Oficio.objects.filter(conta__in=contexto_autorizacao(user).contas_filtro)
 
         # Se o usuário não for superusuário e não tiver um perfil com contas,
         # ele não poderá ver nenhum ofício.
-        return Oficio.objects.none()
+        else:
+            return Oficio.objects.none()
+
+        # Busca textual (?q=) por assunto, destinatário e corpo, ou pelo número do ofício.
+        termo_busca = self.request.query_params.get('q', None)
+        if termo_busca and self.action == 'list':
+            return buscar(
+                queryset, termo_busca,
+                outros_campos=Q(numero__icontains=termo_busca), limite=limite_resultados(self.request)
+            )
+
+        return queryset
 
     def perform_create(self, serializer):
         """